@@ -11,6 +11,7 @@ from alembic import context
 # from app.models.base import Base as AppBaseMetadata
 # ---> ADDED IMPORT FOR APP SETTINGS
 from app.core.config import settings as app_settings
+from app.core import backfill
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -37,6 +38,10 @@ def get_app_metadata():
     """Dynamically imports and returns the app's Base.metadata."""
     # Explicitly import all model modules to ensure they register with Base
     from app.models import user # Assuming user.py contains User model
+    from app.models import refresh_token
+    from app.models import role
+    from app.models import user_search
+    from app.models import auth_event
     # You would add other model module imports here, e.g.:
     # from app.models import item
     # from app.models import order
@@ -52,9 +57,28 @@ def get_app_metadata():
     log.warning(f"DEBUG (get_app_metadata): Metadata object ID: {id(AppBaseMetadata.metadata)}")
     return AppBaseMetadata.metadata
 
+# Backfill options, e.g. `alembic -x backfill_batch_size=5000 -x backfill_dry_run=true upgrade head`
+backfill.configure_defaults(context.get_x_argument(as_dictionary=True))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Managed outside the models: the backfill checkpoint table (app/core/backfill.py)
+    # and the search index with its FTS5 shadow tables (app/models/user_search.py)
+    from app.models.user_search import is_search_object
+    if type_ == "table" and name == backfill.CHECKPOINT_TABLE_NAME:
+        return False
+    return not (type_ in ("table", "index") and is_search_object(name))
+
 # ---> ADDING/MODIFYING get_db_url FUNCTION
+# Sharded deployments migrate each shard in turn: `alembic -x shard=<name> upgrade head`
+# (names from SHARD_URLS); without it, DATABASE_URL is migrated.
 def get_db_url() -> str:
-    return app_settings.DATABASE_URL
+    shard = context.get_x_argument(as_dictionary=True).get("shard")
+    if shard is None:
+        return app_settings.DATABASE_URL
+    if shard not in app_settings.SHARD_URLS:
+        raise ValueError(f"Unknown shard {shard!r}; SHARD_URLS has {list(app_settings.SHARD_URLS)}")
+    return app_settings.SHARD_URLS[shard]
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -70,6 +94,7 @@ def do_run_migrations(connection):
         connection=connection, 
         target_metadata=current_target_metadata, # Use dynamically fetched metadata
         render_as_batch=True,
+        include_object=include_object,
         template_args={}
     )
     # # --- DIRECT PRINT FOR DEBUGGING --- (Commented out)
@@ -101,6 +126,7 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
         render_as_batch=True,
+        include_object=include_object,
         template_args={}
     )
     # # --- DIRECT PRINT FOR DEBUGGING --- (Commented out)
@@ -0,0 +1,66 @@
+"""add_user_search_index
+
+Revision ID: c81e0f4b7a29
+Revises: f55ad45c25fe
+Create Date: 2026-10-19 15:10:27.803114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81e0f4b7a29'
+down_revision: Union[str, None] = 'f55ad45c25fe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Literal copy of the DDL in app/models/user_search.py as of this revision, so the
+# migration keeps doing the same thing when that module changes
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5("
+    "username, email, nickname, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_search_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_search(rowid, username, email, nickname) "
+    "VALUES (new.id, new.username, new.email, new.nickname); END",
+    "CREATE TRIGGER IF NOT EXISTS users_search_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_search(users_search, rowid, username, email, nickname) "
+    "VALUES ('delete', old.id, old.username, old.email, old.nickname); END",
+    "CREATE TRIGGER IF NOT EXISTS users_search_au AFTER UPDATE OF username, email, nickname ON users BEGIN "
+    "INSERT INTO users_search(users_search, rowid, username, email, nickname) "
+    "VALUES ('delete', old.id, old.username, old.email, old.nickname); "
+    "INSERT INTO users_search(rowid, username, email, nickname) "
+    "VALUES (new.id, new.username, new.email, new.nickname); END",
+    # Index rows that existed before the triggers
+    "INSERT INTO users_search(users_search) VALUES ('rebuild')",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS users_search_au",
+    "DROP TRIGGER IF EXISTS users_search_ad",
+    "DROP TRIGGER IF EXISTS users_search_ai",
+    "DROP TABLE IF EXISTS users_search",
+]
+POSTGRESQL_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_search_trgm ON users USING gin "
+    "((lower(username || ' ' || email || ' ' || coalesce(nickname, ''))) gin_trgm_ops)",
+]
+POSTGRESQL_DOWNGRADE = ["DROP INDEX IF EXISTS ix_users_search_trgm"]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # FTS5 trigram table + sync triggers on SQLite, pg_trgm GIN index on PostgreSQL.
+    # Indexing existing rows happens in this statement; budget roughly 10-20s per 1M users.
+    statements = {"sqlite": SQLITE_UPGRADE, "postgresql": POSTGRESQL_UPGRADE}
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    statements = {"sqlite": SQLITE_DOWNGRADE, "postgresql": POSTGRESQL_DOWNGRADE}
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
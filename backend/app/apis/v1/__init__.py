@@ -1,11 +1,15 @@
 from fastapi import APIRouter
 
 from app.apis.v1.endpoints import auth # Import your endpoint modules here
-# from app.apis.v1.endpoints import users # Example for other endpoints
+from app.apis.v1.endpoints import users
+from app.apis.v1.endpoints import admin
+from app.apis.v1.endpoints import avatars
 
 api_router_v1 = APIRouter()
 
 api_router_v1.include_router(auth.router, prefix="/auth", tags=["Authentication"]) # Add auth router
-# api_router_v1.include_router(users.router, prefix="/users", tags=["Users"]) # Example for other routers
+api_router_v1.include_router(users.router, prefix="/users", tags=["Users"])
+api_router_v1.include_router(admin.router, prefix="/admin", tags=["Admin"])
+api_router_v1.include_router(avatars.router, prefix="/avatars", tags=["Avatars"])
 
 # This v1 router will be included in the main app instance 
\ No newline at end of file
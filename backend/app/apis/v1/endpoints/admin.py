@@ -0,0 +1,229 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.deps import get_current_active_superuser, get_db_session
+from app.core.memory_profiler import TracingNotStartedError, memory_profiler
+from app.core.tracing import tracer
+from app.core.user_events import user_events
+from app.crud.cache import model_caches
+from app.langchain_module import llm
+from app.models.user import User as DBUser
+from app.schemas import crud_cache as crud_cache_schema
+from app.schemas import llm_routing as llm_routing_schema
+from app.schemas import memory as memory_schema
+from app.schemas import tracing as tracing_schema
+from app.schemas import user_events as user_events_schema
+from app.schemas import user_import as user_import_schema
+from app.services import user_import
+
+router = APIRouter()
+
+@router.get("/traces", response_model=List[tracing_schema.TraceSummary])
+async def list_traces(
+    limit: int = Query(50, ge=1, le=1000),
+    min_duration_ms: Optional[float] = Query(None, ge=0),
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Most recent sampled traces in this worker's ring buffer, newest first.
+    Use `min_duration_ms` to find slow requests.
+    """
+    summaries = []
+    for trace in reversed(tracer.traces):
+        if min_duration_ms is not None and trace.root.duration_ms < min_duration_ms:
+            continue
+        data = trace.as_dict()
+        data["span_count"] = len(data.pop("spans"))
+        summaries.append(data)
+        if len(summaries) == limit:
+            break
+    return summaries
+
+
+@router.get("/traces/{trace_id}", response_model=tracing_schema.TraceOut)
+async def read_trace(
+    trace_id: str,
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    One trace with all its spans, ordered by start time.
+    """
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trace not found (never sampled, or evicted)")
+    data = trace.as_dict()
+    data["span_count"] = len(data["spans"])
+    return data
+
+
+@router.post("/users/import", status_code=status.HTTP_202_ACCEPTED, response_model=user_import_schema.ImportJobOut)
+async def import_users(
+    request: Request,
+    response: Response,
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="Defaults to the Content-Type (text/csv or application/x-ndjson)"),
+    current_user: DBUser = Depends(get_current_active_superuser),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """
+    Create users in bulk from a CSV (with a header line) or NDJSON upload sent as the
+    raw request body, with the fields of a registration. The import runs in the
+    background; poll the returned job for progress and per-row errors.
+    """
+    import_format = format or user_import.format_for_content_type(request.headers.get("content-type", ""))
+    if import_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or pass ?format=",
+        )
+    # Return the connection authentication checked out: none is held while the upload
+    # is spooled, and the import itself uses its own sessions
+    await db.close()
+    try:
+        path = await user_import.importer.spool(request.stream())
+    except user_import.UploadTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+    job = user_import.importer.submit(path, import_format)
+    response.headers["Location"] = str(request.url_for("read_user_import", job_id=job.id))
+    return job
+
+
+@router.get("/users/imports/{job_id}", response_model=user_import_schema.ImportJobOut)
+async def read_user_import(
+    job_id: str,
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Progress of an import job. Jobs are tracked by the worker that accepted the upload.
+    """
+    job = user_import.importer.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
+
+
+@router.get("/memory", response_model=memory_schema.MemoryStatus)
+async def read_memory_status(
+    instances: bool = Query(False, description="Also count live ORM objects per model (walks the whole heap)"),
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Memory use of this worker: allocation tracing state, RSS, named snapshots and
+    the sizes of in-process caches.
+    """
+    return await run_in_threadpool(memory_profiler.status, instances)
+
+
+@router.post("/memory/tracing", response_model=memory_schema.MemoryStatus)
+async def start_memory_tracing(
+    body: memory_schema.MemoryTracingStart,
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Start tracing allocations with tracemalloc. Allocations get noticeably slower
+    until tracing is stopped; only memory allocated from now on is traced.
+    """
+    memory_profiler.start(body.frames)
+    return memory_profiler.status()
+
+
+@router.delete("/memory/tracing", response_model=memory_schema.MemoryStatus)
+async def stop_memory_tracing(
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Stop tracing allocations, and the sampler with it. Named snapshots are discarded.
+    """
+    await memory_profiler.stop_sampler()
+    memory_profiler.stop()
+    return memory_profiler.status()
+
+
+@router.post("/memory/snapshots", status_code=status.HTTP_201_CREATED, response_model=memory_schema.MemorySnapshotOut)
+async def take_memory_snapshot(
+    body: memory_schema.MemorySnapshotCreate,
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Take a named snapshot of the traced allocations, replacing any snapshot of that name.
+    """
+    try:
+        return await run_in_threadpool(memory_profiler.snapshot, body.name)
+    except TracingNotStartedError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Start tracing first (POST /admin/memory/tracing)") from exc
+
+
+@router.get("/memory/diff", response_model=List[memory_schema.MemoryStatOut])
+async def diff_memory_snapshots(
+    old: str = Query(..., description="Name of the earlier snapshot"),
+    new: str = Query(..., description="Name of the later snapshot"),
+    group_by: Literal["lineno", "filename"] = Query("lineno"),
+    limit: int = Query(25, ge=1, le=1000),
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Allocation sites whose retained memory changed the most between two snapshots,
+    largest change first. Sites that keep growing across diffs are the leak suspects.
+    """
+    try:
+        return await run_in_threadpool(memory_profiler.compare, old, new, group_by, limit)
+    except KeyError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Snapshot {exc.args[0]!r} not found") from exc
+
+
+@router.post("/memory/sampler", response_model=memory_schema.MemoryStatus)
+async def start_memory_sampler(
+    body: memory_schema.MemorySamplerStart,
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Start tracing (if needed) and log the fastest-growing allocation sites every interval.
+    """
+    memory_profiler.start_sampler(body.interval_seconds)
+    return memory_profiler.status()
+
+
+@router.delete("/memory/sampler", response_model=memory_schema.MemoryStatus)
+async def stop_memory_sampler(
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Stop the sampler; tracing keeps running until stopped separately.
+    """
+    await memory_profiler.stop_sampler()
+    return memory_profiler.status()
+
+
+@router.get("/llm/routing", response_model=llm_routing_schema.RoutingStatsOut)
+async def read_llm_routing(
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    LLM routing decisions in this worker: hedges, failovers, circuit breaker states and
+    per-provider latency percentiles over recent requests.
+    """
+    if llm.llm_router is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No LLM requests routed by this worker yet")
+    return llm.llm_router.snapshot()
+
+
+@router.get("/crud-cache", response_model=List[crud_cache_schema.ModelCacheStats])
+async def read_crud_cache(
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Hit rates of the cached CRUD models in this worker, near-cache and Redis hits counted apart.
+    """
+    return [cache.snapshot() for cache in model_caches.values()]
+
+
+@router.get("/user-events", response_model=user_events_schema.UserEventStats)
+async def read_user_events(
+    current_user: DBUser = Depends(get_current_active_superuser)
+):
+    """
+    Change-event streams open in this worker, and what was delivered to them.
+    """
+    return user_events.snapshot()
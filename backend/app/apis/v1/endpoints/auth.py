@@ -1,28 +1,34 @@
-from datetime import timedelta
-
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm # For standard login form
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core import audit_log as audit
 from app.core import security
-from app.core.config import settings
-from app.core.deps import get_db_session, get_current_active_user
+from app.core.activity import activity_tracker
+from app.core.deps import get_db_session, get_current_active_principal
+from app.core.http_cache import PRIVATE_REVALIDATE, Conditional, ConditionalRequest
+from app.core.principal_cache import CachedPrincipal
+from app.core.sharding import shard_set
 from app.crud import user as crud_user
-from app.models.user import User as DBUser # Rename to avoid conflict with schema.User
 from app.schemas import user as user_schema # Use alias for schemas
 from app.schemas import token as token_schema # Use alias for token schemas
+from app.services import token_service
 
 router = APIRouter()
 
 @router.post("/register", response_model=user_schema.UserWithToken)
 async def register_new_user(
     user_in: user_schema.UserCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db_session)
 ):
     """
     Create new user and return user info and access token.
     """
-    db_user_by_email = await crud_user.get_user_by_email(db, email=user_in.email)
+    if shard_set.enabled: # Emails are unique across shards, but only indexed per shard
+        db_user_by_email = await shard_set.find_first(lambda shard_db: crud_user.get_user_by_email(shard_db, email=user_in.email))
+    else:
+        db_user_by_email = await crud_user.get_user_by_email(db, email=user_in.email)
     if db_user_by_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -36,18 +42,17 @@ async def register_new_user(
         )
     
     created_user = await crud_user.create_user(db=db, user_in=user_in)
+    audit.audit_log.record(audit.REGISTER, user_id=created_user.id, username=created_user.username, request=request)
     
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        subject=created_user.username, expires_delta=access_token_expires
-    )
+    tokens = await token_service.issue_tokens(db, created_user)
     
     # Manually construct the User schema from the DBUser model for the response
     response_user = user_schema.User.model_validate(created_user)
 
     return {
         "user": response_user,
-        "access_token": access_token,
+        "access_token": tokens.access_token,
+        "refresh_token": tokens.refresh_token,
         "token_type": "bearer"
     }
 
@@ -56,6 +61,7 @@ async def register_new_user(
 async def login_for_access_token(
     # form_data: OAuth2PasswordRequestForm = Depends(), # Use OAuth2 form for username/password
     user_credentials: user_schema.UserLogin, # Receive JSON payload directly as request body
+    request: Request,
     db: AsyncSession = Depends(get_db_session)
 ):
     """
@@ -68,42 +74,111 @@ async def login_for_access_token(
         # Assuming username field in UserLogin can also be an email address
         user = await crud_user.get_user_by_email(db, email=user_credentials.username)
         if not user:
+             audit.audit_log.record(
+                 audit.LOGIN_FAILURE, success=False, username=user_credentials.username,
+                 request=request, detail={"reason": "unknown_user"},
+             )
              raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-    if not user or not security.verify_password(user_credentials.password, user.hashed_password):
+    verified, new_hash = security.verify_and_update_password(
+        user_credentials.password, user.hashed_password
+    )
+    if not verified:
+        audit.audit_log.record(
+            audit.LOGIN_FAILURE, success=False, user_id=user.id, username=user.username,
+            request=request, detail={"reason": "wrong_password"},
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     if not user.is_active:
+        audit.audit_log.record(
+            audit.LOGIN_FAILURE, success=False, user_id=user.id, username=user.username,
+            request=request, detail={"reason": "inactive"},
+        )
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+    if new_hash:
+        # Stored hash uses an old scheme or a lower cost: migrate it while we know the password
+        await crud_user.update_password_hash(db, user, new_hash)
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        subject=user.username, expires_delta=access_token_expires # Use username as subject
-    )
+    tokens = await token_service.issue_tokens(db, user) # Username is the token subject
+    audit.audit_log.record(audit.LOGIN_SUCCESS, user_id=user.id, username=user.username, request=request)
+    activity_tracker.record_login(user.id) # Written behind; the login itself stays read-only on users
     
     response_user = user_schema.User.model_validate(user)
 
     return {
         "user": response_user,
-        "access_token": access_token,
+        "access_token": tokens.access_token,
+        "refresh_token": tokens.refresh_token,
+        "token_type": "bearer"
+    }
+
+
+@router.post("/refresh", response_model=token_schema.TokenPair)
+async def refresh_access_token(
+    body: token_schema.RefreshTokenRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db_session)
+):
+    """
+    Rotate a refresh token: returns a new access token and a new refresh token.
+    The presented refresh token becomes unusable; presenting it again revokes the whole login.
+    """
+    try:
+        _, tokens = await token_service.rotate_refresh_token(db, body.refresh_token)
+    except token_service.InvalidRefreshToken as exc:
+        if isinstance(exc, token_service.RefreshTokenReuse):
+            audit.audit_log.record(
+                audit.REFRESH_TOKEN_REUSE, success=False, user_id=exc.user_id, username=exc.username,
+                request=request, detail={"family_id": exc.family_id},
+            )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(exc),
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from exc
+    return {
+        "access_token": tokens.access_token,
+        "refresh_token": tokens.refresh_token,
         "token_type": "bearer"
     }
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(
+    body: token_schema.RefreshTokenRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db_session)
+):
+    """
+    Revoke the refresh token's family, invalidating every access and refresh token of that login.
+    """
+    try:
+        username = await token_service.revoke_refresh_token(db, body.refresh_token)
+    except token_service.InvalidRefreshToken as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc)) from exc
+    audit.audit_log.record(audit.LOGOUT, username=username, request=request)
+
+
 @router.get("/me", response_model=user_schema.User) # As per frontend, response is { user: User }
 async def read_users_me(
-    current_user: DBUser = Depends(get_current_active_user) # Use DBUser type hint
+    principal: CachedPrincipal = Depends(get_current_active_principal),
+    conditional: ConditionalRequest = Depends(Conditional(PRIVATE_REVALIDATE))
 ):
     """
     Fetch the current logged in user.
+
+    Responses carry a strong ETag derived from the user's row version; send it back
+    in `If-None-Match` to get an empty 304 while the user is unchanged.
     """
-    # current_user is already a DBUser model instance from get_current_active_user
-    # Pydantic will automatically convert it to user_schema.User based on response_model
-    return current_user # FastAPI will convert this to user_schema.User using from_attributes 
\ No newline at end of file
+    not_modified = conditional.check(principal.etag)
+    if not_modified is not None:
+        return not_modified
+    return principal.user
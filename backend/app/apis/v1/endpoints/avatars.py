@@ -0,0 +1,45 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.http_cache import CachePolicy, Conditional, ConditionalRequest
+from app.core.sendfile import SendfileResponse
+from app.services import avatars
+
+router = APIRouter()
+
+# Content-addressed: a URL always names the same bytes
+IMMUTABLE = CachePolicy(public=True, max_age=31536000, immutable=True)
+
+@router.api_route("/{digest}/{size}", methods=["GET", "HEAD"], response_class=SendfileResponse)
+async def read_avatar(
+    digest: str,
+    size: int,
+    conditional: ConditionalRequest = Depends(Conditional(IMMUTABLE))
+):
+    """
+    An avatar rendition (WebP). Public, since avatar URLs are unguessable and end up in
+    `<img>` tags; supports Range requests and may be cached forever.
+    """
+    store = avatars.avatar_store
+    if not avatars.is_digest(digest) or size not in store.sizes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Avatar not found")
+    not_modified = conditional.check(f'"{digest[:32]}-{size}"')
+    if not_modified is not None:
+        return not_modified
+    path = store.path(digest, size)
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Avatar not found")
+    return SendfileResponse(
+        path,
+        media_type=avatars.MEDIA_TYPE,
+        headers=conditional.headers,
+        stat_result=stat_result,
+        accel_path=(
+            store.accel_redirect_prefix + store.relative_path(digest, size)
+            if store.accel_redirect_prefix else None
+        ),
+    )
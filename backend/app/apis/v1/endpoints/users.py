@@ -0,0 +1,227 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.deps import (
+    get_current_active_principal, get_db_session, get_user_loader, principal_for_token,
+)
+from app.core.http_cache import PRIVATE_REVALIDATE, Conditional, ConditionalRequest, make_etag
+from app.core.principal_cache import CachedPrincipal
+from app.core.sharding import shard_set
+from app.core.sse import HEARTBEAT, EventSourceResponse, format_event
+from app.core.user_events import DELETED, SlowConsumer, Subscription, TooManyConnections, user_events
+from app.crud import user as crud_user
+from app.crud import user_search
+from app.crud.dataloader import DataLoader
+from app.models.user import User as DBUser
+from app.schemas import user as user_schema
+from app.services import avatars
+
+router = APIRouter()
+
+@router.post(":batchGet", response_model=user_schema.UserBatchGetResponse)
+async def batch_get_users(
+    body: user_schema.UserBatchGetRequest,
+    principal: CachedPrincipal = Depends(get_current_active_principal),
+    loader: DataLoader[int, DBUser] = Depends(get_user_loader)
+):
+    """
+    Resolve up to `USERS_BATCH_GET_MAX_IDS` user ids to public profiles with one query.
+    Unknown ids are listed in `missing`.
+    """
+    ids = list(dict.fromkeys(body.ids)) # De-duplicate, keep request order
+    users = await loader.load_many(ids)
+    return {
+        "users": [user for user in users if user is not None],
+        "missing": [user_id for user_id, user in zip(ids, users) if user is None],
+    }
+
+
+@router.get("/search", response_model=user_schema.UserSearchResponse)
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=64),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    principal: CachedPrincipal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """
+    Find users by username or email prefix, or by a substring (3+ characters) of
+    username, email or nickname. Prefix matches rank first.
+    """
+    try:
+        if shard_set.enabled:
+            page = await user_search.search_users_sharded(shard_set, q, limit=limit, cursor=cursor)
+        else:
+            page = await user_search.search_users(db, q, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    return {"users": page.users, "next_cursor": page.next_cursor}
+
+
+@router.post("/me/avatar", response_model=user_schema.User)
+async def upload_avatar(
+    request: Request,
+    principal: CachedPrincipal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """
+    Set the current user's avatar from the `file` field of a multipart/form-data body
+    (JPEG, PNG, GIF or WebP, at most `AVATAR_MAX_UPLOAD_MB`). The image is cropped to a
+    square and stored at each of `AVATAR_SIZES`; `avatar_url` points at the largest, and
+    the other sizes are at the same URL with the size changed.
+    """
+    # Return the connection authentication may have checked out: none is held while the
+    # upload is received and rendered, and the update below takes one only briefly
+    await db.close()
+    try:
+        digest = await avatars.avatar_store.save_upload(request.headers.get("content-type", ""), request.stream())
+    except avatars.AvatarTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+    except avatars.InvalidAvatar as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    user = await crud_user.get_user_by_username(db, principal.username)
+    if user is None: # Deleted during the upload
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return await crud_user.update_avatar_url(db, user, avatars.avatar_store.url(digest))
+
+
+WEBSOCKET_AUTH_TIMEOUT_SECONDS = 10.0
+
+
+async def _event_messages(subscription: Subscription, version: int) -> AsyncIterator[Dict[str, Any]]:
+    """A connection's messages: `ready`, then events and heartbeats until the user is deleted or evicted."""
+    try:
+        yield {"type": "ready", "user_id": subscription.user_id, "version": version}
+        while True:
+            try:
+                user_event = await subscription.next(user_events.heartbeat_seconds)
+            except SlowConsumer:
+                yield {"type": "evicted"}
+                return
+            if user_event is None:
+                yield {"type": "heartbeat"}
+                continue
+            yield user_event.as_dict()
+            if user_event.type == DELETED:
+                return
+    finally:
+        subscription.close()
+
+
+async def _sse_messages(messages: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for message in messages:
+        if message["type"] == "heartbeat":
+            yield HEARTBEAT
+        else:
+            yield format_event(message, event=message["type"], id=message.get("version"))
+
+
+@router.get("/me/events", response_class=EventSourceResponse)
+async def stream_user_events(
+    principal: CachedPrincipal = Depends(get_current_active_principal)
+):
+    """
+    Server-sent events about changes to the current user, instead of polling `/auth/me`.
+    The stream opens with `ready` (the current `version`); then every change sends a
+    `user.updated` event with the new `version` and the changed `fields`, at which point
+    the client should refetch `/auth/me`. `user.deleted` ends the stream. A client that
+    falls `USER_EVENTS_QUEUE_SIZE` events behind gets `evicted` and is disconnected.
+    Idle streams carry a comment line every `USER_EVENTS_HEARTBEAT_SECONDS`.
+    """
+    try:
+        subscription = user_events.subscribe(principal.id)
+    except TooManyConnections as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc)) from exc
+    return EventSourceResponse(
+        _sse_messages(_event_messages(subscription, principal.version)),
+        send_timeout=user_events.send_timeout_seconds,
+        background=BackgroundTask(subscription.close), # Also when the stream never started
+    )
+
+
+async def _send_events(websocket: WebSocket, subscription: Subscription, version: int) -> int:
+    """Send the connection's messages; returns the close code once they end."""
+    async for message in _event_messages(subscription, version):
+        try:
+            async with asyncio.timeout(user_events.send_timeout_seconds):
+                await websocket.send_json(message)
+        except TimeoutError:
+            return status.WS_1013_TRY_AGAIN_LATER
+        if message["type"] == "evicted":
+            return status.WS_1013_TRY_AGAIN_LATER
+    return status.WS_1000_NORMAL_CLOSURE
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@router.websocket("/me/ws")
+async def user_events_socket(websocket: WebSocket):
+    """
+    WebSocket variant of `GET /me/events`, with the same events as JSON objects whose
+    `type` is the event name. Browsers cannot set headers on WebSockets, so the first
+    message must be `{"token": "<access token>"}`, within 10 seconds.
+    """
+    await websocket.accept()
+    try:
+        async with asyncio.timeout(WEBSOCKET_AUTH_TIMEOUT_SECONDS):
+            message = await websocket.receive_json()
+        principal = await principal_for_token(str(message["token"]))
+        if not principal.is_active:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+    except WebSocketDisconnect:
+        return
+    except (TimeoutError, ValueError, KeyError, TypeError, HTTPException):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        subscription = user_events.subscribe(principal.id)
+    except TooManyConnections:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    close_code: Optional[int] = None # Set when the server ends the stream
+
+    async def send_events() -> None:
+        nonlocal close_code
+        close_code = await _send_events(websocket, subscription, principal.version)
+        task_group.cancel_scope.cancel()
+
+    async def wait_for_disconnect() -> None:
+        await _wait_for_disconnect(websocket)
+        task_group.cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(send_events)
+            await wait_for_disconnect()
+    finally:
+        subscription.close()
+    if close_code is not None:
+        await websocket.close(code=close_code)
+
+
+@router.get("/{user_id}", response_model=user_schema.UserPublic)
+async def read_user(
+    user_id: int,
+    principal: CachedPrincipal = Depends(get_current_active_principal),
+    loader: DataLoader[int, DBUser] = Depends(get_user_loader),
+    conditional: ConditionalRequest = Depends(Conditional(PRIVATE_REVALIDATE))
+):
+    """
+    Public profile of one user, with an ETag from its row version.
+    """
+    user = await loader.load(user_id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    not_modified = conditional.check(make_etag("user-public", user.id, user.version))
+    if not_modified is not None:
+        return not_modified
+    return user
@@ -0,0 +1,281 @@
+"""
+Write-behind per-user activity counters: `login_count`, `last_login_at` and
+`last_seen_at` on `users`.
+
+Request handlers call `activity_tracker.record_login(user_id)` or
+`record_seen(user_id)`. Both are plain dict updates. Activity is coalesced per
+user in memory, and a background task flushes it every
+`ACTIVITY_FLUSH_INTERVAL_SECONDS` as one batched UPDATE (see
+`crud.user.add_activity`). A user seen 1000 times in an interval costs one row
+write, and request paths never take row locks on `users`.
+
+With Redis configured, each worker merges its deltas into shared Redis hashes
+instead. Once per interval, whichever worker takes the drain lock writes the
+merged hashes to the database, so the write rate does not grow with the number
+of workers.
+
+Counters are best-effort. A failed database write is retried on the next flush,
+but whatever is still in memory when a worker dies is lost.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+from app.core.redis_client import get_redis_client
+from app.core.sharding import shard_set
+from app.crud import user as crud_user
+
+logger = logging.getLogger(__name__)
+
+REDIS_LOGINS_KEY = "app:activity:logins"
+REDIS_LAST_LOGIN_KEY = "app:activity:last_login_at"
+REDIS_LAST_SEEN_KEY = "app:activity:last_seen_at"
+REDIS_DRAIN_LOCK_KEY = "app:activity:drain_lock"
+_REDIS_KEYS = [REDIS_LOGINS_KEY, REDIS_LAST_LOGIN_KEY, REDIS_LAST_SEEN_KEY]
+_REDIS_DRAINING_KEYS = [f"{key}:draining" for key in _REDIS_KEYS]
+
+# ARGV holds (user_id, logins, last_login_at, last_seen_at) quadruples; '' means unset.
+# Timestamps keep the maximum so workers' flushes can land in any order.
+_MERGE_SCRIPT = """
+for i = 1, #ARGV, 4 do
+    local id = ARGV[i]
+    if ARGV[i + 1] ~= '0' then redis.call('HINCRBY', KEYS[1], id, ARGV[i + 1]) end
+    for k = 2, 3 do
+        local value = ARGV[i + k]
+        if value ~= '' then
+            local current = redis.call('HGET', KEYS[k], id)
+            if not current or tonumber(current) < tonumber(value) then redis.call('HSET', KEYS[k], id, value) end
+        end
+    end
+end
+"""
+# Move the live hashes aside for draining, unless a previous drain failed and left its
+# hashes behind: those are retried first, and new activity keeps accumulating meanwhile.
+_TAKE_SCRIPT = """
+for k = 4, 6 do
+    if redis.call('EXISTS', KEYS[k]) == 1 then return 0 end
+end
+for k = 1, 3 do
+    if redis.call('EXISTS', KEYS[k]) == 1 then redis.call('RENAME', KEYS[k], KEYS[k + 3]) end
+end
+return 1
+"""
+
+
+@dataclass(slots=True)
+class ActivityDelta:
+    logins: int
+    last_login_at: Optional[float] # Epoch seconds
+    last_seen_at: Optional[float]
+
+    def merge(self, other: "ActivityDelta") -> None:
+        self.logins += other.logins
+        self.last_login_at = _latest(self.last_login_at, other.last_login_at)
+        self.last_seen_at = _latest(self.last_seen_at, other.last_seen_at)
+
+
+def _latest(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    return a if b is None or a >= b else b
+
+
+def _to_datetime(value: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+class ActivityTracker:
+    def __init__(
+        self,
+        flush_interval: float = 10.0,
+        batch_size: int = 1000,
+        use_redis: bool = False,
+        enabled: bool = True,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.use_redis = use_redis
+        self.enabled = enabled
+        self.rows_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._pending: Dict[int, ActivityDelta] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record_login(self, user_id: int) -> None:
+        if self.enabled:
+            now = time.time()
+            delta = self._pending.get(user_id)
+            if delta is None:
+                self._pending[user_id] = ActivityDelta(1, now, now)
+            else:
+                delta.logins += 1
+                delta.last_login_at = delta.last_seen_at = now
+
+    def record_seen(self, user_id: int) -> None:
+        if self.enabled:
+            delta = self._pending.get(user_id)
+            if delta is None:
+                self._pending[user_id] = ActivityDelta(0, None, time.time())
+            else:
+                delta.last_seen_at = time.time()
+
+    def _restore(self, deltas: Dict[int, ActivityDelta]) -> None:
+        # Put back deltas that could not be written, merged with whatever arrived since
+        for user_id, delta in deltas.items():
+            newer = self._pending.get(user_id)
+            if newer is not None:
+                delta.merge(newer)
+            self._pending[user_id] = delta
+
+    # --- flushing -----------------------------------------------------------------------
+    async def flush(self, db: AsyncSession) -> int:
+        """Write pending activity; returns the number of user rows updated."""
+        deltas, self._pending = self._pending, {} # Swap, so recording never waits on the flush
+        if self.use_redis:
+            try:
+                await self._merge_into_redis(deltas)
+            except RedisError:
+                logger.exception("Could not merge activity for %d users into Redis", len(deltas))
+                self._restore(deltas)
+                self.failed_flushes += 1
+                return 0
+            return await self._drain_redis(db)
+        try:
+            written = await self._write(db, deltas)
+        except SQLAlchemyError:
+            logger.exception("Activity flush for %d users failed; retrying next interval", len(deltas))
+            await db.rollback()
+            self._restore(deltas)
+            self.failed_flushes += 1
+            return 0
+        return written
+
+    async def _write(self, db: AsyncSession, deltas: Dict[int, ActivityDelta]) -> int:
+        if not deltas:
+            return 0
+        rows = [
+            {
+                "b_id": user_id,
+                "b_logins": delta.logins,
+                "b_last_login_at": _to_datetime(delta.last_login_at),
+                "b_last_seen_at": _to_datetime(delta.last_seen_at),
+            }
+            for user_id, delta in sorted(deltas.items()) # Same lock order in every flush
+        ]
+        if shard_set.enabled:
+            # Ids do not tell which shard a user is on; the UPDATE matches nothing on the others.
+            # If one shard fails, the retry re-applies the login counts on those that succeeded.
+            await shard_set.scatter_gather(lambda shard_db: self._write_rows(shard_db, rows))
+        else:
+            await self._write_rows(db, rows)
+        self.rows_written += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    async def _write_rows(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(rows), self.batch_size):
+            await crud_user.add_activity(db, rows[start:start + self.batch_size])
+        await db.commit()
+
+    async def _merge_into_redis(self, deltas: Dict[int, ActivityDelta]) -> None:
+        if not deltas:
+            return
+        args: List[str] = []
+        for user_id, delta in deltas.items():
+            args += [
+                str(user_id),
+                str(delta.logins),
+                repr(delta.last_login_at) if delta.last_login_at is not None else "",
+                repr(delta.last_seen_at) if delta.last_seen_at is not None else "",
+            ]
+        async with get_redis_client() as redis:
+            await redis.eval(_MERGE_SCRIPT, len(_REDIS_KEYS), *_REDIS_KEYS, *args)
+
+    async def _drain_redis(self, db: AsyncSession) -> int:
+        try:
+            async with get_redis_client() as redis:
+                # The lock is never released: it expires, which caps drains at one per interval
+                if not await redis.set(REDIS_DRAIN_LOCK_KEY, "1", nx=True, px=int(self.flush_interval * 1000)):
+                    return 0
+                keys = [*_REDIS_KEYS, *_REDIS_DRAINING_KEYS]
+                await redis.eval(_TAKE_SCRIPT, len(keys), *keys)
+                logins, last_login, last_seen = [await redis.hgetall(key) for key in _REDIS_DRAINING_KEYS]
+        except RedisError:
+            logger.exception("Could not read activity from Redis")
+            self.failed_flushes += 1
+            return 0
+
+        deltas: Dict[int, ActivityDelta] = {}
+        for user_id in {*logins, *last_login, *last_seen}:
+            deltas[int(user_id)] = ActivityDelta(
+                int(logins.get(user_id, 0)),
+                float(last_login[user_id]) if user_id in last_login else None,
+                float(last_seen[user_id]) if user_id in last_seen else None,
+            )
+        try:
+            written = await self._write(db, deltas)
+        except SQLAlchemyError:
+            # The draining hashes stay in Redis and are retried by the next drain
+            logger.exception("Activity drain for %d users failed", len(deltas))
+            await db.rollback()
+            self.failed_flushes += 1
+            return 0
+        try:
+            async with get_redis_client() as redis:
+                await redis.delete(*_REDIS_DRAINING_KEYS)
+        except RedisError:
+            # Leaves the drained hashes behind, so the next drain applies them a second time
+            logger.exception("Could not clear drained activity hashes in Redis")
+        return written
+
+    # --- lifecycle ----------------------------------------------------------------------
+    def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        async def _loop() -> None:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    async with session_factory() as db:
+                        await self.flush(db)
+                except Exception: # e.g. no connection to be had: keep flushing on later intervals
+                    logger.exception("Activity flush failed")
+                    self.failed_flushes += 1
+
+        if self._task is None:
+            self._task = asyncio.create_task(_loop(), name="activity-flusher")
+
+    async def stop(self, session_factory: Callable[[], AsyncSession]) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        async with session_factory() as db:
+            await self.flush(db) # Final flush of this worker's pending activity
+
+    @classmethod
+    def from_settings(cls) -> "ActivityTracker":
+        return cls(
+            flush_interval=settings.ACTIVITY_FLUSH_INTERVAL_SECONDS,
+            batch_size=settings.ACTIVITY_FLUSH_BATCH_SIZE,
+            use_redis=bool(settings.REDIS_HOST),
+            enabled=settings.ACTIVITY_TRACKING_ENABLED,
+        )
+
+
+activity_tracker = ActivityTracker.from_settings()
+register_cache("activity_pending", activity_tracker)
@@ -0,0 +1,272 @@
+"""
+Buffered, batched writer for the `auth_events` audit table.
+
+Request handlers call `audit_log.record(...)`. That is a plain function: it
+appends to a bounded in-memory buffer and returns, with no await, no I/O and no
+effect on the request's database session. A background task writes the buffer
+with multi-row INSERTs in its own session. It flushes every
+`AUDIT_LOG_FLUSH_INTERVAL_MS`, or as soon as `AUDIT_LOG_BATCH_SIZE` events are
+waiting.
+
+When the buffer is full, or a flush fails, `AUDIT_LOG_OVERFLOW` decides:
+
+* `drop`: discard the events and count them in `stats.dropped` (logged)
+* `spill`: hand them to the background task, which appends them to
+  `AUDIT_LOG_SPILL_FILE` as NDJSON in batches, off the event loop (up to
+  `AUDIT_LOG_QUEUE_SIZE` events wait for that; beyond it they are dropped); the
+  file is replayed into the table the next time the writer starts
+
+`stop()` (application shutdown) drains whatever is still buffered.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+from app.models.auth_event import AuthEvent
+
+logger = logging.getLogger(__name__)
+
+# Event types
+REGISTER = "register"
+LOGIN_SUCCESS = "login_success"
+LOGIN_FAILURE = "login_failure"
+LOGOUT = "logout"
+REFRESH_TOKEN_REUSE = "refresh_token_reuse"
+
+
+@dataclass
+class AuditLogStats:
+    recorded: int = 0
+    written: int = 0
+    dropped: int = 0
+    spilled: int = 0
+    replayed: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+
+
+class AuditLog:
+    def __init__(
+        self,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval_ms: float = 200.0,
+        overflow: str = "drop",
+        spill_file: Optional[str] = None,
+    ):
+        if overflow not in ("drop", "spill"):
+            raise ValueError(f"Unknown audit log overflow policy: {overflow}")
+        if overflow == "spill" and not spill_file:
+            raise ValueError("The spill overflow policy needs a spill file")
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow = overflow
+        self.spill_file = spill_file
+        self.stats = AuditLogStats()
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._to_spill: List[Dict[str, Any]] = [] # Overflowed events waiting to be written to spill_file
+        self._wakeup: Optional[asyncio.Event] = None
+        self._session_factory: Optional[Callable[[], AsyncSession]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def record(
+        self,
+        event_type: str,
+        *,
+        success: bool = True,
+        user_id: Optional[int] = None,
+        username: Optional[str] = None,
+        request: Optional[Request] = None,
+        detail: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Queue one event; never blocks and never raises on a full buffer."""
+        event = {
+            "event_type": event_type,
+            "success": success,
+            "user_id": user_id,
+            "username": username,
+            "ip_address": request.client.host if request is not None and request.client else None,
+            "user_agent": request.headers.get("user-agent", "")[:256] if request is not None else None,
+            "detail": detail,
+            "created_at": datetime.now(timezone.utc),
+        }
+        self.stats.recorded += 1
+        if len(self._buffer) >= self.queue_size:
+            self._overflow([event], "buffer full")
+            return
+        self._buffer.append(event)
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- overflow -----------------------------------------------------------------------
+    def _overflow(self, events: List[Dict[str, Any]], reason: str) -> None:
+        if self.overflow == "spill":
+            # No file I/O here (record() runs on the event loop); the flusher writes them
+            room = max(0, self.queue_size - len(self._to_spill))
+            self._to_spill.extend(events[:room])
+            events = events[room:]
+            if self._wakeup is not None:
+                self._wakeup.set()
+            if not events:
+                return
+            reason = f"{reason}, spill backlog full"
+        self._drop(events, reason)
+
+    def _drop(self, events: List[Dict[str, Any]], reason: str) -> None:
+        if self.stats.dropped == 0 or self.stats.dropped // 1000 != (self.stats.dropped + len(events)) // 1000:
+            logger.warning("Dropping audit events (%s); %d dropped so far", reason, self.stats.dropped + len(events))
+        self.stats.dropped += len(events)
+
+    # --- writing ------------------------------------------------------------------------
+    async def _write(self, events: List[Dict[str, Any]]) -> bool:
+        try:
+            async with self._session_factory() as db:
+                await db.execute(insert(AuthEvent).values(events)) # One multi-row INSERT
+                await db.commit()
+        except (SQLAlchemyError, OSError):
+            logger.exception("Audit log flush of %d events failed", len(events))
+            self.stats.failed_flushes += 1
+            return False
+        self.stats.written += len(events)
+        self.stats.flushes += 1
+        return True
+
+    async def flush(self) -> int:
+        """Write everything buffered right now, in batches; returns the number of events taken."""
+        taken = 0
+        while self._buffer:
+            count = min(self.batch_size, len(self._buffer))
+            events = [self._buffer.popleft() for _ in range(count)]
+            taken += count
+            if not await self._write(events):
+                self._overflow(events, "flush failed")
+        await self._spill()
+        return taken
+
+    async def _spill(self) -> None:
+        if not self._to_spill:
+            return
+        events, self._to_spill = self._to_spill, []
+        try:
+            await asyncio.to_thread(_append_spill_file, self.spill_file, events)
+        except OSError:
+            logger.exception("Could not spill %d audit events to %s", len(events), self.spill_file)
+            self._drop(events, "spill failed")
+            return
+        self.stats.spilled += len(events)
+
+    async def _run(self) -> None:
+        try:
+            await self._replay_spill_file()
+        except Exception:
+            # Logged and skipped: the flusher must keep running
+            logger.exception("Could not replay the audit spill file %s", self.spill_file)
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush() # Drain on shutdown
+
+    async def _replay_spill_file(self) -> None:
+        if self.overflow != "spill" or not self.spill_file or not os.path.exists(self.spill_file):
+            return
+        replaying = f"{self.spill_file}.replaying"
+        os.replace(self.spill_file, replaying) # New spills go to a fresh file meanwhile
+        events = await asyncio.to_thread(_read_spill_file, replaying)
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            if not await self._write(batch):
+                # Back into the (fresh) spill file whole, not through the bounded backlog
+                await asyncio.to_thread(_append_spill_file, self.spill_file, events[start:])
+                self.stats.spilled += len(events) - start
+                break
+            self.stats.replayed += len(batch)
+        os.remove(replaying)
+        if events:
+            logger.info("Replayed %d spilled audit events", self.stats.replayed)
+
+    # --- lifecycle ----------------------------------------------------------------------
+    def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        if self._task is None:
+            self._session_factory = session_factory
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="audit-log-flusher")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error("Audit log did not drain within %.1fs; %d events left", timeout, len(self._buffer))
+            self._overflow(list(self._buffer), "shutdown timeout")
+            self._buffer.clear()
+            await self._spill()
+        self._task = None
+        self._wakeup = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**asdict(self.stats), "buffered": len(self._buffer), "to_spill": len(self._to_spill), "overflow": self.overflow}
+
+    @classmethod
+    def from_settings(cls) -> "AuditLog":
+        return cls(
+            queue_size=settings.AUDIT_LOG_QUEUE_SIZE,
+            batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+            flush_interval_ms=settings.AUDIT_LOG_FLUSH_INTERVAL_MS,
+            overflow=settings.AUDIT_LOG_OVERFLOW,
+            spill_file=settings.AUDIT_LOG_SPILL_FILE,
+        )
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _append_spill_file(path: str, events: List[Dict[str, Any]]) -> None:
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.writelines(json.dumps(event, default=_json_default) + "\n" for event in events)
+
+
+def _read_spill_file(path: str) -> List[Dict[str, Any]]:
+    events = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                event["created_at"] = datetime.fromisoformat(event["created_at"])
+                events.append(event)
+            except (ValueError, KeyError):
+                logger.warning("Skipping corrupt line in audit spill file %s", path)
+    return events
+
+
+audit_log = AuditLog.from_settings()
+register_cache("audit_log_buffer", audit_log)
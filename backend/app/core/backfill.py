@@ -0,0 +1,363 @@
+"""
+Chunked, resumable online data backfills for Alembic migrations.
+
+A single `UPDATE users SET ...` over a large table holds locks for the whole
+run. A `Backfill` instead walks the table in primary-key order (keyset, not
+OFFSET) and updates at most `batch_size` rows per short transaction, optionally
+sleeping between batches to leave room for live traffic. After each batch
+the last key processed is written to the `backfill_checkpoints` table. An
+interrupted run resumes from there. A lease on the checkpoint row makes sure
+only one runner works on a given backfill.
+
+The update should be idempotent (e.g. `WHERE nickname IS NULL`), so rows the
+application writes concurrently are left alone and a batch retried after a
+crash is harmless.
+
+Usage from a migration script:
+
+    from app.core.backfill import Backfill, run_in_migration
+
+    def upgrade():
+        op.add_column("users", sa.Column("display_name", sa.String()))
+        users = sa.table("users", sa.column("id"), sa.column("username"), sa.column("display_name"))
+        run_in_migration(Backfill(
+            "users_display_name",
+            users,
+            values={"display_name": users.c.username},
+            where=users.c.display_name.is_(None),
+        ))
+
+Batch size, throttle and dry-run can be set per run from the command line:
+`alembic -x backfill_batch_size=5000 -x backfill_sleep=0.05 -x backfill_dry_run=true upgrade head`
+"""
+import logging
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Union
+
+from sqlalchemy import (
+    BigInteger, Column, Float, Integer, MetaData, String, Table, func, insert, select, update,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import ColumnElement, TableClause
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TABLE_NAME = "backfill_checkpoints"
+
+# Kept out of the app's Base.metadata: the framework creates the table on demand, so
+# backfills work from any migration regardless of revision order.
+checkpoint_metadata = MetaData()
+checkpoints = Table(
+    CHECKPOINT_TABLE_NAME,
+    checkpoint_metadata,
+    Column("name", String(128), primary_key=True),
+    Column("last_key", String, nullable=True), # str() of the key column value
+    Column("rows_done", BigInteger, nullable=False, default=0),
+    Column("batches", Integer, nullable=False, default=0),
+    Column("owner", String(64), nullable=True),
+    Column("lease_expires_at", Float, nullable=True), # Epoch seconds
+    Column("completed_at", Float, nullable=True),
+    Column("updated_at", Float, nullable=True),
+)
+
+
+@dataclass
+class BackfillDefaults:
+    """Process-wide defaults, set from Alembic `-x` arguments in alembic/env.py."""
+    batch_size: int = 1000
+    sleep_seconds: float = 0.0
+    dry_run: bool = False
+
+
+defaults = BackfillDefaults()
+
+
+def configure_defaults(x_args: Dict[str, str]) -> None:
+    """Apply `backfill_*` options passed as `alembic -x key=value`."""
+    if "backfill_batch_size" in x_args:
+        defaults.batch_size = int(x_args["backfill_batch_size"])
+    if "backfill_sleep" in x_args:
+        defaults.sleep_seconds = float(x_args["backfill_sleep"])
+    if "backfill_dry_run" in x_args:
+        defaults.dry_run = x_args["backfill_dry_run"].lower() in ("1", "true", "yes")
+
+
+class BackfillLocked(RuntimeError):
+    """Another runner holds the lease on this backfill."""
+
+
+class BackfillDryRun(RuntimeError):
+    """Raised by `run_in_migration` in dry-run mode, so the migration is rolled back and not stamped."""
+
+    def __init__(self, estimate: "BackfillEstimate"):
+        super().__init__(
+            f"Backfill {estimate.name} dry run: {estimate.candidate_rows} candidate rows, "
+            f"{estimate.batches} batches, ~{estimate.estimated_seconds:.1f}s; migration aborted"
+        )
+        self.estimate = estimate
+
+
+@dataclass
+class BackfillResult:
+    name: str
+    rows_done: int
+    batches: int
+    elapsed_seconds: float
+    completed: bool
+    resumed_from: Optional[str] = None
+
+
+@dataclass
+class BackfillEstimate:
+    name: str
+    candidate_rows: int
+    batch_size: int
+    batches: int
+    sample_batch_seconds: float
+    sleep_seconds: float
+
+    @property
+    def estimated_seconds(self) -> float:
+        return self.batches * (self.sample_batch_seconds + self.sleep_seconds)
+
+
+class Backfill:
+    def __init__(
+        self,
+        name: str,
+        table: Union[Table, TableClause],
+        *,
+        values: Optional[Dict[str, Any]] = None,
+        where: Optional[ColumnElement] = None,
+        batch_fn: Optional[Callable[[Connection, Any, Any], int]] = None,
+        key_column: str = "id",
+        batch_size: Optional[int] = None,
+        sleep_seconds: Optional[float] = None,
+        lease_seconds: float = 300.0,
+    ):
+        """
+        Describe one resumable backfill.
+
+        **Parameters**
+
+        * `name`: unique checkpoint name; reusing it resumes the earlier run
+        * `table`: table (or `sa.table(...)` clause) to walk
+        * `values`: column -> value/expression for a generated `UPDATE`
+        * `where`: extra predicate limiting the rows touched (keep it idempotent)
+        * `batch_fn`: custom batch body `(connection, low_exclusive, high_inclusive) -> rows`
+          used instead of `values`
+        * `key_column`: unique, indexed column used for keyset chunking
+        * `batch_size` / `sleep_seconds`: rows per batch and pause between batches
+        * `lease_seconds`: how long a crashed runner blocks others
+        """
+        if (values is None) == (batch_fn is None):
+            raise ValueError("Provide exactly one of `values` or `batch_fn`")
+        self.name = name
+        self.table = table
+        self.values = values
+        self.where = where
+        self.batch_fn = batch_fn
+        self.key = table.c[key_column]
+        self.batch_size = batch_size or defaults.batch_size
+        self.sleep_seconds = defaults.sleep_seconds if sleep_seconds is None else sleep_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        try:
+            self._key_type = self.key.type.python_type
+        except NotImplementedError:
+            self._key_type = str
+
+    # --- keyset walking -------------------------------------------------------------
+    def _next_high_key(self, conn: Connection, low: Any) -> Any:
+        """Key of the last row in the next chunk after `low` (None when the table is exhausted)."""
+        chunk = select(self.key).order_by(self.key).limit(self.batch_size)
+        if low is not None:
+            chunk = chunk.where(self.key > low)
+        return conn.execute(select(func.max(chunk.subquery().c[0]))).scalar()
+
+    def _run_batch(self, conn: Connection, low: Any, high: Any) -> int:
+        if self.batch_fn is not None:
+            return self.batch_fn(conn, low, high)
+        statement = update(self.table).where(self.key <= high).values(**self.values)
+        if low is not None:
+            statement = statement.where(self.key > low)
+        if self.where is not None:
+            statement = statement.where(self.where)
+        return conn.execute(statement).rowcount
+
+    # --- checkpoint / lease ------------------------------------------------------------
+    def _acquire(self, conn: Connection) -> Dict[str, Any]:
+        checkpoints.create(conn, checkfirst=True)
+        try:
+            conn.execute(insert(checkpoints).values(name=self.name, rows_done=0, batches=0))
+            conn.commit()
+        except IntegrityError:
+            conn.rollback()
+        now = time.time()
+        claimed = conn.execute(
+            update(checkpoints)
+            .where(
+                checkpoints.c.name == self.name,
+                (checkpoints.c.owner.is_(None))
+                | (checkpoints.c.owner == self.owner)
+                | (checkpoints.c.lease_expires_at < now),
+            )
+            .values(owner=self.owner, lease_expires_at=now + self.lease_seconds, updated_at=now)
+        ).rowcount
+        conn.commit()
+        if claimed != 1:
+            raise BackfillLocked(f"Backfill {self.name!r} is being run by another process")
+        return dict(conn.execute(select(checkpoints).where(checkpoints.c.name == self.name)).mappings().one())
+
+    def _save(self, conn: Connection, high: Any, rows: int) -> None:
+        now = time.time()
+        conn.execute(
+            update(checkpoints)
+            .where(checkpoints.c.name == self.name, checkpoints.c.owner == self.owner)
+            .values(
+                last_key=str(high),
+                rows_done=checkpoints.c.rows_done + rows,
+                batches=checkpoints.c.batches + 1,
+                lease_expires_at=now + self.lease_seconds,
+                updated_at=now,
+            )
+        )
+
+    def _finish(self, conn: Connection, completed: bool) -> None:
+        now = time.time()
+        conn.execute(
+            update(checkpoints)
+            .where(checkpoints.c.name == self.name, checkpoints.c.owner == self.owner)
+            .values(owner=None, lease_expires_at=None, updated_at=now, completed_at=now if completed else None)
+        )
+        conn.commit()
+
+    # --- public API ---------------------------------------------------------------------
+    def estimate(self, bind: Union[Engine, Connection]) -> BackfillEstimate:
+        """
+        Dry run: count candidate rows and time one batch, rolled back. On a connection
+        already in a transaction (a migration's), only a savepoint is rolled back.
+        """
+        with _connection(bind) as conn:
+            external = conn.in_transaction() # Not ours to end
+            count = select(func.count()).select_from(self.table)
+            if self.where is not None:
+                count = count.where(self.where)
+            candidate_rows = conn.execute(count).scalar_one()
+            total_rows = conn.execute(select(func.count()).select_from(self.table)).scalar_one()
+            if not external:
+                conn.rollback()
+
+            sample_seconds = 0.0
+            high = self._next_high_key(conn, None)
+            if high is not None:
+                transaction = conn.begin_nested() if conn.in_transaction() else conn.begin()
+                start = time.perf_counter()
+                self._run_batch(conn, None, high)
+                sample_seconds = time.perf_counter() - start
+                transaction.rollback()
+                if not external:
+                    conn.rollback()
+        # Every key range is visited even if few rows match the predicate
+        batches = math.ceil(total_rows / self.batch_size) if total_rows else 0
+        estimate = BackfillEstimate(
+            name=self.name,
+            candidate_rows=candidate_rows,
+            batch_size=self.batch_size,
+            batches=batches,
+            sample_batch_seconds=sample_seconds,
+            sleep_seconds=self.sleep_seconds,
+        )
+        logger.info(
+            "Backfill %s dry run: %d candidate rows, %d batches of %d, ~%.1fs",
+            self.name, candidate_rows, batches, self.batch_size, estimate.estimated_seconds,
+        )
+        return estimate
+
+    def run(self, bind: Union[Engine, Connection], *, max_batches: Optional[int] = None) -> BackfillResult:
+        """
+        Process batches until the table is exhausted (or `max_batches` ran), committing
+        each batch together with its checkpoint.
+        """
+        started = time.perf_counter()
+        with _connection(bind) as conn:
+            if conn.in_transaction():
+                conn.commit() # Do not hold locks taken before the backfill across batches
+            state = self._acquire(conn)
+            if state["completed_at"] is not None:
+                self._finish(conn, completed=True)
+                return BackfillResult(self.name, state["rows_done"], state["batches"], 0.0, True)
+            low = self._key_type(state["last_key"]) if state["last_key"] is not None else None
+            resumed_from = state["last_key"]
+            rows_done, batches, completed = 0, 0, False
+            try:
+                while max_batches is None or batches < max_batches:
+                    high = self._next_high_key(conn, low)
+                    if high is None:
+                        completed = True
+                        break
+                    rows = self._run_batch(conn, low, high)
+                    self._save(conn, high, rows)
+                    conn.commit()
+                    rows_done += rows
+                    batches += 1
+                    low = high
+                    if batches % 100 == 0:
+                        logger.info("Backfill %s: %d batches, %d rows, at key %s", self.name, batches, rows_done, high)
+                    if self.sleep_seconds:
+                        time.sleep(self.sleep_seconds)
+            finally:
+                conn.rollback()
+                self._finish(conn, completed)
+        elapsed = time.perf_counter() - started
+        logger.info("Backfill %s: %d rows in %d batches (%.1fs)%s", self.name, rows_done, batches, elapsed,
+                    "" if completed else ", paused")
+        return BackfillResult(self.name, rows_done, batches, elapsed, completed, resumed_from)
+
+
+class _connection:
+    """Use a given Connection as-is, or open (and close) one from an Engine."""
+
+    def __init__(self, bind: Union[Engine, Connection]):
+        self.bind = bind
+        self._owned: Optional[Connection] = None
+
+    def __enter__(self) -> Connection:
+        if isinstance(self.bind, Connection):
+            return self.bind
+        self._owned = self.bind.connect()
+        return self._owned
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._owned is not None:
+            self._owned.close()
+
+
+def run_in_migration(backfill: Backfill) -> Optional[BackfillResult]:
+    """
+    Run `backfill` from inside an Alembic migration.
+
+    The migration's own transaction is committed first (`autocommit_block`), so
+    the DDL before it is durable and releases its locks. The batches then run on
+    a separate connection from the same engine, each committing on its own.
+
+    With `-x backfill_dry_run=true` the estimate is taken on the migration's own
+    connection (so it sees the migration's uncommitted DDL), logged, and then
+    `BackfillDryRun` aborts the migration: the revision is not stamped, and a
+    later `upgrade` runs the real backfill. On databases without transactional
+    DDL (MySQL), the schema changes before the backfill are not rolled back.
+    """
+    from alembic import op
+
+    context = op.get_context()
+    if context.as_sql:
+        logger.warning("Backfill %s skipped in offline (--sql) mode", backfill.name)
+        return None
+    if defaults.dry_run:
+        raise BackfillDryRun(backfill.estimate(op.get_bind()))
+    with context.autocommit_block():
+        return backfill.run(op.get_bind().engine)
@@ -1,6 +1,7 @@
-from typing import AsyncGenerator, Optional
+import logging
+from typing import AsyncGenerator, Callable, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 # from redis.asyncio import Redis as AsyncRedis # For redis-py
@@ -8,11 +9,20 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.db import SessionLocal, engine # Assuming SessionLocal and engine are defined in db.py
 # from app.core.redis_client import get_redis_connection # Assuming this function exists
 from app.core.config import settings
-from app.core import security # Import the security module
+from app.core import logging_config, security # Import the security module
+from app.core.activity import activity_tracker
+from app.core.principal_cache import CachedPrincipal, principal_cache
+from app.core.sharding import shard_for_request, shard_set
+from app.core.permissions import decode_bits, has_permissions, permission_bits_cache, permission_registry
+from app.core.token_revocation import revocation_store
 from app.models.user import User
 from app.crud import user as crud_user # Alias crud.user to avoid naming conflict
+from app.crud import role as crud_role
+from app.crud.dataloader import DataLoader, user_loader
 from app.schemas.token import TokenPayload
 
+logger = logging.getLogger(__name__)
+
 # Define oauth2_scheme here, pointing to the actual login URL
 # The tokenUrl should match the path operation of your login endpoint
 oauth2_scheme = OAuth2PasswordBearer(
@@ -21,10 +31,19 @@ oauth2_scheme = OAuth2PasswordBearer(
 
 # settings = get_settings()
 
-async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
-    async with SessionLocal() as session:
+async def get_db_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    if not shard_set.enabled:
+        async with SessionLocal() as session:
+            yield session
+        return
+    # Sharded: the session is on the shard of the user the request is about
+    async with shard_set.session(await shard_for_request(shard_set, request)) as session:
         yield session
 
+async def get_user_loader(db: AsyncSession = Depends(get_db_session)) -> DataLoader[int, User]:
+    """One user DataLoader per request (FastAPI caches dependency results per request)."""
+    return user_loader(db, shards=shard_set if shard_set.enabled else None)
+
 # async def get_redis_client() -> AsyncGenerator[AsyncRedis, None]:
 #     async with get_redis_connection() as redis_client:
 #         yield redis_client
@@ -44,6 +63,9 @@ async def get_current_user(
     token_payload = await security.decode_token(token) # Use the new decode_token function
     if token_payload is None or token_payload.sub is None:
         raise credentials_exception
+    # Local Bloom-filter bit test in the common case; only a hit consults the set of record
+    if token_payload.fam and await revocation_store.is_revoked(db, token_payload.fam):
+        raise credentials_exception
     
     # Assuming 'sub' in token payload is the username
     # If 'sub' is user_id, you would use crud_user.get_user_by_id
@@ -51,6 +73,8 @@ async def get_current_user(
     
     if user is None:
         raise credentials_exception
+    activity_tracker.record_seen(user.id)
+    logging_config.bind(user_id=user.id)
     return user
 
 async def get_current_active_user(
@@ -60,12 +84,117 @@ async def get_current_active_user(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
     return current_user
 
-# Optional: Dependency for superuser
-# async def get_current_active_superuser(
-#     current_user: User = Depends(get_current_active_user),
-# ) -> User:
-#     if not current_user.is_superuser:
-#         raise HTTPException(
-#             status_code=status.HTTP_403_FORBIDDEN, detail="The user doesn\'t have enough privileges"
-#         )
-#     return current_user 
\ No newline at end of file
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_token_payload(token: str = Depends(oauth2_scheme)) -> TokenPayload:
+    """The verified bearer token; decoded once per request, however many dependencies need it."""
+    token_payload = await security.decode_token(token)
+    if token_payload is None or token_payload.sub is None:
+        raise _credentials_exception()
+    return token_payload
+
+async def get_current_principal(
+    db: AsyncSession = Depends(get_db_session),
+    token_payload: TokenPayload = Depends(get_token_payload)
+) -> CachedPrincipal:
+    """
+    Like `get_current_user`, but returns an immutable snapshot from the per-worker
+    principal cache. On a hit (and a Bloom-filter miss for revocation) no query runs;
+    use it for read-only routes that only need the user's public fields.
+    """
+    return await principal_for_payload(db, token_payload)
+
+async def authenticate_principal(db: AsyncSession, token: str) -> CachedPrincipal:
+    return await principal_for_payload(db, await get_token_payload(token))
+
+async def principal_for_payload(db: AsyncSession, token_payload: TokenPayload) -> CachedPrincipal:
+    credentials_exception = _credentials_exception()
+    if token_payload.fam and await revocation_store.is_revoked(db, token_payload.fam):
+        raise credentials_exception
+
+    principal = principal_cache.get(token_payload.sub)
+    if principal is None:
+        user = await crud_user.get_user_by_username(db, username=token_payload.sub)
+        if user is None:
+            raise credentials_exception
+        principal = CachedPrincipal.from_user(user)
+        principal_cache.set(principal)
+    activity_tracker.record_seen(principal.id)
+    logging_config.bind(user_id=principal.id)
+    return principal
+
+async def principal_for_token(token: str) -> CachedPrincipal:
+    """
+    `get_current_principal` outside of a request, for WebSockets: the database session
+    (on the user's shard) lasts only for the lookup, not for the life of the socket.
+    """
+    if not shard_set.enabled:
+        session = SessionLocal()
+    else:
+        token_payload = await security.decode_token(token)
+        subject = token_payload.sub if token_payload is not None else None
+        session = shard_set.session(await shard_set.locate(subject) if subject else shard_set.primary)
+    async with session as db:
+        return await authenticate_principal(db, token)
+
+async def get_current_active_principal(
+    principal: CachedPrincipal = Depends(get_current_principal)
+) -> CachedPrincipal:
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+    return principal
+
+async def get_current_active_superuser(
+    current_user: User = Depends(get_current_active_user),
+) -> User:
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="The user doesn't have enough privileges"
+        )
+    return current_user
+
+def require_permissions(*permission_names: str) -> Callable:
+    """
+    Dependency factory authorizing the bearer token against permission names.
+
+    The caller is authenticated like any other route, with `get_current_active_principal`:
+    revoked tokens and inactive users are refused. The check itself is one bitwise AND
+    of the token's `pbits` claim (or the worker's cached bitset for tokens issued
+    without it) against a mask resolved once per worker. Beyond a principal cache miss,
+    the database is only touched to load the registry or compile a missing bitset.
+    Returns the decoded token payload.
+    """
+    async def checker(
+        principal: CachedPrincipal = Depends(get_current_active_principal),
+        payload: TokenPayload = Depends(get_token_payload),
+        db: AsyncSession = Depends(get_db_session),
+    ) -> TokenPayload:
+        mask = permission_registry.mask_for(permission_names)
+        if mask is None:
+            # Unknown name: the registry may predate a newly created permission
+            await permission_registry.load(db)
+            mask = permission_registry.mask_for(permission_names)
+            if mask is None:
+                logger.warning("require_permissions: unknown permission in %s", permission_names)
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+
+        if payload.pbits is not None:
+            bits = decode_bits(payload.pbits)
+        else:
+            bits = permission_bits_cache.get(principal.username)
+            if bits is None:
+                user = await crud_user.get_user_by_username(db, username=principal.username)
+                if user is None:
+                    raise _credentials_exception()
+                bits = await crud_role.get_permission_bits(db, user)
+
+        if not has_permissions(bits, mask):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+        return payload
+
+    return checker
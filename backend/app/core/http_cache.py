@@ -0,0 +1,120 @@
+"""
+ETags, conditional GETs and per-route Cache-Control.
+
+Routes declare their caching policy with a dependency and hand it the ETag of
+what they are about to return:
+
+    @router.get("/me", response_model=User)
+    async def read_me(
+        principal: CachedPrincipal = Depends(get_current_active_principal),
+        conditional: ConditionalRequest = Depends(Conditional(CachePolicy(private=True, no_cache=True))),
+    ):
+        not_modified = conditional.check(principal.etag)
+        if not_modified is not None:
+            return not_modified
+        return principal.user
+
+`check` puts `ETag` and `Cache-Control` on the 200 response (routes returning
+their own `Response` pass `conditional.headers`). If the client's
+`If-None-Match` already names that ETag, it returns an empty 304 to send
+instead. Computing the ETag must not require building the body. Versioned rows
+(`VersionedMixin`) make it a function of `(id, version)`.
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag (quoted) over `parts`; hashed so ids and versions are not exposed."""
+    digest = hashlib.blake2b(":".join(str(part) for part in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """`If-None-Match` evaluation (RFC 9110 13.1.2): weak comparison, `*` matches anything."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """A route's `Cache-Control` (and `Vary`) headers."""
+    max_age: Optional[int] = None
+    private: bool = False
+    public: bool = False
+    no_cache: bool = False # Cache, but revalidate (with If-None-Match) before every reuse
+    no_store: bool = False
+    must_revalidate: bool = False
+    immutable: bool = False
+    vary: Tuple[str, ...] = ()
+
+    @property
+    def header(self) -> str:
+        directives = []
+        if self.public:
+            directives.append("public")
+        if self.private:
+            directives.append("private")
+        if self.no_store:
+            directives.append("no-store")
+        if self.no_cache:
+            directives.append("no-cache")
+        if self.max_age is not None:
+            directives.append(f"max-age={self.max_age}")
+        if self.must_revalidate:
+            directives.append("must-revalidate")
+        if self.immutable:
+            directives.append("immutable")
+        return ", ".join(directives)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"Cache-Control": self.header} if self.header else {}
+        if self.vary:
+            headers["Vary"] = ", ".join(self.vary)
+        return headers
+
+
+# Per-user resources: any cache may keep them but must revalidate, keyed by credentials
+PRIVATE_REVALIDATE = CachePolicy(private=True, no_cache=True, vary=("Authorization",))
+
+
+class ConditionalRequest:
+    __slots__ = ("if_none_match", "response", "policy", "headers")
+
+    def __init__(self, if_none_match: Optional[str], response: Response, policy: Optional[CachePolicy]):
+        self.if_none_match = if_none_match
+        self.response = response
+        self.policy = policy
+        self.headers: Dict[str, str] = {} # For routes that build their own Response
+
+    def check(self, etag: str) -> Optional[Response]:
+        """Tag the outgoing response with `etag`; return a 304 to send instead if the client has it."""
+        self.headers = {"ETag": etag, **(self.policy.headers if self.policy is not None else {})}
+        if etag_matches(self.if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self.headers)
+        self.response.headers.update(self.headers)
+        return None
+
+
+class Conditional:
+    """Dependency factory: `Depends(Conditional(policy))` yields a `ConditionalRequest`."""
+
+    def __init__(self, policy: Optional[CachePolicy] = None):
+        self.policy = policy
+
+    def __call__(self, request: Request, response: Response) -> ConditionalRequest:
+        return ConditionalRequest(request.headers.get("if-none-match"), response, self.policy)
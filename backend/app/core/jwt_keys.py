@@ -0,0 +1,150 @@
+"""
+JWT signing keys and the published JWKS.
+
+With an asymmetric `ALGORITHM` (ES256/ES384/RS256) tokens are signed with the
+private key from `JWT_PRIVATE_KEY_FILE` and carry its `kid` (RFC 7638 thumbprint)
+in the header. Public keys listed in `JWT_PUBLIC_KEY_FILES` keep verifying after
+a rotation, and all public keys are published at `/.well-known/jwks.json` so
+other services can verify tokens locally (see `app/core/jwt_verifier.py`).
+
+HS256 keeps using the shared `SECRET_KEY` and publishes an empty key set.
+"""
+import base64
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import JWTError, jwk, jwt
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = {"ES256", "ES384", "RS256"}
+_THUMBPRINT_MEMBERS = {"EC": ("crv", "kty", "x", "y"), "RSA": ("e", "kty", "n")}
+
+
+def jwk_thumbprint(public_jwk: Dict[str, Any]) -> str:
+    """RFC 7638 JWK thumbprint, used as the `kid`."""
+    members = {name: public_jwk[name] for name in _THUMBPRINT_MEMBERS[public_jwk["kty"]]}
+    digest = hashlib.sha256(json.dumps(members, separators=(",", ":"), sort_keys=True).encode()).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def generate_private_key_pem(algorithm: str) -> str:
+    """Create a new PEM private key for `algorithm` (used for rotation and local dev)."""
+    if algorithm == "ES256":
+        key = ec.generate_private_key(ec.SECP256R1())
+    elif algorithm == "ES384":
+        key = ec.generate_private_key(ec.SECP384R1())
+    elif algorithm == "RS256":
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise ValueError(f"Unsupported asymmetric JWT algorithm: {algorithm}")
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+@dataclass
+class VerificationKey:
+    kid: str
+    algorithm: str
+    key: Any # Parsed jose key object, reused for every verify
+    public_jwk: Dict[str, Any]
+
+
+class KeyRing:
+    def __init__(
+        self,
+        algorithm: str,
+        private_key_pem: Optional[str] = None,
+        public_key_pems: Optional[List[str]] = None,
+        kid: Optional[str] = None,
+        secret_key: Optional[str] = None,
+    ):
+        """
+        Signing key plus all keys accepted for verification.
+
+        **Parameters**
+
+        * `algorithm`: HS256 or one of `ASYMMETRIC_ALGORITHMS`
+        * `private_key_pem`: active signing key (asymmetric algorithms)
+        * `public_key_pems`: retired public keys still accepted during rotation
+        * `kid`: override for the active key id (defaults to its thumbprint)
+        * `secret_key`: shared secret (HS256)
+        """
+        self.algorithm = algorithm
+        self.asymmetric = algorithm in ASYMMETRIC_ALGORITHMS
+        self._keys: Dict[str, VerificationKey] = {}
+        if not self.asymmetric:
+            self.active_kid: Optional[str] = None
+            self.signing_key: Any = secret_key
+            self.jwks_json = json.dumps({"keys": []}).encode()
+            return
+
+        if private_key_pem is None:
+            raise ValueError(f"{algorithm} requires a private signing key")
+        self.signing_key = jwk.construct(private_key_pem, algorithm)
+        active = self._add_public_key(self.signing_key.public_key(), kid)
+        self.active_kid = active.kid
+        for pem in public_key_pems or []:
+            self._add_public_key(jwk.construct(pem, algorithm))
+        # Serialised once; the JWKS endpoint serves these bytes as-is
+        self.jwks_json = json.dumps(self.jwks()).encode()
+
+    def _add_public_key(self, public_key: Any, kid: Optional[str] = None) -> VerificationKey:
+        public_jwk = public_key.to_dict()
+        kid = kid or jwk_thumbprint(public_jwk)
+        public_jwk.update({"kid": kid, "use": "sig", "alg": self.algorithm})
+        entry = VerificationKey(kid=kid, algorithm=self.algorithm, key=public_key, public_jwk=public_jwk)
+        self._keys[kid] = entry
+        return entry
+
+    def jwks(self) -> Dict[str, Any]:
+        return {"keys": [entry.public_jwk for entry in self._keys.values()]}
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        headers = {"kid": self.active_kid} if self.active_kid else None
+        return jwt.encode(claims, self.signing_key, algorithm=self.algorithm, headers=headers)
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Verify `token` and return its claims; raises `JWTError` on any failure."""
+        if not self.asymmetric:
+            return jwt.decode(token, self.signing_key, algorithms=[self.algorithm])
+        kid = jwt.get_unverified_header(token).get("kid")
+        entry = self._keys.get(kid) if kid else None
+        if entry is None:
+            raise JWTError(f"Unknown signing key id: {kid!r}")
+        return jwt.decode(token, entry.key, algorithms=[entry.algorithm])
+
+    @classmethod
+    def from_settings(cls) -> "KeyRing":
+        if settings.ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+            return cls(settings.ALGORITHM, secret_key=settings.SECRET_KEY)
+        if settings.JWT_PRIVATE_KEY_FILE:
+            private_key_pem = Path(settings.JWT_PRIVATE_KEY_FILE).read_text()
+        else:
+            # Each process would get its own key; only acceptable for a single-process dev server
+            logger.warning(
+                "JWT_PRIVATE_KEY_FILE is not set; using an ephemeral %s key. "
+                "Tokens will not survive restarts or verify across workers.",
+                settings.ALGORITHM,
+            )
+            private_key_pem = generate_private_key_pem(settings.ALGORITHM)
+        public_key_pems = [Path(path).read_text() for path in settings.JWT_PUBLIC_KEY_FILES]
+        return cls(
+            settings.ALGORITHM,
+            private_key_pem=private_key_pem,
+            public_key_pems=public_key_pems,
+        )
+
+
+keyring = KeyRing.from_settings()
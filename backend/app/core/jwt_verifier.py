@@ -0,0 +1,123 @@
+"""
+Local verification of our access tokens for downstream services.
+
+Only depends on python-jose and the standard library, so other services can
+vendor or import it. Public keys are fetched from `/.well-known/jwks.json`
+once, parsed, and kept in memory; every later `verify` is a dictionary lookup
+by `kid` plus a signature check, with no network hop. An unknown `kid` (the
+issuer rotated keys) triggers a rate-limited refresh.
+
+    verifier = JWKSVerifier("https://auth.internal/.well-known/jwks.json")
+    claims = verifier.verify(token)
+"""
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from jose import JWTError, jwk, jwt
+
+JWKSFetcher = Callable[[], Dict[str, Any]]
+
+
+def _http_fetcher(url: str, timeout: float) -> JWKSFetcher:
+    def fetch() -> Dict[str, Any]:
+        with urllib.request.urlopen(url, timeout=timeout) as response: # noqa: S310 (URL comes from config)
+            return json.loads(response.read())
+    return fetch
+
+
+class JWKSVerifier:
+    def __init__(
+        self,
+        jwks_url: Optional[str] = None,
+        *,
+        jwks: Optional[Dict[str, Any]] = None,
+        fetcher: Optional[JWKSFetcher] = None,
+        algorithms: Iterable[str] = ("ES256", "ES384", "RS256"),
+        min_refresh_interval: float = 30.0,
+        timeout: float = 5.0,
+        audience: Optional[str] = None,
+        issuer: Optional[str] = None,
+    ):
+        """
+        Verify JWTs against a cached JWKS.
+
+        **Parameters**
+
+        * `jwks_url`: where to fetch the key set from
+        * `jwks`: an already loaded key set (skips the initial fetch)
+        * `fetcher`: custom callable returning the key set (overrides `jwks_url`)
+        * `algorithms`: accepted signing algorithms; HS* is never accepted here
+        * `min_refresh_interval`: seconds between refreshes triggered by unknown `kid`s
+        """
+        if fetcher is None and jwks_url is not None:
+            fetcher = _http_fetcher(jwks_url, timeout)
+        if fetcher is None and jwks is None:
+            raise ValueError("Provide jwks_url, fetcher or an initial jwks")
+        self._fetcher = fetcher
+        self.algorithms = [alg for alg in algorithms if not alg.startswith("HS")]
+        self.min_refresh_interval = min_refresh_interval
+        self.audience = audience
+        self.issuer = issuer
+        self._keys: Dict[str, Any] = {}
+        self._last_refresh = -float("inf")
+        self._lock = threading.Lock()
+        if jwks is not None:
+            self.load(jwks)
+
+    @property
+    def key_ids(self) -> list:
+        return list(self._keys)
+
+    def load(self, jwks: Dict[str, Any]) -> None:
+        """Parse a JWKS document and replace the in-memory key set."""
+        keys = {}
+        for entry in jwks.get("keys", []):
+            alg = entry.get("alg")
+            if not entry.get("kid") or alg not in self.algorithms:
+                continue
+            keys[entry["kid"]] = jwk.construct(entry, alg)
+        self._keys = keys
+
+    def refresh(self, force: bool = False) -> bool:
+        """Refetch the key set unless it was refreshed less than `min_refresh_interval` ago."""
+        if self._fetcher is None:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.min_refresh_interval:
+                return False
+            self._last_refresh = now
+            self.load(self._fetcher())
+        return True
+
+    def _key_for(self, token: str) -> Any:
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        if header.get("alg") not in self.algorithms:
+            raise JWTError(f"Algorithm {header.get('alg')!r} is not accepted")
+        if kid not in self._keys:
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown signing key id: {kid!r}")
+        return key
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the verified claims; raises `JWTError` if the token is invalid."""
+        key = self._key_for(token)
+        options = {"verify_aud": self.audience is not None}
+        return jwt.decode(
+            token, key, algorithms=self.algorithms,
+            audience=self.audience, issuer=self.issuer, options=options,
+        )
+
+    async def averify(self, token: str) -> Dict[str, Any]:
+        """Like `verify`, but a needed JWKS refresh runs in a thread instead of on the loop."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in self._keys:
+            await asyncio.to_thread(self.refresh)
+        return self.verify(token)
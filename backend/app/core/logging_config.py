@@ -0,0 +1,259 @@
+"""
+Non-blocking, structured logging configured from `Settings`.
+
+`configure_logging()` (application startup) installs a single handler on the
+root logger: a `QueueHandler` that does only cheap work on the calling thread,
+usually the event loop. It renders the message, stamps the record with the
+current request context and puts it on a bounded queue. A `QueueListener`
+thread formats records (one JSON object per line by default, via orjson when it
+is installed) and writes them to stdout or `LOG_FILE`. When the queue is full,
+records are dropped and counted rather than blocking the loop.
+
+`RequestContextMiddleware` gives each HTTP request a context: a request id
+(taken from a well-formed `X-Request-ID` header, or generated, and echoed on the
+response), the matched route template, and whatever is `bind()`-ed later, such
+as the user id from the auth dependencies. Every record logged while serving
+the request carries these fields. The middleware also writes one `app.access`
+line per request.
+
+Unless `LOG_CALLER_INFO` is set, records skip the stack walk that finds the
+calling file, function and line (`findCaller`), which is the largest part of
+creating a record.
+
+DEBUG records are sampled: with `LOG_DEBUG_SAMPLE_RATE` below 1, that fraction
+of requests keep all their debug logs, and the rest keep none. Outside a
+request, the same rate applies per record.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError: # pragma: no cover - orjson ships with the default dependency set
+    orjson = None
+
+access_logger = logging.getLogger("app.access")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Per-request fields. A dict rather than one ContextVar per field, so values bound
+# in a dependency are seen by the middleware even if that ran in a copied context.
+_request_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_request_context", default=None)
+
+_INTERNAL_CONTEXT_KEYS = frozenset({"scope", "sampled"})
+
+# LogRecord's own attributes; anything else on a record came from `extra=` and is emitted
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def bind(**fields: Any) -> None:
+    """Attach fields (e.g. `user_id`) to every log record of the current request."""
+    context = _request_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def current_request_id() -> Optional[str]:
+    context = _request_context.get()
+    return context["request_id"] if context is not None else None
+
+
+def _route(context: Dict[str, Any]) -> str:
+    scope = context["scope"]
+    matched = scope.get("route") # Set by the router once the request has been matched
+    return getattr(matched, "path", None) or scope["path"]
+
+
+if orjson is not None:
+    def _dumps(entry: Dict[str, Any]) -> str:
+        return orjson.dumps(entry, default=str).decode()
+else:
+    def _dumps(entry: Dict[str, Any]) -> str:
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per record: timestamp, level, logger, message, context and extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return _dumps(entry)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Request-path half of the pipeline: sample, stamp context, enqueue without blocking."""
+
+    def __init__(self, log_queue: queue.Queue, debug_sample_rate: float = 1.0):
+        super().__init__(log_queue)
+        self.debug_sample_rate = debug_sample_rate
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            context = _request_context.get()
+            if context is None:
+                sampled = random.random() < self.debug_sample_rate
+            else:
+                sampled = context.get("sampled")
+                if sampled is None: # Decided once per request, so a kept request keeps all its debug logs
+                    sampled = context["sampled"] = random.random() < self.debug_sample_rate
+            if not sampled:
+                self.sampled_out += 1
+                return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message now: its args may be mutated once the logging call returns.
+        # JSON encoding and I/O are left to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        context = _request_context.get()
+        if context is None:
+            record.request_id = record.route = None
+        else:
+            record.route = _route(context)
+            for key, value in context.items(): # request_id plus whatever was bind()-ed
+                if key not in _INTERNAL_CONTEXT_KEYS:
+                    setattr(record, key, value)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestContextMiddleware:
+    """ASGI middleware: request id and context for log records, plus the access log line."""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = _incoming_request_id(scope) or uuid.uuid4().hex
+        token = _request_context.set({"request_id": request_id, "scope": scope})
+        header = (b"x-request-id", request_id.encode())
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_request_id(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s %s %d", scope["method"], scope["path"], status_code,
+                    extra={
+                        "method": scope["method"],
+                        "status": status_code,
+                        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                    },
+                )
+            _request_context.reset(token)
+
+
+def _incoming_request_id(scope: Dict[str, Any]) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            candidate = value.decode("latin-1")
+            return candidate if _REQUEST_ID_PATTERN.fullmatch(candidate) else None
+    return None
+
+
+_SRCFILE = logging._srcfile
+_listener: Optional[logging.handlers.QueueListener] = None
+queue_handler: Optional[ContextQueueHandler] = None
+
+
+def configure_logging(output: Optional[logging.Handler] = None) -> ContextQueueHandler:
+    """
+    Route the root logger (and uvicorn's loggers) through the queue pipeline.
+
+    `output` overrides the handler the listener thread writes to; by default it
+    is stdout, or `LOG_FILE` (reopened when rotated externally).
+    """
+    global _listener, queue_handler
+    stop_logging()
+    if output is None:
+        output = logging.handlers.WatchedFileHandler(settings.LOG_FILE) if settings.LOG_FILE else logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = ContextQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE), settings.LOG_DEBUG_SAMPLE_RATE)
+    # Documented switches that make LogRecord creation cheaper (see "Optimization" in the logging HOWTO)
+    logging._srcfile = _SRCFILE if settings.LOG_CALLER_INFO else None
+    logging.logMultiprocessing = False
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [] # Their default handlers write synchronously on the loop
+        uvicorn_logger.propagate = True
+    # app.access carries the request id and route template; uvicorn's line would duplicate it
+    logging.getLogger("uvicorn.access").disabled = settings.LOG_ACCESS
+    access_logger.setLevel(logging.INFO if settings.LOG_ACCESS else logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop() # Processes everything already queued before returning
+        _listener = None
+
+
+def snapshot() -> Dict[str, Any]:
+    if queue_handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queued": queue_handler.queue.qsize(),
+        "dropped": queue_handler.dropped,
+        "sampled_out": queue_handler.sampled_out,
+    }
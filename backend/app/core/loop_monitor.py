@@ -0,0 +1,257 @@
+"""
+Event-loop blocking detector.
+
+A daemon thread posts a heartbeat callback onto the asyncio loop at a fixed
+interval and waits for it to run. If the heartbeat is not processed within the
+threshold, the loop is stuck in synchronous code (bcrypt, JWT, heavy pydantic
+validation, ...): the watchdog captures the loop thread's stack *while it is
+still blocked*, attributes the stall to the HTTP route being served, and
+exports it as a structured log record plus in-process counters.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopBlockedError(AssertionError):
+    """Raised by `LoopWatchdog.assert_no_stalls` when the loop was blocked."""
+
+
+@dataclass
+class LoopStall:
+    """A single detected stall of the event loop."""
+    duration_ms: float
+    route: Optional[str]
+    method: Optional[str]
+    stack: List[str]
+    started_at: float # Wall clock (time.time()) when the blocked heartbeat was posted
+
+    def as_log_extra(self) -> Dict[str, Any]:
+        return {
+            "duration_ms": round(self.duration_ms, 2),
+            "route": self.route,
+            "method": self.method,
+            "stack": "".join(self.stack),
+        }
+
+
+@dataclass
+class LoopStallStats:
+    """Counters exported by the watchdog."""
+    heartbeats_total: int = 0
+    stalls_total: int = 0
+    stall_ms_total: float = 0.0
+    max_stall_ms: float = 0.0
+    last_lag_ms: float = 0.0
+    max_lag_ms: float = 0.0
+    stalls_by_route: Counter = field(default_factory=Counter)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "heartbeats_total": self.heartbeats_total,
+            "stalls_total": self.stalls_total,
+            "stall_ms_total": round(self.stall_ms_total, 2),
+            "max_stall_ms": round(self.max_stall_ms, 2),
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "stalls_by_route": dict(self.stalls_by_route),
+        }
+
+
+class _Heartbeat:
+    """Callback scheduled on the loop; records when the loop got to it."""
+    __slots__ = ("event", "ran_at")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.ran_at = 0.0
+
+    def __call__(self) -> None:
+        self.ran_at = time.perf_counter()
+        self.event.set()
+
+
+def _find_request_scope(frame: Optional[FrameType]) -> Optional[Dict[str, Any]]:
+    """
+    Walk outwards from the blocked frame looking for the ASGI scope.
+
+    While a coroutine runs, its frame's `f_back` is the coroutine awaiting it, so
+    the chain leads through the endpoint and routing layers, which keep `scope`
+    as a local. The innermost scope carrying a matched `route` wins.
+    """
+    fallback = None
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+            if "route" in scope:
+                return scope
+            if fallback is None:
+                fallback = scope
+        frame = frame.f_back
+    return fallback
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        threshold_ms: float = 100.0,
+        interval_ms: float = 50.0,
+        stack_limit: int = 40,
+        history_size: int = 100,
+    ):
+        """
+        Measure event-loop lag continuously from a side thread.
+
+        **Parameters**
+
+        * `threshold_ms`: heartbeat delay above which the loop counts as blocked
+        * `interval_ms`: pause between heartbeats when the loop is healthy
+        * `stack_limit`: max frames kept from the captured stack
+        * `history_size`: number of recent stalls kept for inspection
+        """
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.stack_limit = stack_limit
+        self.stats = LoopStallStats()
+        self.stalls: Deque[LoopStall] = deque(maxlen=history_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Start watching `loop`; must be called from the loop's own thread."""
+        if self.running:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = LoopStallStats()
+            self.stalls.clear()
+
+    def assert_no_stalls(self, max_ms: Optional[float] = None) -> None:
+        """Fail if any recorded stall lasted longer than `max_ms` (default: threshold)."""
+        limit = self.threshold_ms if max_ms is None else max_ms
+        with self._lock:
+            offenders = [s for s in self.stalls if s.duration_ms > limit]
+        if offenders:
+            worst = max(offenders, key=lambda s: s.duration_ms)
+            raise LoopBlockedError(
+                f"Event loop blocked {len(offenders)} time(s) for more than {limit:.0f} ms; "
+                f"worst {worst.duration_ms:.1f} ms in {worst.method or '-'} {worst.route or '<no request>'}:\n"
+                + "".join(worst.stack)
+            )
+
+    def _run(self) -> None:
+        threshold_s = self.threshold_ms / 1000
+        interval_s = self.interval_ms / 1000
+        while not self._stop.is_set():
+            beat = _Heartbeat()
+            posted_at = time.perf_counter()
+            try:
+                self._loop.call_soon_threadsafe(beat)
+            except RuntimeError: # Loop closed underneath us
+                return
+            if not beat.event.wait(threshold_s):
+                stall = self._capture_stall(posted_at)
+                # Wait for the loop to recover so the full stall duration is measured
+                while not beat.event.wait(0.05):
+                    if self._stop.is_set() or self._loop.is_closed():
+                        return
+                stall.duration_ms = (beat.ran_at - posted_at) * 1000
+                self._record_stall(stall)
+            lag_ms = (beat.ran_at - posted_at) * 1000
+            with self._lock:
+                self.stats.heartbeats_total += 1
+                self.stats.last_lag_ms = lag_ms
+                self.stats.max_lag_ms = max(self.stats.max_lag_ms, lag_ms)
+            self._stop.wait(interval_s)
+
+    def _capture_stall(self, posted_at: float) -> LoopStall:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-self.stack_limit:] if frame else []
+        scope = _find_request_scope(frame)
+        route = method = None
+        if scope is not None:
+            matched = scope.get("route")
+            route = getattr(matched, "path", None) or scope.get("path")
+            method = scope.get("method")
+        return LoopStall(
+            duration_ms=(time.perf_counter() - posted_at) * 1000,
+            route=route,
+            method=method,
+            stack=stack,
+            started_at=time.time() - (time.perf_counter() - posted_at),
+        )
+
+    def _record_stall(self, stall: LoopStall) -> None:
+        with self._lock:
+            self.stats.stalls_total += 1
+            self.stats.stall_ms_total += stall.duration_ms
+            self.stats.max_stall_ms = max(self.stats.max_stall_ms, stall.duration_ms)
+            self.stats.stalls_by_route[stall.route or "<no request>"] += 1
+            self.stalls.append(stall)
+        logger.warning(
+            "Event loop blocked for %.1f ms in %s %s",
+            stall.duration_ms,
+            stall.method or "-",
+            stall.route or "<no request>",
+            extra={"loop_stall": stall.as_log_extra()},
+        )
+
+
+@contextmanager
+def detect_loop_blocking(
+    threshold_ms: float = 100.0, *, fail: bool = True
+) -> Iterator[LoopWatchdog]:
+    """
+    Watch the running loop for the duration of the block (intended for tests).
+
+    With `fail=True`, raises `LoopBlockedError` on exit if any stall exceeded
+    `threshold_ms`.
+    """
+    watchdog = LoopWatchdog(threshold_ms=threshold_ms, interval_ms=min(threshold_ms / 4, 20))
+    watchdog.start()
+    try:
+        yield watchdog
+    finally:
+        watchdog.stop()
+    if fail:
+        watchdog.assert_no_stalls()
+
+
+# Application-wide watchdog, started on app startup when LOOP_MONITOR_ENABLED is set
+watchdog = LoopWatchdog(
+    threshold_ms=settings.LOOP_MONITOR_THRESHOLD_MS,
+    interval_ms=settings.LOOP_MONITOR_INTERVAL_MS,
+)
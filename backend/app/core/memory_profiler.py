@@ -0,0 +1,338 @@
+"""
+Memory diagnostics for finding what a long-running worker keeps alive.
+
+Three views, all served from GET/POST /admin/memory:
+
+* `tracemalloc` allocation tracing, started and stopped at runtime. Named
+  snapshots are kept in memory and can be diffed by file or by line, which
+  shows *where* the memory that stayed allocated was allocated.
+* Live instance counts of every ORM model class (a growing number of `User`
+  objects means something holds on to sessions or loaded rows).
+* The sizes of the in-process caches and buffers that registered themselves
+  with `register_cache`.
+
+A background sampler can take a snapshot every interval and log the lines
+whose allocations grew the most since the previous sample.
+
+Nothing runs unless asked for: tracemalloc hooks every allocation (roughly
+doubling allocation cost and adding ~30-50% memory while on), so it is off
+until started from the admin API, `MEMORY_PROFILER_ENABLED` or
+`track_memory()`. Instance counts walk the whole heap through `gc` and only run
+when requested.
+"""
+import asyncio
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sized, Union
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models.base import Base
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ("lineno", "filename")
+
+# Allocations made by tracemalloc itself and the import machinery are noise in diffs
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+_caches: Dict[str, Callable[[], int]] = {}
+
+
+class TracingNotStartedError(RuntimeError):
+    """Raised when a snapshot is requested while tracemalloc is not tracing."""
+
+
+class MemoryGrowthError(AssertionError):
+    """Raised by `MemoryGrowth.assert_growth_below` when traced memory grew too much."""
+
+
+def register_cache(name: str, size: Union[Sized, Callable[[], int]]) -> None:
+    """Report `len(size)` (or `size()`) as the entry count of cache `name`."""
+    _caches[name] = size.__len__ if isinstance(size, Sized) else size
+
+
+def cache_sizes() -> Dict[str, int]:
+    return {name: size() for name, size in sorted(_caches.items())}
+
+
+def live_model_instances() -> Dict[str, int]:
+    """Number of live instances of each ORM model class, by class name. Walks the heap."""
+    classes = {mapper.class_: mapper.class_.__name__ for mapper in Base.registry.mappers}
+    counts = Counter(classes[cls] for cls in map(type, gc.get_objects()) if cls in classes)
+    return {name: counts.get(name, 0) for name in sorted(classes.values())}
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size; the peak on platforms without /proc."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Bytes on macOS, KiB on Linux
+
+
+@dataclass
+class MemoryStat:
+    """Allocations still alive at one file or line, and how they changed between two snapshots."""
+    location: str # "path:line", or "path" when grouped by file
+    size_bytes: int
+    size_diff_bytes: int
+    count: int
+    count_diff: int
+
+    @classmethod
+    def from_diff(cls, diff: tracemalloc.StatisticDiff, group_by: str) -> "MemoryStat":
+        frame = diff.traceback[0]
+        return cls(
+            location=frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}",
+            size_bytes=diff.size,
+            size_diff_bytes=diff.size_diff,
+            count=diff.count,
+            count_diff=diff.count_diff,
+        )
+
+
+@dataclass
+class NamedSnapshot:
+    name: str
+    taken_at: float # Wall clock
+    traced_bytes: int # Total size of the traced allocations in the snapshot
+    snapshot: tracemalloc.Snapshot
+
+
+def compare_snapshots(
+    old: tracemalloc.Snapshot, new: tracemalloc.Snapshot, group_by: str = "lineno", limit: int = 25
+) -> List[MemoryStat]:
+    """The `limit` locations whose traced size changed the most from `old` to `new`, largest first."""
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {GROUP_BY}")
+    diffs = new.compare_to(old, group_by) # Sorted by absolute size difference
+    return [MemoryStat.from_diff(diff, group_by) for diff in diffs[:limit]]
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+class MemoryProfiler:
+    def __init__(
+        self,
+        frames: int = 1,
+        snapshots_kept: int = 10,
+        sample_interval: float = 60.0,
+        sample_top: int = 10,
+    ):
+        """
+        Runtime-controlled tracemalloc plus a periodic growth sampler.
+
+        **Parameters**
+
+        * `frames`: stack frames stored per allocation; 1 is enough to group by line
+        * `snapshots_kept`: named snapshots kept, the oldest is dropped first
+        * `sample_interval`: seconds between the sampler's snapshots
+        * `sample_top`: growing lines logged per sample
+        """
+        self.frames = frames
+        self.snapshots_kept = snapshots_kept
+        self.sample_interval = sample_interval
+        self.sample_top = sample_top
+        self.snapshots: "OrderedDict[str, NamedSnapshot]" = OrderedDict()
+        self.samples_taken = 0
+        self._sampler_task: Optional[asyncio.Task] = None
+        self._last_sample: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @property
+    def sampling(self) -> bool:
+        return self._sampler_task is not None and not self._sampler_task.done()
+
+    def start(self, frames: Optional[int] = None) -> None:
+        """Start tracing allocations; a no-op if already tracing (with whatever frame depth)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or self.frames)
+
+    def stop(self) -> None:
+        """Stop tracing and drop the snapshots (they hold a copy of every trace)."""
+        tracemalloc.stop()
+        self.snapshots.clear()
+        self._last_sample = None
+
+    def snapshot(self, name: str) -> NamedSnapshot:
+        """Take (or retake) the snapshot called `name`. Blocks for up to seconds on big heaps."""
+        if not tracemalloc.is_tracing():
+            raise TracingNotStartedError("Allocation tracing is not running")
+        snapshot = _take_snapshot()
+        named = NamedSnapshot(
+            name=name,
+            taken_at=time.time(),
+            traced_bytes=sum(stat.size for stat in snapshot.statistics("filename")),
+            snapshot=snapshot,
+        )
+        self.snapshots.pop(name, None)
+        self.snapshots[name] = named
+        while len(self.snapshots) > self.snapshots_kept:
+            self.snapshots.popitem(last=False)
+        return named
+
+    def compare(self, old: str, new: str, group_by: str = "lineno", limit: int = 25) -> List[MemoryStat]:
+        """Diff two named snapshots; raises KeyError for an unknown name."""
+        return compare_snapshots(self.snapshots[old].snapshot, self.snapshots[new].snapshot, group_by, limit)
+
+    def status(self, include_instances: bool = False) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": self.tracing,
+            "traceback_frames": tracemalloc.get_traceback_limit() if self.tracing else None,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+            "rss_bytes": rss_bytes(),
+            "gc_counts": list(gc.get_count()),
+            "sampling": self.sampling,
+            "samples_taken": self.samples_taken,
+            "snapshots": [
+                {"name": named.name, "taken_at": named.taken_at, "traced_bytes": named.traced_bytes}
+                for named in self.snapshots.values()
+            ],
+            "caches": cache_sizes(),
+            "live_instances": live_model_instances() if include_instances else None,
+        }
+
+    # --- periodic sampler -------------------------------------------------------------
+    def sample(self) -> List[MemoryStat]:
+        """Snapshot, log and return the top growers since the previous sample (none the first time)."""
+        snapshot = _take_snapshot()
+        previous, self._last_sample = self._last_sample, snapshot
+        self.samples_taken += 1
+        if previous is None:
+            return []
+        growers = [stat for stat in compare_snapshots(previous, snapshot, limit=self.sample_top * 4) if stat.size_diff_bytes > 0]
+        growers = growers[:self.sample_top]
+        current, _ = tracemalloc.get_traced_memory()
+        logger.info(
+            "Traced memory %.1f MiB, top grower %s",
+            current / 2**20,
+            f"{growers[0].location} (+{growers[0].size_diff_bytes / 1024:.1f} KiB)" if growers else "none",
+            extra={"memory_sample": {
+                "traced_bytes": current,
+                "rss_bytes": rss_bytes(),
+                "caches": cache_sizes(),
+                "growers": [asdict(stat) for stat in growers],
+            }},
+        )
+        return growers
+
+    def start_sampler(self, interval: Optional[float] = None) -> None:
+        """Start tracing if needed and log the top growers every `interval` seconds."""
+        if self.sampling:
+            return
+        self.start()
+        interval = interval or self.sample_interval
+
+        async def _loop() -> None:
+            while True:
+                try:
+                    # take_snapshot copies every trace; keep the loop free meanwhile
+                    await run_in_threadpool(self.sample)
+                except Exception:
+                    logger.exception("Memory sample failed")
+                await asyncio.sleep(interval)
+
+        self._sampler_task = asyncio.create_task(_loop(), name="memory-sampler")
+
+    async def stop_sampler(self) -> None:
+        if self._sampler_task is not None:
+            self._sampler_task.cancel()
+            try:
+                await self._sampler_task
+            except asyncio.CancelledError:
+                pass
+            self._sampler_task = None
+            self._last_sample = None
+
+    @classmethod
+    def from_settings(cls) -> "MemoryProfiler":
+        return cls(
+            frames=settings.MEMORY_PROFILER_FRAMES,
+            snapshots_kept=settings.MEMORY_PROFILER_SNAPSHOTS_KEPT,
+            sample_interval=settings.MEMORY_SAMPLER_INTERVAL_SECONDS,
+            sample_top=settings.MEMORY_SAMPLER_TOP,
+        )
+
+
+class MemoryGrowth:
+    """Traced memory between the start and the end of a `track_memory()` block."""
+
+    def __init__(self, before: tracemalloc.Snapshot):
+        self.before = before
+        self.after: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def growth_bytes(self) -> int:
+        after = self.after if self.after is not None else _take_snapshot()
+        return sum(stat.size_diff for stat in after.compare_to(self.before, "filename"))
+
+    def top(self, limit: int = 10, group_by: str = "lineno") -> List[MemoryStat]:
+        after = self.after if self.after is not None else _take_snapshot()
+        return compare_snapshots(self.before, after, group_by, limit)
+
+    def assert_growth_below(self, max_bytes: int) -> None:
+        growth = self.growth_bytes
+        if growth > max_bytes:
+            lines = "\n".join(
+                f"  {stat.location}: {stat.size_diff_bytes:+,} B in {stat.count_diff:+,} blocks"
+                for stat in self.top(10)
+            )
+            raise MemoryGrowthError(
+                f"Traced memory grew by {growth:,} bytes, more than {max_bytes:,}; top growers:\n{lines}"
+            )
+
+
+@contextmanager
+def track_memory(frames: int = 1) -> Iterator[MemoryGrowth]:
+    """
+    Measure what stays allocated across the block (for soak tests and benchmarks).
+
+    Tracing is started if needed and stopped again on exit if it was started
+    here. Garbage is collected before both snapshots, so only memory something
+    still references counts as growth.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    try:
+        gc.collect()
+        growth = MemoryGrowth(_take_snapshot())
+        yield growth
+        gc.collect()
+        growth.after = _take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+# Application-wide profiler; tracing and the sampler start on app startup when MEMORY_PROFILER_ENABLED is set
+memory_profiler = MemoryProfiler.from_settings()
@@ -0,0 +1,101 @@
+"""
+Compiled permission bitsets.
+
+Each permission owns a fixed bit (`Permission.bit`). A user's effective
+permissions, from roles plus direct grants, compile to a single Python int. The
+int is cached per user and embedded in access tokens as the hex `pbits` claim.
+Checking `require_permissions("users:read", "users:write")` is then one bitwise
+AND against a mask computed once from the name->bit registry.
+
+Superusers are encoded as `SUPERUSER_BITS` ("*"), which passes every check.
+"""
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+from app.models.role import Permission
+
+SUPERUSER_BITS = -1 # Every bit set (Python ints are infinite two's complement)
+SUPERUSER_CLAIM = "*"
+
+
+def encode_bits(bits: int) -> str:
+    return SUPERUSER_CLAIM if bits == SUPERUSER_BITS else format(bits, "x")
+
+
+def decode_bits(claim: str) -> int:
+    return SUPERUSER_BITS if claim == SUPERUSER_CLAIM else int(claim, 16)
+
+
+def has_permissions(bits: int, mask: int) -> bool:
+    return bits & mask == mask
+
+
+class PermissionRegistry:
+    """In-memory name -> bit map, loaded from the `permissions` table."""
+
+    def __init__(self) -> None:
+        self.bits: Dict[str, int] = {}
+        self.loaded = False
+        self._masks: Dict[Tuple[str, ...], int] = {}
+
+    async def load(self, db: AsyncSession) -> None:
+        shards = db.info.get("shards")
+        if shards is not None and db.info["shard"] != shards.primary:
+            # Bits are allocated on the primary shard; the other shards may lag behind it
+            async with shards.session(shards.primary) as primary:
+                return await self.load(primary)
+        result = await db.execute(select(Permission.name, Permission.bit))
+        self.bits = {name: bit for name, bit in result.all()}
+        self._masks = {}
+        self.loaded = True
+
+    def mask_for(self, names: Iterable[str]) -> Optional[int]:
+        """Mask of the given permission names, or None if any name is unknown."""
+        key = tuple(names)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = 0
+            for name in key:
+                bit = self.bits.get(name)
+                if bit is None:
+                    return None
+                mask |= 1 << bit
+            self._masks[key] = mask
+        return mask
+
+
+class PermissionBitsCache:
+    """Per-user compiled bitsets with a TTL, so workers pick up role changes made elsewhere."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, int]] = {}
+
+    def get(self, username: str) -> Optional[int]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, username: str, bits: int) -> None:
+        self._entries[username] = (time.monotonic() + self.ttl_seconds, bits)
+
+    def invalidate(self, username: str) -> None:
+        self._entries.pop(username, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+permission_registry = PermissionRegistry()
+permission_bits_cache = PermissionBitsCache(settings.PERMISSION_CACHE_TTL_SECONDS)
+register_cache("permission_bits", permission_bits_cache)
+register_cache("permission_masks", lambda: len(permission_registry._masks))
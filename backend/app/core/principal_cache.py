@@ -0,0 +1,98 @@
+"""
+Per-worker cache of authenticated principals.
+
+Maps a token subject (username) to an immutable snapshot of the user: the
+response schema plus `version`, with the ETag derived from the two. A hit lets
+`GET /auth/me` answer, or return 304, without a database query. The token
+itself is still verified, and the revocation check is a local Bloom-filter test
+in the common case.
+
+ORM updates and deletes of a user in this worker evict it immediately, via
+mapper events. Changes made by other workers become visible within
+`PRINCIPAL_CACHE_TTL_SECONDS`.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from sqlalchemy import event, inspect
+
+from app.core.config import settings
+from app.core.http_cache import make_etag
+from app.core.memory_profiler import register_cache
+from app.models.user import User
+from app.schemas import user as user_schema
+
+
+@dataclass(frozen=True)
+class CachedPrincipal:
+    id: int
+    username: str
+    version: int
+    is_active: bool
+    is_superuser: bool
+    user: user_schema.User
+    etag: str = field(default="", compare=False)
+
+    @classmethod
+    def from_user(cls, user: User) -> "CachedPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            version=user.version,
+            is_active=bool(user.is_active),
+            is_superuser=bool(user.is_superuser),
+            user=user_schema.User.model_validate(user),
+            etag=make_etag("user", user.id, user.version),
+        )
+
+
+class PrincipalCache:
+    """TTL + LRU bounded map of username -> `CachedPrincipal`."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CachedPrincipal]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[CachedPrincipal]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, principal: CachedPrincipal) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[principal.username] = (time.monotonic() + self.ttl_seconds, principal)
+        self._entries.move_to_end(principal.username)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        self._entries.pop(username, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_TTL_SECONDS, settings.PRINCIPAL_CACHE_MAX_ENTRIES)
+register_cache("principal_cache", principal_cache)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict_changed_user(mapper, connection, target: User) -> None:
+    principal_cache.invalidate(target.username)
+    # A rename leaves the old subject cached; evict it too
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        principal_cache.invalidate(old_username)
@@ -2,22 +2,36 @@ import redis.asyncio as redis # Use redis.asyncio for redis-py >= 4.2
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
+from app.core import tracing
 from app.core.config import get_settings
 
 settings = get_settings()
 
 _redis_pool = None
 
-def get_redis_pool_instance() -> redis.ConnectionPool:
+
+class TracedRedis(redis.Redis):
+    """Redis client emitting a tracing span per command when the request is sampled."""
+
+    async def execute_command(self, *args, **options):
+        if tracing.current_span() is None:
+            return await super().execute_command(*args, **options)
+        with tracing.start_span(f"redis {args[0]}", kind=tracing.KIND_CLIENT, attributes={"db.system": "redis"}):
+            return await super().execute_command(*args, **options)
+
+
+def get_redis_pool_instance() -> redis.BlockingConnectionPool:
     """Initializes and returns the Redis connection pool instance."""
     global _redis_pool
     if _redis_pool is None:
-        # For redis-py 5.x, from_url creates an AsyncConnectionPool if redis.asyncio is used
-        _redis_pool = redis.ConnectionPool.from_url(
+        # Blocking: once max_connections are checked out, callers wait up to `timeout`
+        # for one to be returned instead of failing immediately
+        _redis_pool = redis.BlockingConnectionPool.from_url(
             f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}",
             password=settings.REDIS_PASSWORD,
             decode_responses=True,  # Decode responses to str by default
-            max_connections=10 # Example: configure max connections
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT_SECONDS,
         )
     return _redis_pool
 
@@ -26,7 +40,7 @@ async def get_redis_client() -> AsyncGenerator[redis.Redis, None]:
     """Provides an asynchronous Redis client from the connection pool."""
     pool = get_redis_pool_instance()
     # Each call to redis.Redis(connection_pool=pool) gets a connection from the pool
-    client = redis.Redis(connection_pool=pool)
+    client = TracedRedis(connection_pool=pool)
     try:
         yield client
     finally:
@@ -50,6 +64,7 @@ async def close_redis_pool():
         await _redis_pool.disconnect() 
         _redis_pool = None
 
+
 # Example usage in main.py for startup/shutdown:
 # from app.core.redis_client import get_redis_pool_instance, close_redis_pool
 #
@@ -0,0 +1,183 @@
+"""
+Moving users between shards after the layout changes (see app/core/sharding.py).
+
+To add a shard: migrate it (`alembic -x shard=<name> upgrade head`), copy the
+roles/permissions catalogue to it (`copy_catalog`), then append it to
+`SHARD_URLS` and the ring, with the old ring in `SHARD_PREVIOUS_RING` so users
+not moved yet are still found. `reshard` then walks every shard in id order, in
+batches, and moves each user whose username now hashes elsewhere, with their
+refresh tokens and role/permission links. Finally clear `SHARD_PREVIOUS_RING`.
+
+A batch is copied to the target in one transaction (replacing whatever an
+interrupted run left there) and only then deleted from the source, so a run can
+be stopped and restarted at any point. A write to a user between the copy and
+the delete of its batch is lost, so keep batches small on a busy system.
+Catalogue rows are matched by name on the target, which must have them already.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.sharding import ShardSet
+from app.models.refresh_token import RefreshToken
+from app.models.role import Permission, Role, role_permissions, user_permissions, user_roles
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+_users = User.__table__
+_refresh_tokens = RefreshToken.__table__
+_roles = Role.__table__
+_permissions = Permission.__table__
+
+
+class ReshardError(Exception):
+    pass
+
+
+@dataclass
+class ReshardReport:
+    scanned: int = 0
+    moved: Dict[Tuple[str, str], int] = field(default_factory=lambda: defaultdict(int)) # (source, target) -> users
+    dry_run: bool = False
+
+    @property
+    def total_moved(self) -> int:
+        return sum(self.moved.values())
+
+
+async def _names_to_ids(conn: AsyncConnection, table, names: List[str]) -> Dict[str, int]:
+    rows = await conn.execute(select(table.c.name, table.c.id).where(table.c.name.in_(names)))
+    found = dict(rows.all())
+    missing = set(names) - set(found)
+    if missing:
+        raise ReshardError(f"Target shard lacks {table.name} {sorted(missing)}; run copy-catalog first")
+    return found
+
+
+async def move_users(source: AsyncEngine, target: AsyncEngine, user_ids: Sequence[int]) -> None:
+    """Copy users (with tokens, roles and permissions) from `source` to `target`, then delete them from `source`."""
+    user_ids = list(user_ids)
+    async with source.connect() as conn:
+        users = [dict(row) for row in (await conn.execute(select(_users).where(_users.c.id.in_(user_ids)))).mappings()]
+        tokens = [dict(row) for row in (await conn.execute(
+            select(_refresh_tokens).where(_refresh_tokens.c.user_id.in_(user_ids))
+        )).mappings()]
+        role_links = (await conn.execute(
+            select(user_roles.c.user_id, _roles.c.name)
+            .join(_roles, _roles.c.id == user_roles.c.role_id)
+            .where(user_roles.c.user_id.in_(user_ids))
+        )).all()
+        permission_links = (await conn.execute(
+            select(user_permissions.c.user_id, _permissions.c.name)
+            .join(_permissions, _permissions.c.id == user_permissions.c.permission_id)
+            .where(user_permissions.c.user_id.in_(user_ids))
+        )).all()
+    if not users:
+        return
+
+    async with target.begin() as conn:
+        role_ids = await _names_to_ids(conn, _roles, sorted({name for _, name in role_links}))
+        permission_ids = await _names_to_ids(conn, _permissions, sorted({name for _, name in permission_links}))
+        # Leftovers of an interrupted run are replaced, which makes the copy idempotent
+        for table, column in ((user_roles, "user_id"), (user_permissions, "user_id"), (_refresh_tokens, "user_id"), (_users, "id")):
+            await conn.execute(delete(table).where(table.c[column].in_(user_ids)))
+        await conn.execute(insert(_users), users)
+        if tokens:
+            await conn.execute(insert(_refresh_tokens), tokens)
+        if role_links:
+            await conn.execute(insert(user_roles), [{"user_id": user_id, "role_id": role_ids[name]} for user_id, name in role_links])
+        if permission_links:
+            await conn.execute(
+                insert(user_permissions),
+                [{"user_id": user_id, "permission_id": permission_ids[name]} for user_id, name in permission_links],
+            )
+
+    async with source.begin() as conn:
+        # Children first: SQLite does not enforce the ON DELETE CASCADE foreign keys by default
+        for table, column in ((user_roles, "user_id"), (user_permissions, "user_id"), (_refresh_tokens, "user_id"), (_users, "id")):
+            await conn.execute(delete(table).where(table.c[column].in_(user_ids)))
+
+
+async def reshard(
+    shards: ShardSet,
+    *,
+    sources: Optional[Sequence[str]] = None,
+    batch_size: int = 500,
+    sleep: float = 0.0,
+    dry_run: bool = False,
+) -> ReshardReport:
+    """Move every user not on `shards.shard_for(username)` there; with `dry_run`, only count them."""
+    report = ReshardReport(dry_run=dry_run)
+    for source in sources or shards.names:
+        engine = shards.engines[source]
+        after = None
+        while True:
+            statement = select(_users.c.id, _users.c.username).order_by(_users.c.id).limit(batch_size)
+            if after is not None:
+                statement = statement.where(_users.c.id > after)
+            async with engine.connect() as conn:
+                rows = (await conn.execute(statement)).all()
+            if not rows:
+                break
+            after = rows[-1].id
+            report.scanned += len(rows)
+            moves: Dict[str, List[int]] = defaultdict(list)
+            for user_id, username in rows:
+                target = shards.shard_for(username)
+                if target != source:
+                    moves[target].append(user_id)
+            for target, user_ids in moves.items():
+                if not dry_run:
+                    await move_users(engine, shards.engines[target], user_ids)
+                report.moved[(source, target)] += len(user_ids)
+                logger.info("%s %d users %s -> %s", "Would move" if dry_run else "Moved", len(user_ids), source, target)
+            if sleep:
+                await asyncio.sleep(sleep) # Leave room for live traffic between batches
+    return report
+
+
+async def copy_catalog(shards: ShardSet, source: Optional[str] = None) -> List[str]:
+    """Make roles, permissions and their grants on every other shard match `source` (default: the first shard)."""
+    source = source or shards.primary
+    async with shards.engines[source].connect() as conn:
+        catalog = {
+            table: [dict(row) for row in (await conn.execute(select(table))).mappings()]
+            for table in (_roles, _permissions)
+        }
+        grants = set((await conn.execute(select(role_permissions.c.role_id, role_permissions.c.permission_id))).all())
+
+    targets = [name for name in shards.names if name != source]
+    for target in targets:
+        async with shards.engines[target].begin() as conn:
+            for table, rows in catalog.items():
+                existing = set((await conn.execute(select(table.c.id))).scalars())
+                updates = [row for row in rows if row["id"] in existing]
+                inserts = [row for row in rows if row["id"] not in existing]
+                if updates:
+                    # Rows keep their ids, so user links copied by move_users stay valid
+                    columns = [column.name for column in table.columns if column.name != "id"]
+                    await conn.execute(
+                        update(table).where(table.c.id == bindparam("b_id")).values(
+                            {name: bindparam(f"b_{name}") for name in columns}
+                        ),
+                        [{f"b_{key}": value for key, value in row.items()} for row in updates],
+                    )
+                if inserts:
+                    await conn.execute(insert(table), inserts)
+            current = set((await conn.execute(select(role_permissions.c.role_id, role_permissions.c.permission_id))).all())
+            for role_id, permission_id in current - grants:
+                await conn.execute(delete(role_permissions).where(
+                    role_permissions.c.role_id == role_id, role_permissions.c.permission_id == permission_id
+                ))
+            if grants - current:
+                await conn.execute(
+                    insert(role_permissions),
+                    [{"role_id": role_id, "permission_id": permission_id} for role_id, permission_id in grants - current],
+                )
+    return targets
@@ -1,59 +1,184 @@
+import math
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Union, Any, Optional
+from typing import Union, Any, Optional, List, Tuple, Dict
 
-from jose import jwt, JWTError
+from jose import JWTError
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import ValidationError
 
 from app.core.config import settings
+from app.core.jwt_keys import keyring
+from app.core.permissions import encode_bits
+from app.core.tracing import traced
 from app.schemas.token import TokenPayload
 
 ALGORITHM = settings.ALGORITHM
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Lowest costs calibration may pick, whatever the latency target
+MIN_BCRYPT_ROUNDS = 10
+MIN_ARGON2_TIME_COST = 2
+_CALIBRATION_PASSWORD = "calibration-Password-123"
+
+
+def build_pwd_context(
+    schemes: Optional[List[str]] = None,
+    bcrypt_rounds: Optional[int] = None,
+    argon2_time_cost: Optional[int] = None,
+) -> CryptContext:
+    """
+    Build the password hashing context from settings.
+
+    Every scheme but the first is deprecated, and the configured cost is also the
+    minimum, so `needs_update` flags hashes made with an old scheme or a lower cost.
+    """
+    schemes = schemes or settings.PASSWORD_HASH_SCHEMES
+    bcrypt_rounds = bcrypt_rounds or settings.BCRYPT_ROUNDS
+    argon2_time_cost = argon2_time_cost or settings.ARGON2_TIME_COST
+    options: Dict[str, Any] = {"schemes": schemes, "deprecated": "auto"}
+    if "bcrypt" in schemes:
+        options["bcrypt__rounds"] = bcrypt_rounds
+        options["bcrypt__min_rounds"] = bcrypt_rounds
+    if "argon2" in schemes:
+        options["argon2__rounds"] = argon2_time_cost
+        options["argon2__min_rounds"] = argon2_time_cost
+        options["argon2__memory_cost"] = settings.ARGON2_MEMORY_COST
+        options["argon2__parallelism"] = settings.ARGON2_PARALLELISM
+    return CryptContext(**options)
+
+
+# Password hashing context (rebuilt by configure_password_hashing when calibrating)
+pwd_context = build_pwd_context()
+
+
+def measure_verify_ms(scheme: str, cost: int, repeat: int = 3) -> float:
+    """Best-of-`repeat` time in ms to verify one password with `scheme` at `cost`."""
+    context = build_pwd_context(schemes=[scheme], bcrypt_rounds=cost, argon2_time_cost=cost)
+    hashed = context.hash(_CALIBRATION_PASSWORD)
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        context.verify(_CALIBRATION_PASSWORD, hashed)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def calibrate_hash_cost(
+    scheme: str,
+    target_ms: float,
+    min_cost: Optional[int] = None,
+    max_cost: Optional[int] = None,
+) -> int:
+    """
+    Return the highest cost whose verify time stays within `target_ms` on this machine.
+
+    bcrypt cost is log2(rounds), so time doubles per step; argon2 `time_cost` is
+    linear. One probe gives the slope, a second one at the estimate corrects it.
+    The result never goes below the scheme's security floor.
+    """
+    if scheme == "bcrypt":
+        floor, ceiling = min_cost or MIN_BCRYPT_ROUNDS, max_cost or 31
+        probe = max(4, min(floor, 8))
+        estimate = probe + int(math.floor(math.log2(target_ms / measure_verify_ms(scheme, probe))))
+    elif scheme == "argon2":
+        floor, ceiling = min_cost or MIN_ARGON2_TIME_COST, max_cost or 64
+        probe = 1
+        estimate = int(target_ms // measure_verify_ms(scheme, probe))
+    else:
+        raise ValueError(f"Cannot calibrate unsupported hash scheme {scheme!r}")
+
+    cost = max(floor, min(ceiling, estimate))
+    while cost > floor and measure_verify_ms(scheme, cost) > target_ms:
+        cost -= 1
+    return cost
+
+
+def configure_password_hashing(target_ms: Optional[float] = None) -> CryptContext:
+    """Rebuild `pwd_context`, calibrating the default scheme's cost if a target is given."""
+    global pwd_context
+    target_ms = target_ms if target_ms is not None else settings.PASSWORD_HASH_TARGET_MS
+    scheme = settings.PASSWORD_HASH_SCHEMES[0]
+    if target_ms:
+        cost = calibrate_hash_cost(scheme, target_ms)
+        # Only the calibrated scheme's cost; deprecated schemes keep their configured one
+        cost_option = "bcrypt_rounds" if scheme == "bcrypt" else "argon2_time_cost"
+        pwd_context = build_pwd_context(**{cost_option: cost})
+    else:
+        pwd_context = build_pwd_context()
+    return pwd_context
 
 # OAuth2 scheme for token authentication
 # tokenUrl should point to your token generation endpoint (e.g., /api/v1/auth/login)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def create_access_token(subject: Union[str, Any], expires_delta: Optional[timedelta] = None) -> str:
+@traced()
+def create_access_token(
+    subject: Union[str, Any],
+    expires_delta: Optional[timedelta] = None,
+    family_id: Optional[str] = None,
+    permission_bits: Optional[int] = None,
+) -> str:
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode = {"exp": expire, "sub": str(subject)}
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+    if family_id:
+        to_encode["fam"] = family_id # Revoking the refresh-token family also revokes this token
+    if permission_bits is not None:
+        to_encode["pbits"] = encode_bits(permission_bits)
+    encoded_jwt = keyring.encode(to_encode) # Signed with the active key; asymmetric tokens carry its kid
     return encoded_jwt
 
+@traced()
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+@traced()
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a fresh hash if the stored one uses an outdated scheme/cost."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+@traced()
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-# Placeholder for create_refresh_token if needed
-# def create_refresh_token(
-#     subject: Union[str, Any], expires_delta: timedelta = None
-# ) -> str:
-#     if expires_delta:
-#         expire = datetime.utcnow() + expires_delta
-#     else:
-#         expire = datetime.utcnow() + timedelta(
-#             minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
-#         )
-#     to_encode = {"exp": expire, "sub": str(subject), "type": "refresh"}
-#     encoded_jwt = jwt.encode(to_encode, settings.REFRESH_SECRET_KEY, algorithm=ALGORITHM) # Use a different secret for refresh tokens
-#     return encoded_jwt 
+def create_refresh_token(
+    subject: Union[str, Any],
+    family_id: str,
+    jti: str,
+    expires_at: datetime,
+) -> str:
+    to_encode = {"exp": expires_at, "sub": str(subject), "type": "refresh", "fam": family_id, "jti": jti}
+    return keyring.encode(to_encode)
 
+@traced()
 async def decode_token(token: str) -> Optional[TokenPayload]:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
-        token_data = TokenPayload(sub=payload.get("sub"))
-        if token_data.sub is None:
+        payload = keyring.decode(token)
+        token_data = TokenPayload(
+            sub=payload.get("sub"), type=payload.get("type"), fam=payload.get("fam"),
+            jti=payload.get("jti"), pbits=payload.get("pbits"),
+        )
+        if token_data.sub is None or token_data.type == "refresh": # Refresh tokens are not bearer tokens
             return None
         return token_data
     except (JWTError, ValidationError):
-        return None 
\ No newline at end of file
+        return None
+
+@traced()
+def decode_refresh_token(token: str) -> Optional[TokenPayload]:
+    try:
+        payload = keyring.decode(token)
+        token_data = TokenPayload(
+            sub=payload.get("sub"), type=payload.get("type"), fam=payload.get("fam"), jti=payload.get("jti")
+        )
+    except (JWTError, ValidationError):
+        return None
+    if token_data.type != "refresh" or not (token_data.sub and token_data.fam and token_data.jti):
+        return None
+    return token_data 
\ No newline at end of file
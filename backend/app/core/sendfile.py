@@ -0,0 +1,65 @@
+"""
+File responses that let the server or a proxy copy the bytes (sendfile).
+
+Starlette's `FileResponse` reads the file into Python in 64 KiB chunks and
+sends each one through the ASGI app. `SendfileResponse` keeps its headers and
+its Range / If-Range handling, but hands the copy to something that can use
+`sendfile(2)`, in order of preference:
+
+* the ASGI server, when it offers the `http.response.zerocopysend` extension:
+  the response passes an open file descriptor, an offset and a count;
+* nginx, when `accel_path` is given: the response carries only headers plus
+  `X-Accel-Redirect`, and nginx serves that internal location itself (Range
+  requests included). uvicorn has no zero-copy extension, so this is the
+  production setup behind nginx;
+* otherwise, Starlette's chunked reads (also used for multi-range requests).
+"""
+import os
+from typing import Any, Optional
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class SendfileResponse(FileResponse):
+    def __init__(self, path: str, *args: Any, accel_path: Optional[str] = None, **kwargs: Any):
+        super().__init__(path, *args, **kwargs)
+        self.accel_path = accel_path # Internal nginx location of `path`
+        self._zerocopy = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.accel_path is not None:
+            # nginx computes Content-Length and answers Range requests from the file
+            del self.headers["content-length"]
+            self.headers["x-accel-redirect"] = self.accel_path
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        self._zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _zerocopy_send(self, send: Send, status: int, offset: int, count: int, send_header_only: bool) -> None:
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            await send({"type": ZEROCOPY_EXTENSION, "file": fd, "offset": offset, "count": count, "more_body": False})
+        finally:
+            os.close(fd)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if not self._zerocopy:
+            return await super()._handle_simple(send, send_header_only)
+        count = int(self.headers["content-length"])
+        await self._zerocopy_send(send, self.status_code, 0, count, send_header_only)
+
+    async def _handle_single_range(self, send: Send, start: int, end: int, file_size: int, send_header_only: bool) -> None:
+        if not self._zerocopy:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await self._zerocopy_send(send, 206, start, end - start, send_header_only)
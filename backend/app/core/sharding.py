@@ -0,0 +1,204 @@
+"""
+Optional sharding of user data across several databases.
+
+With `SHARD_URLS` set, each user lives on one shard together with their refresh
+tokens and role/permission links. The shard is found by hashing the username
+onto a consistent-hash ring (`HashRing`), so adding a shard moves only about
+1/N of the users (see scripts/reshard.py). Every shard has the full schema and
+its own copy of the roles/permissions catalogue. The first shard (`primary`)
+owns the catalogue: permission bits are allocated there and copied to other
+shards with the same bit, and the permission registry is loaded from it. Tables
+that are not per user (revoked token families, audit events) stay on
+`DATABASE_URL`.
+
+`deps.get_db_session` opens the request's session on the shard of its routing
+key: the subject of the bearer token, or the `username` (or the refresh token's
+subject) of a JSON body. Requests without one get the first shard. Queries that
+are not about one user, such as search or loading users by id, run on every
+shard concurrently with `ShardSet.scatter_gather` and merge the results.
+
+User ids are unique across shards. Each shard allocates new ids from its own
+block of `SHARD_ID_RANGE` ids, picked by its position in `SHARD_URLS`, and a
+user keeps their id when moved to another shard.
+"""
+import asyncio
+import bisect
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, TypeVar
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.models.user import User
+
+T = TypeVar("T")
+
+# Ids per shard. users.id is a 32-bit INTEGER on PostgreSQL, so this allows 127 shards of
+# ~16.7M users each; widen the column before raising it.
+SHARD_ID_RANGE = 2 ** 24
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing: each shard owns `vnodes` points, a key goes to the next point clockwise."""
+
+    def __init__(self, shards: Sequence[str], vnodes: int = 128):
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted((_hash(f"{shard}#{i}"), shard) for shard in shards for i in range(vnodes))
+        self.shards = list(shards)
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardSet:
+    def __init__(
+        self,
+        urls: Dict[str, str],
+        ring: Sequence[str] = (),
+        previous_ring: Sequence[str] = (),
+        vnodes: int = 128,
+    ):
+        self.urls = dict(urls)
+        self.names = list(self.urls)
+        self.engines: Dict[str, AsyncEngine] = {}
+        self._sessionmakers: Dict[str, sessionmaker] = {}
+        for position, (name, url) in enumerate(self.urls.items()):
+            engine = create_async_engine(
+                url,
+                pool_pre_ping=True,
+                connect_args={"check_same_thread": False} if url.startswith("sqlite") else {},
+            )
+            self.engines[name] = engine
+            # session.info tells shard-aware code (e.g. id allocation in crud.user) where it runs,
+            # and gives it the other shards (e.g. the primary's permission catalogue)
+            self._sessionmakers[name] = sessionmaker(
+                bind=engine,
+                class_=AsyncSession,
+                autoflush=False,
+                expire_on_commit=False,
+                info={"shard": name, "shard_id_base": position * SHARD_ID_RANGE, "shards": self},
+            )
+        for name in [*ring, *previous_ring]:
+            if name not in self.urls:
+                raise ValueError(f"Shard {name!r} is not in SHARD_URLS")
+        self.ring = HashRing(list(ring) or self.names, vnodes) if self.names else None
+        self.previous_ring = HashRing(previous_ring, vnodes) if previous_ring else None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.names)
+
+    @property
+    def primary(self) -> str:
+        return self.names[0]
+
+    def shard_for(self, username: str) -> str:
+        """The shard `username` belongs on in the current layout."""
+        return self.ring.shard_for(username)
+
+    def session(self, shard: str) -> AsyncSession:
+        return self._sessionmakers[shard]()
+
+    async def locate(self, username: str) -> str:
+        """The shard holding `username` now, which differs from `shard_for` only while resharding."""
+        shard = self.shard_for(username)
+        if self.previous_ring is None:
+            return shard
+        previous = self.previous_ring.shard_for(username)
+        if previous == shard:
+            return shard
+        async with self.session(shard) as db:
+            moved = await db.scalar(select(User.id).where(User.username == username))
+        return shard if moved is not None else previous
+
+    async def locate_by_email(self, email: str) -> Optional[str]:
+        async def has_email(db: AsyncSession) -> bool:
+            return await db.scalar(select(User.id).where(User.email == email)) is not None
+
+        found = await self.scatter_gather(has_email)
+        return next((shard for shard in self.names if found[shard]), None)
+
+    async def scatter_gather(
+        self,
+        fn: Callable[[AsyncSession], Awaitable[T]],
+        shards: Optional[Sequence[str]] = None,
+    ) -> Dict[str, T]:
+        """Run `fn` with a session on each shard concurrently; results by shard name."""
+        async def run(shard: str) -> T:
+            async with self.session(shard) as db:
+                return await fn(db)
+
+        shards = list(shards or self.names)
+        results = await asyncio.gather(*(run(shard) for shard in shards))
+        return dict(zip(shards, results))
+
+    async def find_first(self, fn: Callable[[AsyncSession], Awaitable[Optional[T]]]) -> Optional[T]:
+        """The first non-None result of `fn` across shards, in shard order."""
+        results = await self.scatter_gather(fn)
+        return next((result for result in results.values() if result is not None), None)
+
+    async def dispose(self) -> None:
+        for engine in self.engines.values():
+            await engine.dispose()
+
+    @classmethod
+    def from_settings(cls) -> "ShardSet":
+        return cls(
+            settings.SHARD_URLS,
+            ring=settings.SHARD_RING,
+            previous_ring=settings.SHARD_PREVIOUS_RING,
+            vnodes=settings.SHARD_VIRTUAL_NODES,
+        )
+
+
+def _unverified_subject(token: str) -> Optional[str]:
+    # Only picks the shard; the token is verified as usual once the session is open
+    try:
+        subject = jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+    return subject if isinstance(subject, str) else None
+
+
+async def routing_key(request: Request) -> Optional[str]:
+    """The username a request is about, if it names one (see the module docstring)."""
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        return _unverified_subject(authorization[7:])
+    if request.method in ("POST", "PUT", "PATCH") and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body: Any = await request.json() # Cached on the request, so FastAPI does not read it twice
+        except ValueError:
+            return None
+        if isinstance(body, dict):
+            if isinstance(body.get("refresh_token"), str):
+                return _unverified_subject(body["refresh_token"])
+            if isinstance(body.get("username"), str):
+                return body["username"]
+    return None
+
+
+async def shard_for_request(shards: ShardSet, request: Request) -> str:
+    key = await routing_key(request)
+    if key is None:
+        return shards.primary
+    if "@" in key: # Login accepts an email in the username field
+        shard = await shards.locate_by_email(key)
+        if shard is not None:
+            return shard
+    return await shards.locate(key)
+
+
+shard_set = ShardSet.from_settings()
@@ -0,0 +1,84 @@
+"""
+Server-sent events (`text/event-stream`) responses.
+
+`EventSourceResponse` streams the strings of an async iterator, like
+`StreamingResponse`, with two additions for long-lived streams:
+
+* each write must complete within `send_timeout`. A client that stops reading
+  fills the socket buffers until the server's `send` blocks; such a connection
+  is dropped rather than holding its coroutine and buffers indefinitely;
+* the client's disconnect is noticed while the iterator is waiting for the
+  next event, not only on the next write.
+"""
+import asyncio
+import json
+from functools import partial
+from typing import Any, AsyncIterable, Awaitable, Callable, Mapping, Optional, Union
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+HEARTBEAT = ": heartbeat\n\n" # A comment line: keeps proxies from timing out idle streams
+
+
+def format_event(data: Any, event: Optional[str] = None, id: Optional[Union[str, int]] = None) -> str:
+    """One SSE message; `data` is sent as JSON unless it already is a string."""
+    lines = []
+    if event is not None:
+        lines.append(f"event: {event}")
+    if id is not None:
+        lines.append(f"id: {id}")
+    payload = data if isinstance(data, str) else json.dumps(data, separators=(",", ":"))
+    lines.extend(f"data: {line}" for line in payload.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+class EventSourceResponse(StreamingResponse):
+    def __init__(
+        self,
+        content: AsyncIterable[str],
+        send_timeout: float = 10.0,
+        headers: Optional[Mapping[str, str]] = None,
+        background: Optional[BackgroundTask] = None,
+    ):
+        headers = {
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no", # nginx would otherwise hold events back in its buffer
+            **(headers or {}),
+        }
+        super().__init__(content, media_type="text/event-stream", headers=headers, background=background)
+        self.send_timeout = send_timeout
+        self.timed_out = False # The client stopped reading and was dropped
+
+    async def _stream(self, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for chunk in self.body_iterator:
+            try:
+                async with asyncio.timeout(self.send_timeout):
+                    await send({"type": "http.response.body", "body": chunk.encode(self.charset), "more_body": True})
+            except TimeoutError:
+                self.timed_out = True
+                return
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def _wait_for_disconnect(receive: Receive) -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def run_until_first_complete(func: Callable[[], Awaitable[None]]) -> None:
+            await func()
+            task_group.cancel_scope.cancel()
+
+        try:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(run_until_first_complete, partial(self._stream, send))
+                await run_until_first_complete(partial(self._wait_for_disconnect, receive))
+        finally:
+            if hasattr(self.body_iterator, "aclose"):
+                await self.body_iterator.aclose()
+            if self.background is not None:
+                await self.background()
@@ -0,0 +1,212 @@
+"""
+Revocation checks for token families with an in-memory Bloom filter in front.
+
+Every access and refresh token carries the `fam` (family id) of the login that
+produced it. Revoking a family (logout, refresh-token reuse) writes it to the set
+of record, a Redis sorted set when Redis is configured and the
+`revoked_token_families` table otherwise, and adds it to the local Bloom filter.
+
+On the request path, `is_revoked` first tests the Bloom filter. A miss (the
+common case) is a few local bit tests and proves the family was not revoked.
+Only a hit, which is either a real revocation or a false positive at
+`REVOCATION_BLOOM_ERROR_RATE`, costs a lookup in the set of record.
+
+Other workers learn about revocations when their filter is rebuilt from the set
+of record, every `REVOCATION_SYNC_INTERVAL_SECONDS`. The rebuild also drops
+families whose tokens have all expired.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Callable, Iterable, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.redis_client import get_redis_client
+from app.models.refresh_token import RevokedTokenFamily
+
+logger = logging.getLogger(__name__)
+
+REDIS_REVOKED_FAMILIES_KEY = "app:auth:revoked_families"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing on one blake2b digest."""
+    __slots__ = ("size", "hash_count", "bits", "count")
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+
+class DatabaseRevocationRecord:
+    """Revoked families stored in the `revoked_token_families` table."""
+
+    async def add(self, db: AsyncSession, family_id: str, expires_at: datetime, reason: str) -> None:
+        if await db.get(RevokedTokenFamily, family_id) is None:
+            db.add(RevokedTokenFamily(
+                family_id=family_id,
+                revoked_at=datetime.now(timezone.utc),
+                expires_at=expires_at,
+                reason=reason,
+            ))
+            try:
+                await db.commit()
+            except IntegrityError: # Revoked concurrently by another request
+                await db.rollback()
+
+    async def contains(self, db: AsyncSession, family_id: str) -> bool:
+        return await db.get(RevokedTokenFamily, family_id) is not None
+
+    async def active_families(self, db: AsyncSession) -> List[str]:
+        now = datetime.now(timezone.utc)
+        await db.execute(delete(RevokedTokenFamily).where(RevokedTokenFamily.expires_at < now))
+        await db.commit()
+        result = await db.execute(select(RevokedTokenFamily.family_id))
+        return list(result.scalars().all())
+
+
+class PrimaryDatabaseRevocationRecord(DatabaseRevocationRecord):
+    """
+    `revoked_token_families` on `DATABASE_URL` whatever session the caller holds: with
+    sharding, request sessions are on user shards, but revocations must be seen by all.
+    """
+
+    async def add(self, db: AsyncSession, family_id: str, expires_at: datetime, reason: str) -> None:
+        async with SessionLocal() as primary:
+            await super().add(primary, family_id, expires_at, reason)
+
+    async def contains(self, db: AsyncSession, family_id: str) -> bool:
+        async with SessionLocal() as primary:
+            return await super().contains(primary, family_id)
+
+    async def active_families(self, db: AsyncSession) -> List[str]:
+        async with SessionLocal() as primary:
+            return await super().active_families(primary)
+
+
+class RedisRevocationRecord:
+    """Revoked families in a Redis sorted set scored by expiry time, shared by all workers."""
+
+    async def add(self, db: AsyncSession, family_id: str, expires_at: datetime, reason: str) -> None:
+        async with get_redis_client() as redis:
+            await redis.zadd(REDIS_REVOKED_FAMILIES_KEY, {family_id: expires_at.timestamp()})
+
+    async def contains(self, db: AsyncSession, family_id: str) -> bool:
+        async with get_redis_client() as redis:
+            return await redis.zscore(REDIS_REVOKED_FAMILIES_KEY, family_id) is not None
+
+    async def active_families(self, db: AsyncSession) -> List[str]:
+        now = datetime.now(timezone.utc).timestamp()
+        async with get_redis_client() as redis:
+            await redis.zremrangebyscore(REDIS_REVOKED_FAMILIES_KEY, "-inf", now)
+            return list(await redis.zrange(REDIS_REVOKED_FAMILIES_KEY, 0, -1))
+
+
+class RevocationStore:
+    def __init__(self, record, capacity: int = 100_000, error_rate: float = 0.001):
+        self.record = record
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.bloom_hits = 0 # Positive bloom tests that needed the set of record
+        self.false_positives = 0
+        self._revoked_since_sync: List[str] = []
+        self._sync_task: Optional[asyncio.Task] = None
+
+    async def is_revoked(self, db: AsyncSession, family_id: str) -> bool:
+        if family_id not in self.bloom:
+            return False
+        self.bloom_hits += 1
+        try:
+            revoked = await self.record.contains(db, family_id)
+        except (RedisError, SQLAlchemyError):
+            logger.exception("Revocation record unavailable; treating family %s as revoked", family_id)
+            return True
+        if not revoked:
+            self.false_positives += 1
+        return revoked
+
+    async def revoke(self, db: AsyncSession, family_id: str, expires_at: datetime, reason: str) -> None:
+        await self.record.add(db, family_id, expires_at, reason)
+        self.bloom.add(family_id)
+        self._revoked_since_sync.append(family_id)
+        logger.info("Revoked token family %s (%s)", family_id, reason)
+
+    async def sync(self, db: AsyncSession) -> int:
+        """Rebuild the Bloom filter from the set of record; returns the number of revoked families."""
+        self._revoked_since_sync = []
+        families = await self.record.active_families(db)
+        bloom = BloomFilter(max(self.capacity, len(families) * 2), self.error_rate)
+        # Local revocations that raced with the fetch above must survive the swap
+        for family_id in [*families, *self._revoked_since_sync]:
+            bloom.add(family_id)
+        self.bloom = bloom # Swap in one assignment so readers never see a half-built filter
+        return len(families)
+
+    def start_background_sync(self, session_factory: Callable[[], AsyncSession], interval: float) -> None:
+        async def _loop() -> None:
+            while True:
+                try:
+                    async with session_factory() as db:
+                        await self.sync(db)
+                except (RedisError, SQLAlchemyError):
+                    logger.exception("Revocation filter sync failed")
+                await asyncio.sleep(interval)
+
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(_loop(), name="revocation-sync")
+
+    async def stop_background_sync(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    @classmethod
+    def from_settings(cls) -> "RevocationStore":
+        if settings.REDIS_HOST:
+            record = RedisRevocationRecord()
+        elif settings.SHARD_URLS:
+            record = PrimaryDatabaseRevocationRecord()
+        else:
+            record = DatabaseRevocationRecord()
+        return cls(
+            record,
+            capacity=settings.REVOCATION_BLOOM_CAPACITY,
+            error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+        )
+
+
+revocation_store = RevocationStore.from_settings()
@@ -0,0 +1,532 @@
+"""
+Lightweight request tracing.
+
+`TracingMiddleware` opens a root span for each HTTP request. It continues the
+caller's trace when a valid W3C `traceparent` header is present, and keeps the
+caller's sampling decision. Otherwise it samples `TRACING_SAMPLE_RATE` of
+requests. Child spans come from:
+
+* `@traced()` on CRUD, security and service functions, and `start_span(...)`
+  blocks for ad-hoc sections
+* every Redis command (`TracedRedis` in app/core/redis_client.py)
+* every SQL statement, via cursor events on instrumented engines
+* FastAPI's endpoint call and response serialization (`instrument_fastapi`),
+  so the time left in the root span is dependency resolution and middleware
+* outbound HTTP calls made through `TracedTransport` (the LLM clients)
+
+The trace is passed on in `traceparent` headers: on the response of a sampled
+request, and on outbound calls, whose parent is their client span.
+
+A finished sampled trace goes to an in-memory ring buffer of the last
+`TRACING_BUFFER_SIZE` traces, served by `GET /admin/traces`. With
+`TRACING_EXPORT_FILE` set, it is also appended to that file as one OTLP/JSON
+`ExportTraceServiceRequest` per line, written by a background thread.
+
+For an unsampled request, the middleware reads one header and draws one random
+number. Every instrumentation point then does a single ContextVar lookup and
+calls straight through.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import logging_config
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+
+logger = logging.getLogger(__name__)
+
+# Span kinds and status codes, numbered as in OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+MAX_SPANS_PER_TRACE = 1000 # An N+1 loop must not turn one trace into unbounded memory
+MAX_STATEMENT_LENGTH = 1000
+
+_TRACEPARENT = re.compile(r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Trace:
+    __slots__ = ("trace_id", "remote_parent_id", "root", "spans", "dropped_spans")
+
+    def __init__(self, trace_id: str, remote_parent_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.remote_parent_id = remote_parent_id
+        self.root: Optional["Span"] = None
+        self.spans: List["Span"] = []
+        self.dropped_spans = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "parent_span_id": self.remote_parent_id,
+            "name": root.name,
+            "start_time_unix_nano": root.start_ns,
+            "duration_ms": root.duration_ms,
+            "status": root.status,
+            "dropped_spans": self.dropped_spans,
+            "spans": [span.as_dict(root.start_ns) for span in sorted(self.spans, key=lambda s: s.start_ns)],
+        }
+
+
+class Span:
+    __slots__ = (
+        "trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+        "attributes", "status", "status_message", "_token",
+    )
+
+    def __init__(
+        self,
+        trace: Trace,
+        name: str,
+        parent_id: Optional[str],
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+        self.status_message: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return round((self.end_ns - self.start_ns) / 1e6, 3)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C header value for calls made from inside this span."""
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        trace = self.trace
+        if len(trace.spans) < MAX_SPANS_PER_TRACE or self is trace.root:
+            trace.spans.append(self)
+        else:
+            trace.dropped_spans += 1
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self.end()
+
+    def as_dict(self, origin_ns: int) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_offset_ms": round((self.start_ns - origin_ns) / 1e6, 3),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message,
+        }
+
+
+class _NoopSpan:
+    """Returned by `start_span` outside a sampled trace; every operation does nothing."""
+    __slots__ = ()
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, exc: BaseException) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, *, kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+    """Context manager for a child of the current span; a shared no-op when the request is not sampled."""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorator: run the function (sync or async) in a child span, by default `crud.user.get_user_by_id` style."""
+    def decorator(fn: F) -> F:
+        span_name = name or f"{fn.__module__.removeprefix('app.')}.{fn.__name__}"
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                parent = _current_span.get()
+                if parent is None:
+                    return await fn(*args, **kwargs)
+                with Span(parent.trace, span_name, parent.span_id):
+                    return await fn(*args, **kwargs)
+            return async_wrapper # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            parent = _current_span.get()
+            if parent is None:
+                return fn(*args, **kwargs)
+            with Span(parent.trace, span_name, parent.span_id):
+                return fn(*args, **kwargs)
+        return wrapper # type: ignore[return-value]
+    return decorator
+
+
+def parse_traceparent(value: str) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span id, sampled) from a W3C `traceparent`, or None if invalid."""
+    match = _TRACEPARENT.fullmatch(value.strip().lower()) if len(value) <= 128 else None
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+# --- export ---------------------------------------------------------------------------
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)} # int64 is a string in OTLP/JSON
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace, service_name: str) -> Dict[str, Any]:
+    """One trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for span in trace.spans:
+        entry: Dict[str, Any] = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": span.status, **({"message": span.status_message} if span.status_message else {})},
+        }
+        if span.parent_id:
+            entry["parentSpanId"] = span.parent_id
+        spans.append(entry)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class OtlpFileExporter:
+    """Appends traces to a file as OTLP/JSON lines from a background thread; drops when behind."""
+
+    def __init__(self, path: str, service_name: str, queue_size: int = 1000):
+        self.path = path
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as handle:
+            while True:
+                trace = self._queue.get()
+                batch = [trace]
+                while trace is not None and not self._queue.empty():
+                    trace = self._queue.get_nowait()
+                    batch.append(trace)
+                handle.writelines(
+                    json.dumps(to_otlp(item, self.service_name), separators=(",", ":")) + "\n"
+                    for item in batch if item is not None
+                )
+                handle.flush()
+                if batch[-1] is None:
+                    return
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is not None:
+            self._queue.put(None) # Written out after everything queued before it
+            self._thread.join(timeout)
+            self._thread = None
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: float = 0.01,
+        buffer_size: int = 100,
+        exporter: Optional[OtlpFileExporter] = None,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.traces: Deque[Trace] = deque(maxlen=buffer_size)
+        self.sampled = 0
+
+    def start_trace(
+        self, name: str, traceparent: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None
+    ) -> Optional[Span]:
+        """Root span of a new (or continued) trace, or None when it is not sampled."""
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id = parent_id = None
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return None
+        self.sampled += 1
+        trace = Trace(trace_id or os.urandom(16).hex(), remote_parent_id=parent_id)
+        return _RootSpan(self, trace, name, parent_id, KIND_SERVER, attributes)
+
+    def finish(self, trace: Trace) -> None:
+        self.traces.append(trace)
+        if self.exporter is not None:
+            self.exporter.export(trace)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return next((trace for trace in self.traces if trace.trace_id == trace_id), None)
+
+    def start(self) -> None:
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def stop(self) -> None:
+        if self.exporter is not None:
+            self.exporter.stop()
+
+    @classmethod
+    def from_settings(cls) -> "Tracer":
+        exporter = None
+        if settings.TRACING_EXPORT_FILE:
+            exporter = OtlpFileExporter(settings.TRACING_EXPORT_FILE, settings.TRACING_SERVICE_NAME or settings.PROJECT_NAME)
+        return cls(
+            sample_rate=settings.TRACING_SAMPLE_RATE,
+            buffer_size=settings.TRACING_BUFFER_SIZE,
+            exporter=exporter,
+            enabled=settings.TRACING_ENABLED,
+        )
+
+
+class _RootSpan(Span):
+    __slots__ = ("tracer",)
+
+    def __init__(self, tracer: Tracer, *args: Any):
+        super().__init__(*args)
+        self.tracer = tracer
+        self.trace.root = self
+
+    def end(self) -> None:
+        super().end()
+        self.tracer.finish(self.trace)
+
+
+tracer = Tracer.from_settings()
+register_cache("traces", tracer.traces)
+
+
+# --- instrumentation ------------------------------------------------------------------
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each sampled HTTP request."""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        root.attributes.update({"http.request.method": scope["method"], "url.path": scope["path"]})
+        logging_config.bind(trace_id=root.trace.trace_id) # Correlates this request's log lines with the trace
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                root.attributes["http.response.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    root.status = STATUS_ERROR
+                headers = [*message.get("headers", ()), (b"traceparent", root.traceparent.encode("latin-1"))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                matched = scope.get("route")
+                if getattr(matched, "path", None):
+                    root.name = f"{scope['method']} {matched.path}"
+                    root.attributes["http.route"] = matched.path
+
+
+class TracedTransport(httpx.AsyncBaseTransport):
+    """httpx transport emitting a client span per request, and passing the trace on in `traceparent`."""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        parent = _current_span.get()
+        if parent is None:
+            return await self.transport.handle_async_request(request)
+        attributes = {"http.request.method": request.method, "server.address": request.url.host}
+        with Span(parent.trace, f"HTTP {request.method}", parent.span_id, KIND_CLIENT, attributes) as span:
+            request.headers["traceparent"] = span.traceparent
+            response = await self.transport.handle_async_request(request)
+            span.set_attribute("http.response.status_code", response.status_code)
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    parent = _current_span.get()
+    if parent is not None and context is not None:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        context._trace_span = Span(parent.trace, f"db {operation}", parent.span_id, KIND_CLIENT, {
+            "db.system": conn.dialect.name,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            "db.executemany": executemany,
+        })
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        context._trace_span = None
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.attributes["db.rows"] = cursor.rowcount
+        span.end()
+
+
+def _handle_error(exception_context) -> None:
+    span = getattr(exception_context.execution_context, "_trace_span", None)
+    if span is not None:
+        exception_context.execution_context._trace_span = None
+        span.record_error(exception_context.original_exception)
+        span.end()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Emit a span per SQL statement run on `engine` (pass `async_engine.sync_engine`)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+_fastapi_instrumented = False
+
+
+def instrument_fastapi() -> None:
+    """
+    Wrap FastAPI's endpoint call and response serialization in spans.
+
+    Both are module-level functions that FastAPI's request handler looks up on
+    every request, so wrapping them once covers every route.
+    """
+    global _fastapi_instrumented
+    from fastapi import routing
+
+    if _fastapi_instrumented:
+        return
+    run_endpoint_function = routing.run_endpoint_function
+    serialize_response = routing.serialize_response
+
+    @functools.wraps(run_endpoint_function)
+    async def traced_run_endpoint_function(*, dependant, **kwargs: Any) -> Any:
+        parent = _current_span.get()
+        if parent is None:
+            return await run_endpoint_function(dependant=dependant, **kwargs)
+        name = f"endpoint {getattr(dependant.call, '__name__', 'call')}"
+        with Span(parent.trace, name, parent.span_id):
+            return await run_endpoint_function(dependant=dependant, **kwargs)
+
+    @functools.wraps(serialize_response)
+    async def traced_serialize_response(*args: Any, **kwargs: Any) -> Any:
+        parent = _current_span.get()
+        if parent is None:
+            return await serialize_response(*args, **kwargs)
+        with Span(parent.trace, "serialize_response", parent.span_id):
+            return await serialize_response(*args, **kwargs)
+
+    routing.run_endpoint_function = traced_run_endpoint_function
+    routing.serialize_response = traced_serialize_response
+    _fastapi_instrumented = True
@@ -0,0 +1,294 @@
+"""
+Push of user changes to that user's open connections, so clients no longer poll
+`GET /auth/me` to notice role, permission or profile changes.
+
+ORM updates and deletes of a `User` (every profile, role and permission change
+goes through one; see `VersionedMixin`) are collected per session and
+published once the session commits, never for rolled-back changes. An event
+carries the user id, the new `version` and the changed column names; clients
+refetch `/auth/me` (conditionally, with the ETag they hold) when they get one.
+
+Delivery:
+
+* With Redis configured, events are published on one channel. Each worker holds
+  a single subscription, whatever the number of connections, and hands every
+  event to the local connections of its user. Without Redis, events are
+  delivered in process, which only reaches connections on the same worker.
+* Each connection has a bounded queue. A client that falls behind by more than
+  `USER_EVENTS_QUEUE_SIZE` events is evicted: it gets an `evicted` event and is
+  disconnected, and refetches its state when it reconnects.
+* Idle connections get a heartbeat every `USER_EVENTS_HEARTBEAT_SECONDS`.
+
+Events are best-effort. One published while a client is reconnecting is lost,
+which is why every stream starts with a `ready` event holding the current
+`version`. Changes to a role's permissions are not pushed: they edit no `User`
+row.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+from app.core.redis_client import get_redis_client
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+REDIS_CHANNEL = "app:user-events"
+UPDATED = "user.updated"
+DELETED = "user.deleted"
+_UNREPORTED_FIELDS = {"version", "updated_at"} # Change with every update
+_PENDING_KEY = "user_events" # Session.info key of events waiting for the commit
+
+
+class TooManyConnections(RuntimeError):
+    pass
+
+
+class SlowConsumer(RuntimeError):
+    """Raised to a connection evicted for not keeping up with its events."""
+
+
+@dataclass(frozen=True)
+class UserEvent:
+    type: str
+    user_id: int
+    version: Optional[int] = None
+    fields: Tuple[str, ...] = ()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "fields": list(self.fields)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: str) -> "UserEvent":
+        data = json.loads(payload)
+        return cls(data["type"], int(data["user_id"]), data.get("version"), tuple(data.get("fields", ())))
+
+
+class Subscription:
+    """One connection's bounded queue of events."""
+
+    def __init__(self, broker: "UserEventBroker", user_id: int, queue_size: int):
+        self.broker = broker
+        self.user_id = user_id
+        # None is the eviction marker; the extra slot guarantees there is room for it
+        self._queue: "asyncio.Queue[Optional[UserEvent]]" = asyncio.Queue(queue_size + 1)
+        self.queue_size = queue_size
+        self.evicted = False
+
+    def offer(self, event: UserEvent) -> None:
+        if self.evicted:
+            return
+        if self._queue.qsize() < self.queue_size:
+            self._queue.put_nowait(event)
+            return
+        # The client has to refetch its state anyway: drop what is queued
+        self.evicted = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+        self.broker.stats.evicted += 1
+        self.close()
+
+    async def next(self, timeout: float) -> Optional[UserEvent]:
+        """The next event, or None when none arrived within `timeout` (time for a heartbeat)."""
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except TimeoutError:
+            self.broker.stats.heartbeats += 1
+            return None
+        if event is None:
+            raise SlowConsumer(f"More than {self.queue_size} events pending")
+        self.broker.stats.delivered += 1
+        return event
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+@dataclass
+class BrokerStats:
+    published: int = 0
+    received: int = 0 # Events handed to this worker (from Redis or in process)
+    delivered: int = 0 # Events taken off connection queues
+    evicted: int = 0 # Slow consumers dropped
+    rejected: int = 0 # Connections refused at USER_EVENTS_MAX_CONNECTIONS
+    heartbeats: int = 0
+    redis_errors: int = 0
+    malformed: int = 0 # Messages from Redis that were not events
+
+
+class UserEventBroker:
+    def __init__(
+        self,
+        queue_size: int = 16,
+        heartbeat_seconds: float = 15.0,
+        send_timeout_seconds: float = 10.0,
+        max_connections: int = 10000,
+        use_redis: bool = False,
+        retry_seconds: float = 1.0,
+    ):
+        self.queue_size = queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.send_timeout_seconds = send_timeout_seconds
+        self.max_connections = max_connections # Per worker
+        self.use_redis = use_redis
+        self.retry_seconds = retry_seconds
+        self.stats = BrokerStats()
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._connections = 0
+        self._task: Optional[asyncio.Task] = None
+        self._publishing: Set[asyncio.Task] = set() # Keeps Redis PUBLISH tasks referenced until done
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    # --- connections --------------------------------------------------------------------
+    def subscribe(self, user_id: int) -> Subscription:
+        if self._connections >= self.max_connections:
+            self.stats.rejected += 1
+            raise TooManyConnections(f"{self.max_connections} event streams open in this worker")
+        subscription = Subscription(self, user_id, self.queue_size)
+        self._subscriptions[user_id].add(subscription)
+        self._connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        self._connections -= 1
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+
+    # --- events -------------------------------------------------------------------------
+    def publish(self, event: UserEvent) -> None:
+        """Send `event` to its user's connections in every worker. Does not block."""
+        self.stats.published += 1
+        if not self.use_redis:
+            self.dispatch(event)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError: # A commit from synchronous code (scripts): nobody is connected to it
+            logger.warning("No event loop to publish %s for user %s", event.type, event.user_id)
+            return
+        task = loop.create_task(self._publish_to_redis(event))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _publish_to_redis(self, event: UserEvent) -> None:
+        try:
+            async with get_redis_client() as redis:
+                await redis.publish(REDIS_CHANNEL, event.to_json())
+        except RedisError:
+            logger.exception("Could not publish %s for user %s", event.type, event.user_id)
+            self.stats.redis_errors += 1
+
+    def dispatch(self, event: UserEvent) -> None:
+        """Hand `event` to this worker's connections of its user."""
+        self.stats.received += 1
+        for subscription in list(self._subscriptions.get(event.user_id, ())):
+            subscription.offer(event)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with get_redis_client() as redis, redis.pubsub() as pubsub:
+                    await pubsub.subscribe(REDIS_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._dispatch_message(message["data"])
+            except RedisError:
+                logger.exception("User event subscription lost; resubscribing")
+                self.stats.redis_errors += 1
+                await asyncio.sleep(self.retry_seconds)
+
+    def _dispatch_message(self, payload: str) -> None:
+        try:
+            event = UserEvent.from_json(payload)
+        except (ValueError, KeyError, TypeError): # json.JSONDecodeError is a ValueError
+            # One bad payload (another version's format, a stray PUBLISH) must not end the subscription
+            logger.exception("Ignoring malformed user event %.200r", payload)
+            self.stats.malformed += 1
+            return
+        self.dispatch(event)
+
+    # --- lifecycle ----------------------------------------------------------------------
+    def start(self) -> None:
+        if self.use_redis and self._task is None:
+            self._task = asyncio.create_task(self._listen(), name="user-events-subscriber")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"connections": self._connections, "users": len(self._subscriptions), **asdict(self.stats)}
+
+    @classmethod
+    def from_settings(cls) -> "UserEventBroker":
+        return cls(
+            queue_size=settings.USER_EVENTS_QUEUE_SIZE,
+            heartbeat_seconds=settings.USER_EVENTS_HEARTBEAT_SECONDS,
+            send_timeout_seconds=settings.USER_EVENTS_SEND_TIMEOUT_SECONDS,
+            max_connections=settings.USER_EVENTS_MAX_CONNECTIONS,
+            use_redis=bool(settings.REDIS_HOST),
+        )
+
+
+user_events = UserEventBroker.from_settings()
+register_cache("user_event_connections", lambda: user_events.connections)
+
+
+# --- publishing from ORM writes -----------------------------------------------------------
+def _pending(session: Session) -> List[UserEvent]:
+    return session.info.setdefault(_PENDING_KEY, [])
+
+
+@event.listens_for(User, "after_update")
+def _collect_update(mapper, connection, target: User) -> None:
+    state = inspect(target)
+    fields = tuple(sorted(
+        attr.key for attr in state.attrs
+        if attr.key not in _UNREPORTED_FIELDS and attr.history.has_changes()
+    ))
+    _pending(object_session(target)).append(UserEvent(UPDATED, target.id, target.version, fields))
+
+
+@event.listens_for(User, "after_delete")
+def _collect_delete(mapper, connection, target: User) -> None:
+    _pending(object_session(target)).append(UserEvent(DELETED, target.id))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    for user_event in session.info.pop(_PENDING_KEY, ()):
+        user_events.publish(user_event)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session: Session, previous_transaction) -> None:
+    # Savepoint rollbacks keep the list: a few extra events only cause extra refetches
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
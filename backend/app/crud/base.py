@@ -5,6 +5,8 @@ from pydantic import BaseModel
 from sqlalchemy import select, update as sqlalchemy_update, delete as sqlalchemy_delete #Renamed to avoid conflict
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
+from app.crud.cache import ModelCache, cache_for
 from app.models.base import Base # Assuming your Base model is in app.models.base
 
 ModelType = TypeVar("ModelType", bound=Base)
@@ -12,18 +14,28 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], cache_ttl_seconds: Optional[float] = None):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
 
         **Parameters**
 
         * `model`: A SQLAlchemy model class
-        * `schema`: A Pydantic model (schema) class
+        * `cache_ttl_seconds`: Cache `get` and `get_multi` results this long (see app/crud/cache.py);
+          `CRUD_CACHE_TTL_SECONDS` can override it per table. No caching when None
         """
         self.model = model
+        self.cache: Optional[ModelCache] = None
+        if cache_ttl_seconds is not None and settings.CRUD_CACHE_ENABLED:
+            self.cache = cache_for(model, cache_ttl_seconds)
 
     async def get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
+        if self.cache is None:
+            return await self._get(db, id)
+        values = await self.cache.fetch("id", (id,), lambda: self._get(db, id))
+        return None if values is None else await self.cache.attach(db, values)
+
+    async def _get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
         statement = select(self.model).where(self.model.id == id)
         result = await db.execute(statement)
         return result.scalar_one_or_none()
@@ -31,15 +43,28 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     async def get_multi(
         self, db: AsyncSession, *, skip: int = 0, limit: int = 100
     ) -> List[ModelType]:
+        if self.cache is None:
+            return await self._get_multi(db, skip=skip, limit=limit)
+        rows = await self.cache.fetch("page", (skip, limit), lambda: self._get_multi(db, skip=skip, limit=limit))
+        return [await self.cache.attach(db, values) for values in rows]
+
+    async def _get_multi(self, db: AsyncSession, *, skip: int, limit: int) -> List[ModelType]:
         statement = select(self.model).offset(skip).limit(limit)
+        if self.cache is not None:
+            statement = statement.order_by(self.model.id) # A cached page must hold the same rows for every worker
         result = await db.execute(statement)
-        return result.scalars().all()
+        return list(result.scalars().all())
+
+    async def _invalidate(self) -> None:
+        if self.cache is not None:
+            await self.cache.invalidate()
 
     async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)  # type: ignore
         db.add(db_obj)
         await db.commit()
+        await self._invalidate() # Cached pages and absent-id entries no longer hold
         await db.refresh(db_obj)
         return db_obj
 
@@ -62,6 +87,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         
         db.add(db_obj)
         await db.commit()
+        await self._invalidate()
         await db.refresh(db_obj)
         return db_obj
 
@@ -71,5 +97,6 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             statement = sqlalchemy_delete(self.model).where(self.model.id == id)
             await db.execute(statement)
             await db.commit()
+            await self._invalidate()
             return obj
         return None # Return None if object not found 
\ No newline at end of file
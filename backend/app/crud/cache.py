@@ -0,0 +1,359 @@
+"""
+Read-through cache for `CRUDBase.get` and `get_multi`, opt-in per model.
+
+`CRUDBase(Role, cache_ttl_seconds=600)` caches the rows it reads in two tiers:
+
+* a per-worker LRU near-cache, answering without any I/O;
+* with Redis configured, a shared tier that every worker reads and fills, so a
+  row is loaded from the database once per TTL rather than once per worker.
+
+Entries hold the row's column values as JSON. A hit builds a fresh instance and
+merges it into the caller's session without a query (`merge(load=False)`), so
+callers get an ordinary persistent object they can update or delete.
+
+Keys are versioned twice: by a hash of the model's columns, so a deploy that
+changes the table never reads entries in the old layout, and by the model's
+generation, a counter (in Redis when configured) that `create`, `update` and
+`remove` increment. Bumping the generation invalidates every row and page of
+the model at once; entries of older generations are never read again and expire
+on their own. New generations are published on a Redis channel, and each
+worker's listener drops its near-cache as soon as one arrives. Should a message
+be missed, the generation is also re-read every `CRUD_CACHE_LOCAL_TTL_SECONDS`,
+which bounds how long a worker serves the previous state.
+
+Concurrent misses for the same key in a worker share a single database load
+(single-flight), so an expiring hot row causes one query, not a stampede.
+
+Writes that bypass `CRUDBase` (bulk UPDATEs, other crud modules) must call
+`invalidate()` themselves. Cached models should be rarely written: every write
+empties the model's cache.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, time as time_of_day
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+from app.core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "app:crud"
+INVALIDATION_CHANNEL = "app:crud:invalidate" # Messages are "<namespace> <generation>"
+_TEMPORAL_TYPES = (datetime, date, time_of_day)
+
+
+@dataclass
+class CacheStats:
+    local_hits: int = 0
+    redis_hits: int = 0
+    coalesced: int = 0 # Misses that waited for another caller's load instead of querying
+    misses: int = 0 # Loaded from the database
+    invalidations: int = 0
+    redis_errors: int = 0
+
+    @property
+    def requests(self) -> int:
+        return self.local_hits + self.redis_hits + self.coalesced + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of reads that did not query the database."""
+        return 1 - self.misses / self.requests if self.requests else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**asdict(self), "requests": self.requests, "hit_rate": round(self.hit_rate, 4)}
+
+
+def schema_version(model: type) -> str:
+    """Short hash of the model's table and column types."""
+    table = model.__table__
+    layout = ";".join(f"{column.name}:{column.type!r}" for column in table.columns)
+    return hashlib.sha1(f"{table.name}({layout})".encode()).hexdigest()[:8]
+
+
+class ModelCache:
+    """Near-cache + Redis read-through cache of one model's rows and pages."""
+
+    def __init__(
+        self,
+        model: type,
+        ttl_seconds: float = 300.0,
+        local_ttl_seconds: float = 5.0,
+        local_max_entries: int = 1000,
+        use_redis: bool = False,
+    ):
+        self.model = model
+        self.namespace = model.__tablename__
+        self.version = schema_version(model)
+        self.ttl_seconds = ttl_seconds
+        # Without Redis the near-cache is the only tier, and entries live for the full TTL
+        self.local_ttl_seconds = min(local_ttl_seconds, ttl_seconds) if use_redis else ttl_seconds
+        self.local_max_entries = local_max_entries
+        self.use_redis = use_redis
+        self.stats = CacheStats()
+        self._columns = [attr.key for attr in inspect(model).column_attrs]
+        self._temporal: Dict[str, type] = {} # Columns stored as ISO strings
+        for column in model.__table__.columns:
+            try:
+                if issubclass(column.type.python_type, _TEMPORAL_TYPES):
+                    self._temporal[column.key] = column.type.python_type
+            except NotImplementedError: # JSON and other types without a single Python type
+                pass
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[str]"] = {}
+        self._generation = 0
+        self._generation_checked = float("-inf") # Last time the generation was read from Redis
+
+    @property
+    def generation_key(self) -> str:
+        return f"{REDIS_KEY_PREFIX}:{self.namespace}:generation"
+
+    def key(self, generation: int, kind: str, *args: Any) -> str:
+        return ":".join([REDIS_KEY_PREFIX, self.namespace, self.version, f"g{generation}", kind, *map(str, args)])
+
+    # --- rows <-> JSON -----------------------------------------------------------------
+    def dump_row(self, obj: Any) -> Dict[str, Any]:
+        values = {}
+        for name in self._columns:
+            value = getattr(obj, name)
+            values[name] = value.isoformat() if isinstance(value, _TEMPORAL_TYPES) else value
+        return values
+
+    def dump(self, obj: Any) -> str:
+        """JSON payload of a row, a list of rows, or None (cached too: absent ids stay absent)."""
+        if obj is None:
+            return "null"
+        if isinstance(obj, list):
+            return json.dumps([self.dump_row(item) for item in obj])
+        return json.dumps(self.dump_row(obj))
+
+    async def attach(self, db: AsyncSession, values: Dict[str, Any]) -> Any:
+        """A persistent instance in `db` with the cached `values`, without querying."""
+        values = dict(values)
+        for name, python_type in self._temporal.items():
+            if values.get(name) is not None:
+                values[name] = python_type.fromisoformat(values[name])
+        obj = self.model(**values)
+        make_transient_to_detached(obj) # As if just loaded: no pending changes
+        # Returns the session's own instance when it already holds this row
+        return await db.merge(obj, load=False)
+
+    # --- reads ---------------------------------------------------------------------------
+    async def fetch(self, kind: str, args: Tuple[Any, ...], load: Callable[[], Awaitable[Any]]) -> Any:
+        """The decoded JSON cached under `kind` + `args`; on a miss, `load()` returns the row(s) to cache."""
+        generation = await self._current_generation()
+        key = self.key(generation, kind, *args)
+        entry = self._local.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._local.move_to_end(key)
+            self.stats.local_hits += 1
+            return json.loads(entry[1])
+        return json.loads(await self._single_flight(key, lambda: self._fill(key, generation, load)))
+
+    async def _single_flight(self, key: str, fill: Callable[[], Awaitable[str]]) -> str:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled(): # This caller was cancelled, not the load
+                    raise
+            return await fill() # The loading request was cancelled; load for ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        # Retrieve the outcome even when nobody waited, so a failed load logs no warning
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = future
+        try:
+            payload = await fill()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(payload)
+            return payload
+        finally:
+            del self._inflight[key]
+
+    async def _fill(self, key: str, generation: int, load: Callable[[], Awaitable[Any]]) -> str:
+        payload = await self._redis_get(key)
+        if payload is not None:
+            self.stats.redis_hits += 1
+        else:
+            self.stats.misses += 1
+            payload = self.dump(await load())
+            if self._generation != generation:
+                return payload # Invalidated during the load: the rows may predate the write
+            await self._redis_set(key, payload)
+        if self._generation == generation:
+            self._store_local(key, payload)
+        return payload
+
+    def _store_local(self, key: str, payload: str) -> None:
+        if self.local_ttl_seconds <= 0:
+            return
+        self._local[key] = (time.monotonic() + self.local_ttl_seconds, payload)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max_entries:
+            self._local.popitem(last=False)
+
+    # --- Redis tier ---------------------------------------------------------------------
+    async def _redis_get(self, key: str) -> Optional[str]:
+        if not self.use_redis:
+            return None
+        try:
+            async with get_redis_client() as redis:
+                return await redis.get(key)
+        except RedisError:
+            logger.exception("Could not read %s from Redis", key)
+            self.stats.redis_errors += 1
+            return None
+
+    async def _redis_set(self, key: str, payload: str) -> None:
+        if not self.use_redis:
+            return
+        try:
+            async with get_redis_client() as redis:
+                await redis.set(key, payload, ex=max(1, round(self.ttl_seconds)))
+        except RedisError:
+            logger.exception("Could not cache %s in Redis", key)
+            self.stats.redis_errors += 1
+
+    async def _current_generation(self) -> int:
+        if not self.use_redis or time.monotonic() - self._generation_checked < self.local_ttl_seconds:
+            return self._generation
+        self._generation_checked = time.monotonic() # Before awaiting: one refresh at a time
+        try:
+            async with get_redis_client() as redis:
+                self.observe_generation(int(await redis.get(self.generation_key) or 0))
+        except RedisError:
+            logger.exception("Could not read the %s cache generation from Redis", self.namespace)
+            self.stats.redis_errors += 1
+        return self._generation
+
+    # --- invalidation -------------------------------------------------------------------
+    def observe_generation(self, generation: int) -> None:
+        """Switch to `generation` (from Redis or another worker); drops the near-cache if it changed."""
+        if generation != self._generation:
+            self._generation = generation
+            self._local.clear()
+
+    async def invalidate(self) -> None:
+        """Make every cached row and page of the model stale, in all workers."""
+        self.stats.invalidations += 1
+        if not self.use_redis:
+            self.observe_generation(self._generation + 1)
+            return
+        try:
+            async with get_redis_client() as redis:
+                generation = await redis.incr(self.generation_key)
+                await redis.publish(INVALIDATION_CHANNEL, f"{self.namespace} {generation}")
+        except RedisError:
+            # Other workers keep serving cached rows until their entries expire
+            logger.exception("Could not invalidate the %s cache in Redis", self.namespace)
+            self.stats.redis_errors += 1
+            self._local.clear()
+            return
+        self._generation_checked = time.monotonic()
+        self.observe_generation(generation)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "namespace": self.namespace,
+            "ttl_seconds": self.ttl_seconds,
+            "local_entries": len(self._local),
+            "generation": self._generation,
+            "shared": self.use_redis,
+            **self.stats.snapshot(),
+        }
+
+    def clear(self) -> None:
+        """Drop this worker's near-cache."""
+        self._local.clear()
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    @classmethod
+    def from_settings(cls, model: type, ttl_seconds: float) -> "ModelCache":
+        return cls(
+            model,
+            ttl_seconds=settings.CRUD_CACHE_TTL_SECONDS.get(model.__tablename__, ttl_seconds),
+            local_ttl_seconds=settings.CRUD_CACHE_LOCAL_TTL_SECONDS,
+            local_max_entries=settings.CRUD_CACHE_LOCAL_MAX_ENTRIES,
+            use_redis=bool(settings.REDIS_HOST),
+        )
+
+
+model_caches: Dict[str, ModelCache] = {} # By table name; metrics at GET /admin/crud-cache
+
+
+def cache_for(model: type, ttl_seconds: float) -> ModelCache:
+    """The model's cache, shared by every `CRUDBase` of the model."""
+    cache = model_caches.get(model.__tablename__)
+    if cache is None:
+        cache = model_caches[model.__tablename__] = ModelCache.from_settings(model, ttl_seconds)
+        register_cache(f"crud_cache:{cache.namespace}", cache)
+    return cache
+
+
+class InvalidationListener:
+    """Applies the generations other workers publish to this worker's model caches."""
+
+    def __init__(self, caches: Dict[str, ModelCache], retry_seconds: float = 1.0):
+        self.caches = caches
+        self.retry_seconds = retry_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def handle(self, message: str) -> None:
+        namespace, _, generation = message.partition(" ")
+        cache = self.caches.get(namespace)
+        if cache is not None and generation.isdigit():
+            cache.observe_generation(int(generation))
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with get_redis_client() as redis, redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Messages published while unsubscribed are lost: re-read every generation
+                    for cache in self.caches.values():
+                        cache._generation_checked = float("-inf")
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.handle(message["data"])
+            except RedisError:
+                logger.exception("Cache invalidation subscription lost; resubscribing")
+                await asyncio.sleep(self.retry_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen(), name="crud-cache-invalidation")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+invalidation_listener = InvalidationListener(model_caches)
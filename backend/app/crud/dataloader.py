@@ -0,0 +1,106 @@
+"""
+Request-scoped batching of primary-key lookups.
+
+`await loader.load(key)` does not query right away. Keys requested during the
+same event-loop tick (e.g. by `asyncio.gather` over a list, or by several
+dependencies of one request) are collected and resolved with one batch call,
+typically a single `WHERE id IN (...)`. Results are memoised for the loader's
+lifetime, so create one loader per request (see `get_user_loader` in
+app/core/deps.py) and never share it across requests.
+
+Batches are dispatched one at a time, because the batch function usually runs
+on the request's `AsyncSession`, which does not allow concurrent queries.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Iterable, List, Optional, Set, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.sharding import ShardSet
+from app.crud import user as crud_user
+from app.models.user import User
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+BatchLoadFn = Callable[[List[K]], Awaitable[Dict[K, V]]]
+
+
+class DataLoader(Generic[K, V]):
+    def __init__(self, batch_load_fn: BatchLoadFn, max_batch_size: Optional[int] = None):
+        """
+        **Parameters**
+
+        * `batch_load_fn`: async callable mapping a list of unique keys to `{key: value}`;
+          keys absent from the result resolve to None
+        * `max_batch_size`: split larger batches (keeps `IN` lists within driver limits)
+        """
+        self.batch_load_fn = batch_load_fn
+        self.max_batch_size = max_batch_size
+        self.batches = 0 # Number of batch calls made, for tests and diagnostics
+        self._cache: Dict[K, "asyncio.Future[Optional[V]]"] = {}
+        self._pending: Dict[K, "asyncio.Future[Optional[V]]"] = {}
+        self._lock = asyncio.Lock()
+        self._dispatches: Set[asyncio.Task] = set() # The loop only holds weak references to tasks
+
+    def load(self, key: K) -> "asyncio.Future[Optional[V]]":
+        future = self._cache.get(key) or self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            if not self._pending:
+                # Dispatch once the current tick's callers have all queued their keys
+                loop.call_soon(self._schedule_dispatch)
+            self._pending[key] = self._cache[key] = future
+        return future
+
+    async def load_many(self, keys: Iterable[K]) -> List[Optional[V]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: K, value: V) -> None:
+        """Seed the cache with an already loaded value."""
+        if key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[key] = future
+
+    def clear(self, key: Optional[K] = None) -> None:
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def _schedule_dispatch(self) -> None:
+        pending, self._pending = list(self._pending.items()), {}
+        size = self.max_batch_size or len(pending)
+        for start in range(0, len(pending), size):
+            task = asyncio.ensure_future(self._dispatch(dict(pending[start:start + size])))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: Dict[K, "asyncio.Future[Optional[V]]"]) -> None:
+        async with self._lock:
+            self.batches += 1
+            try:
+                results = await self.batch_load_fn(list(batch))
+            except Exception as exc:
+                for key, future in batch.items():
+                    if self._cache.get(key) is future:
+                        del self._cache[key] # Let a later load retry
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+def user_loader(db: AsyncSession, max_batch_size: int = 500, shards: Optional[ShardSet] = None) -> DataLoader[int, User]:
+    """DataLoader resolving user ids on `db`, or on every shard of `shards` at once."""
+    async def batch_load(ids: List[int]) -> Dict[int, User]:
+        if shards is not None: # An id does not say which shard the user lives on now
+            found = await shards.scatter_gather(lambda shard_db: crud_user.get_users_by_ids(shard_db, ids))
+            return {user.id: user for users in found.values() for user in users}
+        return {user.id: user for user in await crud_user.get_users_by_ids(db, ids)}
+
+    return DataLoader(batch_load, max_batch_size=max_batch_size)
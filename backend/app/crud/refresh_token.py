@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.tracing import traced
+from app.models.refresh_token import RefreshToken
+
+@traced()
+async def get_by_jti(db: AsyncSession, jti: str) -> RefreshToken | None:
+    result = await db.execute(select(RefreshToken).filter(RefreshToken.jti == jti))
+    return result.scalar_one_or_none()
+
+@traced()
+async def create_refresh_token(
+    db: AsyncSession,
+    *,
+    jti: str,
+    family_id: str,
+    user_id: int,
+    expires_at: datetime,
+    parent_jti: str | None = None,
+    commit: bool = True,
+) -> RefreshToken:
+    db_token = RefreshToken(
+        jti=jti,
+        family_id=family_id,
+        user_id=user_id,
+        parent_jti=parent_jti,
+        issued_at=datetime.now(timezone.utc),
+        expires_at=expires_at,
+    )
+    db.add(db_token)
+    if commit:
+        await db.commit()
+    return db_token
+
+@traced()
+async def mark_used(db: AsyncSession, jti: str) -> bool:
+    """
+    Atomically mark a token as rotated. Returns False if it was already used,
+    i.e. the token is being replayed (or raced with a concurrent rotation).
+    """
+    result = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.jti == jti, RefreshToken.used_at.is_(None))
+        .values(used_at=datetime.now(timezone.utc))
+    )
+    return result.rowcount == 1
@@ -0,0 +1,150 @@
+from typing import Iterable, List
+
+from sqlalchemy import delete, func, insert, select, union
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.permissions import SUPERUSER_BITS, permission_bits_cache
+from app.core.tracing import traced
+from app.models.role import Permission, Role, role_permissions, user_permissions, user_roles
+from app.models.user import User
+
+PERMISSION_CREATE_ATTEMPTS = 3
+
+@traced()
+async def get_role_by_name(db: AsyncSession, name: str) -> Role | None:
+    result = await db.execute(select(Role).filter(Role.name == name))
+    return result.scalar_one_or_none()
+
+@traced()
+async def get_or_create_role(db: AsyncSession, name: str) -> Role:
+    role = await get_role_by_name(db, name)
+    if role is None:
+        role = Role(name=name)
+        db.add(role)
+        await db.flush()
+    return role
+
+async def _next_free_bit(db: AsyncSession) -> int:
+    # Bits are never reused, so a new permission always takes the next free one
+    return (await db.execute(select(func.coalesce(func.max(Permission.bit) + 1, 0)))).scalar_one()
+
+@traced()
+async def get_or_create_permission(db: AsyncSession, name: str) -> Permission:
+    for attempt in range(1, PERMISSION_CREATE_ATTEMPTS + 1):
+        result = await db.execute(select(Permission).filter(Permission.name == name))
+        permission = result.scalar_one_or_none()
+        if permission is not None:
+            return permission
+        shards = db.info.get("shards")
+        if shards is not None and db.info["shard"] != shards.primary:
+            # Bits must mean the same on every shard: take it from the primary's catalogue
+            async with shards.session(shards.primary) as primary:
+                next_bit = (await get_or_create_permission(primary, name)).bit
+                await primary.commit()
+        else:
+            next_bit = await _next_free_bit(db)
+        try:
+            # A concurrent create can take the same bit (or name) between the read and the
+            # insert; the savepoint undoes only this insert, then the loop looks again
+            async with db.begin_nested():
+                permission = Permission(name=name, bit=next_bit)
+                db.add(permission)
+            return permission
+        except IntegrityError:
+            if attempt == PERMISSION_CREATE_ATTEMPTS:
+                raise
+
+@traced()
+async def grant_permissions_to_role(db: AsyncSession, role_name: str, permission_names: Iterable[str]) -> Role:
+    role = await get_or_create_role(db, role_name)
+    existing = set((await db.execute(
+        select(role_permissions.c.permission_id).where(role_permissions.c.role_id == role.id)
+    )).scalars())
+    for name in permission_names:
+        permission = await get_or_create_permission(db, name)
+        if permission.id not in existing:
+            await db.execute(insert(role_permissions).values(role_id=role.id, permission_id=permission.id))
+            existing.add(permission.id)
+    await db.commit()
+    # Role changes can affect many users; drop every cached bitset in this worker
+    permission_bits_cache.clear()
+    return role
+
+@traced()
+async def set_user_roles(db: AsyncSession, user: User, role_names: Iterable[str]) -> User:
+    role_names = list(dict.fromkeys(role_names))
+    roles = [await get_or_create_role(db, name) for name in role_names]
+    await db.execute(delete(user_roles).where(user_roles.c.user_id == user.id))
+    if roles:
+        await db.execute(insert(user_roles), [{"user_id": user.id, "role_id": role.id} for role in roles])
+    user.roles = role_names # Keep the denormalised copy in sync
+    db.add(user)
+    await db.commit()
+    permission_bits_cache.invalidate(user.username)
+    return user
+
+@traced()
+async def set_user_permissions(db: AsyncSession, user: User, permission_names: Iterable[str]) -> User:
+    permission_names = list(dict.fromkeys(permission_names))
+    permissions = [await get_or_create_permission(db, name) for name in permission_names]
+    await db.execute(delete(user_permissions).where(user_permissions.c.user_id == user.id))
+    if permissions:
+        await db.execute(
+            insert(user_permissions),
+            [{"user_id": user.id, "permission_id": permission.id} for permission in permissions],
+        )
+    user.permissions = permission_names
+    db.add(user)
+    await db.commit()
+    permission_bits_cache.invalidate(user.username)
+    return user
+
+@traced()
+async def compile_permission_bits(db: AsyncSession, user: User) -> int:
+    """OR together the bits of every permission the user has through roles or direct grants."""
+    if user.is_superuser:
+        return SUPERUSER_BITS
+    via_roles = (
+        select(Permission.bit)
+        .join(role_permissions, role_permissions.c.permission_id == Permission.id)
+        .join(user_roles, user_roles.c.role_id == role_permissions.c.role_id)
+        .where(user_roles.c.user_id == user.id)
+    )
+    direct = (
+        select(Permission.bit)
+        .join(user_permissions, user_permissions.c.permission_id == Permission.id)
+        .where(user_permissions.c.user_id == user.id)
+    )
+    bits = 0
+    for bit in (await db.execute(union(via_roles, direct))).scalars():
+        bits |= 1 << bit
+    return bits
+
+@traced()
+async def get_permission_bits(db: AsyncSession, user: User) -> int:
+    """Compiled bitset for `user`, from the per-worker cache when fresh."""
+    bits = permission_bits_cache.get(user.username)
+    if bits is None:
+        bits = await compile_permission_bits(db, user)
+        permission_bits_cache.set(user.username, bits)
+    return bits
+
+@traced()
+async def get_users_by_role(
+    db: AsyncSession, role_name: str, *, after_id: int = 0, limit: int = 100
+) -> List[User]:
+    """
+    Users holding `role_name`, ordered by id, with keyset pagination (`after_id`).
+    Walks ix_user_roles_role_id_user_id in order instead of scanning users.
+    """
+    statement = (
+        select(User)
+        .join(user_roles, user_roles.c.user_id == User.id)
+        .join(Role, Role.id == user_roles.c.role_id)
+        .where(Role.name == role_name, user_roles.c.user_id > after_id)
+        .order_by(user_roles.c.user_id)
+        .limit(limit)
+    )
+    result = await db.execute(statement)
+    return list(result.scalars().all())
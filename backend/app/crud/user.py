@@ -1,22 +1,43 @@
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, case, func, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select # For SQLAlchemy 2.0 style select
 
 from app.core.security import get_password_hash
+from app.core.sharding import SHARD_ID_RANGE
+from app.core.tracing import traced
 from app.models.user import User
 from app.schemas.user import UserCreate
 
+# Tries at taking the next id of a shard's block; concurrent registrations on one shard can pick the same
+ID_ALLOCATION_ATTEMPTS = 3
+
+@traced()
 async def get_user_by_id(db: AsyncSession, user_id: int) -> User | None:
     result = await db.execute(select(User).filter(User.id == user_id))
     return result.scalar_one_or_none()
 
+@traced()
+async def get_users_by_ids(db: AsyncSession, ids: Sequence[int]) -> List[User]:
+    """All users whose id is in `ids`, in one `WHERE id IN (...)` query (order not guaranteed)."""
+    if not ids:
+        return []
+    result = await db.execute(select(User).where(User.id.in_(ids)))
+    return list(result.scalars().all())
+
+@traced()
 async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
     result = await db.execute(select(User).filter(User.email == email))
     return result.scalar_one_or_none()
 
+@traced()
 async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
     result = await db.execute(select(User).filter(User.username == username))
     return result.scalar_one_or_none()
 
+@traced()
 async def create_user(db: AsyncSession, user_in: UserCreate) -> User:
     hashed_password = get_password_hash(user_in.password)
     db_user = User(
@@ -26,11 +47,96 @@ async def create_user(db: AsyncSession, user_in: UserCreate) -> User:
         is_active=user_in.is_active if user_in.is_active is not None else True, # Respect schema default
         is_superuser=user_in.is_superuser if user_in.is_superuser is not None else False
     )
-    db.add(db_user)
-    await db.commit()
+    id_base = db.info.get("shard_id_base")
+    for attempt in range(1, ID_ALLOCATION_ATTEMPTS + 1):
+        if id_base is not None: # Sharded: ids come from the shard's own block
+            db_user.id = _next_id_in_block(id_base)
+        db.add(db_user)
+        try:
+            await db.commit()
+            break
+        except IntegrityError:
+            await db.rollback()
+            if id_base is None or attempt == ID_ALLOCATION_ATTEMPTS or await _is_registered(db, db_user):
+                raise
     await db.refresh(db_user)
     return db_user
 
+async def _is_registered(db: AsyncSession, user: User) -> bool:
+    # Tells a taken username or email from a lost race for the next id
+    taken_usernames, taken_emails = await get_taken_usernames_and_emails(db, [user.username], [user.email])
+    return bool(taken_usernames or taken_emails)
+
+def _next_id_in_block(id_base: int):
+    # Keeps ids unique across shards; users moved in from other shards keep ids from other blocks
+    return (
+        select(func.coalesce(func.max(User.id), id_base) + 1)
+        .where(User.id.between(id_base + 1, id_base + SHARD_ID_RANGE - 1))
+        .scalar_subquery()
+    )
+
+@traced()
+async def get_taken_usernames_and_emails(
+    db: AsyncSession, usernames: Sequence[str], emails: Sequence[str]
+) -> Tuple[Set[str], Set[str]]:
+    """Which of `usernames` and `emails` are already registered (two indexed IN queries)."""
+    taken_usernames = set((await db.execute(select(User.username).where(User.username.in_(usernames)))).scalars()) if usernames else set()
+    taken_emails = set((await db.execute(select(User.email).where(User.email.in_(emails)))).scalars()) if emails else set()
+    return taken_usernames, taken_emails
+
+@traced()
+async def insert_users(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert users from prepared column values (`hashed_password` included, all rows with
+    the same keys) as multi-row INSERTs. Does not commit. On a shard, a concurrent
+    registration can take one of the ids; the IntegrityError is the caller's to retry.
+    """
+    id_base = db.info.get("shard_id_base")
+    if id_base is not None:
+        first_id = await db.scalar(select(_next_id_in_block(id_base)))
+        rows = [{**row, "id": first_id + offset} for offset, row in enumerate(rows)]
+    await db.execute(insert(User), rows)
+
+@traced()
+async def update_password_hash(db: AsyncSession, user: User, hashed_password: str) -> User:
+    user.hashed_password = hashed_password
+    db.add(user)
+    await db.commit()
+    return user
+
+@traced()
+async def update_avatar_url(db: AsyncSession, user: User, avatar_url: Optional[str]) -> User:
+    user.avatar_url = avatar_url
+    db.add(user)
+    await db.commit()
+    return user
+
+def _latest(column, value):
+    # Timestamps only move forward, whatever order concurrent flushes land in
+    return case((value.is_(None), column), (column.is_(None), value), (column < value, value), else_=column)
+
+_users = User.__table__
+_add_activity = (
+    update(_users)
+    .where(_users.c.id == bindparam("b_id"))
+    .values(
+        login_count=_users.c.login_count + bindparam("b_logins"),
+        last_login_at=_latest(_users.c.last_login_at, bindparam("b_last_login_at", type_=_users.c.last_login_at.type)),
+        last_seen_at=_latest(_users.c.last_seen_at, bindparam("b_last_seen_at", type_=_users.c.last_seen_at.type)),
+        updated_at=_users.c.updated_at, # Activity is not a profile change
+    )
+)
+
+@traced()
+async def add_activity(db: AsyncSession, rows: Sequence[Dict[str, Any]]) -> None:
+    """
+    Apply coalesced activity deltas, one row per user: `b_id`, `b_logins`,
+    `b_last_login_at`, `b_last_seen_at`. Runs as a single executemany of a Core
+    UPDATE, so `version` (and with it every ETag) is left alone. Does not commit.
+    """
+    if rows:
+        await db.execute(_add_activity, list(rows))
+
 # Placeholder for update_user if needed
 # async def update_user(db: AsyncSession, user: User, user_in: UserUpdate) -> User:
 #     pass
@@ -0,0 +1,141 @@
+"""
+User search by username, email or nickname.
+
+Results are ranked in tiers, and each tier is read from an index in the order
+it is paginated in, so a page costs `limit` index entries rather than a
+scan-and-sort over every match:
+
+0. username prefix, in username order (B-tree on `users.username`)
+1. email prefix, in email order (B-tree on `users.email`)
+2. substring of username/email/nickname, in id order (trigram index, see
+   app/models/user_search.py); only for queries of 3+ characters
+
+Prefix tiers are case-sensitive (binary index order); the substring tier is not.
+A user appears in the first tier that matches. Pagination is keyset-based: the
+opaque cursor holds the tier and the last key returned.
+
+With sharding, `search_users_sharded` runs the same page query on every shard
+and merges the pages by (tier, key). Keys are usernames, emails and ids, all
+unique across shards, so a cursor means the same position on every shard.
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, column, not_, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.sharding import ShardSet
+from app.core.tracing import traced
+from app.models.user import User
+from app.models.user_search import SEARCH_TABLE, search_document
+
+TIER_USERNAME_PREFIX = 0
+TIER_EMAIL_PREFIX = 1
+TIER_SUBSTRING = 2
+MIN_SUBSTRING_QUERY_LENGTH = 3 # Shortest string a trigram index can answer
+
+_fts = table(SEARCH_TABLE, column("rowid"))
+
+
+@dataclass
+class SearchPage:
+    users: List[User]
+    next_cursor: Optional[str] = None
+    keys: List[Tuple[int, Any]] = field(default_factory=list) # (tier, key) of each user
+
+
+def encode_cursor(tier: int, key: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps([tier, key]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, Any]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        tier, key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+    if tier not in (TIER_USERNAME_PREFIX, TIER_EMAIL_PREFIX, TIER_SUBSTRING):
+        raise ValueError("Invalid cursor")
+    return tier, key
+
+
+def _has_prefix(column_, prefix: str):
+    # A range rather than LIKE 'x%' so the plain B-tree index is usable on every backend
+    return and_(column_ >= prefix, column_ < prefix + "\U0010ffff")
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _tier_statement(db: AsyncSession, tier: int, q: str, after: Any, limit: int):
+    if tier == TIER_USERNAME_PREFIX:
+        statement = select(User, User.username).where(_has_prefix(User.username, q)).order_by(User.username)
+        if after is not None:
+            statement = statement.where(User.username > after)
+    elif tier == TIER_EMAIL_PREFIX:
+        statement = (
+            select(User, User.email)
+            .where(_has_prefix(User.email, q), not_(_has_prefix(User.username, q)))
+            .order_by(User.email)
+        )
+        if after is not None:
+            statement = statement.where(User.email > after)
+    else:
+        if len(q) < MIN_SUBSTRING_QUERY_LENGTH:
+            return None
+        already_ranked = not_(_has_prefix(User.username, q) | _has_prefix(User.email, q))
+        if db.bind.dialect.name == "sqlite":
+            phrase = '"' + q.replace('"', '""') + '"' # One FTS5 phrase, i.e. a plain substring
+            statement = (
+                select(User, _fts.c.rowid)
+                .join(_fts, _fts.c.rowid == User.id)
+                .where(text(f"{SEARCH_TABLE} MATCH :phrase").bindparams(phrase=phrase), already_ranked)
+                .order_by(_fts.c.rowid)
+            )
+            if after is not None:
+                statement = statement.where(_fts.c.rowid > after)
+        else:
+            pattern = f"%{_escape_like(q.lower())}%"
+            statement = (
+                select(User, User.id)
+                .where(search_document.like(pattern, escape="\\"), already_ranked)
+                .order_by(User.id)
+            )
+            if after is not None:
+                statement = statement.where(User.id > after)
+    return statement.limit(limit)
+
+
+@traced()
+async def search_users(db: AsyncSession, q: str, *, limit: int = 20, cursor: Optional[str] = None) -> SearchPage:
+    """One page of users matching `q`, best tier first; pass `next_cursor` back for the next page."""
+    q = q.strip()
+    tier, after = decode_cursor(cursor) if cursor else (TIER_USERNAME_PREFIX, None)
+    users: List[User] = []
+    keys: List[Tuple[int, Any]] = []
+    while q and tier <= TIER_SUBSTRING and len(users) < limit:
+        statement = _tier_statement(db, tier, q, after, limit - len(users))
+        if statement is not None:
+            for user, key in (await db.execute(statement)).all():
+                users.append(user)
+                keys.append((tier, key))
+        tier, after = tier + 1, None
+    next_cursor = encode_cursor(*keys[-1]) if keys and len(users) == limit else None
+    return SearchPage(users=users, next_cursor=next_cursor, keys=keys)
+
+
+@traced()
+async def search_users_sharded(shards: ShardSet, q: str, *, limit: int = 20, cursor: Optional[str] = None) -> SearchPage:
+    """`search_users` over every shard: each returns its best `limit`, the merge keeps the overall best."""
+    if cursor:
+        decode_cursor(cursor) # Reject a malformed cursor before fanning out
+    pages = await shards.scatter_gather(lambda db: search_users(db, q, limit=limit, cursor=cursor))
+    ranked = sorted(
+        ((key, user) for page in pages.values() for key, user in zip(page.keys, page.users)),
+        key=lambda entry: entry[0],
+    )[:limit]
+    next_cursor = encode_cursor(*ranked[-1][0]) if len(ranked) == limit else None
+    return SearchPage(users=[user for _, user in ranked], next_cursor=next_cursor, keys=[key for key, _ in ranked])
@@ -1,38 +1,85 @@
-# from langchain_openai import ChatOpenAI
-# from langchain_anthropic import ChatAnthropic # Example for Anthropic
-# from app.core.config import get_settings
-
-# settings = get_settings()
-
-# Example LLM initialization (adjust based on your needs and chosen provider)
-
-# def get_openai_llm(temperature: float = 0.7, model_name: str = "gpt-3.5-turbo"):
-#     if not settings.OPENAI_API_KEY:
-#         raise ValueError("OPENAI_API_KEY is not set in environment variables.")
-#     return ChatOpenAI(
-#         openai_api_key=settings.OPENAI_API_KEY,
-#         model_name=model_name,
-#         temperature=temperature
-#     )
-
-# def get_anthropic_llm(temperature: float = 0.7, model_name: str = "claude-2"):
-#     if not settings.ANTHROPIC_API_KEY:
-#         raise ValueError("ANTHROPIC_API_KEY is not set in environment variables.")
-#     return ChatAnthropic(
-#         anthropic_api_key=settings.ANTHROPIC_API_KEY,
-#         model_name=model_name,
-#         temperature=temperature
-#     )
-
-# You might have a default LLM getter or a factory based on configuration
-# def get_default_llm():
-#     # Example: prioritize OpenAI if key is available, else try Anthropic, etc.
-#     if settings.OPENAI_API_KEY:
-#         return get_openai_llm()
-#     # elif settings.ANTHROPIC_API_KEY:
-#     #     return get_anthropic_llm()
-#     else:
-#         # Potentially raise an error or return a mock/dummy LLM for local dev if no keys
-#         raise ValueError("No LLM API key configured.")
-
-# print("Langchain LLM module loaded. Configure API keys in .env") 
\ No newline at end of file
+"""
+LLM clients, and a router that spreads requests over every configured provider.
+
+The provider packages are optional: `langchain-openai` is a dependency, install
+`langchain-anthropic` with `pdm install -G anthropic`.
+"""
+from typing import Any, List, Optional
+
+import httpx
+
+from app.core.config import get_settings
+from app.core.tracing import TracedTransport
+from app.langchain_module.routing import LangChainProvider, LLMRouter
+
+settings = get_settings()
+
+
+def get_openai_llm(temperature: float = 0.7, model_name: str = "gpt-3.5-turbo") -> Any:
+    if not settings.OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY is not set in environment variables.")
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        openai_api_key=settings.OPENAI_API_KEY,
+        model_name=model_name,
+        temperature=temperature,
+        http_async_client=httpx.AsyncClient(transport=TracedTransport()), # Calls join the request's trace
+    )
+
+
+def get_anthropic_llm(temperature: float = 0.7, model_name: str = "claude-2") -> Any:
+    if not settings.ANTHROPIC_API_KEY:
+        raise ValueError("ANTHROPIC_API_KEY is not set in environment variables.")
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(
+        anthropic_api_key=settings.ANTHROPIC_API_KEY,
+        model_name=model_name,
+        temperature=temperature
+    )
+
+
+_FACTORIES = {"openai": get_openai_llm, "anthropic": get_anthropic_llm}
+_API_KEYS = {"openai": "OPENAI_API_KEY", "anthropic": "ANTHROPIC_API_KEY"}
+
+
+def configured_providers() -> List[LangChainProvider]:
+    """LLM_PROVIDERS entries ("openai" or "openai:<model>") whose API key is set, in order."""
+    providers = []
+    for entry in settings.LLM_PROVIDERS:
+        vendor, _, model = entry.partition(":")
+        if vendor not in _FACTORIES:
+            raise ValueError(f"Unknown LLM provider {vendor!r} in LLM_PROVIDERS")
+        if getattr(settings, _API_KEYS[vendor]):
+            llm = _FACTORIES[vendor](model_name=model) if model else _FACTORIES[vendor]()
+            providers.append(LangChainProvider(entry, llm))
+    return providers
+
+
+def get_default_llm() -> Any:
+    """The first configured provider's model; use `get_llm_router()` to use them all."""
+    providers = configured_providers()
+    if not providers:
+        raise ValueError("No LLM API key configured.")
+    return providers[0].runnable
+
+
+llm_router: Optional[LLMRouter] = None # Built on first use; its metrics are at GET /admin/llm/routing
+
+
+def get_llm_router() -> LLMRouter:
+    """Router over every configured provider, with hedging and failover (see routing.py)."""
+    global llm_router
+    if llm_router is None:
+        providers = configured_providers()
+        if not providers:
+            raise ValueError("No LLM API key configured.")
+        llm_router = LLMRouter(
+            providers,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+            hedge_budget=settings.LLM_HEDGE_BUDGET,
+            timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+            breaker_failures=settings.LLM_BREAKER_FAILURES,
+            breaker_reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+        )
+    return llm_router
@@ -0,0 +1,371 @@
+"""
+Multi-provider LLM routing: hedged requests, failover and circuit breakers.
+
+`LLMRouter` sends each request to the first provider (in preference order)
+whose circuit breaker admits it. If no answer has arrived by the time that
+provider's rolling p95 latency is reached, a hedge goes to the next provider.
+The first good answer wins and the other request is cancelled. Only the
+slowest ~5% of requests are duplicated, yet the slow tail of one provider is
+cut off at about its p95 plus the other provider's latency. A hedge budget
+caps the extra load if a provider turns slow across the board.
+
+Errors and timeouts fail over straight to the next provider. After
+`breaker_failures` consecutive failures a provider's breaker opens, and the
+provider is skipped for `breaker_reset_seconds`. Then a single trial request
+is let through ("half-open"): if it succeeds the breaker closes, otherwise it
+opens again.
+
+A provider is anything with a `name` and `async ainvoke(input, **kwargs)`.
+LangChain chat models fit through `LangChainProvider`. `ScriptedProvider`
+answers after scripted latencies (and failures), for tests and for measuring
+the effect of hedging; see scripts/bench_llm_routing.py.
+
+`LLMRouter.snapshot()` returns the routing metrics, served at
+GET /admin/llm/routing. Each request's decisions are also logged at DEBUG.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMProvider(Protocol):
+    name: str
+
+    async def ainvoke(self, input: Any, **kwargs: Any) -> Any:
+        ...
+
+
+class NoProviderAvailableError(RuntimeError):
+    """Every provider's circuit breaker is open."""
+
+
+class ProviderError(RuntimeError):
+    """Raised by `ScriptedProvider` for its scripted failures."""
+
+
+class LatencyWindow:
+    """The latencies and outcomes of a provider's last `size` requests."""
+
+    def __init__(self, size: int = 200):
+        self._latencies: Deque[float] = deque(maxlen=size) # Seconds, successes and cut-off requests
+        self._outcomes: Deque[bool] = deque(maxlen=size) # True for success
+        self._sorted: Optional[List[float]] = None # Cached until the next sample
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def add_latency(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+        self._sorted = None
+
+    def add_outcome(self, success: bool) -> None:
+        self._outcomes.append(success)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._latencies)
+        return self._sorted[min(len(self._sorted) - 1, int(len(self._sorted) * pct / 100))]
+
+    @property
+    def error_rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, reset_seconds: float = 30.0):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.opened = 0 # Times the breaker opened
+        self._consecutive = 0
+        self._open_until = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a request may go to the provider now; claims the trial request when half-open."""
+        if self.state == OPEN:
+            if time.monotonic() < self._open_until:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def success(self) -> None:
+        self._consecutive = 0
+        self._trial_in_flight = False
+        self.state = CLOSED
+
+    def failure(self) -> None:
+        self._consecutive += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self._consecutive >= self.failures:
+            self.state = OPEN
+            self.opened += 1
+            self._open_until = time.monotonic() + self.reset_seconds
+
+    def release(self) -> None:
+        """A request that was let through ended without a verdict (cancelled as the loser)."""
+        self._trial_in_flight = False
+
+
+@dataclass
+class ProviderStats:
+    calls: int = 0
+    successes: int = 0
+    failures: int = 0
+    cancelled: int = 0 # Lost to a faster hedge or failover and cancelled
+    wins: int = 0 # Calls whose answer was returned
+
+
+@dataclass
+class RoutingStats:
+    """Counters of the routing decisions."""
+    requests: int = 0
+    succeeded: int = 0
+    failed: int = 0 # Every attempted provider failed
+    rejected: int = 0 # No provider available (all breakers open)
+    hedges: int = 0 # Duplicate requests sent because the first was slower than its p95
+    hedge_wins: int = 0 # Requests answered by the hedge rather than the first provider
+    hedges_skipped: int = 0 # Hedges not sent for lack of budget
+    failovers: int = 0 # Requests re-sent to the next provider after an error
+
+
+class _Route:
+    """Per-provider state held by the router."""
+
+    def __init__(self, provider: LLMProvider, window: int, breaker: CircuitBreaker):
+        self.provider = provider
+        self.window = LatencyWindow(window)
+        self.breaker = breaker
+        self.stats = ProviderStats()
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        providers: Sequence[LLMProvider],
+        hedge_percentile: float = 95.0,
+        min_samples: int = 20,
+        hedge_budget: float = 0.1,
+        timeout_seconds: float = 60.0,
+        window: int = 200,
+        breaker_failures: int = 5,
+        breaker_reset_seconds: float = 30.0,
+    ):
+        """
+        Route requests over `providers`, in order of preference.
+
+        **Parameters**
+
+        * `hedge_percentile`: latency percentile of the first provider after which a hedge is sent
+        * `min_samples`: latencies needed before hedging (no hedges until then)
+        * `hedge_budget`: the largest fraction of recent requests that may be hedged
+        * `timeout_seconds`: per attempt; a timeout counts as a provider failure
+        * `window`: recent requests per provider that percentiles and error rates cover
+        * `breaker_failures`, `breaker_reset_seconds`: consecutive failures that open a
+          provider's breaker, and how long it stays open
+        """
+        if not providers:
+            raise ValueError("At least one provider is required")
+        if len({provider.name for provider in providers}) != len(providers):
+            raise ValueError("Provider names must be unique")
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.hedge_budget = hedge_budget
+        self.timeout_seconds = timeout_seconds
+        self.routes = [
+            _Route(provider, window, CircuitBreaker(breaker_failures, breaker_reset_seconds))
+            for provider in providers
+        ]
+        self.stats = RoutingStats()
+        self._hedged: Deque[bool] = deque(maxlen=window) # Whether each recent request was hedged
+
+    def hedge_delay(self, route: _Route) -> Optional[float]:
+        """Seconds to wait for `route` before hedging; None before enough samples."""
+        if len(route.window) < self.min_samples:
+            return None
+        return route.window.percentile(self.hedge_percentile)
+
+    async def _attempt(self, route: _Route, input: Any, kwargs: Dict[str, Any]) -> Any:
+        route.stats.calls += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(route.provider.ainvoke(input, **kwargs), self.timeout_seconds)
+        except asyncio.CancelledError:
+            # Record how long it had been running: dropping the slow losers would
+            # pull the percentile down and make hedging ever more eager
+            route.window.add_latency(time.perf_counter() - started)
+            route.stats.cancelled += 1
+            route.breaker.release()
+            raise
+        except Exception:
+            route.window.add_outcome(False)
+            route.stats.failures += 1
+            route.breaker.failure()
+            raise
+        route.window.add_latency(time.perf_counter() - started)
+        route.window.add_outcome(True)
+        route.stats.successes += 1
+        route.breaker.success()
+        return result
+
+    async def ainvoke(self, input: Any, **kwargs: Any) -> Any:
+        """The first good answer from the providers, hedging slow requests and failing over on errors."""
+        self.stats.requests += 1
+        available = (route for route in self.routes if route.breaker.allow())
+        first = next(available, None)
+        if first is None:
+            self.stats.rejected += 1
+            raise NoProviderAvailableError("Every LLM provider's circuit breaker is open")
+
+        tasks: Dict[asyncio.Task, _Route] = {}
+
+        def launch(route: _Route) -> None:
+            tasks[asyncio.create_task(self._attempt(route, input, kwargs))] = route
+
+        launch(first)
+        hedge_at = self.hedge_delay(first)
+        hedge: Optional[_Route] = None
+        last_error: Optional[BaseException] = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_at, return_when=asyncio.FIRST_COMPLETED)
+                if not done: # First provider slower than its p95: hedge, once
+                    if sum(self._hedged) >= self.hedge_budget * max(len(self._hedged), 1):
+                        self.stats.hedges_skipped += 1
+                    else:
+                        hedge = next(available, None)
+                        if hedge is not None:
+                            self.stats.hedges += 1
+                            logger.debug("Hedging %s with %s after %.0f ms", first.provider.name, hedge.provider.name, hedge_at * 1000)
+                            launch(hedge)
+                    hedge_at = None
+                    continue
+                for task in done:
+                    route = tasks.pop(task)
+                    if task.exception() is None:
+                        route.stats.wins += 1
+                        self.stats.succeeded += 1
+                        if route is hedge:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    logger.debug("LLM provider %s failed: %r", route.provider.name, last_error)
+                if not tasks: # Nothing else in flight: fail over to the next provider
+                    route = next(available, None)
+                    if route is not None:
+                        self.stats.failovers += 1
+                        logger.debug("Failing over to %s", route.provider.name)
+                        hedge_at = None # A failover is not hedged again
+                        launch(route)
+            self.stats.failed += 1
+            raise last_error
+        finally:
+            self._hedged.append(hedge is not None)
+            for task in tasks: # The losers
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return None if seconds is None else round(seconds * 1000, 2)
+
+        return {
+            "requests": self.stats.requests,
+            "succeeded": self.stats.succeeded,
+            "failed": self.stats.failed,
+            "rejected": self.stats.rejected,
+            "hedges": self.stats.hedges,
+            "hedge_wins": self.stats.hedge_wins,
+            "hedges_skipped": self.stats.hedges_skipped,
+            "failovers": self.stats.failovers,
+            "providers": [
+                {
+                    "name": route.provider.name,
+                    "breaker": route.breaker.state,
+                    "breaker_opened": route.breaker.opened,
+                    "calls": route.stats.calls,
+                    "successes": route.stats.successes,
+                    "failures": route.stats.failures,
+                    "cancelled": route.stats.cancelled,
+                    "wins": route.stats.wins,
+                    "error_rate": round(route.window.error_rate, 4),
+                    "p50_ms": ms(route.window.percentile(50)),
+                    "p95_ms": ms(route.window.percentile(95)),
+                    "p99_ms": ms(route.window.percentile(99)),
+                    "hedge_after_ms": ms(self.hedge_delay(route)),
+                }
+                for route in self.routes
+            ],
+        }
+
+
+class LangChainProvider:
+    """A LangChain runnable (e.g. `ChatOpenAI`) under a name the router reports."""
+
+    def __init__(self, name: str, runnable: Any):
+        self.name = name
+        self.runnable = runnable
+
+    async def ainvoke(self, input: Any, **kwargs: Any) -> Any:
+        return await self.runnable.ainvoke(input, **kwargs)
+
+
+LatencyScript = Union[float, Sequence[float], Callable[[random.Random], float]]
+
+
+def bimodal_latency(fast_ms: float, slow_ms: float, slow_fraction: float, jitter: float = 0.2) -> Callable[[random.Random], float]:
+    """Mostly `fast_ms`, sometimes `slow_ms` (a queueing or cold-start tail), each +/- `jitter`."""
+    def sample(rng: random.Random) -> float:
+        base = slow_ms if rng.random() < slow_fraction else fast_ms
+        return base * rng.uniform(1 - jitter, 1 + jitter)
+    return sample
+
+
+class ScriptedProvider:
+    """
+    Fake provider answering `"<name>: <input>"` after scripted latencies.
+
+    `latency_ms` is a constant, a sequence replayed in a loop, or a function of a
+    seeded `random.Random` (see `bimodal_latency`). A fraction `error_rate` of the
+    calls raise `ProviderError`, after their latency.
+    """
+
+    def __init__(self, name: str, latency_ms: LatencyScript, error_rate: float = 0.0, seed: int = 0):
+        self.name = name
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        if callable(latency_ms):
+            self._next_ms = lambda: latency_ms(self._rng)
+        elif isinstance(latency_ms, (int, float)):
+            self._next_ms = lambda: latency_ms
+        else:
+            script = itertools.cycle(latency_ms)
+            self._next_ms = lambda: next(script)
+
+    async def ainvoke(self, input: Any, **kwargs: Any) -> Any:
+        self.calls += 1
+        fails = self._rng.random() < self.error_rate
+        await asyncio.sleep(self._next_ms() / 1000)
+        if fails:
+            raise ProviderError(f"{self.name} failed (scripted)")
+        return f"{self.name}: {input}"
+
@@ -0,0 +1,24 @@
+"""
+Local vector search over embeddings, for retrieval without an external vector
+database (e.g. offline deployments). Requires NumPy (`pdm install -G vectors`).
+
+    store = TextVectorStore(HashingEmbedder(), VectorStore(dim=256))
+    store.add_texts(["doc-1"], ["How do I reset my password?"])
+    store.similarity_search("forgot password", k=3)
+"""
+from app.langchain_module.vectorstore.embeddings import Embedder, HashingEmbedder, LangChainEmbedder
+from app.langchain_module.vectorstore.ivf import IVFIndex
+from app.langchain_module.vectorstore.store import COSINE, DOT, Hit, VectorStore
+from app.langchain_module.vectorstore.text import TextVectorStore
+
+__all__ = [
+    "COSINE",
+    "DOT",
+    "Embedder",
+    "HashingEmbedder",
+    "Hit",
+    "IVFIndex",
+    "LangChainEmbedder",
+    "TextVectorStore",
+    "VectorStore",
+]
@@ -0,0 +1,61 @@
+"""
+Embedders turn text into vectors for the vector store.
+
+Anything with `dimension`, `embed_documents` and `embed_query` fits, which is
+also the shape of LangChain's `Embeddings`: wrap one (e.g. `OpenAIEmbeddings`,
+or a local model for offline deployments) in `LangChainEmbedder`.
+`HashingEmbedder` needs no model at all. It is deterministic and texts sharing
+words get similar vectors, which is what tests and local development need.
+"""
+import hashlib
+import re
+from typing import Any, Protocol, Sequence
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+
+class Embedder(Protocol):
+    dimension: int
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray: # (len(texts), dimension)
+        ...
+
+    def embed_query(self, text: str) -> np.ndarray: # (dimension,)
+        ...
+
+
+class HashingEmbedder:
+    """Bag of words hashed into `dimension` signed buckets (the "hashing trick"), L2-normalised."""
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+            vector[digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        return np.stack([self._embed(text) for text in texts]) if texts else np.empty((0, self.dimension), np.float32)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._embed(text)
+
+
+class LangChainEmbedder:
+    """Adapts a LangChain `Embeddings` object, whose methods return lists of floats."""
+
+    def __init__(self, embeddings: Any, dimension: int):
+        self.embeddings = embeddings
+        self.dimension = dimension
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32).reshape(len(texts), self.dimension)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
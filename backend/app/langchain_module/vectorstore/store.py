@@ -0,0 +1,275 @@
+"""
+In-memory vector store: one contiguous float32 matrix, searched with NumPy.
+
+Vectors are rows of a single C-contiguous `(capacity, dim)` array that grows by
+doubling, so a search is one matrix product per block of rows followed by a
+partial sort (`argpartition`) for the top k. With the cosine metric, vectors
+are normalised once when added, so cosine similarity is a dot product. Queries
+are batched: `search` takes one vector or a `(n, dim)` matrix.
+
+Deleting only marks a row dead (it is skipped when scoring). Dead rows are
+reclaimed by `compact()`, which runs by itself once a quarter of the rows are
+dead. Adding an id that is already stored replaces its vector.
+
+`build_index()` attaches an approximate IVF index (see ivf.py) for large
+corpora; `search(..., exact=True)` still scans everything.
+
+`save()` writes the matrix as a `.npy` file and `load()` memory-maps it, so a
+restart does not parse or copy the vectors; pages are read from disk as
+searches touch them. The first add after loading copies the matrix into memory.
+
+Searches on large stores take milliseconds of CPU. NumPy releases the GIL
+during the matrix products, so call them through `run_in_threadpool` from
+async code. A store is not safe for concurrent writers.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.langchain_module.vectorstore.ivf import IVFIndex
+
+COSINE = "cosine"
+DOT = "dot"
+
+_FORMAT_VERSION = 1
+_VECTORS_FILE = "vectors.npy"
+_ALIVE_FILE = "alive.npy"
+_META_FILE = "meta.json"
+_CENTROIDS_FILE = "ivf_centroids.npy"
+_ASSIGNMENTS_FILE = "ivf_assignments.npy"
+
+
+@dataclass(frozen=True, slots=True)
+class Hit:
+    id: str
+    score: float
+    payload: Optional[Dict[str, Any]] = None
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores of each row, best first."""
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorStore:
+    def __init__(self, dim: int, metric: str = COSINE, capacity: int = 1024, block_rows: int = 65536):
+        if metric not in (COSINE, DOT):
+            raise ValueError(f"metric must be {COSINE!r} or {DOT!r}")
+        self.dim = dim
+        self.metric = metric
+        self.block_rows = block_rows # Rows scored per matrix product, bounds temporary memory
+        self.index: Optional[IVFIndex] = None
+        self._vectors = np.empty((max(capacity, 1), dim), dtype=np.float32)
+        self._alive = np.zeros(max(capacity, 1), dtype=bool)
+        self._ids: List[Optional[str]] = [] # Row -> id, None once deleted
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {} # Id -> row
+        self._size = 0 # Rows in use, dead ones included
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The stored rows (dead ones included), as a view."""
+        return self._vectors[:self._size]
+
+    def get(self, id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(id)
+        return None if row is None else self._vectors[row]
+
+    def _prepare(self, vectors: Any) -> np.ndarray:
+        array = np.array(vectors, dtype=np.float32, ndmin=2, order="C") # Always a copy
+        if array.ndim != 2 or array.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got shape {array.shape}")
+        if not np.isfinite(array).all():
+            raise ValueError("Vectors must be finite")
+        if self.metric == COSINE:
+            array /= np.maximum(np.linalg.norm(array, axis=1, keepdims=True), 1e-12)
+        return array
+
+    def _reserve(self, rows: int) -> None:
+        capacity = len(self._vectors)
+        if rows <= capacity and self._vectors.flags.writeable:
+            return
+        while capacity < rows:
+            capacity *= 2
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size] # Also detaches from a memory-mapped file
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._alive = vectors, alive
+
+    # --- writes -------------------------------------------------------------------------
+    def add(self, ids: Sequence[str], vectors: Any, payloads: Optional[Sequence[Optional[Dict[str, Any]]]] = None) -> None:
+        """Add (or replace) vectors under `ids`, with optional JSON-serialisable payloads."""
+        ids = list(ids)
+        array = self._prepare(vectors)
+        if len(ids) != len(array) or (payloads is not None and len(payloads) != len(ids)):
+            raise ValueError("ids, vectors and payloads must have the same length")
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in one add")
+        self.delete([id for id in ids if id in self._rows], compact=False)
+        first = self._size
+        self._reserve(first + len(ids))
+        self._vectors[first:first + len(ids)] = array
+        self._alive[first:first + len(ids)] = True
+        for offset, id in enumerate(ids):
+            self._rows[id] = first + offset
+        self._ids.extend(ids)
+        self._payloads.extend(payloads if payloads is not None else [None] * len(ids))
+        self._size += len(ids)
+        if self.index is not None:
+            self.index.add(first, array)
+
+    def delete(self, ids: Sequence[str], compact: bool = True) -> int:
+        """Remove `ids` (unknown ones are ignored); returns how many were removed."""
+        removed = 0
+        for id in ids:
+            row = self._rows.pop(id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._ids[row] = self._payloads[row] = None
+                removed += 1
+        if compact and self._size - len(self._rows) > max(1024, self._size // 4):
+            self.compact()
+        return removed
+
+    def compact(self) -> None:
+        """Drop dead rows, renumbering the live ones."""
+        keep = self._alive[:self._size].copy()
+        live = int(keep.sum())
+        vectors = np.empty((max(live, 1024), self.dim), dtype=np.float32)
+        vectors[:live] = self._vectors[:self._size][keep]
+        self._vectors = vectors
+        self._alive = np.zeros(len(vectors), dtype=bool)
+        self._alive[:live] = True
+        self._ids = [id for id in self._ids if id is not None]
+        self._payloads = [payload for payload, alive in zip(self._payloads, keep) if alive]
+        self._rows = {id: row for row, id in enumerate(self._ids)}
+        self._size = live
+        if self.index is not None:
+            self.index.compact(keep)
+
+    def build_index(self, nlist: Optional[int] = None, nprobe: int = 8, iterations: int = 10) -> IVFIndex:
+        """Train an IVF index on the current vectors; later adds are filed incrementally."""
+        self.compact()
+        index = IVFIndex(
+            nlist or IVFIndex.default_nlist(len(self)), nprobe=nprobe, iterations=iterations,
+            normalize=self.metric == COSINE,
+        )
+        index.train(self.vectors)
+        index.assign_all(self.vectors)
+        self.index = index
+        return index
+
+    # --- search -------------------------------------------------------------------------
+    def search(
+        self, queries: Any, k: int = 10, *, exact: bool = False, nprobe: Optional[int] = None
+    ) -> List[List[Hit]]:
+        """The `k` best hits for each query vector, best first (one list per query)."""
+        queries = self._prepare(queries)
+        k = min(k, len(self))
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+        if self.index is not None and not exact:
+            return [self._search_index(query, k, nprobe) for query in queries]
+        return self._search_exact(queries, k)
+
+    def _hits(self, rows: np.ndarray, scores: np.ndarray) -> List[Hit]:
+        return [
+            Hit(self._ids[row], float(score), self._payloads[row])
+            for row, score in zip(rows.tolist(), scores.tolist())
+            if score > -np.inf
+        ]
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> List[List[Hit]]:
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self._size, self.block_rows):
+            stop = min(start + self.block_rows, self._size)
+            scores = queries @ self._vectors[start:stop].T
+            alive = self._alive[start:stop]
+            if not alive.all():
+                scores[:, ~alive] = -np.inf
+            # Keep a running top k: merge this block's scores with the best so far
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), (len(queries), stop - start))], axis=1)
+            top = _top_k(scores, min(k, scores.shape[1]))
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+        return [self._hits(rows, scores) for rows, scores in zip(best_rows, best_scores)]
+
+    def _search_index(self, query: np.ndarray, k: int, nprobe: Optional[int]) -> List[Hit]:
+        rows = self.index.candidates(query, nprobe)
+        rows = rows[self._alive[rows]]
+        if not len(rows):
+            return []
+        scores = self._vectors[rows] @ query
+        top = _top_k(scores[None, :], min(k, len(rows)))[0]
+        return self._hits(rows[top], scores[top])
+
+    # --- persistence --------------------------------------------------------------------
+    def save(self, path: str) -> None:
+        """Write the store to directory `path` (created if needed); see `load`."""
+        os.makedirs(path, exist_ok=True)
+        files = {
+            _VECTORS_FILE: self.vectors,
+            _ALIVE_FILE: self._alive[:self._size],
+        }
+        if self.index is not None:
+            files[_CENTROIDS_FILE] = self.index.centroids
+            files[_ASSIGNMENTS_FILE] = self.index.assignments
+        for name, array in files.items():
+            # Write-then-rename: a store memory-mapped from `path` keeps reading the old file
+            temporary = os.path.join(path, f".{name}.tmp")
+            with open(temporary, "wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(temporary, os.path.join(path, name))
+        meta = {
+            "version": _FORMAT_VERSION,
+            "dim": self.dim,
+            "metric": self.metric,
+            "ids": self._ids,
+            "payloads": self._payloads,
+            "index": self.index.state() if self.index is not None else None,
+        }
+        temporary = os.path.join(path, f".{_META_FILE}.tmp")
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(meta, file, separators=(",", ":"))
+        os.replace(temporary, os.path.join(path, _META_FILE)) # Last, so a complete save is all-or-nothing to readers
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorStore":
+        """Open a store saved with `save`; with `mmap`, the vectors stay on disk until touched."""
+        with open(os.path.join(path, _META_FILE), encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format {meta.get('version')!r}")
+        store = cls(meta["dim"], meta["metric"], capacity=1)
+        vectors = np.load(os.path.join(path, _VECTORS_FILE), mmap_mode="r" if mmap else None)
+        if len(vectors):
+            store._vectors = vectors
+            store._alive = np.load(os.path.join(path, _ALIVE_FILE))
+        store._size = len(vectors)
+        store._ids = meta["ids"]
+        store._payloads = meta["payloads"]
+        store._rows = {id: row for row, id in enumerate(store._ids) if id is not None}
+        if meta["index"] is not None:
+            store.index = IVFIndex.restore(
+                meta["index"],
+                np.load(os.path.join(path, _CENTROIDS_FILE)),
+                np.load(os.path.join(path, _ASSIGNMENTS_FILE)),
+            )
+        return store
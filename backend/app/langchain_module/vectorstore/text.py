@@ -0,0 +1,28 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.langchain_module.vectorstore.embeddings import Embedder
+from app.langchain_module.vectorstore.store import Hit, VectorStore
+
+
+class TextVectorStore:
+    """A `VectorStore` fed by an `Embedder`: add texts, search with a text query."""
+
+    def __init__(self, embedder: Embedder, store: Optional[VectorStore] = None):
+        self.embedder = embedder
+        self.store = store if store is not None else VectorStore(embedder.dimension)
+        if self.store.dim != embedder.dimension:
+            raise ValueError(f"Store dimension {self.store.dim} does not match the embedder's {embedder.dimension}")
+
+    def add_texts(self, ids: Sequence[str], texts: Sequence[str], metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> None:
+        """Embed and store `texts`; each hit's payload has the text and its metadata."""
+        payloads = [
+            {"text": text, **(metadatas[i] if metadatas is not None else {})}
+            for i, text in enumerate(texts)
+        ]
+        self.store.add(ids, self.embedder.embed_documents(texts), payloads)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        return self.store.delete(ids)
+
+    def similarity_search(self, query: str, k: int = 4, **search_options: Any) -> List[Hit]:
+        return self.store.search(self.embedder.embed_query(query), k, **search_options)[0]
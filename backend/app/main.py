@@ -1,9 +1,23 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.apis.v1 import api_router_v1 # Use the correct variable name from apis/v1/__init__.py
 from app.core.config import settings # Import settings directly
-# from app.core.redis_client import get_redis_pool_instance, close_redis_pool # For startup/shutdown
+from app.core import logging_config, loop_monitor, security, tracing
+from app.core.activity import activity_tracker
+from app.core.audit_log import audit_log
+from app.core.db import SessionLocal, engine
+from app.core.http_cache import CachePolicy, Conditional, ConditionalRequest, make_etag
+from app.core.jwt_keys import keyring
+from app.core.memory_profiler import memory_profiler
+from app.core.redis_client import close_redis_pool
+from app.core.sharding import shard_set
+from app.core.token_revocation import revocation_store
+from app.core.user_events import user_events
+from app.crud.cache import invalidation_listener
+from app.services.avatars import avatar_store
+from app.services.user_import import importer
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -21,12 +35,150 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+# Inside the logging middleware, so sampled requests' log lines carry the trace id
+app.add_middleware(tracing.TracingMiddleware)
+if settings.TRACING_ENABLED:
+    tracing.instrument_fastapi()
+    tracing.instrument_engine(engine.sync_engine)
+    for shard_engine in shard_set.engines.values():
+        tracing.instrument_engine(shard_engine.sync_engine)
+
+# Outermost, so every request (CORS preflights included) gets a request id and an access log line
+app.add_middleware(logging_config.RequestContextMiddleware)
+
 app.include_router(api_router_v1, prefix=settings.API_V1_STR)
 
 @app.get("/api/health") # Keep a simple health check outside API version prefix
 async def health_check(): # Make it async
     return {"status": "OK"}
 
+JWKS_ETAG = make_etag("jwks", keyring.jwks_json)
+
+@app.get("/.well-known/jwks.json", include_in_schema=False)
+async def jwks(conditional: ConditionalRequest = Depends(Conditional(CachePolicy(public=True, max_age=300)))):
+    # Pre-serialised by the keyring; caches may keep it for a while, rotation overlaps keys
+    not_modified = conditional.check(JWKS_ETAG)
+    if not_modified is not None:
+        return not_modified
+    return Response(
+        content=keyring.jwks_json,
+        media_type="application/json",
+        headers=conditional.headers,
+    )
+
+@app.on_event("startup")
+async def configure_logging():
+    # First, so the other startup hooks already log through the queue
+    logging_config.configure_logging()
+
+@app.on_event("startup")
+async def start_tracing():
+    tracing.tracer.start()
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.watchdog.start()
+
+@app.on_event("startup")
+async def start_memory_profiler():
+    if settings.MEMORY_PROFILER_ENABLED:
+        memory_profiler.start_sampler()
+
+@app.on_event("startup")
+async def calibrate_password_hashing():
+    if settings.PASSWORD_HASH_TARGET_MS:
+        # Calibration runs real hashes for a second or so; keep it off the event loop
+        await run_in_threadpool(security.configure_password_hashing)
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    # Warms the Bloom filter right away, then picks up revocations made by other workers
+    revocation_store.start_background_sync(SessionLocal, settings.REVOCATION_SYNC_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_audit_log():
+    if settings.AUDIT_LOG_ENABLED:
+        audit_log.start(SessionLocal)
+
+@app.on_event("startup")
+async def start_activity_tracker():
+    if settings.ACTIVITY_TRACKING_ENABLED:
+        activity_tracker.start(SessionLocal)
+
+@app.on_event("startup")
+async def start_cache_invalidation():
+    # Without Redis, cached models are per worker and invalidated locally
+    if settings.REDIS_HOST:
+        invalidation_listener.start()
+
+@app.on_event("startup")
+async def start_user_events():
+    # With Redis: this worker's single subscription to the change events of all workers
+    user_events.start()
+
+@app.on_event("startup")
+async def start_user_importer():
+    importer.start(SessionLocal)
+
+@app.on_event("shutdown")
+async def stop_user_importer():
+    # Interrupts running imports; rows of finished batches stay imported
+    await importer.stop()
+
+@app.on_event("shutdown")
+async def stop_user_events():
+    await user_events.stop()
+
+@app.on_event("shutdown")
+async def stop_cache_invalidation():
+    await invalidation_listener.stop()
+
+@app.on_event("shutdown")
+async def stop_avatar_store():
+    await avatar_store.stop()
+
+@app.on_event("shutdown")
+async def stop_activity_tracker():
+    if settings.ACTIVITY_TRACKING_ENABLED:
+        await activity_tracker.stop(SessionLocal)
+
+@app.on_event("shutdown")
+async def stop_audit_log():
+    # Drains buffered events before the process exits
+    await audit_log.stop()
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    await revocation_store.stop_background_sync()
+
+@app.on_event("shutdown")
+async def close_redis():
+    # After everything above that holds or uses a Redis connection has stopped
+    await close_redis_pool()
+
+@app.on_event("shutdown")
+async def close_shards():
+    # After the activity tracker's final flush, which writes to every shard
+    await shard_set.dispose()
+
+@app.on_event("shutdown")
+async def stop_memory_profiler():
+    await memory_profiler.stop_sampler()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    loop_monitor.watchdog.stop()
+
+@app.on_event("shutdown")
+async def stop_tracing():
+    tracing.tracer.stop() # Writes out queued traces
+
+@app.on_event("shutdown")
+async def stop_logging():
+    # Last: writes out whatever the other shutdown hooks logged
+    logging_config.stop_logging()
+
 # Comment out Redis related startup/shutdown for now
 # @app.on_event("startup")
 # async def startup_event():
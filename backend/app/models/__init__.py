@@ -1,5 +1,9 @@
 from .base import Base  # noqa: F401, To make Base available via app.models.Base
 from .user import User  # noqa: F401, To ensure User model is registered with Base.metadata
+from .refresh_token import RefreshToken, RevokedTokenFamily  # noqa: F401
+from .role import Permission, Role, role_permissions, user_permissions, user_roles  # noqa: F401
+from .auth_event import AuthEvent  # noqa: F401
+from . import user_search  # noqa: F401, registers the search index DDL on the users table
  
 # If you have other models, import them here as well:
 # from .item import Item # noqa: F401 (example)
@@ -0,0 +1,30 @@
+from sqlalchemy import JSON, Boolean, Column, DateTime, Index, Integer, String
+
+from app.models.base import Base
+
+class AuthEvent(Base):
+    """
+    Audit record of an authentication event (registration, login success/failure, ...).
+
+    Written in batches by app/core/audit_log.py, never inline in the request.
+    `user_id` has no foreign key on purpose: audit history outlives deleted users.
+    """
+    __tablename__ = "auth_events"
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(32), nullable=False)
+    success = Column(Boolean, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    username = Column(String, nullable=True) # As submitted, also for unknown users
+    ip_address = Column(String(45), nullable=True)
+    user_agent = Column(String(256), nullable=True)
+    detail = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True) # When it happened, not when written
+
+    __table_args__ = (
+        Index("ix_auth_events_user_id_created_at", "user_id", "created_at"),
+        Index("ix_auth_events_event_type_created_at", "event_type", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<AuthEvent(id={self.id}, event_type='{self.event_type}', username='{self.username}')>"
@@ -1,7 +1,13 @@
-from sqlalchemy import Column, DateTime, Integer, func
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, func, text
 from sqlalchemy.orm import as_declarative, declared_attr
 from typing import Any
 
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 @as_declarative()
 class Base:
     """Base class for all SQLAlchemy ORM models."""
@@ -22,4 +28,24 @@ class Base:
     # If you prefer UUIDs for primary keys:
     # import uuid
     # from sqlalchemy.dialects.postgresql import UUID
-    # id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True) 
\ No newline at end of file
+    # id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True) 
+
+
+class VersionedMixin:
+    """
+    Row timestamps plus a `version` counter that SQLAlchemy increments on every ORM
+    UPDATE of the row (and checks in the UPDATE's WHERE clause, so concurrent writers
+    get a StaleDataError instead of silently overwriting each other).
+
+    `version` identifies the row's state cheaply, which is what ETags are built from
+    (see app/core/http_cache.py). Bulk Core UPDATEs bypass the counter on purpose,
+    so use them only for columns that are not part of any cached representation.
+    """
+    # Python-side defaults: SQLite cannot ALTER in a column with a CURRENT_TIMESTAMP default
+    created_at = Column(DateTime(timezone=True), default=utcnow, nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=True)
+    version = Column(Integer, nullable=False, server_default=text("1"))
+
+    @declared_attr
+    def __mapper_args__(cls) -> dict:
+        return {"version_id_col": cls.version}
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+
+from app.models.base import Base
+
+class RefreshToken(Base):
+    """
+    One issued refresh token. Tokens rotated from the same login share a `family_id`;
+    presenting a token whose `used_at` is already set means it was replayed, and the
+    whole family is revoked.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(36), unique=True, index=True, nullable=False)
+    family_id = Column(String(36), index=True, nullable=False)
+    parent_jti = Column(String(36), nullable=True) # The token this one was rotated from
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    issued_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True) # Set when rotated
+
+    def __repr__(self):
+        return f"<RefreshToken(jti='{self.jti}', family_id='{self.family_id}', user_id={self.user_id})>"
+
+class RevokedTokenFamily(Base):
+    """Database set of record for revoked token families (used when Redis is not configured)."""
+    __tablename__ = "revoked_token_families"
+
+    family_id = Column(String(36), primary_key=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=False)
+    # Once every token of the family has expired the entry can be pruned
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    reason = Column(String(32), nullable=True)
@@ -0,0 +1,54 @@
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table
+
+from app.models.base import Base
+
+# Association tables. The (role_id, user_id) index serves "all users with role X"
+# without touching the users table until the final join.
+user_roles = Table(
+    "user_roles",
+    Base.metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("role_id", Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_user_roles_role_id_user_id", "role_id", "user_id"),
+)
+
+role_permissions = Table(
+    "role_permissions",
+    Base.metadata,
+    Column("role_id", Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Column("permission_id", Integer, ForeignKey("permissions.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_role_permissions_permission_id", "permission_id"),
+)
+
+# Permissions granted to a user directly rather than through a role
+user_permissions = Table(
+    "user_permissions",
+    Base.metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("permission_id", Integer, ForeignKey("permissions.id", ondelete="CASCADE"), primary_key=True),
+)
+
+class Role(Base):
+    __tablename__ = "roles"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), unique=True, index=True, nullable=False)
+    description = Column(String, nullable=True)
+
+    def __repr__(self):
+        return f"<Role(id={self.id}, name='{self.name}')>"
+
+class Permission(Base):
+    """
+    A named permission. `bit` is its position in the compiled permission bitset;
+    it is assigned once and never reused, so bitsets embedded in tokens stay valid.
+    """
+    __tablename__ = "permissions"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(128), unique=True, index=True, nullable=False)
+    bit = Column(Integer, unique=True, nullable=False)
+    description = Column(String, nullable=True)
+
+    def __repr__(self):
+        return f"<Permission(id={self.id}, name='{self.name}', bit={self.bit})>"
@@ -1,9 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, JSON
+from sqlalchemy import Column, DateTime, Integer, String, Boolean, JSON, text
 from sqlalchemy.orm import relationship
 
-from app.models.base import Base # Corrected import path
+from app.models.base import Base, VersionedMixin # Corrected import path
 
-class User(Base):
+class User(VersionedMixin, Base):
     __tablename__ = "users" # Explicitly define table name as per common practice
 
     id = Column(Integer, primary_key=True, index=True)
@@ -16,9 +16,18 @@ class User(Base):
     # New fields based on frontend User type
     nickname = Column(String, nullable=True)
     avatar_url = Column(String, nullable=True) # Renamed from avatarUrl to follow snake_case
+    # Denormalised copies of the user_roles / user_permissions rows, kept in sync by
+    # app/crud/role.py so profile responses need no joins. Authorization uses the
+    # normalised tables (compiled to a bitset, see app/core/permissions.py).
     roles = Column(JSON, nullable=True) # Storing list of strings as JSON
     permissions = Column(JSON, nullable=True) # Storing list of strings as JSON
 
+    # Activity counters, written behind by app/core/activity.py with Core UPDATEs that
+    # leave `version` alone: being seen is not a profile change and must not bust ETags.
+    last_login_at = Column(DateTime(timezone=True), nullable=True)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    login_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
     # Add relationships here if needed, e.g.:
     # items = relationship("Item", back_populates="owner")
 
@@ -0,0 +1,88 @@
+"""
+Full-text (trigram) index over users' username, email and nickname.
+
+SQLite: an external-content FTS5 table `users_search` with the trigram
+tokenizer. It stores only the index; rows are read from `users`. Triggers
+keep it in sync on INSERT, DELETE and UPDATE OF the three indexed columns, so
+writes to other columns (activity counters, password hashes) do not touch it.
+
+PostgreSQL: a GIN `gin_trgm_ops` expression index (pg_trgm). PostgreSQL
+maintains it itself, so no triggers are needed.
+
+The `add_user_search_index` migration runs a literal copy of this DDL; databases
+built with `Base.metadata.create_all` (tests, throwaway benchmarks) get it from
+an `after_create` hook on the users table. Changing it here needs a migration.
+
+SQLite triggers belong to their table. A migration that rebuilds `users`
+(batch mode with `recreate="always"`, or any "move and copy" alteration) must
+re-create them afterwards, as `add_user_activity_counters`' downgrade does.
+"""
+from sqlalchemy import DDL, event, func
+from sqlalchemy.engine import Connection
+
+from app.models.user import User
+
+SEARCH_TABLE = "users_search"
+SEARCH_INDEX = "ix_users_search_trgm"
+
+_SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"username, email, nickname, content='users', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON users BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, username, email, nickname) "
+    f"VALUES (new.id, new.username, new.email, new.nickname); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON users BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, username, email, nickname) "
+    f"VALUES ('delete', old.id, old.username, old.email, old.nickname); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF username, email, nickname ON users BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, username, email, nickname) "
+    f"VALUES ('delete', old.id, old.username, old.email, old.nickname); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, username, email, nickname) "
+    f"VALUES (new.id, new.username, new.email, new.nickname); END",
+    # Index rows that existed before the triggers
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+]
+_SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+
+# One lower-cased document per user; queries must use the identical expression
+search_document = func.lower(
+    User.username + " " + User.email + " " + func.coalesce(User.nickname, "")
+)
+_POSTGRESQL_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON users USING gin "
+    f"((lower(username || ' ' || email || ' ' || coalesce(nickname, ''))) gin_trgm_ops)",
+]
+_POSTGRESQL_DROP = [f"DROP INDEX IF EXISTS {SEARCH_INDEX}"]
+
+
+def is_search_object(name: str) -> bool:
+    """FTS5 table and its shadow tables, for Alembic's autogenerate filter."""
+    return name == SEARCH_TABLE or name.startswith(f"{SEARCH_TABLE}_") or name == SEARCH_INDEX
+
+
+def create_search_index(connection: Connection) -> None:
+    statements = {"sqlite": _SQLITE_DDL, "postgresql": _POSTGRESQL_DDL}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(DDL(statement))
+
+
+def drop_search_index(connection: Connection) -> None:
+    statements = {"sqlite": _SQLITE_DROP, "postgresql": _POSTGRESQL_DROP}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(DDL(statement))
+
+
+@event.listens_for(User.__table__, "after_create")
+def _create_search_index(target, connection: Connection, **kw) -> None:
+    create_search_index(connection)
+
+
+@event.listens_for(User.__table__, "before_drop")
+def _drop_search_index(target, connection: Connection, **kw) -> None:
+    drop_search_index(connection)
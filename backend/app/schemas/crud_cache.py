@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+
+
+class ModelCacheStats(BaseModel):
+    namespace: str # Table name
+    ttl_seconds: float
+    local_entries: int # In this worker's near-cache
+    generation: int # Bumped by every write through CRUDBase
+    shared: bool # Backed by Redis
+    requests: int
+    local_hits: int
+    redis_hits: int
+    coalesced: int # Misses that waited for a concurrent load of the same key
+    misses: int # Loaded from the database
+    hit_rate: float # Fraction of requests that did not query the database
+    invalidations: int
+    redis_errors: int
@@ -0,0 +1,30 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class ProviderRoutingStats(BaseModel):
+    name: str
+    breaker: str # closed, open or half_open
+    breaker_opened: int # Times the circuit breaker opened
+    calls: int
+    successes: int
+    failures: int # Errors and timeouts
+    cancelled: int # Lost to a faster hedge and cancelled
+    wins: int # Calls whose answer was returned
+    error_rate: float # Over the recent window
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    hedge_after_ms: Optional[float] = None # When a request to this provider gets hedged; None until enough samples
+
+class RoutingStatsOut(BaseModel):
+    requests: int
+    succeeded: int
+    failed: int # Every attempted provider failed
+    rejected: int # Every circuit breaker was open
+    hedges: int
+    hedge_wins: int
+    hedges_skipped: int # Over the hedge budget
+    failovers: int
+    providers: List[ProviderRoutingStats] # In order of preference
@@ -0,0 +1,45 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class MemorySnapshotOut(BaseModel):
+    name: str
+    taken_at: float # Unix time
+    traced_bytes: int
+    model_config = {
+        "from_attributes": True
+    }
+
+class MemoryStatus(BaseModel):
+    tracing: bool
+    traceback_frames: Optional[int] = None
+    traced_bytes: int # Currently allocated through traced allocations (0 when not tracing)
+    traced_peak_bytes: int
+    tracemalloc_overhead_bytes: int # Memory tracemalloc uses for its own traces
+    rss_bytes: Optional[int] = None
+    gc_counts: List[int] # Per-generation allocation counts since the last collection
+    sampling: bool
+    samples_taken: int
+    snapshots: List[MemorySnapshotOut]
+    caches: Dict[str, int] # Entries per registered in-process cache or buffer
+    live_instances: Optional[Dict[str, int]] = None # Live ORM objects per model, when requested
+
+class MemoryTracingStart(BaseModel):
+    frames: Optional[int] = Field(None, ge=1, le=100) # Stack depth per allocation; MEMORY_PROFILER_FRAMES if unset
+
+class MemorySnapshotCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+
+class MemorySamplerStart(BaseModel):
+    interval_seconds: Optional[float] = Field(None, gt=0) # MEMORY_SAMPLER_INTERVAL_SECONDS if unset
+
+class MemoryStatOut(BaseModel):
+    location: str # path:line, or path with group_by=filename
+    size_bytes: int # Traced size at the location in the newer snapshot
+    size_diff_bytes: int
+    count: int
+    count_diff: int
+    model_config = {
+        "from_attributes": True
+    }
@@ -7,5 +7,17 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel): # Renamed from TokenData to TokenPayload for clarity with JWT standards
     sub: str | None = None # 'sub' (subject) is standard for user identifier in JWT
+    type: str | None = None # "refresh" for refresh tokens, unset for access tokens
+    fam: str | None = None # Token family (one per login), used for revocation
+    jti: str | None = None # Unique id of a refresh token
+    pbits: str | None = None # Compiled permission bitset (hex, "*" for superusers)
     # You can add other fields to the payload if necessary, e.g., username, roles
-    # username: Optional[str] = None 
\ No newline at end of file
+    # username: Optional[str] = None
+
+class TokenPair(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str 
\ No newline at end of file
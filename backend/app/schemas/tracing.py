@@ -0,0 +1,28 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class SpanOut(BaseModel):
+    span_id: str
+    parent_id: Optional[str] = None
+    name: str
+    kind: int # OTLP numbering: 1 internal, 2 server, 3 client
+    start_offset_ms: float # From the start of the root span
+    duration_ms: float
+    attributes: Dict[str, Any]
+    status: int # OTLP numbering: 0 unset, 1 ok, 2 error
+    status_message: Optional[str] = None
+
+class TraceSummary(BaseModel):
+    trace_id: str
+    parent_span_id: Optional[str] = None # Caller's span, for traces continued from a traceparent header
+    name: str
+    start_time_unix_nano: int
+    duration_ms: float
+    status: int
+    span_count: int
+    dropped_spans: int = 0
+
+class TraceOut(TraceSummary):
+    spans: List[SpanOut]
@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr, model_validator # model_validator for Pydantic v2
+from pydantic import BaseModel, EmailStr, Field, model_validator # model_validator for Pydantic v2
 from typing import Optional, List
 
+from app.core.config import settings
+
 # Shared properties
 class UserBase(BaseModel):
     email: EmailStr
@@ -45,4 +47,26 @@ class User(UserBase):
 class UserWithToken(BaseModel):
     user: User
     access_token: str
-    token_type: str = "bearer" 
\ No newline at end of file
+    token_type: str = "bearer"
+    refresh_token: Optional[str] = None 
+
+# Profile fields safe to show to any signed-in user (lists, avatars, mentions)
+class UserPublic(BaseModel):
+    id: int
+    username: str
+    nickname: Optional[str] = None
+    avatar_url: Optional[str] = None
+    model_config = {
+        "from_attributes": True
+    }
+
+class UserBatchGetRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=settings.USERS_BATCH_GET_MAX_IDS)
+
+class UserBatchGetResponse(BaseModel):
+    users: List[UserPublic] # In request order, duplicates removed
+    missing: List[int] = []
+
+class UserSearchResponse(BaseModel):
+    users: List[UserPublic] # Best matches first
+    next_cursor: Optional[str] = None # Pass back as `cursor` for the next page
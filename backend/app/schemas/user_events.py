@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class UserEventStats(BaseModel):
+    connections: int # Open SSE and WebSocket streams in this worker
+    users: int # Distinct users among them
+    published: int # Events published from this worker's commits
+    received: int # Events handed to this worker's connections, from any worker
+    delivered: int
+    evicted: int # Slow consumers disconnected
+    rejected: int # Connections refused at USER_EVENTS_MAX_CONNECTIONS
+    heartbeats: int
+    redis_errors: int
+    malformed: int # Messages on the channel that were not events, skipped
@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class ImportRowError(BaseModel):
+    row: int # Data row (CSV, header excluded) or line (NDJSON), from 1
+    username: Optional[str] = None
+    error: str
+
+class ImportJobOut(BaseModel):
+    id: str
+    status: str # pending, running, succeeded or failed
+    format: str
+    rows_read: int
+    created: int
+    failed: int
+    errors: List[ImportRowError] # The first IMPORT_MAX_REPORTED_ERRORS rejected rows
+    detail: Optional[str] = None # Why the job failed as a whole
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    model_config = {
+        "from_attributes": True
+    }
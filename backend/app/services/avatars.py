@@ -0,0 +1,243 @@
+"""
+Avatar uploads (`POST /users/me/avatar`) and their storage on local disk.
+
+1. The multipart body is parsed as it arrives. The bytes of its `file` part
+   are written to a temporary file in chunks and hashed (SHA-256) on the way,
+   so an upload is never held in memory and oversized ones are cut off early.
+2. Storage is content-addressed: renditions live under
+   `AVATAR_DIR/<first 2 hex digits>/<digest>/<size>.webp`. An upload whose
+   digest is already stored (the same picture uploaded twice, by anyone) is
+   not processed again and takes no extra space.
+3. Otherwise the image is decoded, EXIF-rotated, centre-cropped to a square and
+   resized to each of `AVATAR_SIZES` in a process pool: decoding and resampling
+   are CPU-bound. Metadata is dropped with the original. Each rendition is
+   written to a temporary name and renamed into place, so readers never see
+   a partial file.
+4. Only then is the user's `avatar_url` set, in a single versioned UPDATE.
+
+Stored files are immutable: their URLs change when the content does, which is
+what lets `GET /avatars/{digest}/{size}` be cached forever. Replaced avatars
+are not deleted, since other users may share the same digest.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterable, List, Optional, Sequence, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import settings
+
+MEDIA_TYPE = "image/webp"
+ACCEPTED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"} # Pillow format names
+FIELD_NAME = b"file"
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+class InvalidAvatar(ValueError):
+    pass
+
+
+class AvatarTooLarge(InvalidAvatar):
+    pass
+
+
+def is_digest(value: str) -> bool:
+    return bool(_DIGEST.match(value))
+
+
+def _write(file, hasher, data: bytes) -> None:
+    file.write(data)
+    hasher.update(data)
+
+
+def _render(source: str, directory: str, sizes: Sequence[int], max_pixels: int) -> None:
+    """Write a square WebP rendition of `source` per size into `directory` (runs in a pool process)."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(source) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise InvalidAvatar(f"Unsupported image format {image.format}")
+            if image.width * image.height > max_pixels: # Checked before decoding anything
+                raise InvalidAvatar(f"Image has more than {max_pixels} pixels")
+            largest = max(sizes)
+            image.draft("RGB", (largest, largest)) # JPEG: decode at a reduced scale when much larger
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+            square = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+        raise InvalidAvatar("Not a readable image") from exc
+    os.makedirs(directory, exist_ok=True)
+    for size in sizes:
+        rendition = square if size == largest else square.resize((size, size), Image.Resampling.LANCZOS)
+        fd, temporary = tempfile.mkstemp(prefix=f".{size}.", suffix=".tmp", dir=directory)
+        os.close(fd)
+        rendition.save(temporary, "WEBP", quality=85, method=4)
+        os.replace(temporary, os.path.join(directory, f"{size}.webp"))
+
+
+class _FilePartReader:
+    """Multipart parser callbacks collecting the data of the `file` part."""
+
+    def __init__(self, boundary: bytes):
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        self.found = False # A `file` part was seen
+        self.pending: List[bytes] = [] # Data of the `file` part parsed from the last chunk
+        self._in_file = False
+        self._header_field = b""
+        self._header_value = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        self.parser.write(chunk)
+        pending, self.pending = self.pending, []
+        return pending
+
+    def _on_part_begin(self) -> None:
+        self._in_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            if options.get(b"name") == FIELD_NAME and not self.found:
+                self._in_file = self.found = True
+        self._header_field = self._header_value = b""
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self.pending.append(data[start:end])
+
+    def _on_part_end(self) -> None:
+        self._in_file = False
+
+
+class AvatarStore:
+    def __init__(
+        self,
+        root: str = "./avatars",
+        sizes: Sequence[int] = (64, 128, 256),
+        max_upload_bytes: int = 10 * 1024 * 1024,
+        max_pixels: int = 40_000_000,
+        workers: Optional[int] = None,
+        accel_redirect_prefix: Optional[str] = None,
+    ):
+        self.root = root
+        self.sizes = sorted(sizes)
+        self.max_upload_bytes = max_upload_bytes
+        self.max_pixels = max_pixels
+        self.workers = workers # Pool processes; None: one per CPU, 0: a thread instead
+        self.accel_redirect_prefix = accel_redirect_prefix
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def directory(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def path(self, digest: str, size: int) -> str:
+        return os.path.join(self.directory(digest), f"{size}.webp")
+
+    def relative_path(self, digest: str, size: int) -> str:
+        """`path` relative to `root`, with forward slashes (for nginx internal locations)."""
+        return f"{digest[:2]}/{digest}/{size}.webp"
+
+    def url(self, digest: str, size: Optional[int] = None) -> str:
+        return f"{settings.API_V1_STR}/avatars/{digest}/{size or self.sizes[-1]}"
+
+    def stored(self, digest: str) -> bool:
+        return all(os.path.exists(self.path(digest, size)) for size in self.sizes)
+
+    async def receive(self, content_type: str, chunks: AsyncIterable[bytes]) -> Tuple[str, str]:
+        """Stream the `file` part of a multipart body to a temporary file; returns its path and SHA-256."""
+        media_type, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise InvalidAvatar("Expected a multipart/form-data body")
+        reader = _FilePartReader(boundary)
+        incoming = os.path.join(self.root, "incoming")
+        await run_in_threadpool(os.makedirs, incoming, exist_ok=True)
+        file = await run_in_threadpool(tempfile.NamedTemporaryFile, mode="wb", dir=incoming, delete=False)
+        hasher = hashlib.sha256()
+        size = received = 0
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > self.max_upload_bytes + 65536: # Room for the other parts and the framing
+                    raise AvatarTooLarge(f"Avatar exceeds {self.max_upload_bytes} bytes")
+                try:
+                    data = b"".join(reader.feed(chunk))
+                except MultipartParseError as exc:
+                    raise InvalidAvatar("Malformed multipart body") from exc
+                if data:
+                    size += len(data)
+                    if size > self.max_upload_bytes:
+                        raise AvatarTooLarge(f"Avatar exceeds {self.max_upload_bytes} bytes")
+                    await run_in_threadpool(_write, file, hasher, data)
+            if not reader.found or not size:
+                raise InvalidAvatar("No image in the `file` field")
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+        file.close()
+        return file.name, hasher.hexdigest()
+
+    async def store(self, source: str, digest: str) -> None:
+        """Render `source` under `digest` unless already stored; `source` is removed either way."""
+        try:
+            if await run_in_threadpool(self.stored, digest):
+                return
+            args = (source, self.directory(digest), self.sizes, self.max_pixels)
+            if self.workers == 0:
+                await run_in_threadpool(_render, *args)
+                return
+            if self._pool is None:
+                # Not forked: a copy of this process would inherit the event loop, its sockets and
+                # locks held by other threads at the time of the fork
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+            await asyncio.get_running_loop().run_in_executor(self._pool, _render, *args)
+        finally:
+            await run_in_threadpool(os.unlink, source)
+
+    async def save_upload(self, content_type: str, chunks: AsyncIterable[bytes]) -> str:
+        """Receive, hash and store an uploaded avatar; returns its digest."""
+        source, digest = await self.receive(content_type, chunks)
+        await self.store(source, digest)
+        return digest
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @classmethod
+    def from_settings(cls) -> "AvatarStore":
+        return cls(
+            root=settings.AVATAR_DIR,
+            sizes=settings.AVATAR_SIZES,
+            max_upload_bytes=settings.AVATAR_MAX_UPLOAD_MB * 1024 * 1024,
+            max_pixels=settings.AVATAR_MAX_PIXELS,
+            workers=settings.AVATAR_WORKERS,
+            accel_redirect_prefix=settings.AVATAR_ACCEL_REDIRECT_PREFIX,
+        )
+
+
+avatar_store = AvatarStore.from_settings()
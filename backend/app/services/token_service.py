@@ -0,0 +1,110 @@
+"""
+Access/refresh token issuing, rotation and revocation.
+
+Each login starts a token family. Refreshing rotates the presented refresh token:
+it is marked used and a new one from the same family is returned. A refresh
+token that is presented again after rotation was stolen or replayed. In that
+case the whole family is revoked, including access tokens already issued from
+it.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import security
+from app.core.config import settings
+from app.core.token_revocation import revocation_store
+from app.crud import refresh_token as crud_refresh_token
+from app.crud import role as crud_role
+from app.crud import user as crud_user
+from app.models.user import User
+
+
+class InvalidRefreshToken(Exception):
+    """The refresh token is malformed, expired, unknown or revoked."""
+
+
+class RefreshTokenReuse(InvalidRefreshToken):
+    """An already rotated refresh token was presented again; its family is now revoked."""
+
+    def __init__(self, message: str, user_id: int | None = None, username: str | None = None, family_id: str | None = None):
+        super().__init__(message)
+        self.user_id = user_id
+        self.username = username
+        self.family_id = family_id
+
+
+@dataclass
+class IssuedTokens:
+    access_token: str
+    refresh_token: str
+    family_id: str
+
+
+def _refresh_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+
+
+async def _issue(
+    db: AsyncSession, user: User, family_id: str, parent_jti: str | None = None
+) -> IssuedTokens:
+    jti = str(uuid.uuid4())
+    expires_at = _refresh_expiry()
+    await crud_refresh_token.create_refresh_token(
+        db, jti=jti, family_id=family_id, user_id=user.id, expires_at=expires_at, parent_jti=parent_jti
+    )
+    permission_bits = None
+    if settings.EMBED_PERMISSIONS_IN_TOKEN:
+        # Permission changes reach the token at the next refresh
+        permission_bits = await crud_role.get_permission_bits(db, user)
+    return IssuedTokens(
+        access_token=security.create_access_token(
+            subject=user.username,
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+            family_id=family_id,
+            permission_bits=permission_bits,
+        ),
+        refresh_token=security.create_refresh_token(user.username, family_id, jti, expires_at),
+        family_id=family_id,
+    )
+
+
+async def issue_tokens(db: AsyncSession, user: User) -> IssuedTokens:
+    """Start a new token family for a fresh login/registration."""
+    return await _issue(db, user, family_id=str(uuid.uuid4()))
+
+
+async def rotate_refresh_token(db: AsyncSession, refresh_token: str) -> tuple[User, IssuedTokens]:
+    payload = security.decode_refresh_token(refresh_token)
+    if payload is None:
+        raise InvalidRefreshToken("Invalid refresh token")
+    if await revocation_store.is_revoked(db, payload.fam):
+        raise InvalidRefreshToken("Refresh token has been revoked")
+
+    db_token = await crud_refresh_token.get_by_jti(db, payload.jti)
+    if db_token is None or db_token.family_id != payload.fam:
+        raise InvalidRefreshToken("Unknown refresh token")
+    if db_token.used_at is not None or not await crud_refresh_token.mark_used(db, payload.jti):
+        await revocation_store.revoke(db, payload.fam, _refresh_expiry(), reason="reuse")
+        raise RefreshTokenReuse(
+            "Refresh token reuse detected; all sessions of this login were revoked",
+            user_id=db_token.user_id, username=payload.sub, family_id=payload.fam,
+        )
+
+    user = await crud_user.get_user_by_id(db, db_token.user_id)
+    if user is None or not user.is_active:
+        await db.rollback()
+        raise InvalidRefreshToken("Inactive or unknown user")
+    # The used-mark and the new token commit together
+    return user, await _issue(db, user, family_id=payload.fam, parent_jti=payload.jti)
+
+
+async def revoke_refresh_token(db: AsyncSession, refresh_token: str) -> str:
+    """Revoke the family of `refresh_token` (logout of that login on every device/tab); returns its subject."""
+    payload = security.decode_refresh_token(refresh_token)
+    if payload is None:
+        raise InvalidRefreshToken("Invalid refresh token")
+    await revocation_store.revoke(db, payload.fam, _refresh_expiry(), reason="logout")
+    return payload.sub
@@ -0,0 +1,380 @@
+"""
+Bulk user import for onboarding (`POST /admin/users/import`).
+
+The upload is streamed to a spool file on disk, so a large file is never held in
+memory, and the request returns straight away with a job id. A background task
+then reads the file row by row (CSV with a header line, or NDJSON), validates
+each row against `UserCreate`, and handles rows in batches of `IMPORT_BATCH_SIZE`:
+
+1. rows repeating the username or email of an earlier row, or of a registered
+   user (two IN queries per batch), are rejected as conflicts;
+2. the passwords of the remaining rows are hashed in a process pool, since
+   hashing is CPU-bound and would otherwise hold the event loop;
+3. the users are inserted with multi-row INSERTs, one transaction per batch.
+   If a concurrent registration makes the batch fail, it is retried row by row
+   so that only the conflicting rows are rejected.
+
+Progress and per-row errors (the first `IMPORT_MAX_REPORTED_ERRORS`) are kept in
+memory by the worker running the job and served by
+`GET /admin/users/imports/{job_id}`. The `roles` and `permissions` fields are not
+imported.
+"""
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, AsyncIterable, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import security
+from app.core.config import settings
+from app.core.memory_profiler import register_cache
+from app.core.sharding import shard_set
+from app.crud import user as crud_user
+from app.models.base import utcnow
+from app.schemas.user import UserCreate
+
+logger = logging.getLogger(__name__)
+
+CSV = "csv"
+NDJSON = "ndjson"
+_CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/csv": CSV,
+    "application/x-ndjson": NDJSON,
+    "application/ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+}
+_NOT_IMPORTED_FIELDS = ("roles", "permissions")
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+@dataclass
+class RowError:
+    row: int # Data row (CSV, header excluded) or line (NDJSON), from 1
+    error: str
+    username: Optional[str] = None
+
+
+@dataclass
+class ImportJob:
+    id: str
+    format: str
+    status: str = PENDING
+    rows_read: int = 0
+    created: int = 0
+    failed: int = 0
+    errors: List[RowError] = field(default_factory=list)
+    detail: Optional[str] = None # Why the job failed as a whole
+    created_at: datetime = field(default_factory=utcnow)
+    finished_at: Optional[datetime] = None
+    max_errors: int = 1000
+
+    def reject(self, row: int, error: str, username: Optional[str] = None) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(RowError(row, error, username))
+
+
+def format_for_content_type(content_type: str) -> Optional[str]:
+    return _CONTENT_TYPES.get(content_type.split(";", 1)[0].strip().lower())
+
+
+ParsedRow = Tuple[int, Union[UserCreate, str], Optional[str]] # (row, user or error, username)
+
+
+def _records(path: str, import_format: str) -> Iterator[Tuple[int, Any]]:
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        if import_format == CSV:
+            for number, record in enumerate(csv.DictReader(file), start=1):
+                # Empty cells mean "use the default"; cells beyond the header are ignored
+                yield number, {key: value for key, value in record.items() if key and value not in (None, "")}
+        else:
+            for number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError:
+                        yield number, None
+
+
+def _parse(path: str, import_format: str) -> Iterator[ParsedRow]:
+    for number, record in _records(path, import_format):
+        if not isinstance(record, dict):
+            yield number, "Not a JSON object", None
+            continue
+        username = record.get("username") if isinstance(record.get("username"), str) else None
+        for name in _NOT_IMPORTED_FIELDS:
+            record.pop(name, None)
+        try:
+            yield number, UserCreate.model_validate(record), username
+        except ValidationError as exc:
+            yield number, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+            ), username
+
+
+def _next_batch(rows: Iterator[ParsedRow], size: int) -> List[ParsedRow]:
+    return list(itertools.islice(rows, size))
+
+
+@lru_cache(maxsize=4)
+def _context(config: str) -> CryptContext:
+    return CryptContext.from_string(config)
+
+
+def _hash_passwords(context_config: str, passwords: List[str]) -> List[str]:
+    # Runs in a pool process; the context is passed as its config string so a calibrated
+    # (or test) cost applies there too
+    context = _context(context_config)
+    return [context.hash(password) for password in passwords]
+
+
+class UserImporter:
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        hash_workers: Optional[int] = None,
+        max_upload_bytes: int = 200 * 1024 * 1024,
+        spool_dir: Optional[str] = None,
+        max_errors: int = 1000,
+        jobs_kept: int = 50,
+    ):
+        self.batch_size = batch_size
+        self.hash_workers = hash_workers
+        self.max_upload_bytes = max_upload_bytes
+        self.spool_dir = spool_dir
+        self.max_errors = max_errors
+        self.jobs_kept = jobs_kept
+        self.jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self.session_factory: Optional[Callable[[], AsyncSession]] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    async def spool(self, chunks: AsyncIterable[bytes]) -> str:
+        """Write an upload to a temporary file as it arrives; returns its path."""
+        file = await run_in_threadpool(
+            tempfile.NamedTemporaryFile, mode="wb", prefix="user-import-", dir=self.spool_dir, delete=False
+        )
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_upload_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {self.max_upload_bytes} bytes")
+                await run_in_threadpool(file.write, chunk)
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+        file.close()
+        return file.name
+
+    def submit(self, path: str, import_format: str) -> ImportJob:
+        """Start importing the spooled file at `path` in the background; the file is removed afterwards."""
+        if self.session_factory is None:
+            raise RuntimeError("UserImporter.start() has not been called")
+        job = ImportJob(id=uuid.uuid4().hex, format=import_format, max_errors=self.max_errors)
+        self.jobs[job.id] = job
+        finished = [job_id for job_id, kept in self.jobs.items() if kept.finished_at is not None]
+        for job_id in finished[:max(0, len(self.jobs) - self.jobs_kept)]:
+            del self.jobs[job_id]
+        task = asyncio.create_task(self.run(job, path), name=f"user-import-{job.id}")
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def run(self, job: ImportJob, path: str) -> ImportJob:
+        job.status = RUNNING
+        rows = _parse(path, job.format)
+        seen_usernames: Set[str] = set()
+        seen_emails: Set[str] = set()
+        try:
+            while True:
+                # Reading and validating a batch is plain CPU work; keep it off the loop
+                batch = await run_in_threadpool(_next_batch, rows, self.batch_size)
+                if not batch:
+                    break
+                job.rows_read += len(batch)
+                await self._import_batch(job, batch, seen_usernames, seen_emails)
+            job.status = SUCCEEDED
+        except asyncio.CancelledError:
+            job.status, job.detail = FAILED, "Interrupted by shutdown"
+            raise
+        except Exception as exc:
+            logger.exception("User import %s failed after %d rows", job.id, job.rows_read)
+            job.status, job.detail = FAILED, str(exc)
+        finally:
+            try:
+                rows.close()
+            except ValueError:
+                # Cancelled while a threadpool thread is still advancing the generator;
+                # it finishes that batch on its own and the file closes when it is collected
+                pass
+            finally:
+                job.finished_at = utcnow()
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        logger.info("User import %s %s: %d rows, %d created, %d failed",
+                    job.id, job.status, job.rows_read, job.created, job.failed)
+        return job
+
+    async def _import_batch(self, job: ImportJob, batch: List[ParsedRow], seen_usernames: Set[str], seen_emails: Set[str]) -> None:
+        candidates: List[Tuple[int, UserCreate]] = []
+        for number, user, username in batch:
+            if isinstance(user, str):
+                job.reject(number, user, username)
+            elif user.username in seen_usernames:
+                job.reject(number, "Username repeated in the file", user.username)
+            elif user.email in seen_emails:
+                job.reject(number, "Email repeated in the file", user.username)
+            else:
+                seen_usernames.add(user.username)
+                seen_emails.add(user.email)
+                candidates.append((number, user))
+        if not candidates:
+            return
+
+        taken_usernames, taken_emails = await self._taken(
+            [user.username for _, user in candidates], [user.email for _, user in candidates]
+        )
+        fresh: List[Tuple[int, UserCreate]] = []
+        for number, user in candidates:
+            if user.username in taken_usernames:
+                job.reject(number, "Username already registered", user.username)
+            elif user.email in taken_emails:
+                job.reject(number, "Email already registered", user.username)
+            else:
+                fresh.append((number, user))
+        if not fresh:
+            return
+
+        hashes = await self._hash([user.password for _, user in fresh])
+        by_shard: Dict[Optional[str], List[Tuple[int, Dict[str, Any]]]] = {}
+        for (number, user), hashed_password in zip(fresh, hashes):
+            shard = shard_set.shard_for(user.username) if shard_set.enabled else None
+            by_shard.setdefault(shard, []).append((number, {
+                "username": user.username,
+                "email": user.email,
+                "hashed_password": hashed_password,
+                "is_active": user.is_active if user.is_active is not None else True,
+                "is_superuser": user.is_superuser if user.is_superuser is not None else False,
+                "nickname": user.nickname,
+                "avatar_url": user.avatar_url,
+            }))
+        for shard, rows in by_shard.items():
+            await self._insert(job, shard, rows)
+
+    def _session(self, shard: Optional[str]) -> AsyncSession:
+        return shard_set.session(shard) if shard is not None else self.session_factory()
+
+    async def _taken(self, usernames: List[str], emails: List[str]) -> Tuple[Set[str], Set[str]]:
+        if not shard_set.enabled:
+            async with self.session_factory() as db:
+                return await crud_user.get_taken_usernames_and_emails(db, usernames, emails)
+        found = await shard_set.scatter_gather(
+            lambda db: crud_user.get_taken_usernames_and_emails(db, usernames, emails)
+        )
+        return (
+            set().union(*(taken for taken, _ in found.values())),
+            set().union(*(taken for _, taken in found.values())),
+        )
+
+    async def _hash(self, passwords: List[str]) -> List[str]:
+        config = security.pwd_context.to_string()
+        if self.hash_workers == 0:
+            return await run_in_threadpool(_hash_passwords, config, passwords)
+        if self._pool is None:
+            # forkserver: a forked hasher would start with copies of the running loop and of any lock
+            # a threadpool thread happened to hold
+            self._pool = ProcessPoolExecutor(max_workers=self.hash_workers, mp_context=multiprocessing.get_context("forkserver"))
+        workers = self.hash_workers or os.cpu_count() or 1
+        size = math.ceil(len(passwords) / workers) # One slice per process keeps pickling overhead low
+        loop = asyncio.get_running_loop()
+        slices = await asyncio.gather(*(
+            loop.run_in_executor(self._pool, _hash_passwords, config, passwords[start:start + size])
+            for start in range(0, len(passwords), size)
+        ))
+        return [hashed for part in slices for hashed in part]
+
+    async def _insert(self, job: ImportJob, shard: Optional[str], rows: List[Tuple[int, Dict[str, Any]]]) -> None:
+        async with self._session(shard) as db:
+            try:
+                await crud_user.insert_users(db, [values for _, values in rows])
+                await db.commit()
+                job.created += len(rows)
+                return
+            except IntegrityError:
+                await db.rollback()
+            # Someone registered one of these names (or took one of the ids) since the check:
+            # find the rows one by one
+            for number, values in rows:
+                for attempt in range(1, crud_user.ID_ALLOCATION_ATTEMPTS + 1):
+                    try:
+                        await crud_user.insert_users(db, [values])
+                        await db.commit()
+                        job.created += 1
+                        break
+                    except IntegrityError:
+                        await db.rollback()
+                        taken = await crud_user.get_taken_usernames_and_emails(db, [values["username"]], [values["email"]])
+                        if any(taken) or shard is None or attempt == crud_user.ID_ALLOCATION_ATTEMPTS:
+                            job.reject(number, "Username or email already registered", values["username"])
+                            break
+
+    # --- lifecycle ----------------------------------------------------------------------
+    def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        self.session_factory = session_factory
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @classmethod
+    def from_settings(cls) -> "UserImporter":
+        return cls(
+            batch_size=settings.IMPORT_BATCH_SIZE,
+            hash_workers=settings.IMPORT_HASH_WORKERS,
+            max_upload_bytes=settings.IMPORT_MAX_UPLOAD_MB * 1024 * 1024,
+            spool_dir=settings.IMPORT_SPOOL_DIR,
+            max_errors=settings.IMPORT_MAX_REPORTED_ERRORS,
+            jobs_kept=settings.IMPORT_JOBS_KEPT,
+        )
+
+
+importer = UserImporter.from_settings()
+register_cache("import_jobs", importer.jobs)
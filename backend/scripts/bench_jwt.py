@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Benchmark JWT sign and verify cost per signing algorithm.
+
+Verification goes through `JWKSVerifier` with keys loaded from the published
+JWKS, i.e. exactly what a downstream service does per request:
+`pdm run python scripts/bench_jwt.py -n 2000`
+
+EdDSA is not listed: python-jose has no Ed25519 support.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.core.jwt_keys import KeyRing, generate_private_key_pem
+from app.core.jwt_verifier import JWKSVerifier
+
+ALGORITHMS = ["HS256", "ES256", "ES384", "RS256"]
+
+
+def bench(algorithm: str, iterations: int) -> None:
+    if algorithm.startswith("HS"):
+        ring = KeyRing(algorithm, secret_key="bench-secret-key-with-enough-entropy")
+        verify = ring.decode
+    else:
+        ring = KeyRing(algorithm, private_key_pem=generate_private_key_pem(algorithm))
+        verify = JWKSVerifier(jwks=ring.jwks(), algorithms=[algorithm]).verify
+    claims = {"sub": "bench-user", "exp": datetime.now(timezone.utc) + timedelta(minutes=5)}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        token = ring.encode(claims)
+    sign_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verify(token)
+    verify_us = (time.perf_counter() - start) / iterations * 1e6
+
+    print(f"{algorithm:>6} {sign_us:>10.1f} {verify_us:>10.1f} {len(token):>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("--algorithms", nargs="+", default=ALGORITHMS)
+    args = parser.parse_args()
+    print(f"{'alg':>6} {'sign µs':>10} {'verify µs':>10} {'bytes':>8}")
+    for algorithm in args.algorithms:
+        bench(algorithm, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Show what hedging and failover do to LLM tail latency, with fake providers.
+
+Two `ScriptedProvider`s answer after bimodal latencies: usually fast, but a
+fraction of the calls are slow (queueing, cold starts). The script sends the
+same requests to the primary alone and through `LLMRouter`, and compares the
+latency percentiles:
+`pdm run python scripts/bench_llm_routing.py --requests 2000`
+`pdm run python scripts/bench_llm_routing.py --error-rate 0.2` (failover)
+
+No network is involved; latencies are real sleeps on the event loop.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, List
+
+from app.langchain_module.routing import LLMRouter, ScriptedProvider, bimodal_latency
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def measure(target: Any, requests: int, concurrency: int) -> List[float]:
+    """Per-request latencies (ms) with `concurrency` requests in flight; failed requests are dropped."""
+    latencies: List[float] = []
+    prompts = iter(range(requests))
+
+    async def worker() -> None:
+        for prompt in prompts:
+            start = time.perf_counter()
+            try:
+                await target.ainvoke(f"prompt {prompt}")
+            except Exception:
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def providers(args: argparse.Namespace) -> List[ScriptedProvider]:
+    return [
+        ScriptedProvider("primary", bimodal_latency(args.fast_ms, args.slow_ms, args.slow_fraction), args.error_rate, seed=1),
+        ScriptedProvider("secondary", bimodal_latency(args.fast_ms * 1.5, args.slow_ms, args.slow_fraction), seed=2),
+    ]
+
+
+async def run(args: argparse.Namespace) -> None:
+    primary, _ = providers(args)
+    results = [("primary only", await measure(primary, args.requests, args.concurrency), args.requests)]
+    router = LLMRouter(providers(args), breaker_failures=args.breaker_failures, breaker_reset_seconds=1.0)
+    results.append(("router (hedge at p95)", await measure(router, args.requests, args.concurrency), args.requests))
+
+    print(f"{args.requests:,} requests, {args.concurrency} in flight; latency {args.fast_ms:.0f} ms, "
+          f"{args.slow_fraction:.0%} at {args.slow_ms:.0f} ms; primary error rate {args.error_rate:.0%}")
+    print(f"{'case':<24} {'ok':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, latencies, sent in results:
+        print(f"{name:<24} {len(latencies) / sent:>6.1%} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+              f"{percentile(latencies, 99):>8.1f} {max(latencies):>8.1f}")
+    stats = router.snapshot()
+    calls = sum(provider["calls"] for provider in stats["providers"])
+    print(f"router: {stats['hedges']} hedges ({stats['hedges'] / args.requests:.1%} of requests, "
+          f"{calls / args.requests:.3f} calls per request), {stats['hedge_wins']} won by the hedge, "
+          f"{stats['failovers']} failovers, {stats['hedges_skipped']} over budget")
+    for provider in stats["providers"]:
+        print(f"  {provider['name']:<10} breaker {provider['breaker']:<9} opened {provider['breaker_opened']}x, "
+              f"p95 {provider['p95_ms']} ms, error rate {provider['error_rate']:.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--fast-ms", type=float, default=40.0)
+    parser.add_argument("--slow-ms", type=float, default=800.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.04)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Primary's error rate")
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Measure the per-call cost of logging on the request path.
+
+Compares a synchronous JSON handler writing to a file (what a plain
+`logging.FileHandler` setup does on the event loop) with the queue pipeline from
+app/core/logging_config.py, inside a simulated request context:
+`pdm run python scripts/bench_logging.py --calls 200000`
+
+Only the caller's time is measured. The writer thread is started after the
+calls, so on a machine with few cores its formatting and I/O (which hold the
+GIL) are not billed to the caller; the time it needs to drain the backlog is
+reported separately.
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+from typing import Callable
+
+from app.core import logging_config
+from app.core.logging_config import ContextQueueHandler, JsonFormatter
+
+
+def per_call_ns(log: Callable[[int], None], calls: int) -> float:
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        log(i)
+    return (time.perf_counter_ns() - start) / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    logger = logging.getLogger("bench.request")
+    scope = {"path": "/api/v1/auth/me", "route": None}
+    logging_config._request_context.set({"request_id": "3f2a9c", "scope": scope, "user_id": 42})
+    extra = {"duration_ms": 1.25, "status": 200}
+    results = []
+
+    # Baseline: format and write on the calling thread
+    root = logging.getLogger()
+    sync_handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+    sync_handler.setFormatter(JsonFormatter())
+    root.handlers = [sync_handler]
+    root.setLevel(logging.INFO)
+    results.append(("sync file handler, info", per_call_ns(lambda i: logger.info("user %d seen", i, extra=extra), args.calls)))
+    sync_handler.close()
+
+    # Queue pipeline (as configure_logging builds it); a queue big enough that nothing is dropped
+    handler = ContextQueueHandler(queue.Queue(args.calls * 2), debug_sample_rate=0.01)
+    root.handlers = [handler]
+    root.setLevel(logging.DEBUG)
+    results.append(("queue pipeline, info", per_call_ns(lambda i: logger.info("user %d seen", i, extra=extra), args.calls)))
+    results.append(("queue pipeline, debug sampled out", per_call_ns(lambda i: logger.debug("detail %d", i), args.calls)))
+    logging._srcfile = None # What configure_logging does unless LOG_CALLER_INFO is set
+    results.append(("queue pipeline, info, no caller info", per_call_ns(lambda i: logger.info("user %d seen", i, extra=extra), args.calls)))
+    results.append(("  ... debug sampled out", per_call_ns(lambda i: logger.debug("detail %d", i), args.calls)))
+    output = logging.FileHandler(os.path.join(directory, "queued.log"))
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(handler.queue, output)
+    drained = handler.queue.qsize()
+    drain_start = time.perf_counter()
+    listener.start()
+    listener.stop()
+    drain_seconds = time.perf_counter() - drain_start
+    logging.getLogger().setLevel(logging.INFO)
+    results.append(("debug below level", per_call_ns(lambda i: logger.debug("detail %d", i), args.calls)))
+
+    print(f"{args.calls:,} calls per case, in a request context")
+    print(f"{'case':<36} {'ns/call':>10}")
+    for name, ns in results:
+        print(f"{name:<36} {ns:>10.0f}")
+    print(f"writer thread drained {drained:,} records in {drain_seconds:.2f}s; "
+          f"dropped={handler.dropped}, sampled out={handler.sampled_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark password verify cost per hash scheme and cost setting.
+
+Reports the verify latency and the resulting logins/sec per core for each cost,
+plus the cost `calibrate_hash_cost` picks for a latency target:
+`pdm run python scripts/bench_password_hash.py --target-ms 250`
+"""
+import argparse
+
+from passlib.context import CryptContext
+
+from app.core.security import calibrate_hash_cost, measure_verify_ms
+
+COST_RANGES = {
+    "bcrypt": range(8, 15),
+    "argon2": range(1, 9),
+}
+
+
+def scheme_available(scheme: str) -> bool:
+    try:
+        CryptContext(schemes=[scheme]).hash("probe")
+    except Exception: # passlib raises MissingBackendError (or similar) when the backend is absent
+        return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--schemes", nargs="+", default=list(COST_RANGES))
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for scheme in args.schemes:
+        if not scheme_available(scheme):
+            print(f"{scheme}: backend not installed, skipped")
+            continue
+        print(f"\n{scheme}")
+        print(f"{'cost':>6} {'verify ms':>10} {'logins/s/core':>14}")
+        for cost in COST_RANGES[scheme]:
+            ms = measure_verify_ms(scheme, cost, repeat=args.repeat)
+            print(f"{cost:>6} {ms:>10.2f} {1000 / ms:>14.1f}")
+        chosen = calibrate_hash_cost(scheme, args.target_ms)
+        print(f"calibrated cost for {args.target_ms:.0f} ms target: {chosen}")
+
+
+if __name__ == "__main__":
+    main()
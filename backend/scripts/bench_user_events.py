@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Measure how many change-event streams one worker can hold, and what fan-out costs.
+
+Opens N server-sent event streams in process, each a real `EventSourceResponse`
+over the endpoint's message generator, driven through ASGI with a `send` that
+discards the bytes. It reports, per N:
+
+* memory per open stream (tracemalloc, plus RSS growth);
+* the time to push one event to every stream (one event per user, as a
+  role change affecting all of them would) and for all of them to be written.
+  A heartbeat round costs about the same: one wake-up and one write per stream.
+
+`pdm run python scripts/bench_user_events.py --connections 1000 5000 20000`
+
+With Redis configured the workers share one subscription each; the per-worker
+costs measured here are the same, as fan-out happens after the subscription.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import time
+import tracemalloc
+from typing import List, Optional
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.apis.v1.endpoints.users import _event_messages, _sse_messages # noqa: E402
+from app.core.memory_profiler import rss_bytes # noqa: E402
+from app.core.sse import EventSourceResponse # noqa: E402
+from app.core.user_events import UPDATED, UserEvent, user_events # noqa: E402
+
+
+class Connection:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.writes = 0
+        self.written = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None # The response being streamed
+
+    async def receive(self) -> dict:
+        await self.closed.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message: dict) -> None:
+        if message["type"] == "http.response.body":
+            self.writes += 1
+            self.written.set()
+
+
+async def open_streams(count: int) -> List[Connection]:
+    connections = [Connection(user_id) for user_id in range(count)]
+    for connection in connections:
+        subscription = user_events.subscribe(connection.user_id)
+        response = EventSourceResponse(_sse_messages(_event_messages(subscription, 1)))
+        connection.task = asyncio.create_task(response({"type": "http"}, connection.receive, connection.send))
+    await wait_for_writes(connections) # `ready` sent on every stream
+    return connections
+
+
+async def wait_for_writes(connections: List[Connection]) -> None:
+    for connection in connections:
+        await connection.written.wait()
+        connection.written.clear()
+
+
+async def measure(count: int) -> dict:
+    user_events.heartbeat_seconds = 3600 # Only the pushed events are written
+    user_events.max_connections = count
+    gc.collect()
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    connections = await open_streams(count)
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    rss_after = rss_bytes()
+
+    start = time.perf_counter()
+    for connection in connections:
+        user_events.publish(UserEvent(UPDATED, connection.user_id, 2, ("roles",)))
+    published = time.perf_counter() - start
+    await wait_for_writes(connections)
+    fan_out = time.perf_counter() - start
+
+    for connection in connections:
+        connection.closed.set()
+    await asyncio.gather(*(connection.task for connection in connections)) # Raises if a stream failed
+    assert user_events.connections == 0
+    rss_growth: Optional[float] = None if rss_before is None else (rss_after - rss_before) / count
+    return {
+        "connections": count,
+        "traced_kb": traced / count / 1024,
+        "rss_kb": None if rss_growth is None else rss_growth / 1024,
+        "publish_ms": published * 1000,
+        "fan_out_ms": fan_out * 1000,
+        "per_stream_us": fan_out / count * 1e6,
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    print(f"{'streams':>8} {'KiB/stream':>11} {'RSS KiB/stream':>15} {'publish ms':>11} "
+          f"{'all written ms':>15} {'us/stream':>10}")
+    for count in args.connections:
+        result = await measure(count)
+        rss = "n/a" if result["rss_kb"] is None else f"{result['rss_kb']:.1f}"
+        print(f"{result['connections']:>8,} {result['traced_kb']:>11.1f} {rss:>15} {result['publish_ms']:>11.1f} "
+              f"{result['fan_out_ms']:>15.1f} {result['per_stream_us']:>10.0f}")
+    stats = user_events.snapshot()
+    print(f"delivered {stats['delivered']:,} events, {stats['evicted']} evicted")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[1000, 5000, 10000])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
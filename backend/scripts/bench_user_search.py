@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark GET /users/search queries against a large users table.
+
+Uses a database produced by the synthetic data generator, creating one if the
+file does not exist yet:
+`pdm run python scripts/bench_user_search.py --database /tmp/users_1m.db --users 1000000`
+
+Queries are sampled from real rows: username prefixes (2-5 chars), email
+domain fragments, nickname/username substrings and misses. Each query fetches a
+first page and follows the cursor to a second page. The script reports
+latency percentiles per query kind, measured through `crud.user_search` on an
+AsyncSession, i.e. the same code path the endpoint uses.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.crud.user_search import search_users
+from app.models.user import User
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def sample_queries(db: AsyncSession, count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    max_id = (await db.execute(select(func.max(User.id)))).scalar_one()
+    ids = [rng.randint(1, max_id) for _ in range(count)]
+    rows = (await db.execute(select(User.username, User.email, User.nickname).where(User.id.in_(ids)))).all()
+    queries = []
+    for username, email, nickname in rows:
+        kind = rng.choice(["username_prefix", "email_fragment", "substring", "miss"])
+        if kind == "username_prefix":
+            queries.append((kind, username[:rng.randint(2, 5)]))
+        elif kind == "email_fragment":
+            domain = email.split("@", 1)[1]
+            queries.append((kind, domain[:rng.randint(3, len(domain))]))
+        elif kind == "substring":
+            source = nickname if nickname and rng.random() < 0.5 else username
+            start = rng.randint(0, max(0, len(source) - 4))
+            queries.append((kind, source[start:start + 4]))
+        else:
+            queries.append((kind, f"qx{rng.randint(0, 99999)}z"))
+    return queries
+
+
+async def run(database: str, queries_count: int, limit: int, seed: int) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    rng = random.Random(seed)
+    timings: Dict[str, List[float]] = {}
+    async with AsyncSession(engine) as db:
+        total = (await db.execute(select(func.count()).select_from(User))).scalar_one()
+        queries = await sample_queries(db, queries_count, rng)
+        for _, q in queries[:20]: # Warm the page cache
+            await search_users(db, q, limit=limit)
+        for kind, q in queries:
+            start = time.perf_counter()
+            page = await search_users(db, q, limit=limit)
+            first = (time.perf_counter() - start) * 1000
+            timings.setdefault(kind, []).append(first)
+            if page.next_cursor:
+                start = time.perf_counter()
+                await search_users(db, q, limit=limit, cursor=page.next_cursor)
+                timings.setdefault(f"{kind} (page 2)", []).append((time.perf_counter() - start) * 1000)
+            db.expunge_all()
+    await engine.dispose()
+
+    print(f"{total:,} users, limit={limit}, latency in ms")
+    print(f"{'query kind':<26} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for kind, values in sorted(timings.items()):
+        print(f"{kind:<26} {len(values):>6} {statistics.median(values):>8.2f} {percentile(values, 95):>8.2f} "
+              f"{percentile(values, 99):>8.2f} {max(values):>8.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="/tmp/users_bench.db")
+    parser.add_argument("--users", type=int, default=1_000_000, help="Users to generate if the database is missing")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        generator = Path(__file__).with_name("initial_data.py")
+        subprocess.run(
+            [sys.executable, str(generator), "--count", str(args.users), "--create-tables",
+             "--password-pool", "4", "--database-url", f"sqlite+aiosqlite:///{args.database}"],
+            check=True,
+        )
+    asyncio.run(run(args.database, args.queries, args.limit, args.seed))
+
+
+if __name__ == "__main__":
+    main()
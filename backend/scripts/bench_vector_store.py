@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Measure recall and latency of the local vector store, exact vs IVF.
+
+Vectors are synthetic but clustered, like real embeddings (uniform random
+vectors have no neighbourhood structure for an index to exploit):
+`pdm run python scripts/bench_vector_store.py --count 100000 --dim 384`
+`pdm run python scripts/bench_vector_store.py --count 1000000 --dim 384 --nprobe 4 16 64`
+
+Reports, for a set of held-out queries: exact search latency one query at a
+time and batched, IVF build time, IVF latency and recall@k (the fraction of the
+exact top k it finds) per `nprobe`, and save / memory-mapped load times.
+1M x 384 float32 vectors take 1.5 GB of memory.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.langchain_module.vectorstore import VectorStore
+
+
+def clustered(count: int, dim: int, clusters: int, spread: float, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100_000): # Generated in chunks to bound float64 temporaries
+        stop = min(start + 100_000, count)
+        labels = rng.integers(clusters, size=stop - start)
+        vectors[start:stop] = centers[labels] + spread * rng.normal(size=(stop - start, dim))
+    return vectors
+
+
+def per_query_ms(fn, queries: np.ndarray) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=1000, help="Clusters in the synthetic data")
+    parser.add_argument("--spread", type=float, default=1.6, help="Noise around cluster centres; higher is harder")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default 4*sqrt(count))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = clustered(args.count + args.queries, args.dim, args.clusters, args.spread, rng)
+    vectors, queries = vectors[:args.count], vectors[args.count:]
+
+    store = VectorStore(args.dim, capacity=args.count)
+    start = time.perf_counter()
+    for offset in range(0, args.count, 100_000):
+        chunk = vectors[offset:offset + 100_000]
+        store.add([str(i) for i in range(offset, offset + len(chunk))], chunk)
+    print(f"{args.count:,} x {args.dim} vectors added in {time.perf_counter() - start:.2f}s "
+          f"({store.vectors.nbytes / 2**20:,.0f} MiB)")
+
+    exact = store.search(queries, args.k, exact=True)
+    truth = [{hit.id for hit in hits} for hits in exact]
+    print(f"{'case':<28} {'ms/query':>10} {'recall@' + str(args.k):>10}")
+    print(f"{'exact, one at a time':<28} {per_query_ms(lambda q: store.search(q, args.k, exact=True), queries):>10.2f} {1.0:>10.3f}")
+    start = time.perf_counter()
+    store.search(queries, args.k, exact=True)
+    batched_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{'exact, batched':<28} {batched_ms:>10.2f} {1.0:>10.3f}")
+
+    start = time.perf_counter()
+    index = store.build_index(nlist=args.nlist)
+    build_seconds = time.perf_counter() - start
+    for nprobe in args.nprobe:
+        results = [store.search(query, args.k, nprobe=nprobe)[0] for query in queries]
+        recall = np.mean([len({hit.id for hit in hits} & expected) / args.k for hits, expected in zip(results, truth)])
+        ms = per_query_ms(lambda q: store.search(q, args.k, nprobe=nprobe), queries)
+        print(f"{f'ivf nlist={index.nlist} nprobe={nprobe}':<28} {ms:>10.2f} {recall:>10.3f}")
+    print(f"IVF build (k-means + assignment): {build_seconds:.2f}s")
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        store.save(directory)
+        save_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = VectorStore.load(directory)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded.search(queries[0], args.k, nprobe=args.nprobe[0])
+        print(f"save {save_seconds:.2f}s, memory-mapped load {load_seconds:.2f}s, "
+              f"first search after load {(time.perf_counter() - start) * 1000:.1f}ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,279 @@
 #!/usr/bin/env python3
-"""This script can be used to populate the database with initial or sample data.
+"""Populate the database with synthetic users for development, staging and load tests.
 
 It should be run within the PDM environment to have access to project dependencies:
-`pdm run python backend/scripts/initial_data.py`
+`pdm run python scripts/initial_data.py --count 1000000 --seed 42`
+
+Usernames, emails, nicknames, avatars and roles follow skewed real-world-like
+distributions. Output is deterministic for a given `--seed`, apart from the
+password salts. Only a small pool of passwords is hashed, in parallel across
+processes, and the hashes are reused. Rows are written with prebuilt multi-row
+INSERT statements, committing every `--commit-every` rows. The schema must
+already exist (`alembic upgrade head`, or `--create-tables` for a throwaway
+database).
+
+`--passwords-out` writes `username,password` for a sample of users so load
+tests can log in.
 """
+import argparse
 import asyncio
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
-from app.core.db import SessionLocal, engine
 from app.core.config import get_settings
-# Import your models and CRUD operations as needed
-# from app.models.user import User # Example
-# from app.schemas.user import UserCreate # Example
-# from app.crud.user import user as crud_user # Example
-# from app.core.security import get_password_hash # Example
+from app.core.security import get_password_hash
+from app.crud import role as crud_role
+from app.models.base import Base, utcnow
+from app.models.role import Role, user_roles
+from app.models.user import User
 
 settings = get_settings()
 
-async def init_db_with_data():
-    db = SessionLocal()
+FIRST_NAMES = [
+    "james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "william", "elizabeth",
+    "david", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah", "charles", "karen",
+    "wei", "fang", "li", "jing", "yan", "ming", "hui", "xin", "yu", "lei", "hiroshi", "yuki", "sakura",
+    "mohammed", "fatima", "ahmed", "aisha", "omar", "priya", "rahul", "anil", "deepa", "carlos", "maria",
+    "jose", "lucia", "juan", "sofia", "pierre", "marie", "lukas", "anna", "olga", "ivan", "noah", "emma",
+]
+LAST_NAMES = [
+    "smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "rodriguez", "martinez",
+    "wang", "li", "zhang", "liu", "chen", "yang", "huang", "zhao", "wu", "zhou", "tanaka", "suzuki",
+    "khan", "ali", "hassan", "patel", "sharma", "singh", "kumar", "lopez", "gonzalez", "perez", "martin",
+    "bernard", "muller", "schmidt", "ivanov", "petrov", "nguyen", "tran", "kim", "lee", "park", "silva",
+]
+# Zipf-like: a few names are very common, most are rare
+FIRST_WEIGHTS = [1 / (rank + 1) ** 0.8 for rank in range(len(FIRST_NAMES))]
+LAST_WEIGHTS = [1 / (rank + 1) ** 0.8 for rank in range(len(LAST_NAMES))]
+
+EMAIL_DOMAINS = ["gmail.com", "outlook.com", "yahoo.com", "hotmail.com", "icloud.com", "qq.com", "163.com",
+                 "proton.me", "example.com", "example.org"]
+EMAIL_DOMAIN_WEIGHTS = [38, 14, 10, 7, 7, 8, 5, 3, 5, 3]
+
+# (roles, weight); the permission names are seeded into the normalised tables
+ROLE_MIX = [(("user",), 900), (("user", "editor"), 70), (("user", "moderator"), 25), (("admin",), 5)]
+ROLE_PERMISSIONS = {
+    "user": ["users:read"],
+    "editor": ["users:read", "content:write"],
+    "moderator": ["users:read", "users:write", "content:write"],
+    "admin": ["users:read", "users:write", "users:delete", "content:write"],
+}
+
+USER_COLUMNS = ("id", "username", "email", "hashed_password", "is_active", "is_superuser",
+                "nickname", "avatar_url", "roles", "permissions", "created_at", "updated_at", "version")
+SQLITE_MAX_VARIABLES = 32766
+
+
+def sync_url(url: str) -> str:
+    """Same database through the default synchronous driver (the app uses async ones)."""
+    parsed = make_url(url)
+    return parsed.set(drivername=parsed.get_backend_name()).render_as_string(hide_password=False)
+
+
+def hash_password_pool(passwords: Sequence[str], workers: Optional[int]) -> List[str]:
+    """Hash the pool in parallel; each hash takes the full configured work factor."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=1))
+
+
+class UserFactory:
+    """Deterministic stream of synthetic user rows for a given seed."""
+
+    def __init__(self, seed: int, first_id: int, password_hashes: Sequence[str], role_ids: Dict[str, int],
+                 taken: Iterable[str] = ()):
+        self.rng = random.Random(seed)
+        self.next_id = first_id
+        self.password_hashes = password_hashes
+        self.role_ids = role_ids
+        self.role_sets = [roles for roles, _ in ROLE_MIX]
+        self.role_weights = [weight for _, weight in ROLE_MIX]
+        self.role_json = {roles: json.dumps(list(roles)) for roles in self.role_sets}
+        self.created_at = utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+        # Usernames (and email local parts) already in the table, so reruns into it don't collide
+        self._seen: set = set(taken)
+        self._counts: Dict[str, int] = {}
+
+    def _username(self, first: str, last: str) -> str:
+        rng = self.rng
+        style = rng.random()
+        if style < 0.35:
+            base = f"{first}.{last}"
+        elif style < 0.6:
+            base = f"{first[0]}{last}"
+        elif style < 0.8:
+            base = f"{first}_{last}{rng.randint(60, 99)}"
+        else:
+            base = f"{first}{rng.randint(1, 9999)}"
+        # Popular names collide; numbered suffixes like real sign-up flows suggest
+        username = base
+        while username in self._seen:
+            self._counts[base] = self._counts.get(base, 1) + 1
+            username = f"{base}{self._counts[base]}"
+        self._seen.add(username)
+        return username
+
+    def batch(self, size: int) -> Tuple[List[tuple], List[tuple], List[Tuple[int, str]]]:
+        """Return `size` user rows, their user_roles rows and (id, username) pairs."""
+        rng = self.rng
+        firsts = rng.choices(FIRST_NAMES, FIRST_WEIGHTS, k=size)
+        lasts = rng.choices(LAST_NAMES, LAST_WEIGHTS, k=size)
+        domains = rng.choices(EMAIL_DOMAINS, EMAIL_DOMAIN_WEIGHTS, k=size)
+        role_sets = rng.choices(self.role_sets, self.role_weights, k=size)
+        hashes = rng.choices(self.password_hashes, k=size)
+        users, memberships, identities = [], [], []
+        for first, last, domain, roles, hashed in zip(firsts, lasts, domains, role_sets, hashes):
+            user_id = self.next_id
+            self.next_id += 1
+            username = self._username(first, last)
+            draw = rng.random()
+            if draw < 0.55:
+                nickname = first.capitalize()
+            elif draw < 0.75:
+                nickname = f"{first.capitalize()} {last[0].upper()}."
+            else:
+                nickname = None
+            avatar_url = f"https://avatars.example.com/{user_id:x}.png" if rng.random() < 0.4 else None
+            users.append((
+                user_id, username, f"{username}@{domain}", hashed,
+                rng.random() < 0.97, roles == ("admin",),
+                nickname, avatar_url, self.role_json[roles], None,
+                self.created_at, self.created_at, 1,
+            ))
+            memberships.extend((user_id, self.role_ids[name]) for name in roles)
+            identities.append((user_id, username))
+        return users, memberships, identities
+
+
+def multi_row_insert(engine: Engine, table: str, columns: Sequence[str], rows_per_statement: int) -> str:
+    placeholder = "?" if engine.dialect.paramstyle == "qmark" else "%s"
+    row = "(" + ", ".join([placeholder] * len(columns)) + ")"
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([row] * rows_per_statement)
+
+
+def insert_rows(cursor, engine: Engine, table: str, columns: Sequence[str], rows: List[tuple],
+                statements: Dict[int, str], rows_per_statement: int) -> None:
+    for start in range(0, len(rows), rows_per_statement):
+        chunk = rows[start:start + rows_per_statement]
+        sql = statements.get(len(chunk))
+        if sql is None:
+            sql = statements[len(chunk)] = multi_row_insert(engine, table, columns, len(chunk))
+        cursor.execute(sql, [value for row in chunk for value in row])
+
+
+async def ensure_roles(url: str) -> Dict[str, int]:
+    """Create the role/permission catalogue through the regular CRUD layer."""
+    engine = create_async_engine(url)
     try:
-        # Example: Create a superuser if it doesn't exist
-        # This is a simplified example. You'd typically check if the user exists first.
-        # For a real superuser, ensure settings for email/password are handled securely,
-        # possibly from environment variables or a secure config.
-        
-        # superuser_email = settings.FIRST_SUPERUSER_EMAIL # Assuming you add this to your Settings
-        # superuser_password = settings.FIRST_SUPERUSER_PASSWORD # Assuming you add this
-
-        # if superuser_email and superuser_password:
-        #     existing_superuser = await crud_user.get_by_email(db, email=superuser_email)
-        #     if not existing_superuser:
-        #         user_in = UserCreate(
-        #             email=superuser_email,
-        #             password=get_password_hash(superuser_password),
-        #             full_name="Admin User",
-        #             is_superuser=True,
-        #             is_active=True
-        #         )
-        #         await crud_user.create(db=db, obj_in=user_in)
-        #         print(f"Superuser {superuser_email} created.")
-        #     else:
-        #         print(f"Superuser {superuser_email} already exists.")
-        # else:
-        #     print("Superuser email or password not configured. Skipping superuser creation.")
-
-        # Add more data initialization logic here
-        # For example, creating default roles, settings, or sample data for development.
-        print("Initial data script placeholder. Add your data seeding logic here.")
-
-        await db.commit() # Commit all changes made in this session
-    except Exception as e:
-        await db.rollback()
-        print(f"An error occurred during initial data population: {e}")
-        raise
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            for role_name, permission_names in ROLE_PERMISSIONS.items():
+                await crud_role.grant_permissions_to_role(db, role_name, permission_names)
+            result = await db.execute(select(Role.name, Role.id))
+            return {name: role_id for name, role_id in result.all()}
     finally:
-        await db.close()
-
-async def main():
-    print("Starting initial data population...")
-    # Optional: You might want to create tables if they don't exist, though Alembic is preferred for schema management.
-    # from app.models.base import Base
-    # async with engine.begin() as conn:
-    #     await conn.run_sync(Base.metadata.create_all) # Ensure tables exist
-    
-    await init_db_with_data()
-    print("Initial data population finished.")
+        await engine.dispose()
+
+
+def chunks(total: int, size: int) -> Iterator[int]:
+    for start in range(0, total, size):
+        yield min(size, total - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000, help="Number of users to create")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows generated per batch")
+    parser.add_argument("--commit-every", type=int, default=200_000, help="Rows per transaction")
+    parser.add_argument("--password-pool", type=int, default=32, help="Distinct passwords to hash and reuse")
+    parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: CPU count)")
+    parser.add_argument("--passwords-out", default=None, help="CSV of username,password for a sample of users")
+    parser.add_argument("--sample-logins", type=int, default=1000)
+    parser.add_argument("--create-tables", action="store_true", help="Run Base.metadata.create_all first")
+    args = parser.parse_args()
+
+    engine = create_engine(sync_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _bulk_load_pragmas(dbapi_connection, _):
+            # Bulk-load settings for this connection only; a crash mid-load can lose the load
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.execute("PRAGMA cache_size=-262144") # 256 MiB
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+    if args.create_tables:
+        Base.metadata.create_all(engine)
+
+    started = time.perf_counter()
+    passwords = [f"Synthetic-{args.seed}-{index}!" for index in range(args.password_pool)]
+    password_hashes = hash_password_pool(passwords, args.workers)
+    print(f"Hashed {len(passwords)} passwords in {time.perf_counter() - started:.1f}s")
+
+    role_ids = asyncio.run(ensure_roles(args.database_url))
+    with engine.connect() as conn:
+        first_id = conn.execute(select(func.coalesce(func.max(User.id), 0))).scalar_one() + 1
+        taken = set()
+        for username, email in conn.execute(select(User.username, User.email)):
+            taken.add(username)
+            taken.add(email.partition("@")[0])
+
+    factory = UserFactory(args.seed, first_id, password_hashes, role_ids, taken)
+    if engine.dialect.name == "sqlite":
+        user_rows_per_statement = SQLITE_MAX_VARIABLES // len(USER_COLUMNS)
+        role_rows_per_statement = SQLITE_MAX_VARIABLES // 2
+    else:
+        user_rows_per_statement, role_rows_per_statement = 1000, 5000
+    user_statements: Dict[int, str] = {}
+    role_statements: Dict[int, str] = {}
+    login_sample: List[Tuple[str, str]] = []
+    hash_to_password = dict(zip(password_hashes, passwords))
+
+    load_started = time.perf_counter()
+    created = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        uncommitted = 0
+        for size in chunks(args.count, args.batch_size):
+            users, memberships, identities = factory.batch(size)
+            insert_rows(cursor, engine, User.__tablename__, USER_COLUMNS, users,
+                        user_statements, user_rows_per_statement)
+            insert_rows(cursor, engine, user_roles.name, ("user_id", "role_id"), memberships,
+                        role_statements, role_rows_per_statement)
+            for row in users[:max(0, args.sample_logins - len(login_sample))]:
+                login_sample.append((row[1], hash_to_password[row[3]]))
+            created += size
+            uncommitted += size
+            if uncommitted >= args.commit_every:
+                raw.commit()
+                uncommitted = 0
+                elapsed = time.perf_counter() - load_started
+                print(f"  {created:>10,} users  {created / elapsed:>10,.0f} rows/s", file=sys.stderr)
+        raw.commit()
+    finally:
+        raw.close()
+    load_seconds = time.perf_counter() - load_started
+
+    if args.passwords_out:
+        with open(args.passwords_out, "w") as handle:
+            handle.write("username,password\n")
+            handle.writelines(f"{username},{password}\n" for username, password in login_sample)
+
+    print(f"Inserted {created:,} users in {load_seconds:.1f}s "
+          f"({created / load_seconds if load_seconds else 0:,.0f} rows/s); "
+          f"total {time.perf_counter() - started:.1f}s")
+    engine.dispose()
+
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Move users to the shard their username hashes to under the current layout.
+
+Reads SHARD_URLS / SHARD_RING from the environment (see app/core/sharding.py
+and app/core/resharding.py for the procedure):
+
+`pdm run python scripts/reshard.py copy-catalog`
+`pdm run python scripts/reshard.py plan`
+`pdm run python scripts/reshard.py move --batch-size 500 --sleep 0.05`
+
+`plan` only counts the users that would move. `move` can be interrupted and
+run again.
+"""
+import argparse
+import asyncio
+import sys
+
+from app.core.resharding import copy_catalog, reshard
+from app.core.sharding import shard_set
+
+
+async def run(args: argparse.Namespace) -> int:
+    if not shard_set.enabled:
+        print("SHARD_URLS is not set; nothing to do", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "copy-catalog":
+            targets = await copy_catalog(shard_set, args.source_shard)
+            print(f"Catalogue copied to {', '.join(targets) or 'no other shard'}")
+            return 0
+        report = await reshard(
+            shard_set,
+            sources=args.source,
+            batch_size=args.batch_size,
+            sleep=args.sleep,
+            dry_run=args.command == "plan",
+        )
+    finally:
+        await shard_set.dispose()
+    verb = "would move" if report.dry_run else "moved"
+    print(f"Scanned {report.scanned:,} users, {verb} {report.total_moved:,}")
+    for (source, target), count in sorted(report.moved.items()):
+        print(f"  {source} -> {target}: {count:,}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("copy-catalog", help="Copy roles and permissions to every shard").add_argument(
+        "--source-shard", help="Shard holding the reference catalogue (default: the first)"
+    )
+    for name, help_text in (("plan", "Count the users that would move"), ("move", "Move users")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--source", action="append", help="Only scan this shard (repeatable)")
+        command.add_argument("--batch-size", type=int, default=500)
+        command.add_argument("--sleep", type=float, default=0.0, help="Seconds to pause between batches")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
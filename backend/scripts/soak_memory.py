@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Soak the API in-process and report what memory it retains.
+
+Registers a few users, then repeats rounds of login, GET /auth/me, user search,
+batch get and token refresh through the ASGI app (no network), against a
+throwaway SQLite database:
+`pdm run python scripts/soak_memory.py --rounds 2000`
+`pdm run python scripts/soak_memory.py --rounds 5000 --max-growth-kb 512` (exits 1 above the limit, for CI)
+
+Warm-up rounds come first, so the caches, lazy imports and connection pools
+fill before measuring. Then `track_memory()` compares the traced allocations
+before and after the measured rounds. The report lists the growth per request,
+the sites that grew the most, RSS, live ORM instances and cache sizes. A leak
+shows up as growth that scales with `--rounds`.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Before the app is imported: settings are read at import time
+_database = os.path.join(tempfile.mkdtemp(), "soak.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_database}"
+os.environ.setdefault("LOG_LEVEL", "WARNING") # Access lines would drown the report
+os.environ.setdefault("AUDIT_LOG_SPILL_FILE", os.path.join(os.path.dirname(_database), "audit_spill.ndjson"))
+
+from httpx import ASGITransport, AsyncClient
+
+from app import models # noqa: F401, registers all models with Base.metadata
+from app.core import security
+from app.core.db import engine
+from app.core.memory_profiler import cache_sizes, live_model_instances, rss_bytes, track_memory
+from app.main import app
+from app.models.base import Base
+
+REQUESTS_PER_ROUND = 5
+
+
+async def soak_round(client: AsyncClient, username: str, user_ids: list) -> None:
+    login = await client.post("/api/v1/auth/login", json={"username": username, "password": "password123"})
+    login.raise_for_status()
+    tokens = login.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    (await client.get("/api/v1/auth/me", headers=headers)).raise_for_status()
+    (await client.get("/api/v1/users/search", params={"q": "soak"}, headers=headers)).raise_for_status()
+    (await client.post("/api/v1/users:batchGet", json={"ids": user_ids}, headers=headers)).raise_for_status()
+    (await client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})).raise_for_status()
+
+
+async def run(users: int, warmup: int, rounds: int, top: int, max_growth_kb: float) -> int:
+    # Cheapest bcrypt cost: the soak is about memory, not hashing
+    security.pwd_context = security.build_pwd_context(["bcrypt"], bcrypt_rounds=4)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://soak") as client:
+            usernames = [f"soak{i}" for i in range(users)]
+            user_ids = []
+            for username in usernames:
+                response = await client.post("/api/v1/auth/register", json={
+                    "username": username, "email": f"{username}@example.com", "password": "password123",
+                })
+                response.raise_for_status()
+                user_ids.append(response.json()["user"]["id"])
+            for i in range(warmup):
+                await soak_round(client, usernames[i % users], user_ids)
+
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            with track_memory() as growth:
+                for i in range(rounds):
+                    await soak_round(client, usernames[i % users], user_ids)
+            seconds = time.perf_counter() - start
+
+    requests = rounds * REQUESTS_PER_ROUND
+    growth_bytes = growth.growth_bytes
+    print(f"{requests:,} requests in {seconds:.1f}s (traced, so slower than normal)")
+    print(f"traced growth {growth_bytes / 1024:,.1f} KiB, {growth_bytes / requests:,.1f} B/request")
+    if rss_before is not None:
+        print(f"RSS {rss_before / 2**20:,.1f} -> {rss_bytes() / 2**20:,.1f} MiB")
+    print(f"\n{'top growers':<72} {'KiB':>10} {'blocks':>8}")
+    for stat in growth.top(top):
+        location = stat.location if len(stat.location) <= 72 else "..." + stat.location[-69:]
+        print(f"{location:<72} {stat.size_diff_bytes / 1024:>+10.1f} {stat.count_diff:>+8}")
+    print(f"\nlive ORM instances: {live_model_instances()}")
+    print(f"cache sizes: {cache_sizes()}")
+    await engine.dispose()
+    if max_growth_kb is not None and growth_bytes > max_growth_kb * 1024:
+        print(f"FAIL: grew more than {max_growth_kb:,.0f} KiB", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=200, help="Rounds before measuring")
+    parser.add_argument("--rounds", type=int, default=1000, help=f"Measured rounds of {REQUESTS_PER_ROUND} requests")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-growth-kb", type=float, default=None, help="Exit with status 1 above this growth")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.users, args.warmup, args.rounds, args.top, args.max_growth_kb)))
+
+
+if __name__ == "__main__":
+    main()
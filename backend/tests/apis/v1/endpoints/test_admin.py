@@ -0,0 +1,119 @@
+import asyncio
+
+from httpx import AsyncClient
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import security
+from app.core.config import settings
+from app.crud.base import CRUDBase
+from app.langchain_module import llm
+from app.langchain_module.routing import LLMRouter, ScriptedProvider
+from app.models.role import Role
+from app.models.user import User
+from app.services.user_import import importer
+from tests.conftest import SessionTesting
+
+
+async def test_traces_are_listed_for_superusers_only(client: AsyncClient, db_session: AsyncSession):
+    db_session.add_all([
+        User(username="trace_admin", email="trace_admin@example.com", hashed_password="x", is_superuser=True),
+        User(username="trace_user", email="trace_user@example.com", hashed_password="x"),
+    ])
+    await db_session.commit()
+    admin = {"Authorization": f"Bearer {security.create_access_token(subject='trace_admin')}"}
+    user = {"Authorization": f"Bearer {security.create_access_token(subject='trace_user')}"}
+    traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+    await client.get("/api/health", headers={"traceparent": traceparent})
+    response = await client.get(f"{settings.API_V1_STR}/admin/traces", headers=admin)
+    assert response.status_code == 200
+    summary = next(t for t in response.json() if t["trace_id"] == "0af7651916cd43dd8448eb211c80319c")
+    assert summary["name"] == "GET /api/health" and summary["span_count"] >= 1
+
+    detail = await client.get(f"{settings.API_V1_STR}/admin/traces/{summary['trace_id']}", headers=admin)
+    assert detail.json()["spans"][0]["span_id"]
+
+    assert (await client.get(f"{settings.API_V1_STR}/admin/traces", headers=user)).status_code == 403
+
+
+async def test_bulk_import_runs_in_the_background(client: AsyncClient, db_session: AsyncSession, fast_password_hashing, monkeypatch):
+    db_session.add(User(username="import_admin", email="import_admin@example.com", hashed_password="x", is_superuser=True))
+    await db_session.commit()
+    admin = {"Authorization": f"Bearer {security.create_access_token(subject='import_admin')}"}
+    monkeypatch.setattr(importer, "hash_workers", 0)
+    monkeypatch.setattr(importer, "session_factory", SessionTesting)
+    body = "username,email,password\n" + "".join(f"bulk_{i},bulk_{i}@example.com,pw-{i}\n" for i in range(5))
+    url = f"{settings.API_V1_STR}/admin/users/import"
+    try:
+        assert (await client.post(url, content=body, headers={**admin, "Content-Type": "text/plain"})).status_code == 415
+
+        response = await client.post(url, content=body, headers={**admin, "Content-Type": "text/csv"})
+        assert response.status_code == 202
+        status_url = response.headers["Location"]
+        for _ in range(100):
+            job = (await client.get(status_url, headers=admin)).json()
+            if job["finished_at"]:
+                break
+            await asyncio.sleep(0.05)
+        assert job["status"] == "succeeded" and (job["rows_read"], job["created"]) == (5, 5)
+        async with SessionTesting() as db:
+            assert len((await db.execute(select(User.id).where(User.username.startswith("bulk_")))).all()) == 5
+
+        assert (await client.get(f"{settings.API_V1_STR}/admin/users/imports/unknown", headers=admin)).status_code == 404
+    finally:
+        async with SessionTesting() as db:
+            await db.execute(delete(User).where(User.username.startswith("bulk_")))
+            await db.commit()
+
+
+async def test_memory_diagnostics(client: AsyncClient, db_session: AsyncSession):
+    db_session.add(User(username="memory_admin", email="memory_admin@example.com", hashed_password="x", is_superuser=True))
+    await db_session.commit()
+    admin = {"Authorization": f"Bearer {security.create_access_token(subject='memory_admin')}"}
+    url = f"{settings.API_V1_STR}/admin/memory"
+    try:
+        status = (await client.get(url, params={"instances": True}, headers=admin)).json()
+        assert status["tracing"] is False and status["live_instances"]["User"] >= 1
+        assert "principal_cache" in status["caches"]
+        assert (await client.post(f"{url}/snapshots", json={"name": "a"}, headers=admin)).status_code == 409
+
+        assert (await client.post(f"{url}/tracing", json={}, headers=admin)).json()["tracing"] is True
+        assert (await client.post(f"{url}/snapshots", json={"name": "a"}, headers=admin)).status_code == 201
+        await client.get("/api/health")
+        assert (await client.post(f"{url}/snapshots", json={"name": "b"}, headers=admin)).status_code == 201
+        diff = await client.get(f"{url}/diff", params={"old": "a", "new": "b", "group_by": "filename"}, headers=admin)
+        assert diff.status_code == 200 and diff.json()
+        assert (await client.get(f"{url}/diff", params={"old": "a", "new": "c"}, headers=admin)).status_code == 404
+    finally:
+        status = (await client.delete(f"{url}/tracing", headers=admin)).json()
+    assert status["tracing"] is False and status["snapshots"] == []
+
+
+async def test_llm_routing_metrics(client: AsyncClient, db_session: AsyncSession, monkeypatch):
+    db_session.add(User(username="llm_admin", email="llm_admin@example.com", hashed_password="x", is_superuser=True))
+    await db_session.commit()
+    admin = {"Authorization": f"Bearer {security.create_access_token(subject='llm_admin')}"}
+    url = f"{settings.API_V1_STR}/admin/llm/routing"
+    monkeypatch.setattr(llm, "llm_router", None)
+    assert (await client.get(url, headers=admin)).status_code == 404
+
+    router = LLMRouter([ScriptedProvider("broken", 1, error_rate=1.0), ScriptedProvider("backup", 1)])
+    monkeypatch.setattr(llm, "llm_router", router)
+    assert await router.ainvoke("hi") == "backup: hi"
+    stats = (await client.get(url, headers=admin)).json()
+    assert stats["failovers"] == 1 and stats["succeeded"] == 1
+    assert [(p["name"], p["failures"], p["wins"]) for p in stats["providers"]] == [("broken", 1, 0), ("backup", 0, 1)]
+
+
+async def test_crud_cache_metrics(client: AsyncClient, db_session: AsyncSession):
+    db_session.add(User(username="cache_admin", email="cache_admin@example.com", hashed_password="x", is_superuser=True))
+    await db_session.commit()
+    admin = {"Authorization": f"Bearer {security.create_access_token(subject='cache_admin')}"}
+    cached_roles = CRUDBase(Role, cache_ttl_seconds=60)
+    await cached_roles.get(db_session, -1)
+    await cached_roles.get(db_session, -1)
+
+    response = await client.get(f"{settings.API_V1_STR}/admin/crud-cache", headers=admin)
+    stats = next(cache for cache in response.json() if cache["namespace"] == "roles")
+    assert stats["local_hits"] >= 1 and stats["misses"] >= 1 and stats["shared"] is False
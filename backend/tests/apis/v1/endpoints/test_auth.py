@@ -0,0 +1,157 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import security
+from app.core.config import settings
+from app.models.user import User
+
+
+async def create_user(db: AsyncSession, username: str, password: str, **fields) -> User:
+    user = User(
+        username=username,
+        email=f"{username}@example.com",
+        hashed_password=security.get_password_hash(password),
+        **fields,
+    )
+    db.add(user)
+    await db.commit()
+    return user
+
+
+async def test_login_rehashes_outdated_hash(
+    client: AsyncClient, db_session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(security, "pwd_context", security.build_pwd_context(["bcrypt"], bcrypt_rounds=4))
+    user = await create_user(db_session, "rehash_me", "password123")
+    assert user.hashed_password.startswith("$2b$04$")
+
+    monkeypatch.setattr(security, "pwd_context", security.build_pwd_context(["bcrypt"], bcrypt_rounds=5))
+    response = await client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        json={"username": "rehash_me", "password": "password123"},
+    )
+    assert response.status_code == 200
+    await db_session.refresh(user)
+    assert user.hashed_password.startswith("$2b$05$")
+
+
+async def test_login_rejects_wrong_password(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    await create_user(db_session, "wrong_pw", "password123")
+    response = await client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        json={"username": "wrong_pw", "password": "nope"},
+    )
+    assert response.status_code == 401
+
+
+async def login(client: AsyncClient, username: str, password: str) -> dict:
+    response = await client.post(
+        f"{settings.API_V1_STR}/auth/login", json={"username": username, "password": password}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_refresh_rotates_and_detects_reuse(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    await create_user(db_session, "rotator", "password123")
+    first = await login(client, "rotator", "password123")
+    assert first["refresh_token"]
+
+    response = await client.post(f"{settings.API_V1_STR}/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert response.status_code == 200
+    second = response.json()
+    assert second["refresh_token"] != first["refresh_token"]
+
+    me = await client.get(f"{settings.API_V1_STR}/auth/me", headers={"Authorization": f"Bearer {second['access_token']}"})
+    assert me.status_code == 200
+
+    # Replaying the rotated token revokes the family, including the newest access token
+    replay = await client.post(f"{settings.API_V1_STR}/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert replay.status_code == 401
+    me = await client.get(f"{settings.API_V1_STR}/auth/me", headers={"Authorization": f"Bearer {second['access_token']}"})
+    assert me.status_code == 401
+    response = await client.post(f"{settings.API_V1_STR}/auth/refresh", json={"refresh_token": second["refresh_token"]})
+    assert response.status_code == 401
+
+
+async def test_logout_revokes_family(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    await create_user(db_session, "leaver", "password123")
+    tokens = await login(client, "leaver", "password123")
+
+    response = await client.post(f"{settings.API_V1_STR}/auth/logout", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 204
+    me = await client.get(f"{settings.API_V1_STR}/auth/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert me.status_code == 401
+
+
+async def test_refresh_token_is_not_a_bearer_token(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    await create_user(db_session, "confused", "password123")
+    tokens = await login(client, "confused", "password123")
+    me = await client.get(f"{settings.API_V1_STR}/auth/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert me.status_code == 401
+
+
+async def test_me_conditional_get_skips_database_when_principal_cached(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    user = await create_user(db_session, "etag_me", "password123")
+    tokens = await login(client, "etag_me", "password123")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    first = await client.get(f"{settings.API_V1_STR}/auth/me", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and "private" in first.headers["cache-control"]
+
+    statements = []
+    sync_engine = db_session.bind.sync_engine
+    listener = lambda *args: statements.append(args[2]) # noqa: E731
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        cached = await client.get(f"{settings.API_V1_STR}/auth/me", headers={**headers, "If-None-Match": etag})
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag and cached.content == b""
+    assert statements == []
+
+    # Any ORM update bumps the row version and evicts the cached principal
+    user.nickname = "Renamed"
+    await db_session.commit()
+    changed = await client.get(f"{settings.API_V1_STR}/auth/me", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["nickname"] == "Renamed"
+    assert changed.headers["etag"] != etag
+
+
+async def test_login_attempts_are_audited(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    from app.core.audit_log import LOGIN_FAILURE, LOGIN_SUCCESS, audit_log
+    from app.models.auth_event import AuthEvent
+    from tests.conftest import SessionTesting
+
+    await create_user(db_session, "audited", "password123")
+    audit_log.start(SessionTesting)
+    try:
+        await client.post(f"{settings.API_V1_STR}/auth/login", json={"username": "audited", "password": "nope"})
+        await login(client, "audited", "password123")
+    finally:
+        await audit_log.stop()
+
+    async with SessionTesting() as db:
+        events = (await db.execute(
+            select(AuthEvent).where(AuthEvent.username == "audited").order_by(AuthEvent.id)
+        )).scalars().all()
+    assert [(event.event_type, event.success) for event in events] == [(LOGIN_FAILURE, False), (LOGIN_SUCCESS, True)]
+    assert events[0].detail == {"reason": "wrong_password"}
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.websockets import WebSocketDisconnect
+
+from app.core import security
+from app.core.config import settings
+from app.core.principal_cache import CachedPrincipal, principal_cache
+from app.core.user_events import UPDATED, UserEvent, user_events
+from app.crud import user as crud_user
+from app.main import app
+from app.models.user import User
+from app.services import avatars
+
+
+async def auth_headers(db: AsyncSession, username: str) -> dict:
+    user = User(username=username, email=f"{username}@example.com", hashed_password="x")
+    db.add(user)
+    await db.commit()
+    return {"Authorization": f"Bearer {security.create_access_token(subject=username)}"}
+
+
+async def test_batch_get_returns_public_profiles_in_request_order(client: AsyncClient, db_session: AsyncSession):
+    headers = await auth_headers(db_session, "batch_reader")
+    users = [User(username=f"batch_{i}", email=f"batch_{i}@example.com", hashed_password="x", nickname=f"B{i}")
+             for i in range(3)]
+    db_session.add_all(users)
+    await db_session.commit()
+    ids = [users[2].id, 999_999, users[0].id, users[2].id]
+
+    response = await client.post(f"{settings.API_V1_STR}/users:batchGet", json={"ids": ids}, headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [user["username"] for user in body["users"]] == ["batch_2", "batch_0"]
+    assert body["missing"] == [999_999]
+    assert "email" not in body["users"][0]
+
+
+async def test_batch_get_limits_number_of_ids(client: AsyncClient, db_session: AsyncSession):
+    headers = await auth_headers(db_session, "greedy_reader")
+    ids = list(range(1, settings.USERS_BATCH_GET_MAX_IDS + 2))
+    response = await client.post(f"{settings.API_V1_STR}/users:batchGet", json={"ids": ids}, headers=headers)
+    assert response.status_code == 422
+
+
+async def test_read_user_supports_etags(client: AsyncClient, db_session: AsyncSession):
+    headers = await auth_headers(db_session, "profile_reader")
+    response = await client.get(f"{settings.API_V1_STR}/users/999999", headers=headers)
+    assert response.status_code == 404
+
+    me = (await client.get(f"{settings.API_V1_STR}/auth/me", headers=headers)).json()
+    response = await client.get(f"{settings.API_V1_STR}/users/{me['id']}", headers=headers)
+    assert response.status_code == 200
+    cached = await client.get(
+        f"{settings.API_V1_STR}/users/{me['id']}", headers={**headers, "If-None-Match": response.headers["etag"]}
+    )
+    assert cached.status_code == 304
+
+
+async def test_search_endpoint_pages_results(client: AsyncClient, db_session: AsyncSession):
+    headers = await auth_headers(db_session, "searcher")
+    db_session.add_all([
+        User(username=f"qsearch_{i}", email=f"qsearch_{i}@example.com", hashed_password="x") for i in range(3)
+    ])
+    await db_session.commit()
+
+    response = await client.get(f"{settings.API_V1_STR}/users/search", params={"q": "qsearch_", "limit": 2}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [user["username"] for user in body["users"]] == ["qsearch_0", "qsearch_1"]
+
+    response = await client.get(
+        f"{settings.API_V1_STR}/users/search",
+        params={"q": "qsearch_", "limit": 2, "cursor": body["next_cursor"]},
+        headers=headers,
+    )
+    assert [user["username"] for user in response.json()["users"]] == ["qsearch_2"]
+
+    response = await client.get(f"{settings.API_V1_STR}/users/search", params={"q": "x", "cursor": "bogus"}, headers=headers)
+    assert response.status_code == 400
+
+
+def png_bytes(width: int, height: int, color=(200, 30, 30)) -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def test_avatar_upload_is_stored_once_and_served_immutable(client: AsyncClient, db_session: AsyncSession, tmp_path, monkeypatch):
+    store = avatars.AvatarStore(root=str(tmp_path), sizes=[32, 64], max_upload_bytes=100_000, workers=0)
+    monkeypatch.setattr(avatars, "avatar_store", store)
+    url = f"{settings.API_V1_STR}/users/me/avatar"
+    image = png_bytes(120, 80)
+
+    first = await auth_headers(db_session, "avatar_one")
+    response = await client.post(url, files={"file": ("me.png", image, "image/png")}, headers=first)
+    assert response.status_code == 200, response.text
+    avatar_url = response.json()["avatar_url"]
+    digest = hashlib.sha256(image).hexdigest()
+    assert avatar_url == f"{settings.API_V1_STR}/avatars/{digest}/64"
+
+    second = await auth_headers(db_session, "avatar_two")
+    response = await client.post(url, files={"file": ("copy.png", image, "image/png")}, headers=second)
+    assert response.json()["avatar_url"] == avatar_url
+    assert [path.name for path in tmp_path.iterdir() if path.name != "incoming"] == [digest[:2]]
+    assert not list((tmp_path / "incoming").iterdir()) # Uploads are cleaned up
+
+    served = await client.get(avatar_url) # No credentials needed
+    assert served.status_code == 200 and served.headers["content-type"] == "image/webp"
+    assert served.headers["cache-control"] == "public, max-age=31536000, immutable"
+    from PIL import Image
+    assert Image.open(io.BytesIO(served.content)).size == (64, 64)
+    assert (await client.get(avatar_url.replace("/64", "/32"))).status_code == 200
+    partial = await client.get(avatar_url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.content == served.content[:10]
+    assert (await client.get(avatar_url, headers={"If-None-Match": served.headers["etag"]})).status_code == 304
+    assert (await client.get(avatar_url.replace("/64", "/48"))).status_code == 404
+
+    assert (await client.post(url, files={"file": ("x.png", b"not an image", "image/png")}, headers=first)).status_code == 400
+    assert (await client.post(url, files={"file": ("big.png", b"x" * 200_000, "image/png")}, headers=first)).status_code == 413
+    assert (await client.post(url, content=image, headers={**first, "Content-Type": "image/png"})).status_code == 400
+
+
+async def test_user_changes_are_pushed_over_server_sent_events(client: AsyncClient, db_session: AsyncSession):
+    headers = await auth_headers(db_session, "sse_user")
+    user = await crud_user.get_user_by_username(db_session, "sse_user")
+    stream = asyncio.create_task(client.get(f"{settings.API_V1_STR}/users/me/events", headers=headers))
+    while user_events.connections == 0:
+        await asyncio.sleep(0.01)
+
+    await crud_user.update_avatar_url(db_session, user, "/avatars/x")
+    await db_session.delete(user)
+    await db_session.commit() # Ends the stream
+    response = await asyncio.wait_for(stream, 5)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    ready, updated, deleted = response.text.strip().split("\n\n")
+    assert ready.startswith("event: ready\n")
+    assert updated.startswith(f"event: user.updated\nid: {user.version}\n") and '"fields":["avatar_url"]' in updated
+    assert deleted.startswith("event: user.deleted\n")
+    assert user_events.connections == 0
+
+
+def test_user_changes_are_pushed_over_websockets():
+    user = User(id=424242, username="ws_user", email="ws_user@example.com", hashed_password="x", is_active=True,
+                is_superuser=False, version=5)
+    principal_cache.set(CachedPrincipal.from_user(user)) # Authenticates without the database
+    with TestClient(app).websocket_connect(f"{settings.API_V1_STR}/users/me/ws") as websocket:
+        websocket.send_json({"token": security.create_access_token(subject="ws_user")})
+        assert websocket.receive_json() == {"type": "ready", "user_id": 424242, "version": 5}
+        websocket.portal.call(user_events.publish, UserEvent(UPDATED, 424242, 6, ("roles",)))
+        assert websocket.receive_json() == {"type": UPDATED, "user_id": 424242, "version": 6, "fields": ["roles"]}
+    principal_cache.invalidate("ws_user")
+
+    with TestClient(app).websocket_connect(f"{settings.API_V1_STR}/users/me/ws") as websocket:
+        websocket.send_json({"token": "not a token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1008
@@ -1,15 +1,23 @@
 import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator, Generator
 
+import fakeredis
 import pytest
 import pytest_asyncio # Required for async fixtures
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.main import app # Import your FastAPI app
 from app.core.config import get_settings
-from app.core.db import Base, get_db_session # Import Base and get_db_session
+from app.core.loop_monitor import LoopWatchdog, detect_loop_blocking
+from app.core.deps import get_db_session
+from app.core import redis_client
+from app.models.base import Base
+from app import models  # noqa: F401, registers all models with Base.metadata
 # from app.core.redis_client import get_redis_client, close_redis_pool # If you need to manage Redis for tests
 # from app.models import User # Example: Import your models if needed for test data
 
@@ -44,6 +52,7 @@ async def setup_test_database():
     yield
     async with engine_test.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
+    await engine_test.dispose() # Close aiosqlite worker threads so the session can exit
     # await close_redis_pool() # If redis pool was initialized for tests
 
 @pytest_asyncio.fixture(scope="function")
@@ -68,12 +77,46 @@ async def client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
     #     # return mock_redis_client or a test-specific redis instance
     # app.dependency_overrides[get_redis_client] = override_get_redis_client
 
-    async with AsyncClient(app=app, base_url="http://test") as ac:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         yield ac
     
     # Clean up dependency overrides after test
     app.dependency_overrides.clear()
 
+@pytest.fixture(scope="function")
+def fast_password_hashing(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Use the cheapest bcrypt cost so tests creating or logging in users stay fast."""
+    from app.core import security
+    monkeypatch.setattr(security, "pwd_context", security.build_pwd_context(["bcrypt"], bcrypt_rounds=4))
+
+@pytest.fixture(scope="function")
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> fakeredis.FakeAsyncRedis:
+    """
+    Point every `get_redis_client` at one in-memory Redis (Lua scripts and pub/sub included).
+    Returns a client of it for the test's own checks.
+    """
+    server = fakeredis.FakeServer()
+
+    @asynccontextmanager
+    async def get_fake_redis_client() -> AsyncGenerator[fakeredis.FakeAsyncRedis, None]:
+        client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        try:
+            yield client
+        finally:
+            await client.aclose()
+
+    original = redis_client.get_redis_client
+    for module in list(sys.modules.values()):
+        if getattr(module, "get_redis_client", None) is original:
+            monkeypatch.setattr(module, "get_redis_client", get_fake_redis_client)
+    return fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+@pytest_asyncio.fixture(scope="function")
+async def no_loop_blocking() -> AsyncGenerator[LoopWatchdog, None]:
+    """Fail the test if the event loop is blocked longer than LOOP_BLOCK_THRESHOLD_MS (default 200)."""
+    with detect_loop_blocking(float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", "200"))) as watchdog:
+        yield watchdog
+
 # Example fixture for creating a test user (if you have a User model)
 # @pytest_asyncio.fixture(scope="function")
 # async def test_user(db_session: AsyncSession) -> User:
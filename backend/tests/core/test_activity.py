@@ -0,0 +1,150 @@
+import asyncio
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.activity import (
+    REDIS_DRAIN_LOCK_KEY, REDIS_LAST_LOGIN_KEY, REDIS_LAST_SEEN_KEY, REDIS_LOGINS_KEY, ActivityTracker,
+)
+from app.crud import user as crud_user
+from app.models.user import User
+from app.schemas.user import UserCreate
+
+
+async def make_user(db: AsyncSession, username: str) -> User:
+    return await crud_user.create_user(db, UserCreate(
+        username=username, email=f"{username}@example.com", password="password123",
+    ))
+
+
+async def test_activity_is_coalesced_into_one_batched_update(db_session: AsyncSession):
+    alice = await make_user(db_session, "activity_alice")
+    bob = await make_user(db_session, "activity_bob")
+    version = alice.version
+    tracker = ActivityTracker()
+    for _ in range(3):
+        tracker.record_login(alice.id)
+    for _ in range(1000):
+        tracker.record_seen(alice.id)
+        tracker.record_seen(bob.id)
+    assert len(tracker) == 2
+
+    updates = []
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE users"):
+            updates.append(executemany)
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", count_updates)
+    try:
+        assert await tracker.flush(db_session) == 2
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", count_updates)
+    assert updates == [True] # One executemany for both users
+    assert len(tracker) == 0
+
+    rows = {row.id: row for row in (await db_session.execute(
+        select(User.id, User.login_count, User.last_login_at, User.last_seen_at, User.version)
+        .where(User.id.in_([alice.id, bob.id]))
+    )).all()}
+    assert rows[alice.id].login_count == 3
+    assert rows[alice.id].last_login_at is not None and rows[alice.id].last_seen_at is not None
+    assert rows[alice.id].version == version # ETags are not affected
+    assert rows[bob.id].login_count == 0 and rows[bob.id].last_login_at is None
+
+
+async def test_failed_flush_keeps_activity_for_the_next_interval(db_session: AsyncSession, monkeypatch):
+    carol_id = (await make_user(db_session, "activity_carol")).id
+    tracker = ActivityTracker()
+    tracker.record_login(carol_id)
+
+    async def unavailable(db, rows):
+        raise OperationalError("UPDATE users", {}, Exception("database is locked"))
+    monkeypatch.setattr(crud_user, "add_activity", unavailable)
+    assert await tracker.flush(db_session) == 0
+    assert tracker.failed_flushes == 1
+
+    tracker.record_login(carol_id) # Arrives while the write was failing
+    monkeypatch.undo()
+    assert await tracker.flush(db_session) == 1
+    count = (await db_session.execute(select(User.login_count).where(User.id == carol_id))).scalar_one()
+    assert count == 2
+
+
+def test_disabled_tracker_records_nothing():
+    tracker = ActivityTracker(enabled=False)
+    tracker.record_login(1)
+    tracker.record_seen(1)
+    assert len(tracker) == 0
+
+
+async def login_counts(db: AsyncSession, *user_ids: int):
+    return list((await db.execute(
+        select(User.login_count).where(User.id.in_(user_ids)).order_by(User.id)
+    )).scalars())
+
+
+async def test_workers_merge_activity_in_redis_and_one_drains_it(db_session: AsyncSession, fake_redis):
+    dave = (await make_user(db_session, "activity_dave")).id
+    erin = (await make_user(db_session, "activity_erin")).id
+    worker_a, worker_b = ActivityTracker(use_redis=True), ActivityTracker(use_redis=True)
+    worker_a.record_login(dave)
+    worker_a.record_login(dave)
+    worker_b.record_login(dave) # Later: its timestamps win
+    worker_b.record_seen(erin)
+    latest = worker_b._pending[dave].last_login_at
+
+    await fake_redis.set(REDIS_DRAIN_LOCK_KEY, "1") # Another worker drained this interval
+    assert await worker_b.flush(db_session) == 0
+    assert await worker_a.flush(db_session) == 0
+    assert await fake_redis.hgetall(REDIS_LOGINS_KEY) == {str(dave): "3"} # Zero counts are not written
+    assert float(await fake_redis.hget(REDIS_LAST_LOGIN_KEY, str(dave))) == latest
+    assert await fake_redis.hexists(REDIS_LAST_SEEN_KEY, str(erin))
+    assert await login_counts(db_session, dave, erin) == [0, 0]
+
+    await fake_redis.delete(REDIS_DRAIN_LOCK_KEY) # Expired
+    assert await worker_a.flush(db_session) == 2
+    assert await login_counts(db_session, dave, erin) == [3, 0]
+    assert await fake_redis.ttl(REDIS_DRAIN_LOCK_KEY) > 0 # Taken again for the next interval
+    assert await fake_redis.keys("app:activity:*") == [REDIS_DRAIN_LOCK_KEY] # Drained hashes removed
+
+
+async def test_failed_drain_is_retried_before_newer_activity(db_session: AsyncSession, fake_redis, monkeypatch):
+    frank = (await make_user(db_session, "activity_frank")).id
+    grace = (await make_user(db_session, "activity_grace")).id
+    tracker = ActivityTracker(use_redis=True)
+    tracker.record_login(frank)
+
+    async def unavailable(db, rows):
+        raise OperationalError("UPDATE users", {}, Exception("database is locked"))
+    with monkeypatch.context() as patch: # Leaves the fake Redis in place
+        patch.setattr(crud_user, "add_activity", unavailable)
+        assert await tracker.flush(db_session) == 0 and tracker.failed_flushes == 1
+
+    tracker.record_login(grace) # Merged into the live hashes, beside the failed drain
+    await fake_redis.delete(REDIS_DRAIN_LOCK_KEY)
+    assert await tracker.flush(db_session) == 1 # Only the failed drain's users
+    assert await login_counts(db_session, frank, grace) == [1, 0]
+    assert await fake_redis.hgetall(REDIS_LOGINS_KEY) == {str(grace): "1"}
+
+    await fake_redis.delete(REDIS_DRAIN_LOCK_KEY)
+    assert await tracker.flush(db_session) == 1
+    assert await login_counts(db_session, frank, grace) == [1, 1]
+
+
+async def test_flusher_survives_failed_intervals():
+    sessions = 0
+
+    def unavailable_session():
+        nonlocal sessions
+        sessions += 1
+        raise OSError("connection refused")
+
+    tracker = ActivityTracker(flush_interval=0.01)
+    tracker.start(unavailable_session)
+    for _ in range(200):
+        if sessions >= 3 or tracker._task.done():
+            break
+        await asyncio.sleep(0.01)
+    assert sessions >= 3 and not tracker._task.done() and tracker.failed_flushes >= 2
+    tracker._task.cancel()
+    await asyncio.gather(tracker._task, return_exceptions=True)
@@ -0,0 +1,93 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.core import audit_log
+from app.core.audit_log import LOGIN_FAILURE, AuditLog
+from app.models.auth_event import AuthEvent
+from tests.conftest import SessionTesting
+
+
+async def count_events(username: str) -> int:
+    async with SessionTesting() as db:
+        return (await db.execute(select(func.count()).where(AuthEvent.username == username))).scalar_one()
+
+
+async def test_full_batch_is_flushed_without_waiting_for_the_interval():
+    log = AuditLog(batch_size=50, flush_interval_ms=60_000)
+    log.start(SessionTesting)
+    try:
+        for _ in range(50):
+            log.record(LOGIN_FAILURE, success=False, username="audit_batch")
+        for _ in range(100):
+            if log.stats.written == 50:
+                break
+            await asyncio.sleep(0.01)
+        assert log.stats.written == 50
+        assert log.stats.flushes == 1 # One multi-row INSERT
+        assert await count_events("audit_batch") == 50
+    finally:
+        await log.stop()
+
+
+async def test_partial_batch_is_flushed_on_interval_and_drained_on_stop():
+    log = AuditLog(batch_size=1000, flush_interval_ms=20)
+    log.start(SessionTesting)
+    log.record(LOGIN_FAILURE, success=False, username="audit_interval")
+    await asyncio.sleep(0.1)
+    assert log.stats.written == 1
+
+    log.record(LOGIN_FAILURE, success=False, username="audit_interval")
+    await log.stop()
+    assert await count_events("audit_interval") == 2
+
+
+async def test_full_buffer_drops_and_counts():
+    log = AuditLog(queue_size=3, batch_size=10)
+    for _ in range(5):
+        log.record(LOGIN_FAILURE, success=False, username="audit_drop")
+    assert len(log) == 3
+    assert log.stats.dropped == 2 and log.stats.recorded == 5
+
+
+async def test_overflow_spills_to_file_and_is_replayed_on_start(tmp_path):
+    spill_file = tmp_path / "spill.ndjson"
+    log = AuditLog(queue_size=2, batch_size=10, overflow="spill", spill_file=str(spill_file))
+    for _ in range(4):
+        log.record(LOGIN_FAILURE, success=False, username="audit_spill", detail={"reason": "wrong_password"})
+    assert not spill_file.exists() # record() does no file I/O; the flusher spills
+
+    log.start(SessionTesting)
+    await log.stop()
+    assert log.stats.spilled == 2 and log.stats.written == 2
+    assert len(spill_file.read_text().splitlines()) == 2
+
+    log.start(SessionTesting)
+    await log.stop()
+    assert log.stats.replayed == 2 and log.stats.written == 4
+    assert not spill_file.exists()
+    assert await count_events("audit_spill") == 4
+
+
+async def test_spill_backlog_is_bounded(tmp_path):
+    log = AuditLog(queue_size=1, batch_size=10, overflow="spill", spill_file=str(tmp_path / "spill.ndjson"))
+    for _ in range(4):
+        log.record(LOGIN_FAILURE, success=False, username="audit_spill_bound")
+    assert len(log) == 1 and log.snapshot()["to_spill"] == 1
+    assert log.stats.dropped == 2
+
+
+async def test_failed_replay_does_not_stop_the_flusher(tmp_path, monkeypatch):
+    spill_file = tmp_path / "spill.ndjson"
+    spill_file.write_text("{}\n")
+    log = AuditLog(batch_size=10, flush_interval_ms=20, overflow="spill", spill_file=str(spill_file))
+
+    def unreadable(path):
+        raise OSError("disk on fire")
+
+    monkeypatch.setattr(audit_log, "_read_spill_file", unreadable)
+    log.start(SessionTesting)
+    log.record(LOGIN_FAILURE, success=False, username="audit_after_replay")
+    await asyncio.sleep(0.1)
+    assert log.stats.written == 1
+    await log.stop()
@@ -0,0 +1,24 @@
+from app.core.http_cache import CachePolicy, etag_matches, make_etag
+
+
+def test_make_etag_is_strong_and_stable():
+    etag = make_etag("user", 1, 3)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("user", 1, 3)
+    assert etag != make_etag("user", 1, 4)
+
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag("user", 1, 3)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_cache_policy_headers():
+    policy = CachePolicy(private=True, no_cache=True, max_age=0, vary=("Authorization",))
+    assert policy.headers == {"Cache-Control": "private, no-cache, max-age=0", "Vary": "Authorization"}
+    assert CachePolicy(public=True, max_age=31536000, immutable=True).header == "public, max-age=31536000, immutable"
+    assert CachePolicy().headers == {}
@@ -0,0 +1,82 @@
+import pytest
+from httpx import AsyncClient
+from jose import JWTError
+
+from app.core.jwt_keys import KeyRing, generate_private_key_pem, jwk_thumbprint
+from app.core.jwt_verifier import JWKSVerifier
+
+
+@pytest.fixture(scope="module")
+def old_pem() -> str:
+    return generate_private_key_pem("ES256")
+
+
+@pytest.fixture(scope="module")
+def new_pem() -> str:
+    return generate_private_key_pem("ES256")
+
+
+def public_pem(private_pem: str) -> str:
+    from cryptography.hazmat.primitives import serialization
+
+    key = serialization.load_pem_private_key(private_pem.encode(), password=None)
+    return key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+
+def test_es256_tokens_carry_kid_and_verify_locally(old_pem: str):
+    ring = KeyRing("ES256", private_key_pem=old_pem)
+    token = ring.encode({"sub": "alice"})
+
+    verifier = JWKSVerifier(jwks=ring.jwks(), algorithms=["ES256"])
+    assert verifier.verify(token)["sub"] == "alice"
+    assert verifier.key_ids == [ring.active_kid]
+    assert ring.active_kid == jwk_thumbprint(ring.jwks()["keys"][0])
+
+
+def test_rotation_keeps_old_tokens_valid(old_pem: str, new_pem: str):
+    old_ring = KeyRing("ES256", private_key_pem=old_pem)
+    old_token = old_ring.encode({"sub": "alice"})
+
+    rotated = KeyRing("ES256", private_key_pem=new_pem, public_key_pems=[public_pem(old_pem)])
+    assert rotated.decode(old_token)["sub"] == "alice"
+    assert len(rotated.jwks()["keys"]) == 2
+
+    without_old = KeyRing("ES256", private_key_pem=new_pem)
+    with pytest.raises(JWTError):
+        without_old.decode(old_token)
+
+
+def test_verifier_refreshes_on_unknown_kid(old_pem: str, new_pem: str):
+    current = {"ring": KeyRing("ES256", private_key_pem=old_pem)}
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return current["ring"].jwks()
+
+    verifier = JWKSVerifier(fetcher=fetch, min_refresh_interval=0)
+    assert verifier.verify(current["ring"].encode({"sub": "a"}))["sub"] == "a"
+    assert len(fetches) == 1
+
+    current["ring"] = KeyRing("ES256", private_key_pem=new_pem)
+    assert verifier.verify(current["ring"].encode({"sub": "b"}))["sub"] == "b"
+    assert len(fetches) == 2
+
+    verifier.verify(current["ring"].encode({"sub": "c"})) # Cached key, no fetch
+    assert len(fetches) == 2
+
+
+def test_verifier_rejects_hmac_tokens():
+    hs_ring = KeyRing("HS256", secret_key="shared")
+    verifier = JWKSVerifier(jwks={"keys": []})
+    with pytest.raises(JWTError):
+        verifier.verify(hs_ring.encode({"sub": "mallory"}))
+
+
+async def test_jwks_endpoint(client: AsyncClient):
+    response = await client.get("/.well-known/jwks.json")
+    assert response.status_code == 200
+    assert "keys" in response.json()
+    assert "max-age" in response.headers["cache-control"]
@@ -0,0 +1,89 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import logging_config
+from app.core.config import settings
+from app.core.logging_config import ContextQueueHandler, JsonFormatter
+from tests.apis.v1.endpoints.test_users import auth_headers
+
+
+@pytest.fixture
+def log_output():
+    """Configure the pipeline into a buffer; restore the previous root logger setup afterwards."""
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level, logging._srcfile
+    buffer = io.StringIO()
+    output = logging.StreamHandler(buffer)
+    output.setFormatter(JsonFormatter())
+    logging_config.configure_logging(output)
+
+    def lines():
+        logging_config.stop_logging() # Drains the queue
+        return [json.loads(line) for line in buffer.getvalue().splitlines()]
+
+    yield lines
+    logging_config.stop_logging()
+    root.handlers, root.level, logging._srcfile = saved
+    logging.getLogger("uvicorn.access").disabled = False
+
+
+async def test_request_logs_carry_request_id_route_and_user(
+    client: AsyncClient, db_session: AsyncSession, log_output
+):
+    headers = await auth_headers(db_session, "logged_reader")
+    response = await client.get(f"{settings.API_V1_STR}/users/999999", headers={**headers, "X-Request-ID": "req-42"})
+    assert response.status_code == 404
+    assert response.headers["x-request-id"] == "req-42"
+
+    [access] = [line for line in log_output() if line["logger"] == "app.access"]
+    assert access["request_id"] == "req-42"
+    assert access["route"] == f"{settings.API_V1_STR}/users/{{user_id}}"
+    assert access["status"] == 404 and access["method"] == "GET"
+    assert isinstance(access["user_id"], int)
+
+
+async def test_malformed_request_id_is_replaced(client: AsyncClient):
+    response = await client.get("/api/health", headers={"X-Request-ID": "bad id\nwith newline"})
+    assert response.headers["x-request-id"] != "bad id\nwith newline"
+    assert len(response.headers["x-request-id"]) == 32
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = ContextQueueHandler(queue.Queue(maxsize=2))
+    logger = logging.getLogger("tests.logging.drop")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        for i in range(5):
+            logger.warning("event %d", i)
+    finally:
+        logger.removeHandler(handler)
+    assert handler.queue.qsize() == 2 and handler.dropped == 3
+    assert handler.queue.get_nowait().getMessage() == "event 0" # Rendered before enqueueing
+
+
+def test_debug_sampling_is_decided_once_per_request():
+    handler = ContextQueueHandler(queue.Queue(), debug_sample_rate=0.5)
+    logger = logging.getLogger("tests.logging.sampling")
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        kept_per_request = []
+        for _ in range(40):
+            token = logging_config._request_context.set({"request_id": "r", "scope": {"path": "/"}})
+            before = handler.queue.qsize()
+            for _ in range(10):
+                logger.debug("detail")
+            logger.info("always kept")
+            kept_per_request.append(handler.queue.qsize() - before)
+            logging_config._request_context.reset(token)
+    finally:
+        logger.removeHandler(handler)
+    assert set(kept_per_request) == {1, 11} # All of a request's debug records, or none
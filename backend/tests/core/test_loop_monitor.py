@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.core.loop_monitor import LoopBlockedError, LoopWatchdog, detect_loop_blocking
+
+
+def _blocking_hash_like_work(seconds: float) -> None:
+    time.sleep(seconds) # Stands in for bcrypt / JWT / heavy validation
+
+
+async def test_stall_is_detected_with_stack():
+    watchdog = LoopWatchdog(threshold_ms=50, interval_ms=10)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.05)
+        _blocking_hash_like_work(0.2)
+        await asyncio.sleep(0.05)
+    finally:
+        watchdog.stop()
+
+    assert watchdog.stats.stalls_total == 1
+    stall = watchdog.stalls[0]
+    assert stall.duration_ms >= 150
+    assert any("_blocking_hash_like_work" in line for line in stall.stack)
+    with pytest.raises(LoopBlockedError):
+        watchdog.assert_no_stalls()
+
+
+async def test_stall_is_attributed_to_route():
+    app = FastAPI()
+
+    @app.get("/slow/{item_id}")
+    async def slow(item_id: int):
+        _blocking_hash_like_work(0.15)
+        return {"id": item_id}
+
+    with detect_loop_blocking(50, fail=False) as watchdog:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/slow/1")
+        await asyncio.sleep(0.02)
+
+    assert response.status_code == 200
+    assert watchdog.stalls[0].route == "/slow/{item_id}"
+    assert watchdog.stalls[0].method == "GET"
+    assert watchdog.stats.stalls_by_route["/slow/{item_id}"] == 1
+
+
+async def test_detect_loop_blocking_fails_on_stall():
+    with pytest.raises(LoopBlockedError), detect_loop_blocking(50):
+        _blocking_hash_like_work(0.15)
+        await asyncio.sleep(0.02)
+
+
+async def test_health_check_does_not_block(client: AsyncClient, no_loop_blocking: LoopWatchdog):
+    response = await client.get("/api/health")
+    assert response.status_code == 200
@@ -0,0 +1,81 @@
+import tracemalloc
+
+import pytest
+
+from app.core import memory_profiler
+from app.core.memory_profiler import (
+    MemoryGrowthError,
+    MemoryProfiler,
+    TracingNotStartedError,
+    cache_sizes,
+    live_model_instances,
+    register_cache,
+    track_memory,
+)
+from app.models.user import User
+
+_retained = []
+
+
+def _leak(count: int) -> None:
+    _retained.extend(bytearray(1024) for _ in range(count)) # The line the diff should point at
+
+
+def test_snapshot_diff_points_at_the_leaking_line():
+    profiler = MemoryProfiler()
+    with pytest.raises(TracingNotStartedError):
+        profiler.snapshot("before")
+    profiler.start()
+    try:
+        profiler.snapshot("before")
+        _leak(500)
+        profiler.snapshot("after")
+        top = profiler.compare("before", "after", limit=5)
+        assert top[0].location.endswith(f"test_memory_profiler.py:{_leak.__code__.co_firstlineno + 1}")
+        assert top[0].size_diff_bytes > 500 * 1024 and top[0].count_diff >= 500
+        by_file = profiler.compare("before", "after", group_by="filename", limit=5)
+        assert by_file[0].location.endswith("test_memory_profiler.py")
+        with pytest.raises(KeyError):
+            profiler.compare("before", "missing")
+    finally:
+        profiler.stop()
+        _retained.clear()
+    assert not tracemalloc.is_tracing() and not profiler.snapshots
+
+
+def test_sampler_reports_top_growers():
+    profiler = MemoryProfiler(sample_top=3)
+    profiler.start()
+    try:
+        assert profiler.sample() == [] # First sample is the baseline
+        _leak(200)
+        growers = profiler.sample()
+        assert len(growers) <= 3 and growers[0].location.endswith(f":{_leak.__code__.co_firstlineno + 1}")
+    finally:
+        profiler.stop()
+        _retained.clear()
+
+
+def test_track_memory_fails_on_growth():
+    with track_memory() as growth:
+        scratch = [bytearray(1024) for _ in range(100)]
+        del scratch # Freed again: not growth
+    growth.assert_growth_below(64 * 1024)
+
+    with track_memory() as growth:
+        _leak(300)
+    _retained.clear()
+    with pytest.raises(MemoryGrowthError, match="test_memory_profiler.py"):
+        growth.assert_growth_below(64 * 1024)
+    assert not tracemalloc.is_tracing()
+
+
+def test_live_instances_and_cache_sizes(monkeypatch):
+    monkeypatch.setattr(memory_profiler, "_caches", dict(memory_profiler._caches))
+    users = [User(username=f"mem{i}", email=f"mem{i}@example.com") for i in range(3)]
+    assert live_model_instances()["User"] >= 3
+    register_cache("test_users", users)
+    register_cache("test_callable", lambda: 7)
+    sizes = cache_sizes()
+    assert sizes["test_users"] == 3 and sizes["test_callable"] == 7
+    assert "principal_cache" in sizes
@@ -0,0 +1,53 @@
+from fastapi import Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import security
+from app.core.deps import get_db_session, require_permissions
+from app.core.permissions import decode_bits, encode_bits, permission_registry
+from app.crud import role as crud_role
+from app.models.user import User
+
+
+def test_bits_round_trip():
+    assert decode_bits(encode_bits(0b1011)) == 0b1011
+    assert decode_bits(encode_bits(-1)) == -1
+
+
+async def test_require_permissions_uses_token_claim(db_session: AsyncSession):
+    await crud_role.get_or_create_permission(db_session, "widgets:read")
+    await crud_role.get_or_create_permission(db_session, "widgets:write")
+    await db_session.commit()
+    await permission_registry.load(db_session)
+    read_bit = 1 << permission_registry.bits["widgets:read"]
+
+    app = FastAPI()
+
+    @app.get("/widgets", dependencies=[Depends(require_permissions("widgets:read"))])
+    async def list_widgets():
+        return []
+
+    @app.post("/widgets", dependencies=[Depends(require_permissions("widgets:read", "widgets:write"))])
+    async def create_widget():
+        return {}
+
+    async def override_db():
+        yield db_session
+    app.dependency_overrides[get_db_session] = override_db
+
+    # The claim alone authorizes: "widget_reader" holds no role or permission in the database
+    db_session.add_all([
+        User(username="widget_reader", email="widget_reader@example.com", hashed_password="x"),
+        User(username="widget_leaver", email="widget_leaver@example.com", hashed_password="x", is_active=False),
+    ])
+    await db_session.commit()
+    headers = {"Authorization": f"Bearer {security.create_access_token('widget_reader', permission_bits=read_bit)}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        assert (await ac.get("/widgets", headers=headers)).status_code == 200
+        assert (await ac.post("/widgets", headers=headers)).status_code == 403
+        assert (await ac.get("/widgets")).status_code == 401
+        # Deactivated users are refused, whatever their token claims
+        token = security.create_access_token("widget_leaver", permission_bits=read_bit)
+        assert (await ac.get("/widgets", headers={"Authorization": f"Bearer {token}"})).status_code == 400
+        token = security.create_access_token("nobody", permission_bits=read_bit)
+        assert (await ac.get("/widgets", headers={"Authorization": f"Bearer {token}"})).status_code == 401
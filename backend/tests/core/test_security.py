@@ -0,0 +1,41 @@
+import pytest
+
+from app.core import security
+
+
+def test_verify_and_update_flags_lower_cost(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security, "pwd_context", security.build_pwd_context(["bcrypt"], bcrypt_rounds=4))
+    old_hash = security.get_password_hash("s3cret-pass")
+
+    monkeypatch.setattr(security, "pwd_context", security.build_pwd_context(["bcrypt"], bcrypt_rounds=5))
+    verified, new_hash = security.verify_and_update_password("s3cret-pass", old_hash)
+    assert verified
+    assert new_hash is not None and new_hash.startswith("$2b$05$")
+
+    # Already at the configured cost: nothing to migrate
+    assert security.verify_and_update_password("s3cret-pass", new_hash) == (True, None)
+    assert security.verify_and_update_password("wrong", new_hash) == (False, None)
+
+
+def test_calibrate_hash_cost_respects_bounds():
+    cost = security.calibrate_hash_cost("bcrypt", target_ms=1, min_cost=4, max_cost=6)
+    assert cost == 4 # 1 ms is below what any cost can do, so the floor wins
+
+    cost = security.calibrate_hash_cost("bcrypt", target_ms=10_000, min_cost=4, max_cost=6)
+    assert cost == 6
+
+
+def test_calibrate_rejects_unknown_scheme():
+    with pytest.raises(ValueError):
+        security.calibrate_hash_cost("md5_crypt", target_ms=100)
+
+
+def test_configure_calibrates_only_the_default_scheme(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security, "pwd_context", security.pwd_context) # Restored afterwards
+    monkeypatch.setattr(security.settings, "PASSWORD_HASH_SCHEMES", ["argon2", "bcrypt"])
+    monkeypatch.setattr(security, "calibrate_hash_cost", lambda scheme, target_ms: 3)
+
+    options = security.configure_password_hashing(target_ms=50).to_dict()
+
+    assert options["argon2__rounds"] == 3
+    assert options["bcrypt__rounds"] == security.settings.BCRYPT_ROUNDS
@@ -0,0 +1,48 @@
+import os
+
+from app.core.sendfile import ZEROCOPY_EXTENSION, SendfileResponse
+
+
+async def serve(response: SendfileResponse, headers=(), extensions=None):
+    scope = {"type": "http", "method": "GET", "headers": [(k.encode(), v.encode()) for k, v in headers],
+             "extensions": extensions or {}}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION: # The server reads the descriptor before send returns
+            os.lseek(message["file"], message["offset"], os.SEEK_SET)
+            message = {**message, "data": os.read(message["file"], message["count"])}
+        messages.append(message)
+
+    await response(scope, receive, send)
+    return messages
+
+
+async def test_zero_copy_send_when_the_server_offers_it(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    extensions = {ZEROCOPY_EXTENSION: {}}
+
+    start, body = await serve(SendfileResponse(str(path)), extensions=extensions)
+    assert start["status"] == 200 and body["type"] == ZEROCOPY_EXTENSION
+    assert (body["offset"], body["count"]) == (0, 1024)
+
+    start, body = await serve(SendfileResponse(str(path)), headers=[("range", "bytes=10-19")], extensions=extensions)
+    headers = dict(start["headers"])
+    assert start["status"] == 206 and headers[b"content-range"] == b"bytes 10-19/1024"
+    assert body["data"] == path.read_bytes()[10:20]
+
+    start, *chunks = await serve(SendfileResponse(str(path))) # Without the extension: chunked reads
+    assert b"".join(chunk["body"] for chunk in chunks) == path.read_bytes()
+
+
+async def test_accel_redirect_leaves_the_body_to_nginx(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"x" * 100)
+    start, body = await serve(SendfileResponse(str(path), accel_path="/_files/file.bin"))
+    headers = dict(start["headers"])
+    assert headers[b"x-accel-redirect"] == b"/_files/file.bin" and b"content-length" not in headers
+    assert body["body"] == b""
@@ -0,0 +1,216 @@
+from collections import Counter
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+
+from app.apis.v1.endpoints import auth as auth_endpoints
+from app.apis.v1.endpoints import users as users_endpoints
+from app.core import deps
+from app.core.permissions import PermissionRegistry
+from app.core.resharding import copy_catalog, reshard
+from app.core.sharding import SHARD_ID_RANGE, HashRing, ShardSet
+from app.crud import role as crud_role
+from app.crud import user as crud_user
+from app.crud.dataloader import user_loader
+from app.crud.user_search import decode_cursor, search_users_sharded
+from app.main import app
+from app.models.base import Base
+from app.models.refresh_token import RefreshToken
+from app.models.role import Permission, Role, user_roles
+from app.models.user import User
+from app.schemas.user import UserCreate
+
+USERNAMES = [f"user{i:03d}" for i in range(60)]
+
+
+def shard_urls(tmp_path, names):
+    return {name: f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in names}
+
+
+async def open_shards(tmp_path, names, **kwargs) -> ShardSet:
+    shards = ShardSet(shard_urls(tmp_path, names), **kwargs)
+    for engine in shards.engines.values():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    return shards
+
+
+@pytest.fixture
+async def shards(tmp_path):
+    shards = await open_shards(tmp_path, ["a", "b", "c"])
+    yield shards
+    await shards.dispose()
+
+
+async def add_users(shards: ShardSet, usernames):
+    for username in usernames:
+        async with shards.session(shards.shard_for(username)) as db:
+            await crud_user.create_user(db, UserCreate(
+                username=username, email=f"{username}@example.com", password="password123",
+            ))
+
+
+async def users_per_shard(shards: ShardSet):
+    async def usernames(db):
+        return set((await db.execute(select(User.username))).scalars())
+    return await shards.scatter_gather(usernames)
+
+
+def test_hash_ring_is_balanced_and_moves_few_keys_when_a_shard_is_added():
+    keys = [f"user{i}" for i in range(20000)]
+    ring = HashRing(["a", "b", "c"])
+    assert ring.shard_for("alice") == HashRing(["a", "b", "c"]).shard_for("alice") # Deterministic
+    counts = Counter(ring.shard_for(key) for key in keys)
+    assert all(5000 < count < 8500 for count in counts.values()), counts
+
+    grown = HashRing(["a", "b", "c", "d"])
+    moved = [key for key in keys if ring.shard_for(key) != grown.shard_for(key)]
+    assert 0.15 < len(moved) / len(keys) < 0.35 # About 1/4, and only ever to the new shard
+    assert {grown.shard_for(key) for key in moved} == {"d"}
+
+
+async def test_new_users_get_ids_from_their_shards_block(shards, fast_password_hashing):
+    ids = {}
+    for shard in ("a", "c", "c"):
+        async with shards.session(shard) as db:
+            user = await crud_user.create_user(db, UserCreate(
+                username=f"{shard}{len(ids)}", email=f"{shard}{len(ids)}@example.com", password="password123",
+            ))
+            ids[user.username] = user.id
+    assert list(ids.values()) == [1, 2 * SHARD_ID_RANGE + 1, 2 * SHARD_ID_RANGE + 2]
+
+
+async def test_registrations_that_race_for_an_id_retry(shards, monkeypatch, fast_password_hashing):
+    async with shards.session("c") as db:
+        taken = (await crud_user.create_user(db, UserCreate(
+            username="c0", email="c0@example.com", password="password123",
+        ))).id
+    next_id_in_block = crud_user._next_id_in_block
+    calls = []
+
+    def stale_next_id(id_base):
+        calls.append(id_base) # The first attempt picks the id another registration just took
+        return taken if len(calls) == 1 else next_id_in_block(id_base)
+
+    monkeypatch.setattr(crud_user, "_next_id_in_block", stale_next_id)
+    async with shards.session("c") as db:
+        user = await crud_user.create_user(db, UserCreate(username="c1", email="c1@example.com", password="password123"))
+    assert user.id == taken + 1 and len(calls) == 2
+
+
+async def test_permission_bits_come_from_the_primary_shard(shards):
+    for shard, names in (("b", ["users:read", "users:write"]), ("c", ["users:write", "audit:read"]), ("a", ["audit:read"])):
+        async with shards.session(shard) as db:
+            await crud_role.grant_permissions_to_role(db, "staff", names)
+
+    async def catalogue(db):
+        return dict((await db.execute(select(Permission.name, Permission.bit))).all())
+    catalogues = await shards.scatter_gather(catalogue)
+    assert catalogues["a"] == {"users:read": 0, "users:write": 1, "audit:read": 2}
+    assert all(bits.items() <= catalogues["a"].items() for bits in catalogues.values())
+
+    registry = PermissionRegistry()
+    async with shards.session("b") as db: # Lacks audit:read, which the registry still knows
+        await registry.load(db)
+    assert registry.bits == catalogues["a"]
+
+
+async def test_loader_and_search_gather_from_every_shard(shards, fast_password_hashing):
+    await add_users(shards, USERNAMES)
+    placed = await users_per_shard(shards)
+    assert all(placed.values()) # Every shard got some users
+
+    async def ids(db):
+        return list((await db.execute(select(User.id))).scalars())
+    all_ids = [user_id for shard_ids in (await shards.scatter_gather(ids)).values() for user_id in shard_ids]
+    assert len(set(all_ids)) == len(USERNAMES) # Unique across shards
+    async with shards.session("a") as db:
+        users = await user_loader(db, shards=shards).load_many(all_ids)
+    assert sorted(user.username for user in users) == USERNAMES
+
+    page = await search_users_sharded(shards, "user0", limit=7)
+    assert [user.username for user in page.users] == USERNAMES[:7] # Merged in username order
+    assert decode_cursor(page.next_cursor) == (0, "user006")
+    page = await search_users_sharded(shards, "user0", limit=7, cursor=page.next_cursor)
+    assert [user.username for user in page.users] == USERNAMES[7:14]
+
+
+async def test_reshard_moves_users_with_their_tokens_and_roles(tmp_path, fast_password_hashing):
+    old = await open_shards(tmp_path, ["a", "b"])
+    await add_users(old, USERNAMES)
+    async with old.session("a") as db:
+        await crud_role.get_or_create_role(db, "editor")
+        await db.commit()
+    assert await copy_catalog(old) == ["b"]
+    for username in USERNAMES[:10]:
+        async with old.session(old.shard_for(username)) as db:
+            user = await crud_user.get_user_by_username(db, username)
+            await crud_role.set_user_roles(db, user, ["editor"])
+            db.add(RefreshToken(jti=f"jti-{username}", family_id="fam", user_id=user.id,
+                                issued_at=func.now(), expires_at=func.now()))
+            await db.commit()
+    await old.dispose()
+
+    shards = await open_shards(tmp_path, ["a", "b", "c"], previous_ring=["a", "b"])
+    try:
+        await copy_catalog(shards)
+        stranded = [username for username in USERNAMES if shards.shard_for(username) == "c"]
+        # Not moved yet: found through the previous ring
+        assert {await shards.locate(username) for username in stranded} <= {"a", "b"}
+
+        plan = await reshard(shards, dry_run=True, batch_size=7)
+        assert plan.scanned == len(USERNAMES) and plan.total_moved == len(stranded)
+        report = await reshard(shards, batch_size=7)
+        assert report.total_moved == len(stranded)
+        assert {target for _, target in report.moved} == {"c"}
+
+        placed = await users_per_shard(shards)
+        for shard, usernames in placed.items():
+            assert all(shards.shard_for(username) == shard for username in usernames)
+        assert sorted(u for usernames in placed.values() for u in usernames) == USERNAMES
+        assert {await shards.locate(username) for username in stranded} == {"c"}
+
+        async with shards.session("c") as db:
+            moved_with_role = (await db.execute(
+                select(User.username).join(user_roles, user_roles.c.user_id == User.id)
+                .join(Role, Role.id == user_roles.c.role_id).where(Role.name == "editor")
+            )).scalars().all()
+            tokens = (await db.execute(select(RefreshToken.jti))).scalars().all()
+        expected = sorted(set(stranded) & set(USERNAMES[:10]))
+        assert sorted(moved_with_role) == expected
+        assert sorted(tokens) == [f"jti-{username}" for username in expected]
+
+        assert (await reshard(shards)).total_moved == 0 # Idempotent
+    finally:
+        await shards.dispose()
+
+
+async def test_requests_use_the_session_of_the_users_shard(shards, monkeypatch, fast_password_hashing):
+    for module in (deps, auth_endpoints, users_endpoints):
+        monkeypatch.setattr(module, "shard_set", shards)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        for username in ("alice", "bob", "carol"):
+            response = await client.post("/api/v1/auth/register", json={
+                "username": username, "email": f"{username}@example.com", "password": "password123",
+            })
+            assert response.status_code == 200, response.text
+        duplicate = await client.post("/api/v1/auth/register", json={
+            "username": "alice2", "email": "bob@example.com", "password": "password123",
+        })
+        assert duplicate.status_code == 400 # Email taken on another shard
+
+        login = await client.post("/api/v1/auth/login", json={"username": "carol@example.com", "password": "password123"})
+        assert login.status_code == 200, login.text
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        me = await client.get("/api/v1/auth/me", headers=headers)
+        assert me.json()["username"] == "carol"
+        refreshed = await client.post("/api/v1/auth/refresh", json={"refresh_token": login.json()["refresh_token"]})
+        assert refreshed.status_code == 200, refreshed.text
+
+        found = await client.get("/api/v1/users/search", params={"q": "example.com"}, headers=headers)
+        assert sorted(user["username"] for user in found.json()["users"]) == ["alice", "bob", "carol"]
+
+    placed = await users_per_shard(shards)
+    for username in ("alice", "bob", "carol"):
+        assert username in placed[shards.shard_for(username)]
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.token_revocation import BloomFilter, DatabaseRevocationRecord, RevocationStore
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    members = [f"family-{i}" for i in range(10_000)]
+    for member in members:
+        bloom.add(member)
+
+    assert all(member in bloom for member in members)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300 # ~1% expected
+
+
+async def test_store_checks_record_only_on_bloom_hit(db_session: AsyncSession):
+    store = RevocationStore(DatabaseRevocationRecord(), capacity=1000, error_rate=0.001)
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    assert not await store.is_revoked(db_session, "fam-live")
+    assert store.bloom_hits == 0
+
+    await store.revoke(db_session, "fam-dead", expires, reason="test")
+    assert await store.is_revoked(db_session, "fam-dead")
+    assert store.bloom_hits == 1
+
+
+async def test_sync_rebuilds_filter_from_record(db_session: AsyncSession):
+    record = DatabaseRevocationRecord()
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    await RevocationStore(record).revoke(db_session, "fam-from-other-worker", expires, reason="test")
+
+    fresh = RevocationStore(record, capacity=1000)
+    assert "fam-from-other-worker" not in fresh.bloom
+    await fresh.sync(db_session)
+    assert await fresh.is_revoked(db_session, "fam-from-other-worker")
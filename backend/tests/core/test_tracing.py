@@ -0,0 +1,100 @@
+import json
+
+import httpx
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import tracing
+from app.core.config import settings
+from app.core.tracing import OtlpFileExporter, TracedTransport, Tracer, parse_traceparent, tracer
+from tests.apis.v1.endpoints.test_auth import create_user
+from tests.conftest import engine_test
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+    assert parse_traceparent(f"ff-{TRACE_ID}-{PARENT_ID}-01") is None
+    assert parse_traceparent("garbage") is None
+
+
+async def test_sampled_login_is_traced_across_layers(
+    client: AsyncClient, db_session: AsyncSession, fast_password_hashing: None
+):
+    tracing.instrument_engine(engine_test.sync_engine)
+    await create_user(db_session, "traced_user", "password123")
+    response = await client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        json={"username": "traced_user", "password": "password123"},
+        headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+    )
+    assert response.status_code == 200
+
+    trace = tracer.get(TRACE_ID)
+    assert trace is not None
+    root = trace.root
+    assert root.parent_id == PARENT_ID # Continues the caller's trace
+    assert response.headers["traceparent"] == root.traceparent
+    assert root.name == f"POST {settings.API_V1_STR}/auth/login"
+    assert root.attributes["http.response.status_code"] == 200
+
+    spans = {span.name: span for span in trace.spans}
+    endpoint = spans["endpoint login_for_access_token"]
+    lookup = spans["crud.user.get_user_by_username"]
+    assert lookup.parent_id == endpoint.span_id
+    assert spans["core.security.verify_and_update_password"].parent_id == endpoint.span_id
+    assert spans["serialize_response"].parent_id == root.span_id
+    queries = [span for span in trace.spans if span.parent_id == lookup.span_id]
+    assert [span.name for span in queries] == ["db SELECT"]
+    assert "FROM users" in queries[0].attributes["db.statement"]
+    assert all(span.end_ns >= span.start_ns for span in trace.spans)
+
+
+async def test_unsampled_request_records_nothing(client: AsyncClient):
+    sampled, traces = tracer.sampled, len(tracer.traces)
+    response = await client.get("/api/health", headers={"traceparent": f"00-{'1' * 32}-{PARENT_ID}-00"})
+    assert tracer.sampled == sampled and len(tracer.traces) == traces
+    assert "traceparent" not in response.headers
+    assert tracing.start_span("outside") is tracing.NOOP_SPAN
+
+
+async def test_traces_are_exported_as_otlp_json(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    local = Tracer(sample_rate=1.0, exporter=OtlpFileExporter(str(path), "backend"))
+    local.start()
+    with local.start_trace("GET /things") as root:
+        with tracing.start_span("child", attributes={"rows": 3}):
+            pass
+    local.stop()
+
+    [line] = path.read_text().splitlines()
+    [resource_spans] = json.loads(line)["resourceSpans"]
+    assert resource_spans["resource"]["attributes"][0]["value"] == {"stringValue": "backend"}
+    spans = resource_spans["scopeSpans"][0]["spans"]
+    child = next(span for span in spans if span["name"] == "child")
+    assert child["traceId"] == root.trace.trace_id and child["parentSpanId"] == root.span_id
+    assert child["attributes"] == [{"key": "rows", "value": {"intValue": "3"}}]
+
+
+async def test_outbound_calls_carry_the_trace():
+    received = []
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        received.append(request.headers.get("traceparent"))
+        return httpx.Response(204)
+
+    local = Tracer(sample_rate=1.0)
+    async with httpx.AsyncClient(transport=TracedTransport(httpx.MockTransport(upstream))) as client:
+        await client.get("https://llm.example.com/v1/models") # Outside a trace: passed through as is
+        with local.start_trace("POST /chat") as root:
+            await client.post("https://llm.example.com/v1/chat")
+
+    call = next(span for span in root.trace.spans if span.name == "HTTP POST")
+    assert received == [None, f"00-{root.trace.trace_id}-{call.span_id}-01"]
+    assert call.parent_id == root.span_id and call.kind == tracing.KIND_CLIENT
+    assert call.attributes["server.address"] == "llm.example.com"
+    assert call.attributes["http.response.status_code"] == 204
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import user_events as user_events_module
+from app.core.sse import EventSourceResponse
+from app.core.user_events import DELETED, REDIS_CHANNEL, UPDATED, SlowConsumer, TooManyConnections, UserEvent, UserEventBroker
+from app.models.user import User
+
+
+async def test_events_fan_out_to_every_connection_of_the_user():
+    broker = UserEventBroker(queue_size=4, max_connections=3)
+    tabs = [broker.subscribe(1), broker.subscribe(1)]
+    other = broker.subscribe(2)
+    with pytest.raises(TooManyConnections):
+        broker.subscribe(3)
+
+    broker.publish(UserEvent(UPDATED, 1, 2, ("nickname",)))
+    assert [await tab.next(1) for tab in tabs] == [UserEvent(UPDATED, 1, 2, ("nickname",))] * 2
+    assert await other.next(0.01) is None # Nothing for user 2: a heartbeat is due
+
+    for tab in tabs:
+        tab.close()
+    assert broker.snapshot()["connections"] == 1 and broker.snapshot()["users"] == 1
+
+
+async def test_slow_consumers_are_evicted():
+    broker = UserEventBroker(queue_size=2)
+    slow, fast = broker.subscribe(1), broker.subscribe(1)
+    for version in range(2, 5):
+        broker.dispatch(UserEvent(UPDATED, 1, version))
+        if version < 4:
+            await fast.next(1)
+    assert (await fast.next(1)).version == 4
+    with pytest.raises(SlowConsumer):
+        await slow.next(1)
+    assert broker.stats.evicted == 1 and broker.connections == 1
+
+
+async def test_committed_user_changes_are_published(db_session: AsyncSession, monkeypatch):
+    broker = UserEventBroker()
+    monkeypatch.setattr(user_events_module, "user_events", broker)
+    user = User(username="pushed_user", email="pushed_user@example.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.commit()
+    subscription = broker.subscribe(user.id)
+
+    user.nickname = "Rolled back"
+    await db_session.flush()
+    await db_session.rollback()
+    user.nickname = "Pushed"
+    await db_session.commit()
+    event = await subscription.next(1)
+    assert (event.type, event.version, event.fields) == (UPDATED, user.version, ("nickname",))
+    assert await subscription.next(0.01) is None # Nothing from the rolled-back flush
+
+    await db_session.delete(user)
+    await db_session.commit()
+    assert (await subscription.next(1)).type == DELETED
+
+
+async def test_event_stream_drops_clients_that_stop_reading():
+    async def events():
+        while True:
+            yield "data: x\n\n"
+
+    async def receive():
+        await asyncio.sleep(10)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) > 3: # The client's socket buffer is full
+            await asyncio.sleep(10)
+
+    response = EventSourceResponse(events(), send_timeout=0.05)
+    await asyncio.wait_for(response({"type": "http"}, receive, send), 2)
+    assert response.timed_out and len(sent) == 4
+
+
+async def test_malformed_messages_do_not_end_the_redis_subscription(fake_redis):
+    broker = UserEventBroker(use_redis=True)
+    subscription = broker.subscribe(7)
+    broker.start()
+    try:
+        while (await fake_redis.pubsub_numsub(REDIS_CHANNEL))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        for payload in ("not json", '{"type": "user.updated"}', '{"type": "x", "user_id": null}'):
+            await fake_redis.publish(REDIS_CHANNEL, payload)
+        broker.publish(UserEvent(UPDATED, 7, 3, ("nickname",))) # Through Redis, after the bad ones
+        assert await subscription.next(1) == UserEvent(UPDATED, 7, 3, ("nickname",))
+    finally:
+        await broker.stop()
+    assert broker.stats.malformed == 3 and broker.stats.redis_errors == 0
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import List
+
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.crud.cache import INVALIDATION_CHANNEL, CacheStats, InvalidationListener, ModelCache
+from app.models.role import Role
+from app.models.user import User
+
+
+class RoleIn(BaseModel):
+    name: str
+    description: str | None = None
+
+
+crud_role = CRUDBase[Role, RoleIn, RoleIn](Role, cache_ttl_seconds=60)
+
+
+async def test_reads_are_cached_until_a_write(db_session: AsyncSession):
+    crud_role.cache.stats = CacheStats()
+    role = await crud_role.create(db_session, obj_in=RoleIn(name="cached-role", description="before"))
+    assert (await crud_role.get(db_session, role.id)).description == "before"
+    assert (await crud_role.get(db_session, -1)) is None
+
+    statements: List[str] = []
+    sync_engine = db_session.bind.sync_engine
+    listener = lambda *args: statements.append(args[2]) # noqa: E731
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        cached = await crud_role.get(db_session, role.id)
+        assert await crud_role.get(db_session, -1) is None # Absent ids are cached too
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+    assert cached is role and statements == [] # The session's own instance, no query
+    assert crud_role.cache.stats.local_hits == 2 and crud_role.cache.stats.misses == 2
+
+    await crud_role.update(db_session, db_obj=role, obj_in={"description": "after"})
+    db_session.expunge_all()
+    fresh = await crud_role.get(db_session, role.id)
+    assert fresh.description == "after" and crud_role.cache.stats.misses == 3
+
+    # Cached rows come back as persistent instances that can be written through
+    db_session.expunge_all()
+    hit = await crud_role.get(db_session, role.id)
+    assert crud_role.cache.stats.local_hits == 3
+    await crud_role.update(db_session, db_obj=hit, obj_in={"description": "again"})
+    assert (await crud_role.remove(db_session, id=role.id)).description == "again"
+    assert await crud_role.get(db_session, role.id) is None
+    assert crud_role.cache.stats.invalidations == 4
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = ModelCache(Role, ttl_seconds=60)
+    loads = 0
+
+    async def slow_load() -> Role:
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.05)
+        return Role(id=1, name="hot")
+
+    results = await asyncio.gather(*(cache.fetch("id", (1,), slow_load) for _ in range(20)))
+    assert loads == 1 and all(result["name"] == "hot" for result in results)
+    assert cache.stats.coalesced == 19 and cache.stats.hit_rate == 0.95
+
+    # A write landing during a load keeps the loaded rows out of the cache
+    load = asyncio.ensure_future(cache.fetch("id", (2,), slow_load))
+    await asyncio.sleep(0.01)
+    await cache.invalidate()
+    assert (await load)["name"] == "hot" and len(cache) == 0
+
+
+async def test_cached_values_round_trip_column_types(db_session: AsyncSession):
+    seen = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    user = User(id=987654, username="cache_types", email="cache_types@example.com", hashed_password="x",
+                roles=["editor"], last_seen_at=seen, version=3)
+    cache = ModelCache(User)
+    values = await cache.fetch("id", (user.id,), lambda: asyncio.sleep(0, user))
+    attached = await cache.attach(db_session, values)
+    assert attached.last_seen_at == seen and attached.roles == ["editor"] and attached.version == 3
+    assert attached in db_session and not db_session.dirty
+
+
+def loader(role: Role):
+    calls = []
+
+    async def load() -> Role:
+        calls.append(role.id)
+        return role
+    return load, calls
+
+
+async def test_workers_share_the_redis_tier_and_poll_its_generation(fake_redis):
+    worker_a = ModelCache(Role, ttl_seconds=60, local_ttl_seconds=0.05, use_redis=True)
+    worker_b = ModelCache(Role, ttl_seconds=60, local_ttl_seconds=0.05, use_redis=True)
+    load, calls = loader(Role(id=7, name="shared"))
+
+    assert (await worker_a.fetch("id", (7,), load))["name"] == "shared"
+    assert (await worker_b.fetch("id", (7,), load))["name"] == "shared"
+    assert calls == [7] # Loaded once, by whichever worker missed first
+    assert worker_a.stats.misses == 1 and worker_b.stats.redis_hits == 1
+    assert await fake_redis.ttl(worker_a.key(0, "id", 7)) == 60
+
+    await worker_a.invalidate()
+    assert await fake_redis.get(worker_a.generation_key) == "1"
+    await worker_b.fetch("id", (7,), load) # Within its local TTL: not re-read yet
+    assert worker_b.stats.local_hits == 1 and calls == [7]
+    await asyncio.sleep(0.06)
+    await worker_b.fetch("id", (7,), load) # Re-reads the generation: the old entries are never read again
+    assert worker_b.snapshot()["generation"] == 1 and calls == [7, 7]
+
+
+async def test_published_generations_drop_other_workers_near_caches(fake_redis):
+    writer = ModelCache(Role, ttl_seconds=60, use_redis=True)
+    reader = ModelCache(Role, ttl_seconds=60, local_ttl_seconds=60, use_redis=True)
+    listener = InvalidationListener({reader.namespace: reader})
+    load, calls = loader(Role(id=8, name="listened"))
+    await reader.fetch("id", (8,), load)
+    assert len(reader) == 1
+
+    listener.start()
+    try:
+        while (await fake_redis.pubsub_numsub(INVALIDATION_CHANNEL))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        await writer.invalidate()
+        for _ in range(100):
+            if len(reader) == 0:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await listener.stop()
+    assert len(reader) == 0 and reader.snapshot()["generation"] == 1
+    await reader.fetch("id", (8,), load)
+    assert calls == [8, 8]
+
+    listener.handle("roles not-a-number") # Malformed and unknown messages are ignored
+    listener.handle("other_table 5")
+    assert reader.snapshot()["generation"] == 1
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.dataloader import DataLoader, user_loader
+from app.models.user import User
+
+
+def recording_loader(**kwargs) -> "tuple[DataLoader[int, str], List[List[int]]]":
+    calls: List[List[int]] = []
+
+    async def batch(keys: List[int]) -> Dict[int, str]:
+        calls.append(keys)
+        return {key: f"value-{key}" for key in keys if key >= 0}
+
+    return DataLoader(batch, **kwargs), calls
+
+
+async def test_loads_in_the_same_tick_share_one_batch():
+    loader, calls = recording_loader()
+    results = await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(-1))
+    assert results == ["value-1", "value-2", "value-1", None]
+    assert calls == [[1, 2, -1]]
+
+    # Memoised for the loader's lifetime
+    assert await loader.load(2) == "value-2"
+    assert len(calls) == 1
+
+
+async def test_max_batch_size_splits_batches():
+    loader, calls = recording_loader(max_batch_size=2)
+    assert await loader.load_many([1, 2, 3]) == ["value-1", "value-2", "value-3"]
+    assert calls == [[1, 2], [3]]
+
+
+async def test_batch_errors_propagate_and_are_not_cached():
+    attempts = []
+
+    async def flaky(keys: List[int]) -> Dict[int, int]:
+        attempts.append(keys)
+        if len(attempts) == 1:
+            raise RuntimeError("database went away")
+        return {key: key for key in keys}
+
+    loader: DataLoader[int, int] = DataLoader(flaky)
+    with pytest.raises(RuntimeError):
+        await loader.load(7)
+    assert await loader.load(7) == 7
+
+
+async def test_user_loader_resolves_ids_with_one_query(db_session: AsyncSession):
+    users = [User(username=f"loader_{i}", email=f"loader_{i}@example.com", hashed_password="x") for i in range(5)]
+    db_session.add_all(users)
+    await db_session.flush()
+
+    statements = []
+    sync_engine = db_session.bind.sync_engine
+    listener = lambda *args: statements.append(args[2]) # noqa: E731
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        loader = user_loader(db_session)
+        loaded = await asyncio.gather(*(loader.load(user.id) for user in users))
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+
+    assert [user.username for user in loaded] == [f"loader_{i}" for i in range(5)]
+    assert len(statements) == 1 and " IN " in statements[0]
@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.permissions import SUPERUSER_BITS, has_permissions, permission_registry
+from app.crud import role as crud_role
+from app.models.user import User
+
+
+async def make_user(db: AsyncSession, username: str, **fields) -> User:
+    user = User(username=username, email=f"{username}@example.com", hashed_password="x", **fields)
+    db.add(user)
+    await db.commit()
+    return user
+
+
+async def test_compile_permission_bits_from_roles_and_direct_grants(db_session: AsyncSession):
+    await crud_role.grant_permissions_to_role(db_session, "bits-editor", ["articles:read", "articles:write"])
+    user = await make_user(db_session, "bits_user")
+    await crud_role.set_user_roles(db_session, user, ["bits-editor"])
+    await crud_role.set_user_permissions(db_session, user, ["reports:read"])
+    await crud_role.grant_permissions_to_role(db_session, "bits-admin", ["articles:delete"])
+
+    bits = await crud_role.compile_permission_bits(db_session, user)
+    await permission_registry.load(db_session)
+    assert has_permissions(bits, permission_registry.mask_for(["articles:read", "reports:read"]))
+    assert not has_permissions(bits, permission_registry.mask_for(["articles:read", "articles:delete"]))
+    assert user.roles == ["bits-editor"] # Denormalised copy kept in sync
+
+
+async def test_superuser_has_every_bit(db_session: AsyncSession):
+    user = await make_user(db_session, "bits_root", is_superuser=True)
+    assert await crud_role.compile_permission_bits(db_session, user) == SUPERUSER_BITS
+    assert has_permissions(SUPERUSER_BITS, 1 << 200)
+
+
+async def test_get_users_by_role_pages_by_id(db_session: AsyncSession):
+    users = [await make_user(db_session, f"role_member_{i}") for i in range(5)]
+    for user in users:
+        await crud_role.set_user_roles(db_session, user, ["bits-member"])
+    await make_user(db_session, "role_outsider")
+
+    first_page = await crud_role.get_users_by_role(db_session, "bits-member", limit=3)
+    second_page = await crud_role.get_users_by_role(db_session, "bits-member", after_id=first_page[-1].id, limit=3)
+    assert [u.username for u in first_page + second_page] == [u.username for u in users]
+
+
+async def test_permission_retries_a_bit_taken_concurrently(db_session: AsyncSession, monkeypatch: pytest.MonkeyPatch):
+    taken = await crud_role.get_or_create_permission(db_session, "race:first")
+    next_free_bit = crud_role._next_free_bit
+    stale = [taken.bit] # What a concurrent create would have read before the first insert
+
+    async def racing_next_free_bit(db):
+        return stale.pop() if stale else await next_free_bit(db)
+
+    monkeypatch.setattr(crud_role, "_next_free_bit", racing_next_free_bit)
+    permission = await crud_role.get_or_create_permission(db_session, "race:second")
+
+    assert permission.bit == taken.bit + 1
+    assert (await crud_role.get_or_create_permission(db_session, "race:first")).bit == taken.bit
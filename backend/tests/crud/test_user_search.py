@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.user_search import decode_cursor, search_users
+from app.models.user import User
+
+
+@pytest.fixture
+async def people(db_session: AsyncSession):
+    rows = [
+        ("zorro", "zorro@mask.example", "Fox"),
+        ("zoe.kim", "zoe.kim@example.com", None),
+        ("kim.zorn", "zorn@example.com", "Zorn"),
+        ("mike", "zo.mike@example.com", None),
+        ("amazon_fan", "shopper@example.com", "Prime"),
+        ("bystander", "by@example.com", "Nobody"),
+    ]
+    users = [User(username=u, email=e, nickname=n, hashed_password="x") for u, e, n in rows]
+    db_session.add_all(users)
+    await db_session.flush()
+    return {user.username: user for user in users}
+
+
+async def test_prefix_matches_rank_before_substring_matches(db_session: AsyncSession, people):
+    page = await search_users(db_session, "zo", limit=10)
+    # Username prefixes (alphabetical), then email prefixes; 2 chars is too short for substrings
+    assert [user.username for user in page.users] == ["zoe.kim", "zorro", "mike", "kim.zorn"]
+    assert page.next_cursor is None
+
+    page = await search_users(db_session, "zor", limit=10)
+    assert [user.username for user in page.users] == ["zorro", "kim.zorn"]
+
+
+async def test_substring_search_is_case_insensitive_and_covers_nickname(db_session: AsyncSession, people):
+    page = await search_users(db_session, "RIME", limit=10)
+    assert [user.username for user in page.users] == ["amazon_fan"]
+    page = await search_users(db_session, "mazo", limit=10)
+    assert [user.username for user in page.users] == ["amazon_fan"]
+
+
+async def test_keyset_pagination_visits_every_match_once(db_session: AsyncSession, people):
+    seen, cursor = [], None
+    while True:
+        page = await search_users(db_session, "zo", limit=1, cursor=cursor)
+        seen.extend(user.username for user in page.users)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert seen == ["zoe.kim", "zorro", "mike", "kim.zorn"]
+
+
+async def test_index_follows_updates_and_deletes(db_session: AsyncSession, people):
+    people["bystander"].nickname = "Quixotic"
+    await db_session.flush()
+    assert [u.username for u in (await search_users(db_session, "quixo")).users] == ["bystander"]
+    assert (await search_users(db_session, "nobody")).users == []
+
+    await db_session.delete(people["bystander"])
+    await db_session.flush()
+    assert (await search_users(db_session, "quixo")).users == []
+
+
+async def test_invalid_cursor_is_rejected(db_session: AsyncSession):
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
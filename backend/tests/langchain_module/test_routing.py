@@ -0,0 +1,124 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.langchain_module import routing
+from app.langchain_module.routing import (
+    CLOSED,
+    OPEN,
+    LLMRouter,
+    NoProviderAvailableError,
+    ProviderError,
+    RoutingStats,
+    ScriptedProvider,
+    bimodal_latency,
+)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next timer when nothing is ready, so sleeps take no real time."""
+
+    def __init__(self):
+        super().__init__()
+        self._now = 0.0
+
+    def time(self) -> float:
+        return self._now
+
+    def _run_once(self) -> None:
+        if not self._ready:
+            pending = [handle.when() for handle in self._scheduled if not handle.cancelled()]
+            if pending:
+                self._now = max(self._now, min(pending))
+        super()._run_once()
+
+
+def p99(latencies):
+    return sorted(latencies)[int(len(latencies) * 0.99)]
+
+
+async def latencies_of(target, requests: int, concurrency: int):
+    latencies = []
+    prompts = iter(range(requests))
+    loop = asyncio.get_running_loop()
+
+    async def worker():
+        for prompt in prompts:
+            start = loop.time()
+            await target.ainvoke(prompt)
+            latencies.append(loop.time() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def test_hedging_cuts_p99_for_a_few_percent_extra_calls(monkeypatch):
+    def providers():
+        # 3% of calls are slow, so p95 falls in the fast mode
+        return [
+            ScriptedProvider("a", bimodal_latency(10, 400, 0.03), seed=1),
+            ScriptedProvider("b", bimodal_latency(15, 400, 0.03), seed=2),
+        ]
+
+    async def scenario():
+        direct = await latencies_of(providers()[0], 400, 40)
+        router = LLMRouter(providers())
+        await latencies_of(router, 100, 10) # Warm up: no hedging until the window has latencies
+        router.stats = RoutingStats()
+        return direct, router, await latencies_of(router, 400, 40)
+
+    # Scripted latencies on a virtual clock: the outcome does not depend on how busy the machine is
+    with asyncio.Runner(loop_factory=VirtualTimeLoop) as runner:
+        clock = runner.get_loop().time
+        monkeypatch.setattr(routing, "time", SimpleNamespace(perf_counter=clock, monotonic=clock))
+        direct, router, routed = runner.run(scenario())
+
+    assert p99(direct) > 0.3 # The slow mode shows at p99...
+    assert p99(routed) < 0.05 # ...and hedging cuts it off
+    assert 0 < router.stats.hedges <= 0.1 * 400 # Within the hedge budget
+    assert router.stats.hedge_wins > 0
+    assert router.stats.succeeded == 400 and router.routes[0].stats.cancelled > 0
+
+
+async def test_hedge_wins_and_the_slow_request_is_cancelled():
+    slow_primary = ScriptedProvider("primary", [10] * 20 + [2000])
+    router = LLMRouter([slow_primary, ScriptedProvider("secondary", 10)], min_samples=20)
+    for i in range(20):
+        assert await router.ainvoke(i) == f"primary: {i}"
+    assert router.snapshot()["providers"][0]["hedge_after_ms"] == pytest.approx(10, abs=15)
+
+    start = time.perf_counter()
+    assert await router.ainvoke("late") == "secondary: late"
+    assert time.perf_counter() - start < 0.5
+    assert router.stats.hedges == router.stats.hedge_wins == 1
+    assert router.routes[0].stats.cancelled == 1
+
+
+async def test_failover_and_circuit_breaker():
+    broken = ScriptedProvider("broken", 1, error_rate=1.0)
+    backup = ScriptedProvider("backup", 1)
+    router = LLMRouter([broken, backup], breaker_failures=3, breaker_reset_seconds=0.05)
+
+    for i in range(5):
+        assert await router.ainvoke(i) == f"backup: {i}"
+    assert broken.calls == 3 and router.routes[0].breaker.state == OPEN # Skipped once open
+    assert router.stats.failovers == 3
+
+    await asyncio.sleep(0.06)
+    assert await router.ainvoke("trial") == "backup: trial"
+    assert broken.calls == 4 and router.routes[0].breaker.state == OPEN # Failed trial reopens it
+
+    broken.error_rate = 0.0
+    await asyncio.sleep(0.06)
+    assert await router.ainvoke("recovered") == "broken: recovered"
+    assert router.routes[0].breaker.state == CLOSED
+
+    backup.error_rate = broken.error_rate = 1.0
+    for _ in range(3):
+        with pytest.raises(ProviderError):
+            await router.ainvoke("down")
+    with pytest.raises(NoProviderAvailableError):
+        await router.ainvoke("down")
+    assert router.snapshot()["rejected"] == 1
@@ -0,0 +1,98 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.langchain_module.vectorstore import DOT, HashingEmbedder, TextVectorStore, VectorStore
+
+
+def clustered(n: int, dim: int, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def brute_force(vectors: np.ndarray, query: np.ndarray, k: int) -> list:
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(normed @ (query / np.linalg.norm(query))))[:k])
+
+
+def test_exact_search_matches_brute_force_across_blocks():
+    vectors = clustered(3000, 16)
+    store = VectorStore(16, capacity=8, block_rows=512) # Grows several times; several blocks per search
+    store.add([str(i) for i in range(len(vectors))], vectors)
+
+    queries = clustered(5, 16, seed=1)
+    for query, hits in zip(queries, store.search(queries, k=7)):
+        assert [int(hit.id) for hit in hits] == brute_force(vectors, query, 7)
+        assert hits[0].score >= hits[-1].score
+
+    dot_store = VectorStore(2, metric=DOT)
+    dot_store.add(["small", "large"], [[1, 0], [3, 0]])
+    assert [hit.id for hit in dot_store.search([1, 0], k=2)[0]] == ["large", "small"] # Magnitude counts
+
+
+def test_add_replaces_and_delete_hides_rows():
+    store = VectorStore(2)
+    store.add(["a", "b", "c"], [[1, 0], [0, 1], [1, 1]], payloads=[{"n": 1}, {"n": 2}, {"n": 3}])
+    store.add(["a"], [[-1, 0]], payloads=[{"n": 4}]) # Replaces a
+    assert len(store) == 3
+    hit = store.search([-1, 0], k=1)[0][0]
+    assert (hit.id, hit.payload) == ("a", {"n": 4})
+
+    assert store.delete(["b", "missing"]) == 1
+    assert [hit.id for hit in store.search([0, 1], k=5)[0]] == ["c", "a"]
+    store.compact()
+    assert store.vectors.shape == (2, 2) and "b" not in store
+
+    with pytest.raises(ValueError):
+        store.add(["x"], [[1, 2, 3]])
+
+
+def test_ivf_index_has_high_recall_and_follows_updates():
+    vectors = clustered(5000, 32)
+    store = VectorStore(32)
+    store.add([str(i) for i in range(len(vectors))], vectors)
+    store.build_index(nlist=50, nprobe=5)
+
+    queries = clustered(40, 32, seed=2)
+    approximate = store.search(queries, k=10)
+    exact = store.search(queries, k=10, exact=True)
+    recall = np.mean([len({h.id for h in a} & {h.id for h in e}) / 10 for a, e in zip(approximate, exact)])
+    assert recall > 0.9
+
+    store.add(["new"], queries[:1] * 5) # Filed under its nearest list as it is added
+    assert store.search(queries[0], k=1)[0][0].id == "new"
+    store.delete(["new"])
+    assert store.search(queries[0], k=1)[0][0].id != "new"
+
+
+def test_save_and_memory_mapped_load(tmp_path):
+    vectors = clustered(2000, 8)
+    store = VectorStore(8)
+    store.add([f"v{i}" for i in range(len(vectors))], vectors, payloads=[{"i": i} for i in range(len(vectors))])
+    store.delete(["v3"])
+    store.build_index(nlist=16, nprobe=4)
+    store.save(str(tmp_path))
+
+    loaded = VectorStore.load(str(tmp_path))
+    assert isinstance(loaded.vectors, np.memmap) and len(loaded) == len(store)
+    query = vectors[10]
+    assert loaded.search(query, k=5) == store.search(query, k=5)
+    assert loaded.search(query, k=5, exact=True) == store.search(query, k=5, exact=True)
+
+    loaded.add(["extra"], [query]) # Copies the matrix out of the file
+    assert not isinstance(loaded.vectors, np.memmap)
+    assert loaded.search(query, k=1)[0][0].id in ("extra", "v10")
+    assert VectorStore.load(str(tmp_path), mmap=False).search(query, k=5) == store.search(query, k=5)
+
+
+def test_text_store_with_hashing_embedder():
+    texts = TextVectorStore(HashingEmbedder(128))
+    texts.add_texts(
+        ["reset", "invoice", "avatar"],
+        ["How to reset a forgotten password", "Download your invoice as PDF", "Change your profile avatar"],
+        metadatas=[{"section": "auth"}, {"section": "billing"}, {"section": "profile"}],
+    )
+    hit = texts.similarity_search("forgotten password help", k=1)[0]
+    assert hit.id == "reset" and hit.payload == {"text": "How to reset a forgotten password", "section": "auth"}
+    assert np.allclose(HashingEmbedder(128).embed_query("same text"), HashingEmbedder(128).embed_query("Same  text!"))
@@ -0,0 +1,44 @@
+import hashlib
+import io
+
+import pytest
+
+from app.services.avatars import AvatarStore, InvalidAvatar
+
+BOUNDARY = "avatar-test-boundary"
+
+
+def multipart(fields) -> bytes:
+    body = b""
+    for name, filename, content in fields:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def test_upload_is_streamed_hashed_and_resized_in_a_process_pool(tmp_path):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGBA", (90, 300), (0, 128, 255, 128)).save(buffer, "PNG")
+    image = buffer.getvalue()
+    store = AvatarStore(root=str(tmp_path), sizes=[16, 48], workers=1)
+    body = multipart([("caption", None, b"me"), ("file", "me.png", image)])
+    try:
+        # Odd chunk sizes split the boundary and headers across chunks
+        digest = await store.save_upload(f"multipart/form-data; boundary={BOUNDARY}", chunked(body, 7))
+        assert digest == hashlib.sha256(image).hexdigest()
+        for size in (16, 48):
+            with Image.open(store.path(digest, size)) as rendition:
+                assert rendition.size == (size, size) and rendition.mode == "RGBA"
+
+        with pytest.raises(InvalidAvatar, match="No image"):
+            await store.save_upload(f"multipart/form-data; boundary={BOUNDARY}", chunked(multipart([("other", "a.png", image)]), 64))
+        with pytest.raises(InvalidAvatar, match="readable"):
+            await store.save_upload(f"multipart/form-data; boundary={BOUNDARY}", chunked(multipart([("file", "a.png", b"GIF89a junk")]), 64))
+    finally:
+        await store.stop()
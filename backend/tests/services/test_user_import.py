@@ -0,0 +1,119 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.core import security
+from app.models.user import User
+from app.services import user_import
+from app.services.user_import import CSV, FAILED, NDJSON, SUCCEEDED, ImportJob, UserImporter
+from tests.conftest import SessionTesting
+
+
+@pytest.fixture
+async def cleanup():
+    prefixes = []
+    yield prefixes
+    async with SessionTesting() as db:
+        for prefix in prefixes:
+            await db.execute(delete(User).where(User.username.startswith(prefix)))
+        await db.commit()
+
+
+def write(tmp_path, name: str, content: str) -> str:
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+async def test_csv_import_validates_rows_and_reports_conflicts(tmp_path, cleanup, fast_password_hashing):
+    cleanup.append("csvimp_")
+    async with SessionTesting() as db:
+        db.add(User(username="csvimp_taken", email="csvimp_taken@example.com", hashed_password="x"))
+        await db.commit()
+    path = write(tmp_path, "users.csv", "\n".join([
+        "username,email,password,nickname,roles",
+        "csvimp_ann,ann@example.com,secret-1,Ann,admin", # roles column is ignored
+        "csvimp_bob,not-an-email,secret-2,,",
+        "csvimp_ann,ann2@example.com,secret-3,,",
+        "csvimp_cid,csvimp_taken@example.com,secret-4,,",
+        "csvimp_taken,new@example.com,secret-5,,",
+        "csvimp_dee,dee@example.com,secret-6,,",
+        "csvimp_eve,eve@example.com,,,",
+    ]))
+    importer = UserImporter(batch_size=3, hash_workers=0)
+    importer.start(SessionTesting)
+
+    job = await importer.run(ImportJob(id="job", format=CSV), path)
+
+    assert job.status == SUCCEEDED
+    assert (job.rows_read, job.created, job.failed) == (7, 2, 5)
+    assert [(error.row, error.username) for error in job.errors] == [
+        (2, "csvimp_bob"), (3, "csvimp_ann"), (4, "csvimp_cid"), (5, "csvimp_taken"), (7, "csvimp_eve"),
+    ]
+    assert "email" in job.errors[0].error and job.errors[1].error == "Username repeated in the file"
+    assert job.errors[2].error == "Email already registered"
+    async with SessionTesting() as db:
+        ann = await db.scalar(select(User).where(User.username == "csvimp_ann"))
+        assert ann.nickname == "Ann" and ann.roles is None and ann.is_active
+        assert security.verify_password("secret-1", ann.hashed_password)
+        assert await db.scalar(select(User.id).where(User.username == "csvimp_dee"))
+
+
+async def test_ndjson_import_hashes_in_worker_processes(tmp_path, cleanup, fast_password_hashing):
+    cleanup.append("ndimp_")
+    lines = [json.dumps({"username": f"ndimp_{i}", "email": f"ndimp_{i}@example.com", "password": f"pw-{i}"})
+             for i in range(6)]
+    path = write(tmp_path, "users.ndjson", "\n".join([*lines[:3], "", "[1, 2]", "{oops", *lines[3:]]) + "\n")
+    importer = UserImporter(batch_size=4, hash_workers=2)
+    importer.start(SessionTesting)
+    try:
+        job = await importer.run(ImportJob(id="job", format=NDJSON), path)
+    finally:
+        await importer.stop()
+
+    assert job.status == SUCCEEDED and (job.created, job.failed) == (6, 2)
+    assert [(error.row, error.error) for error in job.errors] == [(5, "Not a JSON object"), (6, "Not a JSON object")]
+    async with SessionTesting() as db:
+        user = await db.scalar(select(User).where(User.username == "ndimp_5"))
+    assert security.verify_password("pw-5", user.hashed_password)
+
+
+async def test_unreadable_upload_fails_the_job(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_bytes(b"username,email,password\n\xff\xfe\xfa,x@example.com,pw\n")
+    importer = UserImporter(hash_workers=0)
+    importer.start(SessionTesting)
+
+    job = await importer.run(ImportJob(id="job", format=CSV), str(path))
+
+    assert job.status == FAILED and "decode" in job.detail
+    assert not path.exists() # The spool file is removed either way
+
+
+async def test_cancelled_import_still_finishes_and_removes_the_upload(tmp_path, monkeypatch):
+    path = write(tmp_path, "users.csv", "username,email,password\ncancel_a,a@example.com,pw-a\n")
+    reading, release = threading.Event(), threading.Event()
+    parse = user_import._parse
+
+    def blocking_parse(path, import_format):
+        reading.set()
+        release.wait(5) # Still inside the generator, in a threadpool thread, when the task is cancelled
+        yield from parse(path, import_format)
+
+    monkeypatch.setattr(user_import, "_parse", blocking_parse)
+    importer = UserImporter(hash_workers=0)
+    importer.start(SessionTesting)
+    job = ImportJob(id="job", format=CSV)
+    task = asyncio.create_task(importer.run(job, path))
+    await asyncio.to_thread(reading.wait, 5)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    release.set()
+
+    assert job.status == FAILED and job.finished_at is not None
+    assert not (tmp_path / "users.csv").exists()
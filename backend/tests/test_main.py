@@ -10,6 +10,13 @@ async def test_health_check(client: AsyncClient):
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {"status": "OK"}
 
+async def test_jwks_supports_conditional_get(client: AsyncClient):
+    response = await client.get("/.well-known/jwks.json")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["cache-control"] == "public, max-age=300"
+    cached = await client.get("/.well-known/jwks.json", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+
 # Example of a test for a non-existent route (if you have a general 404 handler)
 # async def test_not_found(client: AsyncClient):
 #     response = await client.get("/api/v1/non_existent_route")